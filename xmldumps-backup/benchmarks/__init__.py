@@ -0,0 +1,5 @@
+#!/usr/bin/python3
+'''
+benchmarks for xml dumps, run from the top level directory
+as python3 -m benchmarks.<name>
+'''
@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+'''
+compare the ways we have of cutting page ranges for history
+content jobs: bisection via db queries, scanning the revinfo
+file, and binary searches in the revinfo index, on a synthetic
+wiki with as many pages as you like
+
+the db is simulated from the same revinfo, so db times are for
+our side of the work only; the number of queries is reported
+and an estimate given at the specified time per query
+'''
+
+import getopt
+import gzip
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from bisect import bisect_right
+
+from dumps.pagerange import PageRange, RevInfoIndex, get_revinfo_index_path
+
+
+class FakeConfig():
+    '''
+    just the config settings PageRange wants
+    '''
+    def __init__(self, revs_margin):
+        self.revs_margin = revs_margin
+
+
+class FakeWiki():
+    '''
+    just the wiki attributes PageRange wants
+    '''
+    def __init__(self, revs_margin):
+        self.config = FakeConfig(revs_margin)
+
+
+class FakeQueryRunner():
+    '''
+    answer the revision count and length queries PageRange makes
+    from a revinfo index, counting the queries as we go; page
+    ranges within one revinfo entry are prorated
+    '''
+    def __init__(self, index, max_page_id, revs_margin):
+        self.index = index
+        self.max_page_id = max_page_id
+        self.wiki = FakeWiki(revs_margin)
+        self.queries = 0
+
+    def cumulative(self, cums, pageid):
+        '''
+        return the cumulative value of revs or bytes for pages before pageid
+        '''
+        entry = bisect_right(self.index.page_ids, pageid) - 1
+        if entry < 0:
+            return 0
+        entry_start = self.index.page_ids[entry]
+        if entry + 1 < self.index.count:
+            entry_end = self.index.page_ids[entry + 1]
+        else:
+            entry_end = self.max_page_id + 1
+        fraction = (pageid - entry_start) / (entry_end - entry_start)
+        return int(cums[entry] + fraction * (cums[entry + 1] - cums[entry]))
+
+    def get_max_id(self, idtype):
+        '''
+        max page id, or total number of revisions as max rev id
+        '''
+        self.queries += 1
+        if idtype == 'page':
+            return self.max_page_id
+        return self.index.cum_revs[-1]
+
+    def get_count(self, page_start, page_end):
+        '''
+        number of revisions for pages page_start up to but not including page_end
+        '''
+        self.queries += 1
+        return (self.cumulative(self.index.cum_revs, page_end) -
+                self.cumulative(self.index.cum_revs, page_start))
+
+    def get_length(self, page_start, page_end):
+        '''
+        length of revisions for pages page_start up to but not including page_end
+        '''
+        self.queries += 1
+        return (self.cumulative(self.index.cum_bytes, page_end) -
+                self.cumulative(self.index.cum_bytes, page_start))
+
+    def get_estimate(self, page_start, page_end):
+        '''
+        estimated number of revisions for pages page_start through page_end
+        '''
+        return self.get_count(page_start, page_end + 1)
+
+
+def write_synthetic_revinfo(revinfo_path, pages, batchsize, seed):
+    '''
+    write a revinfo file for a wiki with the specified number of pages,
+    one entry per batch of pages; most pages have few revisions, a few
+    have a great many, and older pages (low page ids) have more
+    '''
+    randomizer = random.Random(seed)
+    with gzip.open(revinfo_path, "wb", compresslevel=1) as outfile:
+        lines = []
+        for pageid in range(1, pages + 1, batchsize):
+            age = 1.0 - pageid / pages
+            revcount = int(batchsize * (1 + 40 * age * age) * randomizer.lognormvariate(0, 1))
+            bytecount = revcount * int(randomizer.lognormvariate(8, 1))
+            lines.append(b"%d:%d:%d\n" % (pageid, bytecount, revcount))
+            if len(lines) >= 100000:
+                outfile.write(b''.join(lines))
+                lines = []
+        outfile.write(b''.join(lines))
+
+
+def time_it(method, *args):
+    '''
+    run the method with the args and return the result
+    and the elapsed time in seconds
+    '''
+    start = time.time()
+    result = method(*args)
+    return result, time.time() - start
+
+
+def run_bench(settings, workdir):
+    '''
+    generate the synthetic revinfo and its index, get page ranges
+    all three ways and display the timings
+    '''
+    revinfo_path = os.path.join(workdir, "benchwiki-revinfo.gz")
+    index_path = get_revinfo_index_path(revinfo_path)
+    _result, elapsed = time_it(write_synthetic_revinfo, revinfo_path, settings['pages'],
+                               settings['batchsize'], settings['seed'])
+    print("generated revinfo for %d pages in %.2fs, %d bytes" % (
+        settings['pages'], elapsed, os.path.getsize(revinfo_path)))
+    _result, elapsed = time_it(RevInfoIndex.build, revinfo_path, index_path)
+    print("built revinfo index in %.2fs, %d bytes" % (elapsed, os.path.getsize(index_path)))
+
+    with RevInfoIndex(index_path) as index:
+        print("total revisions: %d, total bytes: %d" % (index.cum_revs[-1], index.cum_bytes[-1]))
+        qrunner = FakeQueryRunner(index, settings['pages'], settings['margin'])
+        prange = PageRange(qrunner)
+        args = (settings['maxbytes'], settings['revs'], 1, settings['pages'], 5)
+
+        scan_ranges, elapsed = time_it(PageRange.get_ranges_via_revinfo, revinfo_path, *args)
+        print("revinfo scan: %d ranges in %.3fs" % (len(scan_ranges), elapsed))
+
+        index_ranges, elapsed = time_it(index.get_ranges, *args)
+        print("revinfo index: %d ranges in %.3fs%s" % (
+            len(index_ranges), elapsed,
+            "" if index_ranges == scan_ranges else " (RANGES DIFFER FROM SCAN)"))
+
+        _index_ranges, elapsed = time_it(index.get_ranges_for_jobs, settings['jobs'],
+                                         1, settings['pages'])
+        print("revinfo index: ranges for %d jobs in %.3fs" % (settings['jobs'], elapsed))
+
+        if settings['skipdb']:
+            return
+        db_ranges, elapsed = time_it(prange.get_ranges_via_db, 1, settings['pages'],
+                                     settings['revs'], settings['maxbytes'])
+        print("db bisection: %d ranges in %.3fs with %d queries, "
+              "about %.0fs at %.3fs per query" % (
+                  len(db_ranges), elapsed, qrunner.queries,
+                  elapsed + qrunner.queries * settings['querytime'], settings['querytime']))
+
+
+def usage(message=None):
+    '''
+    display a helpful usage message with
+    an optional introductory message first
+    '''
+    if message is not None:
+        sys.stderr.write(message)
+        sys.stderr.write("\n")
+    usage_message = """
+Usage: python3 -m benchmarks.pagerange_bench [--pages <int>] [--batchsize <int>]
+        [--revs <int>] [--maxbytes <int>] [--jobs <int>] [--margin <int>]
+        [--querytime <float>] [--seed <int>] [--skipdb] [--help]
+
+Generates revinfo for a synthetic wiki, and times getting page ranges for
+history content jobs via the db, a scan of the revinfo file and the revinfo index.
+
+--pages      (-p):  number of pages in the synthetic wiki, default 50000000
+--batchsize  (-b):  number of pages per revinfo entry, default 10
+--revs       (-r):  number of revisions per page range, default 1000000
+--maxbytes   (-m):  max bytes per page range, default 35000000000
+--jobs       (-j):  number of jobs for ranges for jobs, default 27
+--margin     (-M):  revsMargin setting for db bisection, default 100
+--querytime  (-q):  seconds per db query for the estimate, default 0.05
+--seed       (-s):  random seed, default 1
+--skipdb     (-S):  don't do db bisection
+--help       (-h):  display this help message
+"""
+    sys.stderr.write(usage_message)
+    sys.exit(1)
+
+
+def main():
+    '''
+    main entry point, does all the work
+    '''
+    settings = {'pages': 50000000, 'batchsize': 10, 'revs': 1000000,
+                'maxbytes': 35000000000, 'jobs': 27, 'margin': 100,
+                'querytime': 0.05, 'seed': 1, 'skipdb': False}
+    intopts = {'-p': 'pages', '--pages': 'pages', '-b': 'batchsize', '--batchsize': 'batchsize',
+               '-r': 'revs', '--revs': 'revs', '-m': 'maxbytes', '--maxbytes': 'maxbytes',
+               '-j': 'jobs', '--jobs': 'jobs', '-M': 'margin', '--margin': 'margin',
+               '-s': 'seed', '--seed': 'seed'}
+    try:
+        (options, remainder) = getopt.gnu_getopt(
+            sys.argv[1:], "p:b:r:m:j:M:q:s:Sh",
+            ["pages=", "batchsize=", "revs=", "maxbytes=", "jobs=", "margin=",
+             "querytime=", "seed=", "skipdb", "help"])
+    except getopt.GetoptError as err:
+        usage("Unknown option specified: " + str(err))
+    for (opt, val) in options:
+        if opt in intopts:
+            if not val.isdigit():
+                usage("%s argument requires a number" % opt)
+            settings[intopts[opt]] = int(val)
+        elif opt in ["-q", "--querytime"]:
+            try:
+                settings['querytime'] = float(val)
+            except ValueError:
+                usage("querytime argument requires a number")
+        elif opt in ["-S", "--skipdb"]:
+            settings['skipdb'] = True
+        elif opt in ["-h", "--help"]:
+            usage("Help for this script")
+    if remainder:
+        usage("Unknown option(s) specified: <%s>" % remainder[0])
+
+    workdir = tempfile.mkdtemp(prefix="pagerange_bench")
+    try:
+        run_bench(settings, workdir)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
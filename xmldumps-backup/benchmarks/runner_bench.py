@@ -0,0 +1,443 @@
+#!/usr/bin/python3
+'''
+run the dump runner end to end on synthetic wikis, with stand-ins
+for php, the MediaWiki maintenance scripts and the mysql tools,
+and report wall time, cpu, read and write syscalls and bytes moved
+for each phase of the runs: runner setup, each dump job, status
+publishing, and the checksumming and other work done after each job
+
+the stand-ins are fast and the numbers are for the whole process
+tree, so what shows up here is mostly our own overhead: scheduling,
+status files, checksums, compression and validation of the output
+
+save the results with --output and compare a later run against
+them with --baseline to catch regressions
+'''
+
+import datetime
+import getopt
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from benchmarks.standins import write_wrappers
+from benchmarks.synthwiki import make_wiki_db
+from dumps.dbquery import QueryService
+from dumps.runner import Runner
+from dumps.wikidump import Config, Wiki
+
+# these need tools we have no stand-ins for, or a network
+SKIP_JOBS = ["metahistory7zdump", "metahistory7zdumprecombine", "articlesmultistreamdump",
+             "articlesmultistreamdumprecombine", "xmlflowdump", "xmlflowhistorydump",
+             "sitelistdump"]
+
+TABLE_JOBS = """tables:
+    site_stats:
+      job: sitestats
+      description: A few statistics such as the page count.
+    pagelinks:
+      job: pagelinks
+      description: Wiki page-to-page link records.
+    categorylinks:
+      job: categorylinks
+      description: Wiki category membership link records.
+"""
+
+CONFIG = """[wiki]
+dblist={workdir}/all.dblist
+privatelist={workdir}/private.dblist
+dir={workdir}/mediawiki
+tablejobs={workdir}/tables.yaml
+apijobs={workdir}/api.yaml
+
+[output]
+public={workdir}/public
+private={workdir}/private
+temp={workdir}/temp
+index={workdir}/public/index.html
+webroot=http://localhost/dumps
+templatedir={samples}
+
+[reporting]
+adminmail=nomail
+
+[database]
+querybackend={querybackend}
+client_config_file={workdir}/my-client.conf
+
+[tools]
+php={php}
+mysql={mysql}
+mysqldump={mysqldump}
+gzip={gzip}
+bzip2={bzip2}
+
+[chunks]
+chunksEnabled={chunks_enabled}
+chunksForPagelogs={parts}
+pagesPerChunkHistory={pages_per_part}
+rebalanceParts={rebalance}
+recombineHistory=1
+recombineMetaCurrent=1
+lbzip2threads=
+
+[stubs]
+minpages=1
+maxrevs=100000
+
+[misc]
+commandsupervisor={supervisor}
+tabledumpworkers={tableworkers}
+inlinechecksums={inlinechecksums}
+"""
+
+# counters kept for each phase
+FIELDS = ["wall", "cpu", "children_cpu", "syscr", "syscw", "rchar", "wchar", "write_bytes"]
+
+
+def get_snapshot():
+    '''
+    return a dict of the counters we measure phases by; io counts
+    in /proc/self/io include those of children once they are reaped
+    '''
+    ours = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    snapshot = {'wall': time.time(), 'cpu': ours.ru_utime + ours.ru_stime,
+                'children_cpu': children.ru_utime + children.ru_stime}
+    with open("/proc/self/io", "r") as infile:
+        for line in infile:
+            name, _sep, value = line.partition(":")
+            if name in FIELDS:
+                snapshot[name] = int(value)
+    return snapshot
+
+
+class PhaseMeter():
+    '''
+    accumulate the counters from get_snapshot for named phases;
+    phases may be nested, and are then counted in each enclosing
+    phase as well
+    '''
+    def __init__(self):
+        self.phases = {}
+        self.order = []
+
+    @contextmanager
+    def phase(self, name):
+        '''
+        measure everything done in the with block as the named phase
+        '''
+        before = get_snapshot()
+        try:
+            yield
+        finally:
+            after = get_snapshot()
+            if name not in self.phases:
+                self.phases[name] = dict((field, 0) for field in FIELDS)
+                self.phases[name]['count'] = 0
+                self.order.append(name)
+            self.phases[name]['count'] += 1
+            for field in FIELDS:
+                self.phases[name][field] += after.get(field, 0) - before.get(field, 0)
+
+    def wrap(self, name, method):
+        '''
+        return the method wrapped so that each call is measured as the named phase
+        '''
+        def wrapped(*args, **kwargs):
+            with self.phase(name):
+                return method(*args, **kwargs)
+        return wrapped
+
+
+class BenchRunner(Runner):
+    '''
+    a Runner that measures its setup, each dump job it runs,
+    its status publishing and what it does after each job
+    '''
+    def __init__(self, meter, *args, **kwargs):
+        self.meter = meter
+        with self.meter.phase("startup"):
+            super().__init__(*args, **kwargs)
+        self.dumpjobdata.do_after_job = self.meter.wrap("after job", self.dumpjobdata.do_after_job)
+
+    def do_run_setup(self):
+        with self.meter.phase("setup"):
+            super().do_run_setup()
+
+    def do_run_item(self, item):
+        if not item.to_run():
+            return super().do_run_item(item)
+        with self.meter.phase("job " + item.name()):
+            return super().do_run_item(item)
+
+    def do_run_table_group(self, group):
+        with self.meter.phase("job table group"):
+            super().do_run_table_group(group)
+
+    def publish_status(self, force=False):
+        with self.meter.phase("status"):
+            super().publish_status(force)
+
+    def report_all_the_things(self, status):
+        with self.meter.phase("status"):
+            super().report_all_the_things(status)
+
+
+def setup_workdir(settings, workdir):
+    '''
+    generate the synthetic wikis, the stand-in tools and the config
+    file in the workdir, returning the path to the config file
+    and the list of wiki names
+    '''
+    dbdir = os.path.join(workdir, "db")
+    os.makedirs(dbdir)
+    wikis = ["bench%dwiki" % num for num in range(1, settings['wikis'] + 1)]
+    for num, wikiname in enumerate(wikis):
+        start = time.time()
+        totals = make_wiki_db(os.path.join(dbdir, wikiname + ".sqlite"), settings,
+                              settings['seed'] + num)
+        print("generated %s in %.2fs: %d pages, %d revisions, %d log items, %d bytes of text" % (
+            wikiname, time.time() - start, totals['pages'], totals['revs'], totals['logs'],
+            totals['bytes']))
+    with open(os.path.join(workdir, "all.dblist"), "w") as outfile:
+        outfile.write("\n".join(wikis) + "\n")
+    with open(os.path.join(workdir, "private.dblist"), "w") as outfile:
+        outfile.write("")
+    with open(os.path.join(workdir, "tables.yaml"), "w") as outfile:
+        outfile.write(TABLE_JOBS)
+    with open(os.path.join(workdir, "api.yaml"), "w") as outfile:
+        outfile.write("{}\n")
+
+    tools = write_wrappers(os.path.join(workdir, "bin"), os.path.join(workdir, "mediawiki"))
+    parts = settings['parts']
+    configpath = os.path.join(workdir, "wikidump.conf")
+    with open(configpath, "w") as outfile:
+        outfile.write(CONFIG.format(
+            workdir=workdir, samples=os.path.join(os.getcwd(), "samples"),
+            querybackend=settings['querybackend'], supervisor=settings['supervisor'],
+            tableworkers=settings['tableworkers'],
+            inlinechecksums=1 if settings['inlinechecksums'] else 0,
+            rebalance=1 if settings['rebalance'] else 0,
+            gzip=shutil.which("gzip"), bzip2=shutil.which("bzip2"),
+            chunks_enabled=1 if parts > 1 else 0, parts=parts if parts > 1 else "",
+            pages_per_part=",".join([str(-(-settings['pages'] // parts))] * parts),
+            **tools))
+
+    os.environ["DUMPSBENCH_DBDIR"] = dbdir
+    os.environ["DUMPSBENCH_RATE"] = str(settings['rate'])
+    os.environ["DUMPSBENCH_QUERYTIME"] = str(settings['querytime'])
+    os.environ["DUMPSBENCH_STARTUP"] = str(settings['startup'])
+    return configpath, wikis
+
+
+def run_wiki(settings, configpath, wikiname, date, meter):
+    '''
+    do one dump run of the wiki for the date, all jobs or the jobs
+    asked for one at a time, and return the names of jobs that failed
+    '''
+    config = Config(configpath)
+    wiki = Wiki(config, wikiname)
+    wiki.set_date(date)
+    failed = []
+    for job in settings['jobs'] or [None]:
+        runner = BenchRunner(meter, wiki, prefetch=True, spawn=True, job=job,
+                             skip_jobs=settings['skipjobs'], do_prereqs=True)
+        runner.run()
+        failed.extend([item.name() for item in runner.dump_item_list.dump_items
+                       if item.status() == "failed"])
+    return failed
+
+
+def show_results(meter, elapsed, baseline):
+    '''
+    print the counters for each phase, along with the percent change
+    from the baseline for wall and our own cpu time where there is one
+    '''
+    print("%-36s %5s %9s %8s %8s %9s %9s %9s %9s" % (
+        "phase", "count", "wall", "cpu", "chld cpu", "reads", "writes", "MB read", "MB writ"))
+    for name in meter.order:
+        stats = meter.phases[name]
+        line = "%-36s %5d %9.3f %8.3f %8.3f %9d %9d %9.1f %9.1f" % (
+            name, stats['count'], stats['wall'], stats['cpu'], stats['children_cpu'],
+            stats['syscr'], stats['syscw'], stats['rchar'] / 1000000.0,
+            stats['wchar'] / 1000000.0)
+        if baseline and name in baseline:
+            changes = []
+            for field in ["wall", "cpu"]:
+                if baseline[name][field]:
+                    changes.append("%s %+.0f%%" % (field, 100.0 * (
+                        stats[field] - baseline[name][field]) / baseline[name][field]))
+            line += "  " + ", ".join(changes)
+        print(line)
+    print("total elapsed: %.2fs" % elapsed)
+    for server, stats in QueryService.get_all_stats().items():
+        print("queries to %s: %d in %.3fs, %d failed" % (
+            server, stats['queries'], stats['seconds'], stats['failures']))
+
+
+def run_bench(settings, workdir):
+    '''
+    set up the synthetic wikis and stand-ins, do all the dump runs
+    and display the results
+    '''
+    configpath, wikis = setup_workdir(settings, workdir)
+    baseline = None
+    if settings['baseline']:
+        with open(settings['baseline'], "r") as infile:
+            baseline = json.load(infile)
+
+    meter = PhaseMeter()
+    today = datetime.date.today()
+    start = time.time()
+    failed = []
+    for run in range(settings['runs']):
+        date = (today - datetime.timedelta(days=settings['runs'] - run - 1)).strftime("%Y%m%d")
+        for wikiname in wikis:
+            failed.extend(["%s %s %s" % (wikiname, date, job)
+                           for job in run_wiki(settings, configpath, wikiname, date, meter)])
+    elapsed = time.time() - start
+
+    show_results(meter, elapsed, baseline)
+    QueryService.close_all()
+    if failed:
+        print("failed jobs: %s" % ", ".join(failed))
+    if settings['output']:
+        with open(settings['output'], "w") as outfile:
+            json.dump(meter.phases, outfile, indent=2, sort_keys=True)
+
+
+def usage(message=None):
+    '''
+    display a helpful usage message with
+    an optional introductory message first
+    '''
+    if message is not None:
+        sys.stderr.write(message)
+        sys.stderr.write("\n")
+    usage_message = """
+Usage: python3 -m benchmarks.runner_bench [--wikis <int>] [--pages <int>]
+        [--revs <int>] [--textsize <int>] [--logs <float>] [--parts <int>]
+        [--runs <int>] [--jobs <job>[,<job>...]] [--skipjobs <job>[,<job>...]]
+        [--rate <int>] [--querytime <float>] [--startup <float>]
+        [--querybackend session|subprocess] [--supervisor threads|eventloop]
+        [--output <path>] [--baseline <path>] [--seed <int>] [--keep] [--help]
+
+Generates synthetic wikis and runs dumps of them through the dump runner with
+stand-ins for php, MediaWiki and mysql, and displays wall time, cpu time, read
+and write syscalls and bytes moved by the runner and its children for each phase.
+Must be run from the xmldumps-backup directory.
+
+--wikis        (-w):  number of wikis to generate and dump, default 1
+--pages        (-p):  number of pages in each wiki, default 2000
+--revs         (-r):  average number of revisions per page, default 5
+--textsize     (-t):  average revision length in bytes, default 2000
+--logs         (-l):  log items per page, default 1.0
+--parts        (-P):  number of parts for page content and log jobs, default 1
+--runs         (-R):  number of runs of each wiki, on consecutive dates, default 1
+--jobs         (-j):  comma-separated list of jobs to run one at a time,
+                      default: a full run of all jobs
+--skipjobs     (-s):  comma-separated list of jobs to skip, default:
+                      %s
+--rate         (-a):  bytes per second each stand-in process writes, 0 for
+                      as fast as possible, default 0
+--querytime    (-q):  seconds each sql query takes, default 0
+--startup      (-u):  seconds each maintenance script takes to start, default 0
+--querybackend (-b):  how the runner makes sql queries, default session
+--supervisor   (-S):  how commands run in parallel are watched, default threads
+--tableworkers (-T):  number of table dump jobs to run at once, default 1
+--inlinechecksums (-c): checksum output we save to files as it is written
+--rebalance:          choose page ranges of parts from the runtimes of the
+                      run before, for runs after the first
+--output       (-o):  write the results for each phase to this file as json
+--baseline     (-B):  compare the results to those in this file from --output
+--seed         (-e):  random seed, default 1
+--keep         (-k):  don't remove the directory with the wikis and dumps
+--help         (-h):  display this help message
+"""
+    sys.stderr.write(usage_message % ",".join(SKIP_JOBS))
+    sys.exit(1)
+
+
+def main():
+    '''
+    main entry point, does all the work
+    '''
+    settings = {'wikis': 1, 'pages': 2000, 'revs': 5, 'textsize': 2000, 'logs': 1.0,
+                'parts': 1, 'runs': 1, 'jobs': [], 'skipjobs': SKIP_JOBS, 'rate': 0,
+                'querytime': 0.0, 'startup': 0.0, 'querybackend': 'session',
+                'supervisor': 'threads', 'tableworkers': 1, 'inlinechecksums': False,
+                'rebalance': False, 'output': None, 'baseline': None, 'seed': 1,
+                'keep': False}
+    intopts = {'-w': 'wikis', '--wikis': 'wikis', '-p': 'pages', '--pages': 'pages',
+               '-r': 'revs', '--revs': 'revs', '-t': 'textsize', '--textsize': 'textsize',
+               '-P': 'parts', '--parts': 'parts', '-R': 'runs', '--runs': 'runs',
+               '-a': 'rate', '--rate': 'rate', '-e': 'seed', '--seed': 'seed',
+               '-T': 'tableworkers', '--tableworkers': 'tableworkers'}
+    floatopts = {'-l': 'logs', '--logs': 'logs', '-q': 'querytime', '--querytime': 'querytime',
+                 '-u': 'startup', '--startup': 'startup'}
+    try:
+        (options, remainder) = getopt.gnu_getopt(
+            sys.argv[1:], "w:p:r:t:l:P:R:j:s:a:q:u:b:S:T:o:B:e:ckh",
+            ["wikis=", "pages=", "revs=", "textsize=", "logs=", "parts=", "runs=",
+             "jobs=", "skipjobs=", "rate=", "querytime=", "startup=", "querybackend=",
+             "supervisor=", "tableworkers=", "output=", "baseline=", "seed=", "inlinechecksums",
+             "rebalance", "keep", "help"])
+    except getopt.GetoptError as err:
+        usage("Unknown option specified: " + str(err))
+    for (opt, val) in options:
+        if opt in intopts:
+            if not val.isdigit():
+                usage("%s argument requires a number" % opt)
+            settings[intopts[opt]] = int(val)
+        elif opt in floatopts:
+            try:
+                settings[floatopts[opt]] = float(val)
+            except ValueError:
+                usage("%s argument requires a number" % opt)
+        elif opt in ["-j", "--jobs"]:
+            settings['jobs'] = val.split(",")
+        elif opt in ["-s", "--skipjobs"]:
+            settings['skipjobs'] = val.split(",") if val else []
+        elif opt in ["-b", "--querybackend"]:
+            settings['querybackend'] = val
+        elif opt in ["-S", "--supervisor"]:
+            settings['supervisor'] = val
+        elif opt in ["-o", "--output"]:
+            settings['output'] = val
+        elif opt in ["-B", "--baseline"]:
+            settings['baseline'] = val
+        elif opt in ["-c", "--inlinechecksums"]:
+            settings['inlinechecksums'] = True
+        elif opt == "--rebalance":
+            settings['rebalance'] = True
+        elif opt in ["-k", "--keep"]:
+            settings['keep'] = True
+        elif opt in ["-h", "--help"]:
+            usage("Help for this script")
+    if remainder:
+        usage("Unknown option(s) specified: <%s>" % remainder[0])
+    if not settings['wikis'] or not settings['pages'] or not settings['parts']:
+        usage("--wikis, --pages and --parts must be at least 1")
+    if settings['querybackend'] not in ["session", "subprocess"]:
+        usage("--querybackend must be one of session, subprocess")
+    if settings['supervisor'] not in ["threads", "eventloop"]:
+        usage("--supervisor must be one of threads, eventloop")
+
+    workdir = tempfile.mkdtemp(prefix="runner_bench")
+    try:
+        run_bench(settings, workdir)
+    finally:
+        if settings['keep']:
+            print("wikis and dumps are in %s" % workdir)
+        else:
+            shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
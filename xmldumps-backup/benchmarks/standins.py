@@ -0,0 +1,492 @@
+#!/usr/bin/python3
+'''
+stand-ins for the MediaWiki maintenance scripts and the mysql tools
+the dumps run, producing output from the synthetic wiki databases
+made by benchmarks.synthwiki, so that the dump runner can be run
+without php, MediaWiki or a db server around
+
+the wrapper scripts written by write_wrappers() call main() with
+the name of the tool; how fast the tools go is set from these
+environment variables:
+
+DUMPSBENCH_DBDIR:      directory with the sqlite db for each wiki
+DUMPSBENCH_RATE:       bytes per second of output per process, 0 for no limit
+DUMPSBENCH_QUERYTIME:  seconds each sql query takes
+DUMPSBENCH_STARTUP:    seconds each maintenance script takes to get going
+'''
+
+import bz2
+import gzip
+import json
+import os
+import re
+import sqlite3
+import stat
+import sys
+import time
+
+from benchmarks.synthwiki import NS_NAMES, get_text, get_title
+
+MAINTENANCE_SCRIPTS = ["dumpBackup.php", "dumpTextPass.php", "getReplicaServer.php",
+                       "getConfiguration.php"]
+TOOLS = ["php", "mysql", "mysqldump"]
+
+WRAPPER = '''#!{python}
+import sys
+sys.path.insert(0, {path!r})
+from benchmarks import standins
+standins.main({tool!r}, sys.argv[1:])
+'''
+
+TEXT_STUB = re.compile(rb'^(\s*)<text bytes="(\d+)" sha1="([^"]*)" location="[^"]*" id="(\d+)" />')
+
+
+def write_wrappers(bindir, mwdir):
+    '''
+    write the php, mysql and mysqldump wrapper scripts into bindir,
+    and empty maintenance scripts for php to be given into mwdir,
+    returning a dict of the paths of the tools
+    '''
+    os.makedirs(bindir, exist_ok=True)
+    os.makedirs(os.path.join(mwdir, "maintenance"), exist_ok=True)
+    paths = {}
+    for tool in TOOLS:
+        paths[tool] = os.path.join(bindir, tool)
+        with open(paths[tool], "w") as outfile:
+            outfile.write(WRAPPER.format(
+                python=sys.executable, tool=tool,
+                path=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        os.chmod(paths[tool], stat.S_IRWXU)
+    for script in MAINTENANCE_SCRIPTS:
+        with open(os.path.join(mwdir, "maintenance", script), "w") as outfile:
+            outfile.write("<?php\n// stand-in, see benchmarks/standins.py\n")
+    return paths
+
+
+def get_setting(name):
+    '''
+    return the float value of the DUMPSBENCH_ environment variable
+    with the given name, 0 if it is not set
+    '''
+    return float(os.environ.get("DUMPSBENCH_" + name, 0))
+
+
+def get_db(wikidb):
+    '''
+    return a connection to the synthetic db for the wiki
+    '''
+    path = os.path.join(os.environ.get("DUMPSBENCH_DBDIR", "."), wikidb + ".sqlite")
+    if not os.path.exists(path):
+        sys.stderr.write("no synthetic db for %s\n" % wikidb)
+        sys.exit(1)
+    return sqlite3.connect(path)
+
+
+def get_option(args, name, default=None):
+    '''
+    return the value of --name=value or --name value from the args
+    '''
+    for index, arg in enumerate(args):
+        if arg.startswith("--%s=" % name):
+            return arg[len(name) + 3:]
+        if arg == "--" + name and index + 1 < len(args):
+            return args[index + 1]
+    return default
+
+
+class Throttle():
+    '''
+    an output file that writes no faster than DUMPSBENCH_RATE
+    bytes per second, and keeps track of how much was written
+    '''
+    def __init__(self, outfile):
+        self.outfile = outfile
+        self.rate = get_setting("RATE")
+        self.written = 0
+        self.started = time.time()
+
+    def write(self, data):
+        '''
+        write the data, then sleep if we are ahead of the rate
+        '''
+        self.outfile.write(data)
+        self.written += len(data)
+        if self.rate:
+            ahead = self.written / self.rate - (time.time() - self.started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    def close(self):
+        '''
+        close the underlying file, unless it's stdout
+        '''
+        if self.outfile is sys.stdout.buffer:
+            self.outfile.flush()
+        else:
+            self.outfile.close()
+
+
+def open_output(spec):
+    '''
+    given a dumpBackup.php output spec such as file:path or bzip2:path,
+    return a Throttle for writing to it
+    '''
+    kind, _sep, path = spec.partition(":")
+    if path == "/dev/stdout":
+        outfile = sys.stdout.buffer
+    elif kind == "gzip":
+        outfile = gzip.open(path, "wb", compresslevel=1)
+    elif kind in ["bzip2", "lbzip2", "dbzip2"]:
+        outfile = bz2.open(path, "wb", compresslevel=1)
+    else:
+        outfile = open(path, "wb")
+    return Throttle(outfile)
+
+
+def open_input(spec):
+    '''
+    given a dumpTextPass.php stub spec such as gzip:path,
+    return the file opened for reading
+    '''
+    kind, _sep, path = spec.partition(":")
+    if kind == "gzip":
+        return gzip.open(path, "rb")
+    if kind in ["bzip2", "lbzip2", "dbzip2"]:
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+
+def iso_time(timestamp):
+    '''
+    convert a mediawiki timestamp to the format in xml dumps
+    '''
+    return "%s-%s-%sT%s:%s:%sZ" % (timestamp[0:4], timestamp[4:6], timestamp[6:8],
+                                   timestamp[8:10], timestamp[10:12], timestamp[12:14])
+
+
+def get_header(wikidb):
+    '''
+    return the xml header with siteinfo for the wiki
+    '''
+    lines = ['<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/" '
+             'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+             'xsi:schemaLocation="http://www.mediawiki.org/xml/export-0.11/ '
+             'http://www.mediawiki.org/xml/export-0.11.xsd" version="0.11" xml:lang="en">',
+             '  <siteinfo>',
+             '    <sitename>Benchmark wiki</sitename>',
+             '    <dbname>%s</dbname>' % wikidb,
+             '    <base>https://%s.example.org/wiki/Main_Page</base>' % wikidb,
+             '    <generator>MediaWiki 1.43.0-wmf.1</generator>',
+             '    <case>first-letter</case>',
+             '    <namespaces>']
+    for namespace in sorted(NS_NAMES):
+        if NS_NAMES[namespace]:
+            lines.append('      <namespace key="%d" case="first-letter">%s</namespace>' % (
+                namespace, NS_NAMES[namespace]))
+        else:
+            lines.append('      <namespace key="0" case="first-letter" />')
+    lines.extend(['    </namespaces>', '  </siteinfo>'])
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def get_revision(row):
+    '''
+    return the xml stub for a revision row from the synthetic db
+    '''
+    rev_id, timestamp, actor, minor, length, sha1, parent = row
+    lines = ['    <revision>', '      <id>%d</id>' % rev_id]
+    if parent:
+        lines.append('      <parentid>%d</parentid>' % parent)
+    lines.extend(['      <timestamp>%s</timestamp>' % iso_time(timestamp),
+                  '      <contributor>',
+                  '        <username>Synthetic user %d</username>' % actor,
+                  '        <id>%d</id>' % (actor + 1),
+                  '      </contributor>'])
+    if minor:
+        lines.append('      <minor />')
+    lines.extend(['      <comment>synthetic edit %d</comment>' % rev_id,
+                  '      <model>wikitext</model>',
+                  '      <format>text/x-wiki</format>',
+                  '      <text bytes="%d" sha1="%s" location="tt:%d" id="%d" />' % (
+                      length, sha1, rev_id, rev_id),
+                  '      <sha1>%s</sha1>' % sha1,
+                  '    </revision>'])
+    return "\n".join(lines) + "\n"
+
+
+def get_page_ranges(args, conn, table, column):
+    '''
+    return the first id and the id after the last one to dump
+    '''
+    start = int(get_option(args, "start", 1))
+    end = get_option(args, "end")
+    if end is None:
+        end = (conn.execute("SELECT MAX(%s) FROM %s" % (column, table)).fetchone()[0] or 0) + 1
+    return start, int(end)
+
+
+def get_outputs(args):
+    '''
+    return a list of (output spec, list of filters) from the dumpBackup.php
+    args; filters apply to the output before them
+    '''
+    outputs = []
+    for arg in args:
+        if arg.startswith("--output="):
+            outputs.append((arg[len("--output="):], []))
+        elif arg.startswith("--filter=") and outputs:
+            outputs[-1][1].append(arg[len("--filter="):])
+    return outputs
+
+
+def page_wanted(namespace, filters):
+    '''
+    return True if a page in the namespace passes the filters
+    '''
+    if "notalk" in filters and namespace % 2:
+        return False
+    if "namespace:!NS_USER" in filters and namespace in [2, 3]:
+        return False
+    return True
+
+
+def dump_pages(args, conn, outfiles):
+    '''
+    write stubs for the pages and revisions asked for in the args
+    '''
+    start, end = get_page_ranges(args, conn, "page", "page_id")
+    pages = conn.execute("SELECT page_id, page_namespace, page_latest FROM page "
+                         "WHERE page_id >= ? AND page_id < ? ORDER BY page_id", (start, end))
+    for page_id, namespace, latest in pages.fetchall():
+        revs = conn.execute("SELECT rev_id, rev_timestamp, rev_actor, rev_minor_edit, rev_len, "
+                            "rev_sha1, rev_parent_id FROM revision WHERE rev_page = ? "
+                            "ORDER BY rev_id", (page_id,)).fetchall()
+        head = "  <page>\n    <title>%s</title>\n    <ns>%d</ns>\n    <id>%d</id>\n" % (
+            get_title(namespace, page_id), namespace, page_id)
+        for outfile, filters in outfiles:
+            if not page_wanted(namespace, filters):
+                continue
+            if "latest" in filters:
+                body = [get_revision(row) for row in revs if row[0] == latest]
+            else:
+                body = [get_revision(row) for row in revs]
+            outfile.write((head + "".join(body) + "  </page>\n").encode("utf-8"))
+
+
+def dump_logs(args, conn, outfiles):
+    '''
+    write the log items asked for in the args
+    '''
+    start, end = get_page_ranges(args, conn, "logging", "log_id")
+    rows = conn.execute("SELECT log_id, log_type, log_action, log_timestamp, log_actor, "
+                        "log_namespace, log_page, log_comment FROM logging "
+                        "WHERE log_id >= ? AND log_id < ? ORDER BY log_id", (start, end))
+    for log_id, log_type, log_action, timestamp, actor, namespace, page, comment in rows:
+        item = ("  <logitem>\n    <id>%d</id>\n    <timestamp>%s</timestamp>\n"
+                "    <contributor>\n      <username>Synthetic user %d</username>\n"
+                "      <id>%d</id>\n    </contributor>\n    <comment>%s</comment>\n"
+                "    <type>%s</type>\n    <action>%s</action>\n"
+                "    <logtitle>%s</logtitle>\n    <params xml:space=\"preserve\" />\n"
+                "  </logitem>\n" % (log_id, iso_time(timestamp), actor, actor + 1, comment,
+                                    log_type, log_action, get_title(namespace, page)))
+        for outfile, _filters in outfiles:
+            outfile.write(item.encode("utf-8"))
+
+
+def dump_backup(args):
+    '''
+    stand-in for dumpBackup.php, writes stubs or log items
+    '''
+    wikidb = get_option(args, "wiki")
+    conn = get_db(wikidb)
+    outfiles = [(open_output(spec), filters) for spec, filters in get_outputs(args)]
+    if not outfiles:
+        outfiles = [(open_output("file:/dev/stdout"), [])]
+    if "--skip-header" not in args:
+        for outfile, _filters in outfiles:
+            outfile.write(get_header(wikidb))
+    if "--logs" in args:
+        dump_logs(args, conn, outfiles)
+    else:
+        dump_pages(args, conn, outfiles)
+    for outfile, _filters in outfiles:
+        if "--skip-footer" not in args:
+            outfile.write(b"</mediawiki>\n")
+        outfile.close()
+
+
+def dump_text_pass(args):
+    '''
+    stand-in for dumpTextPass.php, fills in the revision
+    text for the stubs file given in the args
+    '''
+    stubs = open_input(get_option(args, "stub"))
+    outputs = get_outputs(args)
+    outfile = open_output(outputs[0][0] if outputs else "file:/dev/stdout")
+    for line in stubs:
+        found = TEXT_STUB.match(line)
+        if found:
+            indent, length, sha1, rev_id = found.groups()
+            line = b'%s<text bytes="%s" sha1="%s" xml:space="preserve">%s</text>\n' % (
+                indent, length, sha1, get_text(int(rev_id), int(length)))
+        outfile.write(line)
+    stubs.close()
+    outfile.close()
+
+
+def php(args):
+    '''
+    stand-in for php running a maintenance script
+    '''
+    if not args:
+        sys.stderr.write("usage: php script [args]\n")
+        sys.exit(1)
+    script = os.path.basename(args[0])
+    time.sleep(get_setting("STARTUP"))
+    if script == "dumpBackup.php":
+        dump_backup(args[1:])
+    elif script == "dumpTextPass.php":
+        dump_text_pass(args[1:])
+    elif script == "getReplicaServer.php":
+        print("dumpsbenchdb1001")
+    elif script == "getConfiguration.php":
+        print(json.dumps({"wgDBprefix": "", "wgCanonicalServer": "https://bench.example.org",
+                          "wgScriptPath": "/w"}))
+    else:
+        sys.stderr.write("no stand-in for %s\n" % script)
+        sys.exit(1)
+
+
+def get_db_name(args):
+    '''
+    return the first positional arg given to mysql or mysqldump
+    '''
+    skip = False
+    positional = []
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg in ["-h", "--port", "-u", "-P"]:
+            skip = True
+        elif not arg.startswith("-"):
+            positional.append(arg)
+    return positional
+
+
+def run_query(conn, dbname, query, header):
+    '''
+    run one query and return its output as the mysql client
+    formats it with -r --batch
+    '''
+    time.sleep(get_setting("QUERYTIME"))
+    if query.lower() == "show tables":
+        rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                            "ORDER BY name").fetchall()
+        columns = ["Tables_in_%s" % dbname]
+    else:
+        cursor = conn.execute(query)
+        rows = cursor.fetchall()
+        if cursor.description is None:
+            return b""
+        columns = [column[0] for column in cursor.description]
+    lines = ["\t".join(columns)] if header else []
+    for row in rows:
+        lines.append("\t".join(["NULL" if field is None else str(field) for field in row]))
+    return ("\n".join(lines) + "\n").encode("utf-8") if lines else b""
+
+
+def mysql(args):
+    '''
+    stand-in for the mysql client, runs queries from stdin one
+    at a time against the synthetic db, writing output as soon
+    as each one is done, so it works for long-running sessions too
+    '''
+    positional = get_db_name(args)
+    dbname = positional[0] if positional else None
+    conn = get_db(dbname) if dbname else None
+    header = "--silent" not in args and "-s" not in args
+    statement = b""
+    while True:
+        line = sys.stdin.buffer.readline()
+        statement += line
+        if line and not line.rstrip().endswith(b";"):
+            continue
+        query = statement.decode("utf-8").strip().rstrip(";").strip()
+        if len(query) > 1 and query[0] == query[-1] == "'":
+            # quoted for the shell but not by one
+            query = query[1:-1]
+        statement = b""
+        if query:
+            used = re.match(r"use `?([^`]+)`?$", query, re.IGNORECASE)
+            try:
+                if used:
+                    dbname = used.group(1)
+                    conn = get_db(dbname)
+                else:
+                    sys.stdout.buffer.write(run_query(conn, dbname, query, header))
+                    sys.stdout.buffer.flush()
+            except (sqlite3.Error, AttributeError) as ex:
+                sys.stderr.write("ERROR at query '%s': %s\n" % (query, ex))
+                if "--force" not in args:
+                    sys.exit(1)
+        if not line:
+            break
+
+
+def sql_value(value):
+    '''
+    format a value for an INSERT statement
+    '''
+    if value is None:
+        return "NULL"
+    if isinstance(value, str):
+        return "'%s'" % value.replace("\\", "\\\\").replace("'", "\\'")
+    return str(value)
+
+
+def mysqldump(args):
+    '''
+    stand-in for mysqldump of one table, extended inserts and all
+    '''
+    positional = get_db_name(args)
+    if len(positional) < 2:
+        sys.stderr.write("usage: mysqldump [options] db table\n")
+        sys.exit(1)
+    dbname, table = positional[:2]
+    conn = get_db(dbname)
+    time.sleep(get_setting("QUERYTIME"))
+    schema = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                          (table,)).fetchone()
+    if schema is None:
+        sys.stderr.write("mysqldump: Couldn't find table: \"%s\"\n" % table)
+        sys.exit(2)
+    outfile = Throttle(sys.stdout.buffer)
+    outfile.write(("-- MySQL dump 10.19  Distrib 10.6.16-MariaDB, for debian-linux-gnu\n--\n"
+                   "-- Host: dumpsbenchdb1001    Database: %s\n"
+                   "-- ------------------------------------------------------\n\n"
+                   "DROP TABLE IF EXISTS `%s`;\n%s;\n\n" % (
+                       dbname, table, schema[0].replace(
+                           "CREATE TABLE %s" % table, "CREATE TABLE `%s`" % table))).encode(
+                               "utf-8"))
+    values = []
+    size = 0
+    for row in conn.execute("SELECT * FROM %s" % table):
+        values.append("(%s)" % ",".join(sql_value(field) for field in row))
+        size += len(values[-1])
+        if size > 1000000:
+            outfile.write(("INSERT INTO `%s` VALUES %s;\n" % (table, ",".join(values))).encode(
+                "utf-8"))
+            values = []
+            size = 0
+    if values:
+        outfile.write(("INSERT INTO `%s` VALUES %s;\n" % (table, ",".join(values))).encode(
+            "utf-8"))
+    outfile.write(b"\n-- Dump completed\n")
+    outfile.close()
+
+
+def main(tool, args):
+    '''
+    run the stand-in for the named tool with the given args
+    '''
+    {"php": php, "mysql": mysql, "mysqldump": mysqldump}[tool](args)
@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+'''
+generate synthetic wikis for benchmarks: a sqlite database per
+wiki with the page, revision and logging tables and a few link
+tables, filled in with as many pages as you like
+
+the stand-in tools in benchmarks.standins answer queries and
+produce xml from these databases
+'''
+
+import hashlib
+import random
+import sqlite3
+
+NAMESPACES = [(0, 60), (1, 10), (2, 8), (3, 6), (4, 4), (6, 4), (10, 5), (14, 3)]
+NS_NAMES = {0: "", 1: "Talk", 2: "User", 3: "User talk", 4: "Project",
+            6: "File", 10: "Template", 14: "Category"}
+LOG_TYPES = [("create", "create"), ("delete", "delete"), ("move", "move"),
+             ("newusers", "create"), ("patrol", "patrol"), ("upload", "upload")]
+WORDS = [b"lorem", b"ipsum", b"dolor", b"sit", b"amet", b"consectetur", b"[[link]]",
+         b"adipiscing", b"elit", b"sed", b"do", b"eiusmod", b"{{template}}",
+         b"tempor", b"incididunt", b"ut", b"labore", b"et", b"dolore", b"magna\n"]
+
+SCHEMA = [
+    "CREATE TABLE page (page_id INTEGER PRIMARY KEY, page_namespace INTEGER, "
+    "page_title TEXT, page_is_redirect INTEGER, page_latest INTEGER, page_len INTEGER, "
+    "page_touched TEXT)",
+    "CREATE TABLE revision (rev_id INTEGER PRIMARY KEY, rev_page INTEGER, "
+    "rev_timestamp TEXT, rev_actor INTEGER, rev_minor_edit INTEGER, rev_len INTEGER, "
+    "rev_sha1 TEXT, rev_parent_id INTEGER)",
+    "CREATE INDEX rev_page_id ON revision (rev_page, rev_id)",
+    "CREATE TABLE logging (log_id INTEGER PRIMARY KEY, log_type TEXT, log_action TEXT, "
+    "log_timestamp TEXT, log_actor INTEGER, log_namespace INTEGER, log_title TEXT, "
+    "log_page INTEGER, log_comment TEXT)",
+    "CREATE TABLE pagelinks (pl_from INTEGER, pl_namespace INTEGER, pl_title TEXT)",
+    "CREATE TABLE categorylinks (cl_from INTEGER, cl_to TEXT, cl_sortkey TEXT, "
+    "cl_timestamp TEXT)",
+    "CREATE TABLE site_stats (ss_row_id INTEGER, ss_total_edits INTEGER, "
+    "ss_good_articles INTEGER, ss_total_pages INTEGER, ss_users INTEGER, ss_images INTEGER)",
+]
+
+
+def get_timestamp(seconds):
+    '''
+    return a mediawiki-style timestamp some number of seconds into 2001
+    '''
+    days, seconds = divmod(seconds, 86400)
+    return "%04d%02d%02d%02d%02d%02d" % (2001 + days // 336, days % 336 // 28 + 1,
+                                         days % 28 + 1, seconds // 3600,
+                                         seconds % 3600 // 60, seconds % 60)
+
+
+def get_text(rev_id, length):
+    '''
+    return length bytes of made-up wikitext for the revision, the
+    same every time for the same args, so that content jobs and
+    anyone checking them agree
+    '''
+    randomizer = random.Random(rev_id)
+    chunks = []
+    size = 0
+    while size < length:
+        word = WORDS[randomizer.randrange(len(WORDS))]
+        chunks.append(word)
+        size += len(word) + 1
+    return b" ".join(chunks)[:length]
+
+
+def get_title(namespace, page_id):
+    '''
+    return the title of a page with the prefix for its namespace
+    '''
+    if NS_NAMES[namespace]:
+        return "%s:Synthetic page %d" % (NS_NAMES[namespace], page_id)
+    return "Synthetic page %d" % page_id
+
+
+def make_wiki_db(path, settings, seed):
+    '''
+    write a sqlite db at path for a wiki with settings['pages']
+    pages, on average settings['revs'] revisions per page with
+    older (lower id) pages having more, revisions about
+    settings['textsize'] bytes long, and settings['logs'] log
+    entries per page
+
+    returns a dict of the number of pages, revisions and log
+    entries and the total revision text length
+    '''
+    randomizer = random.Random(seed)
+    conn = sqlite3.connect(path)
+    for statement in SCHEMA:
+        conn.execute(statement)
+    namespaces = [namespace for namespace, weight in NAMESPACES for _count in range(weight)]
+    pages = []
+    revs = []
+    links = []
+    rev_id = 0
+    totals = {'pages': settings['pages'], 'revs': 0, 'logs': 0, 'bytes': 0}
+    for page_id in range(1, settings['pages'] + 1):
+        namespace = namespaces[randomizer.randrange(len(namespaces))]
+        age = 1.0 - page_id / settings['pages']
+        revcount = max(1, int(settings['revs'] * (0.2 + 1.6 * age) *
+                              randomizer.lognormvariate(0, 0.75) / 1.32))
+        parent = 0
+        for _count in range(revcount):
+            rev_id += 1
+            length = max(1, int(randomizer.lognormvariate(0, 1) * settings['textsize'] / 1.65))
+            sha1 = hashlib.sha1(b"%d:%d" % (rev_id, length)).hexdigest()
+            revs.append((rev_id, page_id, get_timestamp(rev_id * 37), randomizer.randrange(500),
+                         randomizer.randrange(2), length, sha1, parent))
+            parent = rev_id
+            totals['bytes'] += length
+        pages.append((page_id, namespace, get_title(namespace, page_id).split(":")[-1].replace(
+            " ", "_"), 0, rev_id, length, get_timestamp(rev_id * 37)))
+        for _count in range(randomizer.randrange(8)):
+            links.append((page_id, 0, "Synthetic_page_%d" % randomizer.randint(
+                1, settings['pages'])))
+        if len(revs) > 50000:
+            conn.executemany("INSERT INTO revision VALUES (?,?,?,?,?,?,?,?)", revs)
+            revs = []
+    conn.executemany("INSERT INTO revision VALUES (?,?,?,?,?,?,?,?)", revs)
+    conn.executemany("INSERT INTO page VALUES (?,?,?,?,?,?,?)", pages)
+    conn.executemany("INSERT INTO pagelinks VALUES (?,?,?)", links)
+    conn.executemany("INSERT INTO categorylinks VALUES (?,?,?,?)", [
+        (page[0], "Synthetic_category_%d" % (page[0] % 97), page[2], page[6])
+        for page in pages if page[0] % 3 == 0])
+    totals['revs'] = rev_id
+
+    logs = []
+    for log_id in range(1, int(settings['pages'] * settings['logs']) + 1):
+        log_type, log_action = LOG_TYPES[randomizer.randrange(len(LOG_TYPES))]
+        page_id = randomizer.randint(1, settings['pages'])
+        logs.append((log_id, log_type, log_action, get_timestamp(log_id * 53),
+                     randomizer.randrange(500), 0, "Synthetic_page_%d" % page_id, page_id,
+                     "synthetic %s" % log_action))
+    conn.executemany("INSERT INTO logging VALUES (?,?,?,?,?,?,?,?,?)", logs)
+    totals['logs'] = len(logs)
+    conn.execute("INSERT INTO site_stats VALUES (1, ?, ?, ?, 500, 0)",
+                 (rev_id, len([page for page in pages if page[1] == 0]), len(pages)))
+    conn.commit()
+    conn.close()
+    return totals
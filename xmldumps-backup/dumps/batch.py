@@ -4,6 +4,7 @@ import fcntl
 import json
 import socket
 import random
+import sqlite3
 import time
 from dumps.fileutils import FileUtils
 from dumps.exceptions import BackupError
@@ -53,6 +54,11 @@ class BatchesFile():
         self.wiki = wiki
         self.jobname = jobname
         self.maxretries = maxretries
+        # if configured, batch info is kept in an sqlite db instead,
+        # and all reads and updates are passed on to it
+        self.ledger = None
+        if wiki.config.batch_ledger == 'sqlite':
+            self.ledger = BatchesLedger(self)
 
     def set_retries(self, maxretries):
         '''
@@ -94,13 +100,17 @@ class BatchesFile():
         return False
 
     def count_unclaimed_batches(self):
-        '''count and return the number of unclaimed batches,
-        returning 0 if there is not even a batchfile'''
+        '''count and return the number of batches available to be
+        claimed (unclaimed or aborted), returning 0 if there is not
+        even a batchfile'''
+        if self.ledger:
+            return self.ledger.count_unclaimed_batches()
         try:
             with open(self.get_path(), "r") as fhandle:
                 contents = fhandle.read()
                 batches_info = json.loads(contents)
-                return len(batches_info['batches'])
+                return len([entry for entry in batches_info['batches']
+                            if entry['batch']['status'] in ['unclaimed', 'aborted']])
         except Exception:
             return 0
 
@@ -234,6 +244,8 @@ class BatchesFile():
         if a range is specified that does not exist in the file,
         an exception will be raised
         '''
+        if self.ledger:
+            return self.ledger.do_update(batch_range, status, current_statuses)
         with open(self.get_path(), 'r+') as fhandle:
             if not self.get_lock(fhandle):
                 raise BackupError("failed to get lock on " + self.get_path())
@@ -298,6 +310,9 @@ class BatchesFile():
         create a file with all of the ranges in it (page ranges, row ranges, whatever)
         and a status of 'unclaimed' for each one, with some sensible defaults
         '''
+        if self.ledger:
+            self.ledger.create(ranges)
+            return
         if ranges is not None:
             ranges = sorted(list(set(ranges)), key=lambda thing: int(thing[0]))
             bad_ranges = self.sanity_check_ranges(ranges)
@@ -371,6 +386,215 @@ class BatchesFile():
         return self.do_update(batch_range, 'done', ['claimed'])
 
 
+class BatchesLedger():
+    '''
+    keep the batch info for a BatchesFile in an sqlite db, one row per
+    batch, instead of in a json file that must be read, searched and
+    rewritten in full for each update
+
+    each update is one transaction, so claims and status changes are
+    atomic without our having to lock and back up files; the db is in
+    WAL mode by default, so readers (counts, exports) don't block the
+    workers claiming batches.
+
+    WAL mode needs all processes using the db to be on the same host;
+    if batches are claimed by workers on several hosts sharing the private
+    dump dir, set batchledgerjournal=delete.
+    '''
+    # how many seconds to wait for another process to finish its update
+    LOCK_TIMEOUT = 60
+    FIELDS = ['start', 'end', 'status', 'host', 'pid',
+              'first_claimed', 'completed_time', 'runs']
+
+    def __init__(self, batchesfile):
+        self.batchesfile = batchesfile
+        self.wiki = batchesfile.wiki
+
+    def get_path(self):
+        '''return path to the sqlite db for the given wiki, date and job'''
+        return os.path.join(self.wiki.private_dir(), self.wiki.date,
+                            'batches-{jobname}.sqlite'.format(jobname=self.batchesfile.jobname))
+
+    def connect(self):
+        '''
+        return a connection to the db, creating the table if needed;
+        transactions are begun explicitly
+        '''
+        conn = sqlite3.connect(self.get_path(), timeout=self.LOCK_TIMEOUT,
+                               isolation_level=None)
+        conn.execute("PRAGMA journal_mode={mode}".format(
+            mode=self.wiki.config.batch_ledger_journal))
+        conn.execute("CREATE TABLE IF NOT EXISTS batches ("
+                     "id INTEGER PRIMARY KEY, start TEXT NOT NULL, end TEXT NOT NULL, "
+                     "status TEXT NOT NULL, host TEXT, pid INTEGER, first_claimed TEXT, "
+                     "completed_time TEXT, runs TEXT NOT NULL, UNIQUE (start, end))")
+        conn.execute("CREATE INDEX IF NOT EXISTS batches_status ON batches (status, id)")
+        return conn
+
+    @staticmethod
+    def row_to_entry(row):
+        '''
+        convert a row from the db (in FIELDS order) to a batch entry
+        in the format used in the json batches file
+        '''
+        entry = BatchesFile.get_default_batchinfo()
+        entry['owner'] = {'host': row[3], 'pid': row[4]}
+        entry['first_claimed'] = row[5]
+        entry['completed_time'] = row[6]
+        entry['runs'] = row[7]
+        entry['status'] = row[2]
+        entry['range'] = {'start': row[0], 'end': row[1]}
+        return {'batch': entry}
+
+    @staticmethod
+    def entry_to_row(entry):
+        '''
+        convert a batch entry in the json batches file format
+        to a tuple of values in FIELDS order
+        '''
+        batch = entry['batch']
+        return (batch['range']['start'], batch['range']['end'], batch['status'],
+                batch['owner']['host'], batch['owner']['pid'],
+                batch['first_claimed'], batch['completed_time'], batch['runs'])
+
+    def _replace_all(self, conn, entries):
+        '''
+        replace all batch rows with the given entries, in one transaction
+        '''
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM batches")
+        insert = "INSERT INTO batches ({fields}) VALUES ({marks})".format(
+            fields=", ".join(self.FIELDS), marks=", ".join(["?"] * len(self.FIELDS)))
+        conn.executemany(insert, [self.entry_to_row(entry) for entry in entries])
+        conn.execute("COMMIT")
+
+    def create(self, ranges):
+        '''
+        (re)create the batch rows from the ranges, all unclaimed
+        '''
+        if ranges is not None:
+            ranges = sorted(list(set(ranges)), key=lambda thing: int(thing[0]))
+            if BatchesFile.sanity_check_ranges(ranges):
+                raise BackupError("bad ranges passed")
+        entries = []
+        for batch_range in ranges or []:
+            new_entry = BatchesFile.get_default_batchinfo()
+            new_entry['range'] = {'start': str(batch_range[0]), 'end': str(batch_range[1])}
+            entries.append({'batch': new_entry})
+        conn = self.connect()
+        try:
+            self._replace_all(conn, entries)
+        finally:
+            conn.close()
+
+    def do_update(self, batch_range, status, current_statuses=None):
+        '''
+        same as BatchesFile.do_update, but the lookup of the batch
+        and the change of its status are done in one transaction
+        '''
+        if not os.path.exists(self.get_path()):
+            raise BackupError("batches ledger {path} does not exist".format(
+                path=self.get_path()))
+        conn = self.connect()
+        try:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError:
+                raise BackupError("failed to get lock on " + self.get_path())
+            try:
+                result = self._do_update(conn, batch_range, status, current_statuses)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        finally:
+            conn.close()
+
+    def _do_update(self, conn, batch_range, status, current_statuses):
+        '''
+        find the batch and update it, inside a transaction
+        '''
+        select = "SELECT id, {fields} FROM batches ".format(fields=", ".join(self.FIELDS))
+        if status == 'claimed' and batch_range is None:
+            # get the first entry and claim that, if there is one
+            row = conn.execute(
+                select + "WHERE status IN ({marks}) ORDER BY id LIMIT 1".format(
+                    marks=", ".join(["?"] * len(current_statuses))),
+                current_statuses).fetchone()
+            if not row:
+                # no entries left. done!
+                return None
+            batch_range = (row[1], row[2])
+        else:
+            row = conn.execute(select + "WHERE start = ? AND end = ?",
+                               (str(batch_range[0]), str(batch_range[1]))).fetchone()
+        if not row:
+            raise BackupError("batches ledger is missing the batch we are trying to update!")
+
+        if status == 'rerun':
+            status = 'claimed'
+        if status not in BatchesFile.STATUSES:
+            raise BackupError("bad status passed: " + status)
+
+        batch_entry = self.row_to_entry(row[1:])
+        if current_statuses is not None and batch_entry['batch']['status'] not in current_statuses:
+            return None
+        self.batchesfile._do_command(status, batch_entry)
+        update = "UPDATE batches SET {fields} WHERE id = ?".format(
+            fields=", ".join([field + " = ?" for field in self.FIELDS]))
+        conn.execute(update, self.entry_to_row(batch_entry) + (row[0],))
+        return batch_range
+
+    def count_unclaimed_batches(self):
+        '''
+        count and return the number of batches available to be claimed,
+        returning 0 if there is no ledger
+        '''
+        if not os.path.exists(self.get_path()):
+            return 0
+        conn = self.connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM batches WHERE status IN (?, ?)",
+                                ('unclaimed', 'aborted')).fetchone()[0]
+        finally:
+            conn.close()
+
+    def export_json(self, path=None):
+        '''
+        write the batch info out in the json batches file format, by default
+        to the path BatchesFile would use, for tools that read that file
+        '''
+        conn = self.connect()
+        try:
+            rows = conn.execute("SELECT {fields} FROM batches ORDER BY id".format(
+                fields=", ".join(self.FIELDS))).fetchall()
+        finally:
+            conn.close()
+        contents = json.dumps({'batches': [self.row_to_entry(row) for row in rows]})
+        if path is None:
+            path = self.batchesfile.get_path()
+        FileUtils.write_file(
+            FileUtils.wiki_tempdir(self.wiki.db_name, self.wiki.config.temp_dir,
+                                   create=True),
+            path, contents, int('0o644', 0))
+
+    def import_json(self, path=None):
+        '''
+        replace the batch info with the contents of a json batches file,
+        by default the one BatchesFile would use
+        '''
+        if path is None:
+            path = self.batchesfile.get_path()
+        with open(path, "r") as fhandle:
+            batches_info = json.loads(fhandle.read())
+        conn = self.connect()
+        try:
+            self._replace_all(conn, batches_info.get('batches', []))
+        finally:
+            conn.close()
+
+
 class BatchProgressCallback(ProgressCallback):
     def __init__(self, batchjobs):
         '''
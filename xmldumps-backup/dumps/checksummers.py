@@ -6,6 +6,7 @@ contain md5 or other checksums of dumps content
 import os
 import time
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 from dumps.fileutils import DumpContents, DumpFilename, FileUtils
 from dumps.specialfilesregistry import Registered
@@ -33,11 +34,9 @@ class Checksummer(Registered):
             # default
             ext = "txt"
 
-        if htype == "md5":
-            return "md5sums." + ext
-        if htype == "sha1":
-            return "sha1sums." + ext
-        return None
+        if not htype:
+            return None
+        return htype + "sums." + ext
 
     @staticmethod
     def get_checksum_basename_perfile(htype, filename):
@@ -46,11 +45,18 @@ class Checksummer(Registered):
         specific type will be written for the specified file
         this is only in txt format.
         '''
-        if htype == "md5":
-            return "md5sums-{fname}.txt".format(fname=filename)
-        if htype == "sha1":
-            return "sha1sums-{fname}.txt".format(fname=filename)
-        return None
+        if not htype:
+            return None
+        return "{htype}sums-{fname}.txt".format(htype=htype, fname=filename)
+
+    @staticmethod
+    def get_hashtypes(config):
+        """
+        return the list of hash types for which we produce checksum
+        files: md5 and sha1 always, plus any extras configured
+        """
+        return Checksummer.HASHTYPES + [htype for htype in config.checksum_extras
+                                        if htype not in Checksummer.HASHTYPES]
 
     @staticmethod
     def get_hashinfo(filename, jsoninfo):
@@ -112,6 +118,7 @@ class Checksummer(Registered):
         self.verbose = verbose
         self.timestamp = time.strftime("%Y%m%d%H%M%S", time.gmtime())
         self._enabled = enabled
+        self.hashtypes = Checksummer.get_hashtypes(wiki.config)
 
     def get_per_file_path(self, htype, filename):
         '''
@@ -128,7 +135,7 @@ class Checksummer(Registered):
         Call this at the start of the dump run, and move the file
         into the final location at the completion of the dump run."""
         if Checksummer.NAME in self._enabled:
-            for htype in Checksummer.HASHTYPES:
+            for htype in self.hashtypes:
                 for fmt in Checksummer.FORMATS:
                     checksum_filename = self._get_checksum_filename_tmp(htype, fmt)
                     with open(checksum_filename, "w") as output_fhandle:
@@ -136,25 +143,58 @@ class Checksummer(Registered):
                             output_fhandle.write(json.dumps({htype: {"files": {}}}))
                         output_fhandle.close()
 
-    def write_per_file_checksum(self, dfname, dumpjobdata, htype):
+    def write_per_file_checksums(self, dfname, dumpjobdata):
         '''
-        write out a per-file checksum of the specified type, if necessary,
-        returning the checksum if one was produced
+        write out per-file checksums of all hash types for which the
+        per-file checksum file is missing or older than the file itself,
+        reading the file only once for all of them
+        returns a dict of hash type: checksum for each checksum produced
         '''
-        per_file_path = self.get_per_file_path(htype, dfname.filename)
-        if not os.path.exists(per_file_path) or self.is_more_recent(
-                dumpjobdata.dump_dir.filename_public_path(dfname), per_file_path):
-            dcontents = DumpContents(
-                self.wiki, dumpjobdata.dump_dir.filename_public_path(dfname),
-                None, self.verbose)
-            dumpjobdata.debugfn("Checksumming %s via %s" % (dfname.filename, htype))
-            checksum = dcontents.checksum(htype)
-            if checksum is not None:
-                with open(per_file_path, "wt") as output_perfile_txt:
-                    output_perfile_txt.write("%s  %s\n" % (checksum, dfname.filename))
-                    output_perfile_txt.close()
-                return checksum
-        return None
+        path = dumpjobdata.dump_dir.filename_public_path(dfname)
+        htypes = []
+        for htype in self.hashtypes:
+            per_file_path = self.get_per_file_path(htype, dfname.filename)
+            if not os.path.exists(per_file_path) or self.is_more_recent(path, per_file_path):
+                htypes.append(htype)
+        if not htypes:
+            return {}
+
+        dcontents = DumpContents(self.wiki, path, None, self.verbose)
+        dumpjobdata.debugfn("Checksumming %s via %s" % (dfname.filename, ", ".join(htypes)))
+        sums = dcontents.checksums(htypes)
+        if not sums:
+            return {}
+        self.save_per_file_checksums(dfname, sums)
+        return sums
+
+    def save_per_file_checksums(self, dfname, sums):
+        '''
+        write out per-file checksums for the file from a dict of
+        hash type: checksum, which may have been computed elsewhere,
+        e.g. while the file was being written; this must be done once
+        the file is complete, or the checksums will be out of date
+        '''
+        for htype, checksum in sums.items():
+            with open(self.get_per_file_path(htype, dfname.filename), "wt") as output_perfile_txt:
+                output_perfile_txt.write("%s  %s\n" % (checksum, dfname.filename))
+
+    def get_file_checksums(self, dfname, dumpjobdata):
+        '''
+        return a dict of hash type: checksum for the file, computing the
+        ones that are not current, reading the rest from per-file checksum files;
+        checksums that could not be had are None
+        '''
+        sums = self.write_per_file_checksums(dfname, dumpjobdata)
+        for htype in self.hashtypes:
+            # no checksum file written because it's already there and is current,
+            # or no checksum was able to be generated. we'll try to read it from
+            # the file where it ought to be
+            if sums.get(htype) is None:
+                per_file_path = self.get_per_file_path(htype, dfname.filename)
+                dumpjobdata.debugfn("Reading %s checksum for %s from file %s" % (
+                    dfname.filename, htype, per_file_path))
+                sums[htype] = self.get_checksum_from_file(per_file_path)
+        return sums
 
     def checksums(self, dfname, dumpjobdata):
         """
@@ -162,46 +202,57 @@ class Checksummer(Registered):
         args:
             DumpFilename, ...
         """
-        if Checksummer.NAME in self._enabled:
-            for htype in Checksummer.HASHTYPES:
-                checksum_filename_txt = self._get_checksum_filename_tmp(htype, "txt")
-                checksum_filename_json = self._get_checksum_filename_tmp(htype, "json")
-                output_txt = open(checksum_filename_txt, "a")
-                # for txt file, append our new line. for json file, must read
-                # previous contents, stuff our new info into the dict, write it
-                # back out
-                output = {}
-                try:
-                    with open(checksum_filename_json, "r") as fhandle:
-                        contents = fhandle.read()
-                        output = json.loads(contents)
-                except Exception:
-                    # might be empty file, as at the start of a run
-                    pass
-                if not output:
-                    # at least let's not write new bad content into a
-                    # possibly corrupt file.
-                    output = {htype: {"files": {}}}
-                output_json = open(checksum_filename_json, "w")
-
-                checksum = self.write_per_file_checksum(dfname, dumpjobdata, htype)
-
-                # no checksum file written because it's already there and is current,
-                # or no checksum was able to be generated. we'll try to read it from
-                # the file where it ought to be
-                if checksum is None:
-                    per_file_path = self.get_per_file_path(htype, dfname.filename)
-                    dumpjobdata.debugfn("Reading %s checksum for %s from file %s" % (
-                        dfname.filename, htype, per_file_path))
-                    checksum = self.get_checksum_from_file(per_file_path)
-
-                if checksum is not None:
-                    output_txt.write("%s  %s\n" % (checksum, dfname.filename))
-                    output[htype]["files"][dfname.filename] = checksum
-                # always write a json stanza, even if no file info included.
+        self.checksums_for_files([dfname], dumpjobdata)
+
+    def checksums_for_files(self, dfnames, dumpjobdata):
+        """
+        Run checksums for a list of output files and append them to the lists.
+        Each file is read only once for all hash types, several files are
+        checksummed at the same time, and the temporary txt and json checksum
+        files are then each updated with one write.
+        args:
+            list of DumpFilename, ...
+        """
+        if Checksummer.NAME not in self._enabled:
+            return
+
+        if len(dfnames) > 1 and self.wiki.config.checksum_threads > 1:
+            with ThreadPoolExecutor(max_workers=self.wiki.config.checksum_threads) as executor:
+                all_sums = list(executor.map(
+                    lambda dfname: self.get_file_checksums(dfname, dumpjobdata), dfnames))
+        else:
+            all_sums = [self.get_file_checksums(dfname, dumpjobdata) for dfname in dfnames]
+
+        for htype in self.hashtypes:
+            checksum_filename_txt = self._get_checksum_filename_tmp(htype, "txt")
+            checksum_filename_json = self._get_checksum_filename_tmp(htype, "json")
+            # for txt file, append our new lines. for json file, must read
+            # previous contents, stuff our new info into the dict, write it
+            # back out
+            output = {}
+            try:
+                with open(checksum_filename_json, "r") as fhandle:
+                    contents = fhandle.read()
+                    output = json.loads(contents)
+            except Exception:
+                # might be empty file, as at the start of a run
+                pass
+            if not output:
+                # at least let's not write new bad content into a
+                # possibly corrupt file.
+                output = {htype: {"files": {}}}
+
+            lines = []
+            for dfname, sums in zip(dfnames, all_sums):
+                if sums[htype] is not None:
+                    lines.append("%s  %s\n" % (sums[htype], dfname.filename))
+                    output[htype]["files"][dfname.filename] = sums[htype]
+
+            with open(checksum_filename_txt, "a") as output_txt:
+                output_txt.write("".join(lines))
+            # always write a json stanza, even if no file info included.
+            with open(checksum_filename_json, "w") as output_json:
                 output_json.write(json.dumps(output))
-                output_txt.close()
-                output_json.close()
 
     def move_chksumfiles_into_place(self):
         """
@@ -211,7 +262,7 @@ class Checksummer(Registered):
         into permanent location
         """
         if Checksummer.NAME in self._enabled:
-            for htype in Checksummer.HASHTYPES:
+            for htype in self.hashtypes:
                 for fmt in Checksummer.FORMATS:
                     tmp_filename = self._get_checksum_filename_tmp(htype, fmt)
                     real_filename = self._get_checksum_path(htype, fmt)
@@ -225,7 +276,7 @@ class Checksummer(Registered):
         completes
         """
         if Checksummer.NAME in self._enabled:
-            for htype in Checksummer.HASHTYPES:
+            for htype in self.hashtypes:
                 for fmt in Checksummer.FORMATS:
                     tmp_filename = self._get_checksum_filename_tmp(htype, fmt)
                     real_filename = self._get_checksum_path(htype, fmt)
@@ -240,7 +291,7 @@ class Checksummer(Registered):
         return a list of all checksum files in all formats
         """
         files = []
-        for htype in Checksummer.HASHTYPES:
+        for htype in self.hashtypes:
             for fmt in Checksummer.FORMATS:
                 files.append(self._get_checksum_filename(htype, fmt))
         return files
@@ -1,15 +1,130 @@
+import hashlib
 import os
 import sys
 import select
+import selectors
 import signal
 import queue
 import fcntl
 import threading
+import time
+from collections import deque
 
 from subprocess import Popen, PIPE
 
 
-# FIXME no explicit stderr handling, is this ok?
+class ProcessAccounting():
+    """
+    Resource usage of one process in a command pipeline: wall time,
+    plus user and system cpu time and peak rss from wait4() when the
+    process is reaped. Bytes written (to anything, and to storage) are
+    sampled from /proc while the process runs, since they are gone once
+    it exits. Time the process spent off the cpu, waiting on pipes, disk
+    or the scheduler, is the wall time less the cpu time.
+    """
+    def __init__(self, command_string, pid):
+        self.command = command_string
+        self.pid = pid
+        self.started = time.time()
+        self.ended = None
+        self.exitcode = None
+        self.user = None
+        self.sys = None
+        self.maxrss_kb = None
+        self.written = {'wchar': 0, 'write_bytes': 0}
+
+    def sample(self):
+        """
+        read the byte counts and peak rss so far for the process
+        from /proc, if it is still around
+        """
+        if self.ended is not None:
+            return
+        try:
+            with open("/proc/%s/io" % self.pid, "r") as infile:
+                for line in infile:
+                    field, value = line.split(":", 1)
+                    if field in self.written:
+                        self.written[field] = int(value)
+            with open("/proc/%s/status" % self.pid, "r") as infile:
+                for line in infile:
+                    if line.startswith("VmHWM:"):
+                        self.maxrss_kb = int(line.split()[1])
+        except (IOError, ValueError):
+            # gone already, or we aren't allowed to look
+            pass
+
+    def finish(self, exitcode, rusage=None):
+        """
+        record the end of the process with the exit code and
+        the rusage from wait4(), if we have it
+        """
+        if self.ended is not None:
+            return
+        self.ended = time.time()
+        self.exitcode = exitcode
+        if rusage is not None:
+            self.user = rusage.ru_utime
+            self.sys = rusage.ru_stime
+            # in kilobytes on linux
+            self.maxrss_kb = rusage.ru_maxrss
+
+    def get_stats(self):
+        """
+        return a dict of the resource usage of the process
+        """
+        ended = self.ended if self.ended is not None else time.time()
+        wall = ended - self.started
+        stats = {'command': self.command, 'pid': self.pid, 'exitcode': self.exitcode,
+                 'wall': round(wall, 3), 'user': self.user, 'sys': self.sys,
+                 'wait': None, 'maxrss_kb': self.maxrss_kb,
+                 'wchar': self.written['wchar'], 'write_bytes': self.written['write_bytes']}
+        if self.user is not None:
+            stats['wait'] = round(max(wall - self.user - self.sys, 0), 3)
+        return stats
+
+
+class OutputHasher(threading.Thread):
+    """
+    Copy the output of the last command of a pipeline from a pipe into
+    the pipeline's save file, computing checksums of the given hash
+    types over the data on the way through, so that the file need not
+    be read back in afterwards to checksum it. If the save file can't
+    be written, the pipe is closed so that the command gets SIGPIPE.
+    """
+    READ_SIZE = 1048576
+
+    def __init__(self, infd, outfile, hashtypes):
+        super().__init__()
+        self.daemon = True
+        self._infd = infd
+        self._outfile = outfile
+        self._hashers = {htype: hashlib.new(htype) for htype in hashtypes}
+        self.error = None
+
+    def run(self):
+        try:
+            while True:
+                data = os.read(self._infd, OutputHasher.READ_SIZE)
+                if not data:
+                    break
+                for hasher in self._hashers.values():
+                    hasher.update(data)
+                self._outfile.write(data)
+            self._outfile.flush()
+        except (IOError, OSError) as ex:
+            self.error = ex
+        finally:
+            os.close(self._infd)
+
+    def get_digests(self):
+        """
+        return a dict of hash type: hex digest of everything copied,
+        or None if the copy failed
+        """
+        if self.error is not None:
+            return None
+        return {htype: hasher.hexdigest() for htype, hasher in self._hashers.items()}
 
 
 class CommandPipeline():
@@ -21,8 +136,11 @@ class CommandPipeline():
     the output of the pipeline will be written into the specified file.
     If the last command in the pipeline has at the end of the arg list >> filename then
     the output of the pipeline will be appended to the specified file.
+    If hashtypes is a list of hash types (as hashlib names them) and the output
+    of the pipeline is written (not appended) into a file, checksums of those
+    types are computed as the file is written; see get_digests().
     """
-    def __init__(self, commands, quiet=False, shell=False):
+    def __init__(self, commands, quiet=False, shell=False, hashtypes=None):
         if not isinstance(commands, list):
             self._commands = [commands]
         else:
@@ -38,6 +156,10 @@ class CommandPipeline():
         self._quiet = quiet
         self._poller = None
         self._shell = shell
+        self._accounting = []
+        self._last_sampled = 0
+        self._hashtypes = hashtypes
+        self._hasher = None
         command_strings = []
         for command in self._commands:
             command_strings.append(" ".join(command))
@@ -82,9 +204,19 @@ class CommandPipeline():
         if self._save_filename:
             if self._append:
                 self._save_fhandle = open(self._save_filename, "a")
+            elif self.hashes_output():
+                # our hasher copies the raw bytes in
+                self._save_fhandle = open(self._save_filename, "wb")
             else:
                 self._save_fhandle = open(self._save_filename, "w")
 
+    def hashes_output(self):
+        """
+        return True if checksums of the save file are to be
+        computed as it is written
+        """
+        return bool(self._hashtypes and self._save_filename and not self._append)
+
     def subprocess_setup(self):
         # Python installs a SIGPIPE handler by default. This is usually not what
         # non-Python subprocesses expect.
@@ -96,6 +228,11 @@ class CommandPipeline():
         if self.save_filename():
             if not self.save_file():
                 self.open_save_file()
+        # all processes in the pipeline write their errors to one pipe, which
+        # we read from as stderr of the last process; we only ever read from
+        # the last process, and anything earlier would otherwise block once
+        # its own stderr pipe filled up
+        (stderr_read, stderr_write) = os.pipe()
         for command in self._commands:
             command_string = " ".join(command)
             redacted_command_string = " ".join(redact_command_parameters(command))
@@ -110,13 +247,18 @@ class CommandPipeline():
             else:
                 stdin_opt = previous_process.stdout
 
-            # last cmd in pipe might write to an output file
+            # last cmd in pipe might write to an output file,
+            # or to our hasher which writes the file for it
+            hasher_fd = None
             if (command == self._commands[-1]) and (self.save_file()):
-                stdout_opt = self.save_file()
+                if self.hashes_output():
+                    (hasher_fd, stdout_opt) = os.pipe()
+                else:
+                    stdout_opt = self.save_file()
             else:
                 stdout_opt = PIPE
 
-            stderr_opt = PIPE
+            stderr_opt = stderr_write
 
             process = Popen(command, stdout=stdout_opt,    # pylint: disable=subprocess-popen-preexec-fn
                             stdin=stdin_opt, stderr=stderr_opt,
@@ -130,12 +272,19 @@ class CommandPipeline():
                 # will never get sigpipe. (which it should so it can bail)
             if previous_process:
                 previous_process.stdout.close()
+            if hasher_fd is not None:
+                os.close(stdout_opt)
+                self._hasher = OutputHasher(hasher_fd, self.save_file(), self._hashtypes)
+                self._hasher.start()
 
             if not self._quiet:
                 print("command %s (%s) started... " % (redacted_command_string, process.pid))
             self._processes.append(process)
+            self._accounting.append(ProcessAccounting(redacted_command_string, process.pid))
             previous_process = process
 
+        os.close(stderr_write)
+        process.stderr = os.fdopen(stderr_read, "rb")
         self._last_process_in_pipe = process
         self._last_command_string = command_string
 
@@ -151,10 +300,17 @@ class CommandPipeline():
         # will hang forever in the wait() on them.
         self._processes.reverse()
         for proc in self._processes:
-            self._exit_values.append(proc.wait())
-            proc.poll()
+            self._exit_values.append(self.reap_process(proc))
         self._exit_values.reverse()
         self._processes.reverse()
+        if self._hasher is not None:
+            self._hasher.join()
+            if self._hasher.error is not None:
+                if not self._quiet:
+                    print("failed to write %s (%s)" % (self._save_filename, self._hasher.error))
+                # the output is lost, whatever the command thinks
+                if self._exit_values[-1] == 0:
+                    self._exit_values[-1] = 1
         if self.save_file():
             self.save_file().close()
 
@@ -169,13 +325,85 @@ class CommandPipeline():
         """Check if process is running."""
         # Note that poll() returns None if the process
         # is not completed, or some value (may be 0) otherwise
-        if self._last_process_in_pipe.poll() is None:
+        if self.reap_process(self._last_process_in_pipe, block=False) is None:
             return True
         return False
 
+    def reap_process(self, proc, block=True):
+        """
+        wait for the process (one of ours) to exit if block is set, or
+        just check if it has, and return its exit code or None if it is
+        still running; we use wait4() rather than letting Popen reap it,
+        so that we can record its resource usage
+        """
+        accounting = [entry for entry in self._accounting if entry.pid == proc.pid][0]
+        if proc.returncode is not None:
+            # reaped via Popen, e.g. by communicate(), so no rusage
+            accounting.finish(proc.returncode)
+            return proc.returncode
+        try:
+            # wait without reaping, so that the last byte counts
+            # can still be read from /proc
+            if os.waitid(os.P_PID, proc.pid,
+                         os.WEXITED | os.WNOWAIT | (0 if block else os.WNOHANG)) is None:
+                return None
+            accounting.sample()
+            (_pid, status, rusage) = os.wait4(proc.pid, 0)
+        except ChildProcessError:
+            # someone else reaped it; Popen will sort out the exit code
+            returncode = proc.wait() if block else proc.poll()
+            if returncode is not None:
+                accounting.finish(returncode)
+            return returncode
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        accounting.finish(proc.returncode, rusage)
+        return proc.returncode
+
+    def sample_processes(self, interval=1):
+        """
+        sample /proc info for the processes in the pipeline that are
+        still running, at most once per interval (in seconds)
+        """
+        now = time.time()
+        if now - self._last_sampled < interval:
+            return
+        self._last_sampled = now
+        for accounting in self._accounting:
+            accounting.sample()
+
+    def get_process_stats(self):
+        """
+        return a list of dicts with the resource usage of each process
+        started in the pipeline, in pipeline order
+        """
+        return [accounting.get_stats() for accounting in self._accounting]
+
+    def get_wall_time(self):
+        """
+        return the seconds from the start of the pipeline until its last
+        process exited (or until now, for processes not yet reaped), or
+        None if it was never started
+        """
+        if not self._accounting:
+            return None
+        started = min(entry.started for entry in self._accounting)
+        ended = max(entry.ended if entry.ended is not None else time.time()
+                    for entry in self._accounting)
+        return round(ended - started, 3)
+
     def save_filename(self):
         return self._save_filename
 
+    def get_digests(self):
+        """
+        return a dict of hash type: hex digest of the save file, if
+        checksums were computed as it was written and the pipeline
+        has completed, None otherwise
+        """
+        if self._hasher is None or self._hasher.is_alive():
+            return None
+        return self._hasher.get_digests()
+
     def exited_successfully(self):
         for value in self._exit_values:
             if value != 0:
@@ -213,6 +441,10 @@ class CommandPipeline():
     def process_to_poll(self):
         return self._last_process_in_pipe
 
+    def processes(self):
+        """Return the list of processes started for the pipeline"""
+        return self._processes
+
     def process_to_write_to(self):
         return self._first_process_in_pipe
 
@@ -325,13 +557,17 @@ class CommandSeries():
     """Run a list of command pipelines in serial (e.g.
     tar cvfp distro/ distro.tar; chmod 644 distro.tar  )
     It takes as args: series of pipelines (each pipeline is a list of commands)"""
-    def __init__(self, commandSeries, quiet=False, shell=False):
+    def __init__(self, commandSeries, quiet=False, shell=False, hashtypes=None):
         self._command_series = commandSeries
         self._command_pipelines = []
         for pipeline in commandSeries:
-            self._command_pipelines.append(CommandPipeline(pipeline, quiet, shell))
+            self._command_pipelines.append(CommandPipeline(pipeline, quiet, shell, hashtypes))
         self._in_progress_pipeline = None
 
+    def command_series(self):
+        """Return the series of pipelines (lists of commands) as passed in"""
+        return self._command_series
+
     def start_commands(self, read_input_from_caller=False):
         self._command_pipelines[0].start_commands(read_input_from_caller)
         self._in_progress_pipeline = self._command_pipelines[0]
@@ -375,6 +611,34 @@ class CommandSeries():
         return [pipeline for pipeline in self._command_pipelines
                 if not pipeline.exited_successfully()]
 
+    def get_process_stats(self):
+        """Return list of dicts with the resource usage of each process
+        started for the series so far"""
+        stats = []
+        for pipeline in self._command_pipelines:
+            stats.extend(pipeline.get_process_stats())
+        return stats
+
+    def get_wall_time(self):
+        """Return the seconds the pipelines of the series that were started
+        took to run, one after another, or None if none were started"""
+        walls = [pipeline.get_wall_time() for pipeline in self._command_pipelines]
+        walls = [wall for wall in walls if wall is not None]
+        if not walls:
+            return None
+        return round(sum(walls), 3)
+
+    def get_output_digests(self):
+        """Return a dict of save file path: dict of hash type: hex digest,
+        for the save files of completed pipelines in the series that were
+        checksummed as they were written"""
+        digests = {}
+        for pipeline in self._command_pipelines:
+            pipeline_digests = pipeline.get_digests()
+            if pipeline_digests:
+                digests[pipeline.save_filename()] = pipeline_digests
+        return digests
+
     def all_output_read_from_pipeline(self):
         '''
         check that we have all the output from the pipeline currently
@@ -394,14 +658,19 @@ class CommandSeries():
             # get exit codes and run the next one
             if (self.all_output_read_from_pipeline() and
                     not self._in_progress_pipeline.is_running()):
-                self._in_progress_pipeline.set_return_codes()
-                # oohh ohhh start thenext one, w00t!
-                index = self._command_pipelines.index(self._in_progress_pipeline)
-                if index + 1 < len(self._command_pipelines):
-                    self._in_progress_pipeline = self._command_pipelines[index + 1]
-                    self._in_progress_pipeline.start_commands(read_input_from_caller)
-                else:
-                    self._in_progress_pipeline = None
+                self.start_next_pipeline(read_input_from_caller)
+
+    def start_next_pipeline(self, read_input_from_caller=False):
+        """Get the exit codes of the pipeline that was running, which
+        must have completed, and start the next one in the series if any"""
+        self._in_progress_pipeline.set_return_codes()
+        # oohh ohhh start thenext one, w00t!
+        index = self._command_pipelines.index(self._in_progress_pipeline)
+        if index + 1 < len(self._command_pipelines):
+            self._in_progress_pipeline = self._command_pipelines[index + 1]
+            self._in_progress_pipeline.start_commands(read_input_from_caller)
+        else:
+            self._in_progress_pipeline = None
 
     def get_one_line_of_output_if_ready(self):
         """This will retrieve one line of output from the end of the currently
@@ -424,11 +693,31 @@ class CommandSeries():
     #            break
 
 
+def series_should_start(callback_should_start, callback_should_start_arg, series):
+    """
+    let the caller veto a queued series just before it would be started,
+    for example because its output was produced elsewhere in the meantime;
+    both supervisors check with this, so they start the same series
+    """
+    if callback_should_start is None:
+        return True
+    if callback_should_start_arg:
+        return callback_should_start(callback_should_start_arg, series)
+    return callback_should_start(series)
+
+
 class ProcessMonitor(threading.Thread):
+    """
+    Start and watch command series taken from a shared queue, one at a time,
+    until the queue is empty. Running several of these against the same queue
+    gives a pool of slots: as soon as one series completes, its slot starts
+    the next queued series.
+    """
     def __init__(self, timeout, cmdqueue, output_queue, default_callback_interval,
                  callback_stderr, callbackStdout, callback_timed,
                  callback_stderr_arg, callbackStdoutArg, callback_timed_arg,
-                 callback_on_completion):
+                 callback_on_completion, callback_should_start=None,
+                 callback_should_start_arg=None):
         threading.Thread.__init__(self)
         self.timeout = timeout
         self.cmdqueue = cmdqueue
@@ -441,53 +730,59 @@ class ProcessMonitor(threading.Thread):
         self._callback_stdout_arg = callbackStdoutArg
         self._callback_timed_arg = callback_timed_arg
         self._callback_on_completion = callback_on_completion
+        self._callback_should_start = callback_should_start
+        self._callback_should_start_arg = callback_should_start_arg
 
-    # one of these as a thread to monitor each command series.
     def run(self):
-        series = self.cmdqueue.get()
+        while True:
+            try:
+                series = self.cmdqueue.get_nowait()
+            except queue.Empty:
+                # nothing left to start, this slot is done
+                return
+            if series_should_start(self._callback_should_start,
+                                   self._callback_should_start_arg, series):
+                series.start_commands()
+                self.monitor_series(series)
+            self.cmdqueue.task_done()
+
+    def monitor_series(self, series):
+        """
+        collect output from the running series, run the next pipeline in it
+        whenever one completes, and invoke the completion callback at the end
+        """
         while series.process_producing_output():
             proc = series.process_producing_output()
             poller = select.poll()
-            poller.register(proc.stderr, select.POLLIN | select.POLLPRI)
-            fderr = proc.stderr.fileno()
-            flerr = fcntl.fcntl(fderr, fcntl.F_GETFL)
-            fcntl.fcntl(fderr, fcntl.F_SETFL, flerr | os.O_NONBLOCK)
-            if proc.stdout:
-                poller.register(proc.stdout, select.POLLIN | select.POLLPRI)
-                fdout = proc.stdout.fileno()
-                flout = fcntl.fcntl(fdout, fcntl.F_GETFL)
-                fcntl.fcntl(fdout, fcntl.F_SETFL, flout | os.O_NONBLOCK)
-
-            command_completed = False
+            # output we read until eof, by fd
+            channels = {}
+            for (channel, fileobj) in [(OutputQueueItem.get_stderr_channel(), proc.stderr),
+                                       (OutputQueueItem.get_stdout_channel(), proc.stdout)]:
+                if fileobj is None:
+                    continue
+                poller.register(fileobj, select.POLLIN | select.POLLPRI)
+                filed = fileobj.fileno()
+                flags = fcntl.fcntl(filed, fcntl.F_GETFL)
+                fcntl.fcntl(filed, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+                channels[filed] = channel
 
             waited = 0
-            while not command_completed:
+            # stderr is closed only once every process in the pipeline
+            # has exited, so we keep reading until there's nothing left
+            while channels:
                 waiting = poller.poll(self.timeout)
-                if waiting:
-                    for (filed, event) in waiting:
-                        series.in_progress_pipeline().set_poll_state(event)
-                        if series.in_progress_pipeline().check_poll_ready_for_read():
-                            out = os.read(filed, 1024)
-                            if out:
-                                if filed == proc.stderr.fileno():
-                                    self.output_queue.put(
-                                        OutputQueueItem(
-                                            OutputQueueItem.get_stderr_channel(), out))
-                                elif filed == proc.stdout.fileno():
-                                    self.output_queue.put(
-                                        OutputQueueItem(
-                                            OutputQueueItem.get_stdout_channel(), out))
-                            else:
-                                # possible eof? what would cause this?
-                                pass
-                        elif series.in_progress_pipeline().check_for_poll_errors():
-                            poller.unregister(filed)
-                            # FIXME if it closed prematurely and then runs for hours to completion
-                            # we will get no updates here...
-                            proc.wait()
-                            # FIXME put the returncode someplace?
-                            print("returned from %s with %s" % (proc.pid, proc.returncode))
-                            command_completed = True
+                series.in_progress_pipeline().sample_processes()
+                for (filed, _event) in waiting:
+                    try:
+                        out = os.read(filed, 1024)
+                    except BlockingIOError:
+                        continue
+                    if out:
+                        self.output_queue.put(OutputQueueItem(channels[filed], out))
+                    else:
+                        # eof, or the other end went away
+                        poller.unregister(filed)
+                        del channels[filed]
 
                 waited = waited + self.timeout
                 if waited > self._default_callback_interval and self._callback_timed:
@@ -496,6 +791,11 @@ class ProcessMonitor(threading.Thread):
                     else:
                         self._callback_timed()
                     waited = 0
+            # every fd hung up and was read dry
+            series.in_progress_pipeline().set_poll_state(select.POLLHUP)
+            series.in_progress_pipeline().reap_process(proc)
+            # FIXME put the returncode someplace?
+            print("returned from %s with %s" % (proc.pid, proc.returncode))
 
             # run next command in series, if any
             series.continue_commands()
@@ -505,8 +805,6 @@ class ProcessMonitor(threading.Thread):
             # let caller do any bookkeeping or other work on command completion
             self._callback_on_completion(series)
 
-        self.cmdqueue.task_done()
-
 
 class OutputQueueItem():
     def __init__(self, channel, contents):
@@ -534,11 +832,19 @@ class CommandsInParallel():
     to the callback function first before the output line).  If no callback is provided
     and the individual pipelines are not provided with a file to save output,
     then output is written to stderr.
-    Callbackinterval is in milliseconds, defaults is 20 seconds"""
+    Callbackinterval is in milliseconds, defaults is 20 seconds
+    If slots is given, at most that many series run at once; the rest wait in
+    a queue and each is started as soon as any running series completes, so
+    that one long series does not leave the other slots idle. If a
+    callback_should_start is given, it is called (with callback_should_start_arg
+    first, if set) with each CommandSeries right before it would be started, and
+    the series is skipped if it returns False. If hashtypes is given, it is passed
+    on to each CommandPipeline, see there."""
     def __init__(self, command_series_list, callback_stderr=None, callbackStdout=None,
                  callback_timed=None, callback_stderr_arg=None, callbackStdoutArg=None,
                  callback_timed_arg=None, quiet=False, shell=False, callback_interval=20000,
-                 callback_on_completion=None):
+                 callback_on_completion=None, slots=None, callback_should_start=None,
+                 callback_should_start_arg=None, hashtypes=None):
         from .utils import is_nested_list_empty
         if is_nested_list_empty(command_series_list):
             print("WARNING: CommandsInParallel was given an empty series of pipelines!")
@@ -546,7 +852,7 @@ class CommandsInParallel():
         self._command_series_list = command_series_list
         self._command_serieses = []
         for series in self._command_series_list:
-            self._command_serieses.append(CommandSeries(series, quiet, shell))
+            self._command_serieses.append(CommandSeries(series, quiet, shell, hashtypes))
         # for each command series running in parallel,
         # in cases where a command pipeline in the series generates output, the callback
         # will be called with a line of output from the pipeline as it becomes available
@@ -557,6 +863,12 @@ class CommandsInParallel():
         self._callback_stdout_arg = callbackStdoutArg
         self._callback_timed_arg = callback_timed_arg
         self._callback_on_completion = callback_on_completion
+        self._callback_should_start = callback_should_start
+        self._callback_should_start_arg = callback_should_start_arg
+        if not slots or slots > len(self._command_serieses):
+            # everything runs at once
+            slots = len(self._command_serieses)
+        self._slots = slots
         self._command_series_queue = queue.Queue()
         self._output_queue = queue.Queue()
         self._normal_thread_count = threading.activeCount()
@@ -569,18 +881,27 @@ class CommandsInParallel():
         self._default_callback_interval = callback_interval
 
     def start_commands(self):
+        """
+        queue up all the command series; they are started by the
+        monitor threads as slots become free
+        """
         for series in self._command_serieses:
-            series.start_commands()
+            self._command_series_queue.put(series)
 
     def setup_output_monitoring(self):
-        for series in self._command_serieses:
-            self._command_series_queue.put(series)
+        """
+        start one monitor thread per slot; each starts and watches
+        queued command series until there are none left
+        """
+        for _slot in range(self._slots):
             thrd = ProcessMonitor(500, self._command_series_queue,
                                   self._output_queue, self._default_callback_interval,
                                   self._callback_stderr, self._callback_stdout,
                                   self._callback_timed, self._callback_stderr_arg,
                                   self._callback_stdout_arg, self._callback_timed_arg,
-                                  self._callback_on_completion)
+                                  self._callback_on_completion,
+                                  self._callback_should_start,
+                                  self._callback_should_start_arg)
             # when the main script dies this thread must too.
             thrd.daemon = True
             thrd.start()
@@ -613,34 +934,50 @@ class CommandsInParallel():
                 commands.extend(series.pipelines_with_errors())
         return commands
 
+    def get_process_stats(self):
+        """
+        return a list with an entry for each command series, a dict with
+        the series as passed in, the resource usage of each of its
+        processes that were started, and the wall time of the series
+        """
+        return [{'series': series.command_series(), 'commands': series.get_process_stats(),
+                 'wall': series.get_wall_time()}
+                for series in self._command_serieses]
+
     def watch_output_queue(self):
-        done = False
-        while not done:
-            # check the number of threads active, if they are all gone we are done
-            if threading.activeCount() == self._normal_thread_count:
-                done = True
-            output = None
+        while True:
+            # check the number of threads active, if they are all gone we are
+            # done once we have handled everything they queued up
+            done = threading.activeCount() == self._normal_thread_count
             try:
                 output = self._output_queue.get(True, 1)
-            except Exception as ex:
-                pass
-            if output:
-                if output.channel == OutputQueueItem.get_stdout_channel():
-                    if self._callback_stdout:
-                        if self._callback_stdout_arg:
-                            self._callback_stdout(self._callback_stdout_arg, output.contents)
-                        else:
-                            self._callback_stdout(output.contents)
-                    else:
-                        sys.stderr.write(output.contents.decode('utf-8'))
-                else:  # output channel is stderr
-                    if self._callback_stderr:
-                        if self._callback_stderr_arg:
-                            self._callback_stderr(self._callback_stderr_arg, output.contents)
-                        else:
-                            self._callback_stderr(output.contents)
-                    else:
-                        sys.stderr.write(output.contents.decode('utf-8'))
+            except queue.Empty:
+                if done:
+                    break
+                continue
+            self.handle_output(output)
+
+    def handle_output(self, output):
+        """
+        pass output from a command to the stdout or stderr
+        callback as appropriate, or write it to stderr
+        """
+        if output.channel == OutputQueueItem.get_stdout_channel():
+            if self._callback_stdout:
+                if self._callback_stdout_arg:
+                    self._callback_stdout(self._callback_stdout_arg, output.contents)
+                else:
+                    self._callback_stdout(output.contents)
+            else:
+                sys.stderr.write(output.contents.decode('utf-8'))
+        else:  # output channel is stderr
+            if self._callback_stderr:
+                if self._callback_stderr_arg:
+                    self._callback_stderr(self._callback_stderr_arg, output.contents)
+                else:
+                    self._callback_stderr(output.contents)
+            else:
+                sys.stderr.write(output.contents.decode('utf-8'))
 
     def run_commands(self):
         self.start_commands()
@@ -652,6 +989,157 @@ class CommandsInParallel():
 #        self._commandSeriesQueue.join()
 
 
+class CommandsInParallelEventLoop(CommandsInParallel):
+    """Run a pile of commandSeries in parallel, taking the same arguments and
+    invoking the same callbacks as CommandsInParallel, but supervising all of
+    them from one event loop in the calling thread rather than from a thread
+    per slot. Output is read in large chunks as soon as it is available and
+    passed to the stdout and stderr callbacks a line at a time. Process exits
+    are noticed via pidfds where the platform has them, and otherwise by
+    checking twice a second. The timed callback is invoked once per callback
+    interval for all the series together."""
+    READ_SIZE = 65536
+
+    def __init__(self, command_series_list, **kwargs):
+        super().__init__(command_series_list, **kwargs)
+        self._selector = None
+        # processes we check on because we could not get a pidfd for them
+        self._polled = {}
+        # partial lines of output per fd
+        self._partial = {}
+
+    def watch_pipeline(self, series):
+        """
+        register the output of the running pipeline of the series and
+        the exit of each of its processes with the selector; return the
+        set of output files and processes to wait for before the
+        pipeline is complete
+        """
+        pipeline = series.in_progress_pipeline()
+        proc = pipeline.process_to_poll()
+        waiting = set()
+        for (channel, fileobj) in [(OutputQueueItem.get_stderr_channel(), proc.stderr),
+                                   (OutputQueueItem.get_stdout_channel(), proc.stdout)]:
+            if fileobj is not None:
+                self._selector.register(fileobj, selectors.EVENT_READ, (series, channel, fileobj))
+                waiting.add(fileobj)
+        for process in pipeline.processes():
+            waiting.add(process)
+            try:
+                pidfd = os.pidfd_open(process.pid)
+            except (AttributeError, OSError):
+                self._polled[process] = series
+                continue
+            self._selector.register(pidfd, selectors.EVENT_READ, (series, None, process))
+        return waiting
+
+    def handle_read(self, fdesc, channel, data, eof=False):
+        """
+        pass each complete line of the data read from a command to the
+        callbacks, keeping any partial line until the rest arrives;
+        on eof, pass on whatever partial line is left
+        """
+        data = self._partial.pop(fdesc, b'') + data
+        if not eof:
+            (data, newline, partial) = data.rpartition(b'\n')
+            data += newline
+            if partial:
+                self._partial[fdesc] = partial
+        start = 0
+        while start < len(data):
+            end = data.find(b'\n', start) + 1
+            if not end:
+                end = len(data)
+            self.handle_output(OutputQueueItem(channel, data[start:end]))
+            start = end
+
+    def handle_event(self, key, waiting):
+        """
+        read output that is ready, or reap a process that has exited; remove
+        the output file or process from the series' waiting set when done
+        """
+        (series, channel, target) = key.data
+        if channel is None:
+            self._selector.unregister(key.fd)
+            os.close(key.fd)
+            series.in_progress_pipeline().reap_process(target)
+            waiting[series].discard(target)
+            return
+        data = os.read(key.fd, CommandsInParallelEventLoop.READ_SIZE)
+        if not data:
+            self._selector.unregister(key.fd)
+            self.handle_read(key.fd, channel, b'', eof=True)
+            target.close()
+            waiting[series].discard(target)
+            return
+        self.handle_read(key.fd, channel, data)
+
+    def get_select_timeout(self, next_timed):
+        """
+        return how long to wait for events before doing the timed callback,
+        checking on processes without pidfds, or sampling process stats
+        """
+        timeout = 1.0
+        if self._polled:
+            timeout = 0.5
+        if self._callback_timed:
+            timeout = min(timeout, max(next_timed - time.time(), 0))
+        return timeout
+
+    def do_timed_callback(self):
+        """
+        invoke the timed callback if there is one
+        """
+        if self._callback_timed_arg:
+            self._callback_timed(self._callback_timed_arg)
+        else:
+            self._callback_timed()
+
+    def run_commands(self):
+        pending = deque(self._command_serieses)
+        # for each running series, the outputs and processes of its
+        # current pipeline that are not yet done
+        waiting = {}
+        self._selector = selectors.DefaultSelector()
+        interval = self._default_callback_interval / 1000
+        next_timed = time.time() + interval
+        while pending or waiting:
+            while pending and len(waiting) < self._slots:
+                series = pending.popleft()
+                if series_should_start(self._callback_should_start,
+                                       self._callback_should_start_arg, series):
+                    series.start_commands()
+                    waiting[series] = self.watch_pipeline(series)
+
+            for (key, _mask) in self._selector.select(self.get_select_timeout(next_timed)):
+                self.handle_event(key, waiting)
+            for process, series in list(self._polled.items()):
+                if series.in_progress_pipeline().reap_process(process, block=False) is not None:
+                    del self._polled[process]
+                    waiting[series].discard(process)
+
+            for series in list(waiting):
+                if waiting[series]:
+                    series.in_progress_pipeline().sample_processes()
+                    continue
+                # run next pipeline in series, if any
+                series.start_next_pipeline()
+                if series.in_progress_pipeline():
+                    waiting[series] = self.watch_pipeline(series)
+                    continue
+                del waiting[series]
+                if self._callback_on_completion is not None:
+                    self._callback_on_completion(series)
+
+            if self._callback_timed and time.time() >= next_timed:
+                self.do_timed_callback()
+                next_timed = time.time() + interval
+        self._selector.close()
+        for series in self._command_serieses:
+            for pipeline in series._command_pipelines:
+                pipeline.close_all_pipes()
+
+
 def testcallback(output=None):
     output_file = open("/home/ariel/src/mediawiki/testing/outputsaved.txt", "a")
     if output is None:
@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+'''
+keep the db server, table prefix and site settings of each wiki,
+as got from the MediaWiki maintenance scripts, in a file shared by
+all dump processes, so that not every process has to bootstrap
+MediaWiki for every wiki just to find out where its db lives
+'''
+
+import fcntl
+import json
+import os
+import tempfile
+import time
+
+
+class DbInfoCache():
+    '''
+    per-wiki settings with the time they were retrieved; entries
+    older than ttl seconds are ignored, and so is the whole file
+    if any of the dblists has been changed since it was written,
+    since wikis may have been added or moved to other db sections
+
+    updates are done under a lock and written to a temp file that
+    is then renamed into place, so readers never see a partial file
+    and concurrent writers don't lose each other's entries
+    '''
+    VERSION = 1
+
+    @staticmethod
+    def get_cache(config):
+        '''
+        return the cache configured for the given config,
+        or None if caching is turned off
+        '''
+        if not config.dbinfo_cache or config.dbinfo_cache_ttl <= 0:
+            return None
+        return DbInfoCache(config.dbinfo_cache, config.dbinfo_cache_ttl,
+                           config.dbinfo_cache_lists)
+
+    def __init__(self, path, ttl, dblists=None):
+        self.path = path
+        self.ttl = ttl
+        self.dblists = dblists if dblists else []
+
+    def get_dblist_mtimes(self):
+        '''
+        return a dict of the modification time of each dblist
+        '''
+        mtimes = {}
+        for dblist in self.dblists:
+            try:
+                mtimes[dblist] = os.stat(dblist).st_mtime
+            except OSError:
+                mtimes[dblist] = None
+        return mtimes
+
+    def load(self):
+        '''
+        read and return the entries for all wikis; a cache file
+        that is missing, can't be read, or is out of date with
+        respect to the dblists has no entries
+        '''
+        try:
+            with open(self.path, "r") as infile:
+                contents = json.load(infile)
+        except (OSError, ValueError):
+            return {}
+        if (not isinstance(contents, dict) or contents.get('version') != self.VERSION or
+                contents.get('dblists') != self.get_dblist_mtimes()):
+            return {}
+        return contents.get('wikis', {})
+
+    def is_fresh(self, entry):
+        '''
+        return True if the entry was retrieved recently enough to be used
+        '''
+        return entry is not None and time.time() - entry.get('fetched', 0) < self.ttl
+
+    def get(self, db_name, fields):
+        '''
+        return the cached entry for the wiki if it is fresh and has
+        all of the given fields, otherwise None
+        '''
+        entry = self.load().get(db_name)
+        if not self.is_fresh(entry) or any(field not in entry for field in fields):
+            return None
+        return entry
+
+    def _write(self, wikis):
+        '''
+        write out the entries for all wikis, atomically
+        '''
+        dirname = os.path.dirname(self.path) or "."
+        contents = json.dumps({'version': self.VERSION, 'dblists': self.get_dblist_mtimes(),
+                               'wikis': wikis})
+        (fdesc, temp_path) = tempfile.mkstemp(".tmp", "dbinfocache_", dirname)
+        try:
+            os.write(fdesc, contents.encode('utf-8'))
+            os.close(fdesc)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, self.path)
+        except OSError:
+            os.unlink(temp_path)
+            raise
+
+    def _update(self, change):
+        '''
+        while holding the lock on the cache, load the entries,
+        pass them to the change function, then write them out
+        '''
+        dirname = os.path.dirname(self.path) or "."
+        os.makedirs(dirname, exist_ok=True)
+        with open(self.path + ".lock", "a") as lockfile:
+            fcntl.lockf(lockfile.fileno(), fcntl.LOCK_EX)
+            try:
+                wikis = self.load()
+                change(wikis)
+                self._write(wikis)
+            finally:
+                fcntl.lockf(lockfile.fileno(), fcntl.LOCK_UN)
+
+    def put(self, db_name, values):
+        '''
+        add the dict of settings to the entry for the wiki; a stale
+        entry is replaced, a fresh one keeps its retrieval time so
+        that no setting outlives the ttl
+        '''
+        def change(wikis):
+            entry = wikis.get(db_name)
+            if not self.is_fresh(entry):
+                entry = {'fetched': time.time()}
+            entry.update(values)
+            wikis[db_name] = entry
+        self._update(change)
+
+    def invalidate(self, db_name=None):
+        '''
+        remove the entry for the wiki, or for all wikis if none is given
+        '''
+        def change(wikis):
+            if db_name is None:
+                wikis.clear()
+            else:
+                wikis.pop(db_name, None)
+        self._update(change)
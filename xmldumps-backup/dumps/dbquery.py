@@ -0,0 +1,308 @@
+#!/usr/bin/python3
+'''
+run sql queries against the wiki databases, keeping one
+connection open per db server instead of starting up a
+mysql client for every query
+'''
+
+import atexit
+import os
+import re
+import select
+import sqlite3
+import threading
+import time
+
+from subprocess import Popen, PIPE
+from dumps.commandmanagement import CommandPipeline
+from dumps.exceptions import BackupError
+
+
+class SubprocessBackend():
+    """
+    run each query by piping it to a new mysql client process;
+    this is the way we always used to do it
+    """
+    def __init__(self, dbinfo):
+        self.dbinfo = dbinfo
+
+    def run(self, db_name, query):
+        """
+        run the query and return the output, or None
+        on error or if there was no output
+        """
+        command = [["/bin/echo", "%s" % query],
+                   ["%s" % self.dbinfo.wiki.config.mysql] +
+                   self.dbinfo.mysql_standard_parameters() + ["%s" % db_name, "-r"]]
+        proc = CommandPipeline(command, quiet=True)
+        proc.run_pipeline_get_output()
+        if proc.exited_successfully() and proc.output():
+            return proc.output()
+        return None
+
+    def close(self):
+        """
+        nothing to clean up
+        """
+        return
+
+
+class MysqlSessionBackend():
+    """
+    feed queries to one long-running mysql client process; after each
+    query we send a marker query, and everything that the client writes
+    before the marker output is the output of our query
+
+    output looks the same as it does for one mysql process per query:
+    column names followed by rows, tab-separated, unescaped
+
+    the client exits on the first error, so that a failed query never
+    leaves it running in some state we don't know about, such as
+    reconnected to the server with no database selected
+    """
+    MARKER = b"dumps_query_marker"
+    # errors from the client rather than the server (codes 2000 and up),
+    # e.g. the connection to the server was lost
+    CLIENT_ERROR = re.compile(rb'^ERROR 2[0-9]{3}\b', re.MULTILINE)
+
+    def __init__(self, dbinfo):
+        self.dbinfo = dbinfo
+        self.proc = None
+        self.current_db = None
+        self.marker_count = 0
+
+    def connect(self):
+        """
+        start the mysql client, which exits on the first error
+        and does not reconnect on its own
+        """
+        if not os.path.exists(self.dbinfo.wiki.config.mysql):
+            raise BackupError("mysql command %s not found" % self.dbinfo.wiki.config.mysql)
+        command = ([self.dbinfo.wiki.config.mysql] + self.dbinfo.mysql_standard_parameters() +
+                   ["-r", "--batch", "--unbuffered", "--skip-reconnect"])
+        self.proc = Popen(command, stdin=PIPE, stdout=PIPE, stderr=PIPE, bufsize=0)
+        self.current_db = None
+
+    def _read_until_marker(self, marker, timeout):
+        """
+        read output from the client until we see the marker query
+        output, and return everything before it, or None if the
+        client went away or did not finish within timeout seconds,
+        along with any errors the client wrote
+        """
+        output = b''
+        errors = b''
+        stdout_fd = self.proc.stdout.fileno()
+        stderr_fd = self.proc.stderr.fileno()
+        fdescs = [stdout_fd, stderr_fd]
+        deadline = time.time() + timeout if timeout else None
+        while not output.endswith(marker):
+            wait = None
+            if deadline is not None:
+                wait = deadline - time.time()
+                if wait <= 0:
+                    return None, errors
+            ready, _unused, _unused = select.select(fdescs, [], [], wait)
+            for fdesc in ready:
+                data = os.read(fdesc, 65536)
+                if fdesc == stderr_fd:
+                    if not data:
+                        fdescs.remove(stderr_fd)
+                    errors += data
+                elif not data:
+                    # the client exited, get the rest of what it had to say
+                    if stderr_fd in fdescs:
+                        errors += self.proc.stderr.read()
+                    return None, errors
+                else:
+                    output += data
+        return output[:-1 * len(marker)], errors
+
+    def run(self, db_name, query):
+        """
+        run the query and return the output, or None
+        on error or if there was no output
+
+        raises OSError if the client process has gone away
+        or lost its connection to the server
+        """
+        if self.proc is None or self.proc.poll() is not None:
+            self.connect()
+        text = ""
+        if db_name != self.current_db:
+            text = "use `%s`;\n" % db_name
+        self.marker_count += 1
+        marker = b"%s\n%d\n" % (self.MARKER, self.marker_count)
+        text += "%s;\nselect %d as %s;\n" % (query.rstrip().rstrip(';'), self.marker_count,
+                                             self.MARKER.decode('utf-8'))
+        self.proc.stdin.write(text.encode('utf-8'))
+        output, errors = self._read_until_marker(marker, self.dbinfo.wiki.config.query_timeout)
+        if output is None:
+            # no telling what state the client is in, start over next time
+            self.close()
+            if errors and not self.CLIENT_ERROR.search(errors):
+                # the server turned down the query, trying again won't help
+                return None
+            raise OSError("no response from mysql client for query")
+        self.current_db = db_name
+        return output or None
+
+    def close(self):
+        """
+        shut down the client if it is running
+        """
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=5)
+        except Exception:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stdout.close()
+        self.proc.stderr.close()
+        self.proc = None
+        self.current_db = None
+
+
+class SqliteBackend():
+    """
+    run queries against a local sqlite database, formatting
+    the output the way the mysql client does; meant for testing
+    without a mysql server around
+    """
+    def __init__(self, dbinfo):
+        self.path = dbinfo.wiki.config.query_sqlite_db
+        self.conn = None
+
+    def run(self, db_name, query):
+        """
+        run the query and return the output, or None
+        on error or if there was no output
+        """
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            cursor = self.conn.execute(query)
+            rows = cursor.fetchall()
+        except sqlite3.Error:
+            return None
+        if cursor.description is None:
+            return None
+        lines = ["\t".join([column[0] for column in cursor.description])]
+        for row in rows:
+            lines.append("\t".join(["NULL" if field is None else str(field) for field in row]))
+        return ("\n".join(lines) + "\n").encode('utf-8')
+
+    def close(self):
+        """
+        close the db connection if there is one
+        """
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class QueryService():
+    """
+    one connection to a db server, shared by everyone querying it,
+    with timing stats for the queries run
+
+    get one via QueryService.get_service(DbServerInfo)
+    """
+    BACKENDS = {'session': MysqlSessionBackend,
+                'subprocess': SubprocessBackend,
+                'sqlite': SqliteBackend}
+
+    _services = {}
+    _services_lock = threading.Lock()
+
+    @staticmethod
+    def get_service(dbinfo):
+        """
+        return the QueryService for the db server of the DbServerInfo,
+        creating it if need be
+        """
+        backend = dbinfo.wiki.config.query_backend
+        if backend not in QueryService.BACKENDS:
+            raise BackupError("unknown query backend %s" % backend)
+        key = (backend, dbinfo.get_attr('db_server'), dbinfo.get_attr('db_port'))
+        with QueryService._services_lock:
+            if key not in QueryService._services:
+                QueryService._services[key] = QueryService(
+                    QueryService.BACKENDS[backend](dbinfo), "%s:%s" % key[1:])
+            return QueryService._services[key]
+
+    @staticmethod
+    def get_all_stats():
+        """
+        return a dict of query stats for each db server we've used
+        """
+        with QueryService._services_lock:
+            return {service.name: service.get_stats()
+                    for service in QueryService._services.values()}
+
+    @staticmethod
+    def close_all():
+        """
+        close all connections and forget about them
+        """
+        with QueryService._services_lock:
+            for service in QueryService._services.values():
+                service.close()
+            QueryService._services = {}
+
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+        self.lock = threading.Lock()
+        self.stats = {'queries': 0, 'failures': 0, 'reconnects': 0,
+                      'seconds': 0.0, 'max_seconds': 0.0}
+
+    def run(self, db_name, query):
+        """
+        run the query for the given db and return the output, or None
+        on error or if there was no output
+
+        if the connection has gone away, reconnect and try once
+        more; any further retries are up to the caller, who may
+        want to check the db server config first
+        """
+        with self.lock:
+            start = time.time()
+            try:
+                output = self.backend.run(db_name, query)
+            except OSError:
+                self.stats['reconnects'] += 1
+                self.backend.close()
+                try:
+                    output = self.backend.run(db_name, query)
+                except OSError:
+                    self.backend.close()
+                    output = None
+            elapsed = time.time() - start
+            self.stats['queries'] += 1
+            self.stats['seconds'] += elapsed
+            self.stats['max_seconds'] = max(self.stats['max_seconds'], elapsed)
+            if output is None:
+                self.stats['failures'] += 1
+            return output
+
+    def get_stats(self):
+        """
+        return a copy of the query stats
+        """
+        return dict(self.stats)
+
+    def close(self):
+        """
+        close the connection to the db server
+        """
+        with self.lock:
+            self.backend.close()
+
+
+atexit.register(QueryService.close_all)
@@ -1,12 +1,17 @@
 #!/usr/bin/python3
 # Worker process, does the actual dumping
 
+import bz2
+import gzip
 import hashlib
+import json
 import os
 from os.path import exists
 import errno
 import re
+import subprocess
 import sys
+import threading
 import time
 import traceback
 import tempfile
@@ -32,13 +37,28 @@ class FileUtils():
         return os.fdopen(fdesc, mode)
 
     @staticmethod
-    def write_file(dirname, filepath, text, perms=0):
+    def has_contents(filepath, text):
+        """Return True if the file exists and contains exactly the given text."""
+        try:
+            if os.path.getsize(filepath) != len(text.encode('utf-8')):
+                return False
+            with open(filepath, "r") as fhandle:
+                return fhandle.read() == text
+        except (OSError, UnicodeDecodeError):
+            return False
+
+    @staticmethod
+    def write_file(dirname, filepath, text, perms=0, skip_unchanged=False):
         """Write text to a file, as atomically as possible,
         via a temporary file in a specified directory.
         Arguments: dirname = where temp file is created,
         filepath = full path to actual file, text = contents
-        to write to file, perms = permissions that the file will have after creation"""
+        to write to file, perms = permissions that the file will have after creation,
+        skip_unchanged = if the file already has these contents, leave it alone.
+        Returns True if the file was written."""
 
+        if skip_unchanged and FileUtils.has_contents(filepath, text):
+            return False
         if not os.path.isdir(dirname):
             try:
                 os.makedirs(dirname)
@@ -54,20 +74,26 @@ class FileUtils():
         # This may fail across filesystems or on Windows.
         # Of course nothing else will work on Windows. ;)
         shutil.move(temp_filepath, filepath)
+        return True
 
     @staticmethod
-    def write_file_in_place(filepath, text, perms=0):
+    def write_file_in_place(filepath, text, perms=0, skip_unchanged=False):
         """Write text to a file, after opening it for write with truncation.
         This assumes that only one process or thread accesses the given file at a time.
         Arguments: filepath = full path to actual file, text = contents
         to write to file, perms = permissions that the file will have after creation,
-        if it did not exist already"""
+        if it did not exist already, skip_unchanged = if the file already has
+        these contents, leave it alone.
+        Returns True if the file was written."""
 
+        if skip_unchanged and FileUtils.has_contents(filepath, text):
+            return False
         fhandle = open(filepath, "wt")
         fhandle.write(text)
         fhandle.close()
         if perms:
             os.chmod(filepath, perms)
+        return True
 
     @staticmethod
     def read_file(filepath):
@@ -459,6 +485,59 @@ class DumpFilename():
             self.last_page_id_int = int(value)
 
 
+class ContentsVerdict():
+    """
+    result of one streaming pass over the contents of a dump output
+    file, as produced by DumpContents.validate()
+
+    attributes:
+
+    filename        full path to the file that was checked
+    checked         False if we don't know how to read this type of file, in
+                      which case nothing else here is meaningful
+    empty           True if there was no (uncompressed) content at all
+    truncated       True if the compressed stream ended early or was corrupt,
+                      or if a last tag was required and the content didn't end with it
+    binary          True if a run of NUL bytes was found near the start of an xml file
+    first_page_id   first page id found in the content, as a string, or None
+    last_page_id    last page id found in the content, as a string, or None
+    pages           number of pages in the content, or None if not known
+    revisions       number of revisions in the content, or None if not known
+    error           description of the decompression error, if there was one
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.checked = False
+        self.empty = False
+        self.truncated = False
+        self.binary = False
+        self.first_page_id = None
+        self.last_page_id = None
+        self.pages = 0
+        self.revisions = 0
+        self.error = None
+
+    def is_bad(self):
+        """
+        return True if the file is empty, truncated or has binary junk in it
+        """
+        return bool(self.checked and (self.empty or self.truncated or self.binary))
+
+    def describe(self):
+        """
+        return a short description of the verdict, suitable for logging
+        """
+        if not self.checked:
+            return "%s: not checked" % self.filename
+        problems = [problem for problem in ["empty", "truncated", "binary"]
+                    if getattr(self, problem)]
+        if self.error:
+            problems.append(self.error)
+        return "%s: %s (pages %s to %s)" % (
+            self.filename, ", ".join(problems) if problems else "ok",
+            self.first_page_id, self.last_page_id)
+
+
 class DumpContents():
     """Methods for dealing with dump contents in a file containing output
     created by any job of a jump run.  This includes
@@ -471,11 +550,20 @@ class DumpContents():
     md5sum(): return md5sum of the contents.
     sha1sum(): return sha1sum of the contents.
     checksum(htype): return checksum of the specified type, of the contents.
-    check_if_truncated(): for compressed files, check if the file is truncated (stops
-       abruptly before the end of the compressed data) or not, and set and return
-         self.is_truncated accordingly.  This is fast for bzip2 files
-       and slow for gz and 7z fles, since for the latter two types it must serially
-       read through the file to determine if it is truncated or not.
+    checksums(htypes): return checksums of all the specified types, reading the
+       contents only once.
+    validate(last_tag): read through the uncompressed contents once (for bz2 files,
+       just the start and the last block), and return a
+       ContentsVerdict saying whether the file is empty, truncated (stops abruptly before
+       the end of the compressed data, or doesn't end with last_tag), or has binary junk
+       near the start, along with the first and last page ids in the file.
+    check_if_empty(), check_if_truncated(last_tag), check_if_binary_crap(): the
+       corresponding pieces of the verdict from validate()
+    write_sidecar(verdict): save the page ids and counts from a verdict in a small
+       json file next to the dump file, so that later lookups of the first or last
+       page id don't need to uncompress anything
+    read_sidecar(): return the contents of that file, if it is there and describes
+       the dump file as it is now
     get_size(): returns the current size of the file contents in bytes
     rename(newname): rename the file. Arguments: the new name of the file without
        the directory.
@@ -507,6 +595,7 @@ class DumpContents():
         self.first_page_id_int = 0
         self.last_page_id = None
         self.last_page_id_int = 0
+        self._scan = None
         self.dirname = os.path.dirname(filename)
         if dfname:
             self.dfname = dfname
@@ -516,32 +605,102 @@ class DumpContents():
         if verbose:
             sys.stderr.write("setting up info for %s\n" % filename)
 
-    def _checksum(self, summer):
+    # read size for checksumming; a multiple of the page size, and large
+    # enough that on network filesystems we aren't bound by per-read latency
+    CHECKSUM_BUFSIZE = 4 * 1024 * 1024
+
+    def _checksum(self, summers):
+        """
+        read the file once, feeding each block to all of the hash
+        objects passed in, and return a list of their hex digests
+        """
         if not self.filename:
             return None
-        infhandle = open(self.filename, "rb")
-        bufsize = 4192 * 32
-        fbuffer = infhandle.read(bufsize)
-        while fbuffer:
-            summer.update(fbuffer)
-            fbuffer = infhandle.read(bufsize)
-        infhandle.close()
-        return summer.hexdigest()
+        fbuffer = bytearray(DumpContents.CHECKSUM_BUFSIZE)
+        fview = memoryview(fbuffer)
+        # unbuffered, so that reads go straight into our buffer
+        with open(self.filename, "rb", buffering=0) as infhandle:
+            while True:
+                count = infhandle.readinto(fbuffer)
+                if not count:
+                    break
+                for summer in summers:
+                    summer.update(fview[:count])
+        return [summer.hexdigest() for summer in summers]
 
     def md5sum(self):
-        summer = hashlib.md5()
-        return self._checksum(summer)
+        return self.checksum("md5")
 
     def sha1sum(self):
-        summer = hashlib.sha1()
-        return self._checksum(summer)
+        return self.checksum("sha1")
 
     def checksum(self, htype):
-        if htype == "md5":
-            return self.md5sum()
-        if htype == "sha1":
-            return self.sha1sum()
-        return None
+        sums = self.checksums([htype])
+        if not sums:
+            return None
+        return sums[htype]
+
+    def checksums(self, htypes):
+        """
+        compute checksums of all of the given types (md5, sha1 or
+        any other algorithm name that hashlib knows about) in one
+        read of the file
+
+        returns: dict of hash type: hex digest, or None if the file
+        has no name or none of the hash types are known
+        """
+        htypes = [htype for htype in htypes if htype in hashlib.algorithms_available]
+        if not htypes:
+            return None
+        digests = self._checksum([hashlib.new(htype) for htype in htypes])
+        if digests is None:
+            return None
+        return dict(zip(htypes, digests))
+
+    SIDECAR_SUFFIX = ".pageids.json"
+
+    def get_sidecar_path(self):
+        """
+        return the path to the page id sidecar file for this dump file
+        """
+        return self.filename + self.SIDECAR_SUFFIX
+
+    def _get_file_stamp(self):
+        """
+        return size and mtime of the dump file, used to tell whether a
+        sidecar file still describes it
+        """
+        stat = os.stat(self.filename)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    def write_sidecar(self, verdict):
+        """
+        write the page ids and page and revision counts from the
+        given ContentsVerdict into the sidecar file for this dump file,
+        along with the size and mtime of the dump file
+        """
+        info = self._get_file_stamp()
+        info.update({'first_page_id': verdict.first_page_id,
+                     'last_page_id': verdict.last_page_id,
+                     'pages': verdict.pages, 'revisions': verdict.revisions})
+        FileUtils.write_file(self.dirname, self.get_sidecar_path(),
+                             json.dumps(info), self._wiki.config.fileperms)
+
+    def read_sidecar(self):
+        """
+        return the contents of the sidecar file for this dump file
+        as a dict, or None if there is no such file, or if it was
+        written for a different version of the dump file
+        """
+        try:
+            with open(self.get_sidecar_path(), "r") as infile:
+                info = json.load(infile)
+            stamp = self._get_file_stamp()
+        except (OSError, ValueError):
+            return None
+        if any(info.get(field) != stamp[field] for field in stamp):
+            return None
+        return info
 
     def get_first_500_lines(self):
         if self.first_lines:
@@ -609,6 +768,13 @@ class DumpContents():
     def find_first_page_id_in_file(self):
         if self.first_page_id_int:
             return self.first_page_id_int
+        sidecar = self.read_sidecar()
+        # a null id means it wasn't found when the file was checked, not
+        # that there isn't one, so we look in the file for it
+        if sidecar and sidecar['first_page_id'] is not None:
+            self.first_page_id = sidecar['first_page_id']
+            self.first_page_id_int = int(self.first_page_id)
+            return self.first_page_id_int
         output = self.get_first_500_lines()
         if output:
             page_data = output
@@ -681,13 +847,19 @@ class DumpContents():
     def find_last_page_id(self):
         """
         find and return the last page id in a compressed
-        stub or page content xml file, using uncompression
+        stub or page content xml file, from the sidecar file
+        if there is one with the id, otherwise using uncompression
         command (bzcat, zcat) and tail
 
         arg: Runner
         """
         if self.last_page_id_int:
             return self.last_page_id_int
+        sidecar = self.read_sidecar()
+        if sidecar and sidecar['last_page_id'] is not None:
+            self.last_page_id = sidecar['last_page_id']
+            self.last_page_id_int = int(self.last_page_id)
+            return self.last_page_id_int
         count = self.get_lineno_last_page()
         lastlines = self.get_last_lines(count)
         # now look for the last page id in here. eww
@@ -704,81 +876,245 @@ class DumpContents():
             self.last_page_id_int = int(self.last_page_id)
         return self.last_page_id_int
 
-    def check_if_truncated(self, last_tag=None):
-        '''
-        NOTE: last_tag, if set, must be a b' type, so that we can compare it
-        to output retrieved from a command run by Popen
-        '''
-        if self.is_truncated:
-            return self.is_truncated
+    # how much uncompressed content we read at a time when validating
+    VALIDATE_BUFSIZE = 1024 * 1024
+    # how much content we keep from the end of one read for the next; this
+    # must be large enough to hold a full page title and id and the last line
+    VALIDATE_CARRY = 8192
+    # xml files with binary junk have runs of NULs in them, we check
+    # this many lines at the start of the file for those
+    VALIDATE_BINARY_LINES = 2000
+    NUL_RUN = b'\0\0\0'
+    PAGE_ID_PATTERN = re.compile(rb'<title>(?P<title>.+?)</title>\s*' +
+                                 rb'(<ns>[0-9]+</ns>\s*)?' +
+                                 rb'<id>(?P<pageid>\d+?)</id>')
+
+    def _open_uncompressed(self):
+        """
+        return a file-like object from which the uncompressed contents
+        can be read, and a function which returns an error message if
+        the stream was not read to completion successfully once we've
+        read everything from it, or None if we don't know how to read
+        this type of file
+
+        7z is the only format python can't uncompress for us; for that
+        we read the output of a 7za process
+        """
+        if self.dfname.file_ext == "bz2":
+            return bz2.open(self.filename, "rb"), lambda: None
+        if self.dfname.file_ext == "gz":
+            return gzip.open(self.filename, "rb"), lambda: None
+        if self.dfname.file_ext == "7z":
+            if not exists(self._wiki.config.sevenzip):
+                raise BackupError("command %s to uncompress file not found" %
+                                  self._wiki.config.sevenzip)
+            proc = subprocess.Popen([self._wiki.config.sevenzip, "e", "-so", self.filename],
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            # 7z returns 0 even if there is garbage after the archive end
+            return proc.stdout, lambda: (None if not proc.wait() else
+                                         "7z exited with %s" % proc.returncode)
+        if self.dfname.file_ext in ['', 'txt', 'html']:
+            return open(self.filename, "rb"), lambda: None
+        return None, None
 
-        shell = bool(last_tag)
+    @staticmethod
+    def _find_last_page_id(content):
+        """
+        find the last complete page title and id in the content
+        and return the page id, or None
+        """
+        index = content.rfind(b'<title>')
+        while index >= 0:
+            result = DumpContents.PAGE_ID_PATTERN.match(content, index)
+            if result:
+                return result.group('pageid').decode('utf-8')
+            index = content.rfind(b'<title>', 0, index)
+        return None
 
-        # Setting up the pipeline depending on the file extension
-        if self.dfname.file_ext == "bz2":
-            if not exists(self._wiki.config.checkforbz2footer):
-                raise BackupError("checkforbz2footer command %s not found" %
-                                  self._wiki.config.checkforbz2footer)
-            if last_tag:
-                # see if file is compressed right AND has appropriate last tag
-                pipeline = [self._wiki.config.dumplastbz2block, self.filename, '|',
-                            self._wiki.config.tail, '-1']
-            else:
-                pipeline = [self._wiki.config.checkforbz2footer, self.filename]
-        elif self.dfname.file_ext == 'gz':
-            if last_tag:
-                pipeline = [self._wiki.config.gzip, "-dc", self.filename,
-                            "|", self._wiki.config.tail, '-1']
-            else:
-                pipeline = [self._wiki.config.gzip, "-dc", self.filename,
-                            ">", "/dev/null"]
-        elif self.dfname.file_ext == '7z':
-            # Note that 7z does return 0, if archive contains
-            # garbage /after/ the archive end
-            if last_tag:
-                pipeline = [self._wiki.config.sevenzip, "e", "-so",
-                            self.filename, "|", self._wiki.config.tail, '-1']
-            else:
-                pipeline = [self._wiki.config.sevenzip, "e", "-so",
-                            self.filename, ">", "/dev/null"]
-        else:
-            # we do't know how to handle this type of file.
-            return self.is_truncated
-
-        if shell:
-            pipeline = ' '.join(pipeline)
-        pipeline = [pipeline]
-        # Run the prepared pipeline
-        proc = CommandPipeline(pipeline, shell=shell, quiet=True)
+    def _scan_stream(self, infile, get_error, head_only=False):
+        """
+        read the uncompressed contents from the file-like object, and
+        return a dict with everything validate() needs to know:
+        whether there was any content, whether the stream was complete,
+        whether we saw a run of NULs near the start, the first and last
+        page ids, the numbers of pages and revisions and the last line
+        of content
+
+        if head_only is set, stop once the lines near the start have
+        been checked; 'complete' in the dict says whether we got to the
+        end of the content anyways
+        """
+        scan = {'checked': True, 'empty': True, 'error': None, 'nuls': False,
+                'first_page_id': None, 'last_page_id': None, 'last_line': b'',
+                'pages': 0, 'revisions': 0, 'complete': False}
+        carry = b''
+        lines_to_check = self.VALIDATE_BINARY_LINES
+        try:
+            with infile:
+                while True:
+                    chunk = infile.read(self.VALIDATE_BUFSIZE)
+                    if not chunk:
+                        scan['complete'] = True
+                        break
+                    scan['empty'] = False
+                    if lines_to_check:
+                        newlines = chunk.count(b'\n')
+                        if newlines >= lines_to_check:
+                            end = 0
+                            for _count in range(lines_to_check):
+                                end = chunk.index(b'\n', end) + 1
+                            head = chunk[:end]
+                            lines_to_check = 0
+                        else:
+                            head = chunk
+                            lines_to_check -= newlines
+                        # runs may start in the previous chunk
+                        if self.NUL_RUN in carry[-len(self.NUL_RUN) + 1:] + head:
+                            scan['nuls'] = True
+                    # tags may start in the previous chunk too
+                    scan['pages'] += (carry[-len(b'<page>') + 1:] + chunk).count(b'<page>')
+                    scan['revisions'] += (carry[-len(b'<revision>') + 1:] + chunk).count(
+                        b'<revision>')
+                    content = carry + chunk
+                    if scan['first_page_id'] is None:
+                        result = self.PAGE_ID_PATTERN.search(content)
+                        if result:
+                            scan['first_page_id'] = result.group('pageid').decode('utf-8')
+                    last_page_id = self._find_last_page_id(content)
+                    if last_page_id is not None:
+                        scan['last_page_id'] = last_page_id
+                    carry = content[-self.VALIDATE_CARRY:]
+                    if head_only and not lines_to_check:
+                        break
+            if scan['complete']:
+                scan['error'] = get_error()
+        except (EOFError, OSError) as ex:
+            scan['error'] = str(ex)
+
+        # same as 'tail -1', the trailing newline doesn't start a new line
+        lines = carry[:-1] if carry.endswith(b'\n') else carry
+        scan['last_line'] = lines.rsplit(b'\n', 1)[-1]
+        return scan
+
+    def _have_bz2_footer_tools(self):
+        """
+        return True if the tools for checking the end of a bz2 file
+        without uncompressing all of it are installed
+        """
+        return (exists(self._wiki.config.checkforbz2footer) and
+                exists(self._wiki.config.dumplastbz2block))
+
+    def _scan_bz2_ends(self):
+        """
+        like _scan_contents, but for a bz2 file, uncompressing only the
+        start of the file and its last block: the start for emptiness,
+        junk and the first page id, and the last block for truncation,
+        the last line and the last page id. The numbers of pages and
+        revisions are not known unless the whole file was read as part
+        of the start, and are None. The last page id is None if the last
+        page started before the last block.
+        """
+        scan = self._scan_stream(bz2.open(self.filename, "rb"), lambda: None, head_only=True)
+        if scan['complete'] or scan['error']:
+            return scan
+        scan['pages'] = None
+        scan['revisions'] = None
+        scan['last_page_id'] = None
+        scan['last_line'] = b''
+        proc = CommandPipeline([[self._wiki.config.checkforbz2footer, self.filename]],
+                               quiet=True)
+        proc.run_pipeline_get_output()
+        if not proc.exited_successfully():
+            scan['error'] = "no bz2 footer"
+            return scan
+        proc = CommandPipeline([[self._wiki.config.dumplastbz2block, self.filename]],
+                               quiet=True)
         proc.run_pipeline_get_output()
-        self.is_truncated = not proc.exited_successfully()
-        if last_tag and not self.is_truncated:
-            # there might be a newline or something after the tag, so 'startswith' is good enough
-            output = proc.output()
-            self.is_truncated = bool(not output or not output.startswith(last_tag))
-        return self.is_truncated
+        if not proc.exited_successfully():
+            scan['error'] = "last bz2 block could not be read"
+            return scan
+        content = proc.output()
+        scan['last_page_id'] = self._find_last_page_id(content)
+        lines = content[:-1] if content.endswith(b'\n') else content
+        scan['last_line'] = lines.rsplit(b'\n', 1)[-1]
+        return scan
+
+    def _scan_contents(self):
+        """
+        read the uncompressed contents and return a dict with everything
+        validate() needs to know, see _scan_stream; 'checked' is False if
+        we don't know how to read the file at all
 
-    def check_if_empty(self):
-        if self.is_empty:
-            return self.is_empty
-        if self.dfname.file_ext == "bz2":
-            pipeline = [["%s -dc  %s | head -5" % (self._wiki.config.bzip2, self.filename)]]
-        elif self.dfname.file_ext == "gz":
-            pipeline = [["%s -dc %s | head -5" % (self._wiki.config.gzip, self.filename)]]
-        elif self.dfname.file_ext == '7z':
-            pipeline = [["%s e -so %s | head -5" % (self._wiki.config.sevenzip, self.filename)]]
-        elif (self.dfname.file_ext == '' or self.dfname.file_ext == 'txt' or
-              self.dfname.file_ext == 'html'):
-            pipeline = [["head -5 %s" % self.filename]]
-        else:
-            # we do't know how to handle this type of file.
-            return self.is_empty
+        bz2 files are not read through if the tools to check their
+        last block are available, since reading all of a multi-GB
+        history file in-process takes far too long
+        """
+        if self.dfname.file_ext == "bz2" and self._have_bz2_footer_tools():
+            return self._scan_bz2_ends()
+        infile, get_error = self._open_uncompressed()
+        if infile is None:
+            return {'checked': False}
+        return self._scan_stream(infile, get_error)
+
+    def validate(self, last_tag=None):
+        """
+        read through the file contents once, uncompressing as we go,
+        and return a ContentsVerdict for the file; for bz2 files, only
+        the start and the last block are uncompressed, if the tools for
+        that are installed
+
+        if last_tag is set, it must be a bytes object, and the last
+        line of content must start with it or the file is considered
+        truncated; this is only checked for bz2 and gz files, since
+        those are the only formats we produce with full xml content
+
+        the expensive part (reading the contents) is done only once
+        per instance, no matter how many times this is called
+        """
+        verdict = ContentsVerdict(self.filename)
+        if not self.filename or not exists(self.filename):
+            return verdict
+        if self._scan is None:
+            self._scan = self._scan_contents()
+        verdict.checked = self._scan['checked']
+        if not verdict.checked:
+            return verdict
+
+        verdict.empty = self._scan['empty']
+        verdict.error = self._scan['error']
+        verdict.first_page_id = self._scan['first_page_id']
+        verdict.last_page_id = self._scan['last_page_id']
+        verdict.pages = self._scan['pages']
+        verdict.revisions = self._scan['revisions']
+        if self.dfname.file_ext in ['bz2', 'gz', '7z']:
+            verdict.truncated = bool(verdict.error)
+            if (last_tag and not verdict.truncated and self.dfname.file_ext != '7z' and
+                    not self._scan['last_line'].startswith(last_tag)):
+                verdict.truncated = True
+        # only xml files are expected to be free of junk, sql files etc. may
+        # have anything in them
+        verdict.binary = bool('xml' in self.dfname.filename and self._scan['nuls'])
+
+        self.is_empty = verdict.empty
+        self.is_truncated = verdict.truncated
+        self.is_binary = verdict.binary
+        if verdict.first_page_id is not None:
+            self.first_page_id = verdict.first_page_id
+            self.first_page_id_int = int(verdict.first_page_id)
+        if verdict.last_page_id is not None:
+            self.last_page_id = verdict.last_page_id
+            self.last_page_id_int = int(verdict.last_page_id)
+        return verdict
 
-        proc = CommandPipeline(pipeline, quiet=True, shell=True)
-        proc.run_pipeline_get_output()
-        self.is_empty = bool(not proc.output())
+    def check_if_truncated(self, last_tag=None):
+        '''
+        NOTE: last_tag, if set, must be a b' type, so that we can compare it
+        to the uncompressed file contents
+        '''
+        return self.validate(last_tag).truncated
 
-        return self.is_empty
+    def check_if_empty(self):
+        return self.validate().empty
 
     def check_if_binary_crap(self):
         '''
@@ -789,35 +1125,7 @@ class DumpContents():
         Note we expect real content to be present within the
         2000 lines arbitrarily chosen as the cutoff
         '''
-        if 'xml' not in self.dfname.filename:
-            return False
-
-        if self.is_binary:
-            return self.is_binary
-        rest = "| head -2000 | cat -vte | grep '@^@^@' | wc -l"
-        if self.dfname.file_ext == "bz2":
-            pipeline = [["{bzip2} -dc  {fname} {rest}".format(
-                bzip2=self._wiki.config.bzip2, fname=self.filename, rest=rest)]]
-        elif self.dfname.file_ext == "gz":
-            pipeline = [["{gzip} -dc {fname} {rest}".format(
-                gzip=self._wiki.config.gzip, fname=self.filename, rest=rest)]]
-        elif self.dfname.file_ext == '7z':
-            pipeline = [["{sevenz} e -so {fname} {rest}".format(
-                sevenz=self._wiki.config.sevenzip, fname=self.filename, rest=rest)]]
-        elif (self.dfname.file_ext == '' or self.dfname.file_ext == 'txt' or
-              self.dfname.file_ext == 'html'):
-            pipeline = [["{cat} {fname} {rest}".format(
-                cat=self._wiki.config.cat, fname=self.filename, rest=rest)]]
-        else:
-            # we do't know how to handle this type of file.
-            return self.is_binary
-
-        proc = CommandPipeline(pipeline, quiet=True, shell=True)
-        proc.run_pipeline_get_output()
-        result = proc.output().rstrip()
-        self.is_binary = bool(result != b'0')
-
-        return self.is_binary
+        return self.validate().binary
 
     def get_size(self):
         if exists(self.filename):
@@ -835,16 +1143,193 @@ class DumpContents():
         self.filename = os.path.join(self.dirname, newname)
 
 
+class DumpFileCatalog():
+    """
+    the files in one dump run directory, with each name parsed just
+    once into a DumpFilename, and indexed by dump name and by part
+    number, so that listing the output files of one job needn't look
+    at every file that every job has produced
+
+    entries are kept up to date by relisting the directory when its
+    mtime changes, parsing only names that are new; files we move or
+    remove ourselves can be passed to add and remove directly
+
+    jobs whose commands are supervised from several threads add and
+    remove files from those threads, so every change, relisting and
+    lookup is done holding the catalog's lock, and lookups hand back
+    lists of their own rather than the catalog's containers
+    """
+    def __init__(self, wiki, directory):
+        self._wiki = wiki
+        self.directory = directory
+        self._lock = threading.Lock()
+        # filename -> DumpFilename
+        self.dfnames = {}
+        # filename -> key for sorting filenames the way humans expect
+        self.sort_keys = {}
+        # dumpname -> partnum_int -> set of filenames; files without a
+        # part number have partnum_int 0
+        self.index = {}
+        # mtime of the directory as of the last listing, or None if the
+        # listing can't be trusted to be current
+        self.dir_time_stamp = None
+
+    @staticmethod
+    def get_sort_key(filename):
+        """
+        split the filename into text and numbers so that
+        'pages-articles2' sorts before 'pages-articles10'
+        """
+        return [int(text) if text.isdigit() else text for text in re.split('([0-9]+)', filename)]
+
+    def add(self, filename):
+        """
+        parse and index a filename not already in the catalog
+        """
+        with self._lock:
+            self._add(filename)
+
+    def remove(self, filename):
+        """
+        drop a filename from the catalog, if it is there
+        """
+        with self._lock:
+            self._remove(filename)
+
+    def update(self, removed, added):
+        """
+        drop the removed filenames and index the added ones in one go,
+        so that no one sees a renamed file under neither name
+        """
+        with self._lock:
+            for filename in removed:
+                self._remove(filename)
+            for filename in added:
+                self._add(filename)
+
+    def _add(self, filename):
+        if filename in self.dfnames:
+            return
+        dfname = DumpFilename(self._wiki)
+        dfname.new_from_filename(filename)
+        self.dfnames[filename] = dfname
+        self.sort_keys[filename] = self.get_sort_key(filename)
+        parts = self.index.setdefault(dfname.dumpname, {})
+        parts.setdefault(dfname.partnum_int, set()).add(filename)
+
+    def _remove(self, filename):
+        dfname = self.dfnames.pop(filename, None)
+        if dfname is None:
+            return
+        del self.sort_keys[filename]
+        parts = self.index[dfname.dumpname]
+        parts[dfname.partnum_int].discard(filename)
+        if not parts[dfname.partnum_int]:
+            del parts[dfname.partnum_int]
+        if not parts:
+            del self.index[dfname.dumpname]
+
+    def is_outdated(self):
+        """
+        return True if the directory may have changed since it was last listed
+        """
+        if self.dir_time_stamp is None or not exists(self.directory):
+            return True
+        return os.stat(self.directory).st_mtime > self.dir_time_stamp
+
+    def refresh(self):
+        """
+        if the directory has changed since it was last listed, list
+        it again, indexing new files and dropping those now gone
+        """
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        if not self.is_outdated():
+            return
+        if not exists(self.directory):
+            for filename in list(self.dfnames):
+                self._remove(filename)
+            return
+        dir_time_stamp = os.stat(self.directory).st_mtime
+        filenames = set(os.listdir(self.directory))
+        for filename in [filename for filename in self.dfnames if filename not in filenames]:
+            self._remove(filename)
+        for filename in filenames:
+            self._add(filename)
+        # Some typical file systems' (eg. ext2, ext3) mtime resolution is 1s. If we
+        # trusted the listing made at x.1 seconds (with mtime x) and a new file were
+        # added at x.2, the directory's mtime would still be x and we would never
+        # notice. So we trust the listing only if adding a file now would yield a
+        # /different/ mtime; otherwise the next check lists the directory again.
+        if time.time() >= dir_time_stamp + 1:
+            self.dir_time_stamp = dir_time_stamp
+        else:
+            self.dir_time_stamp = None
+
+    def get_candidates(self, dump_name=None, parts=None):
+        """
+        return the DumpFilenames that might have the given dump name
+        and part numbers; see DumpDir._get_files_filtered for the
+        meaning of parts. callers must still check each one.
+        """
+        with self._lock:
+            return self._get_candidates(dump_name, parts)
+
+    def _get_candidates(self, dump_name, parts):
+        if dump_name:
+            part_indexes = [self.index.get(dump_name, {})]
+        else:
+            part_indexes = list(self.index.values())
+        if parts is None:
+            partnums = [0]
+        elif parts and parts != PARTS_ANY:
+            partnums = parts
+        else:
+            partnums = None
+        candidates = []
+        for part_index in part_indexes:
+            if partnums is None:
+                for filenames in part_index.values():
+                    candidates.extend(filenames)
+            else:
+                for partnum in partnums:
+                    candidates.extend(part_index.get(partnum, []))
+        return [self.dfnames[filename] for filename in candidates]
+
+    def get_dfnames(self):
+        """
+        return a list of the DumpFilenames of all files in the catalog
+        """
+        with self._lock:
+            return list(self.dfnames.values())
+
+    def sort(self, dfnames):
+        """
+        return the DumpFilenames sorted the way humans expect, using the
+        keys we have for files in the catalog
+        """
+        with self._lock:
+            sort_keys = {dfname.filename: self.sort_keys.get(dfname.filename)
+                         for dfname in dfnames}
+        for filename, sort_key in sort_keys.items():
+            if sort_key is None:
+                # removed since it was looked up
+                sort_keys[filename] = self.get_sort_key(filename)
+        return sorted(dfnames, key=lambda dfname: sort_keys[dfname.filename])
+
+
 class DumpDir():
     BAD = [".truncated", ".empty"]
 
     def __init__(self, wiki, db_name):
         self._wiki = wiki
         self._db_name = db_name
-        self._dir_cache = {}
-        self._dir_cache_time = {}
-        self._filepart_cache = {}
-        self._checkpoint_file_cache = {}
+        # date -> DumpFileCatalog
+        self._catalogs = {}
+        # catalogs are looked up and added from command monitor threads
+        self._catalogs_lock = threading.Lock()
 
     def get_wiki(self):
         '''
@@ -892,14 +1377,27 @@ class DumpDir():
             date_string = self._wiki.date
         return os.path.join(self._wiki.web_dir_relative(), date_string, dfname.filename)
 
+    def get_catalog(self, date=None):
+        """
+        args:
+            date in YYYYMMDD format, or "latest"
+        returns:
+            DumpFileCatalog for the directory, brought up to date
+        """
+        if not date:
+            date = self._wiki.date
+        with self._catalogs_lock:
+            if date not in self._catalogs:
+                self._catalogs[date] = DumpFileCatalog(
+                    self._wiki, os.path.join(self._wiki.public_dir(), date))
+            catalog = self._catalogs[date]
+        catalog.refresh()
+        return catalog
+
     def dir_cache_outdated(self, date):
         if not date:
             date = self._wiki.date
-        directory = os.path.join(self._wiki.public_dir(), date)
-        if exists(directory):
-            dir_time_stamp = os.stat(directory).st_mtime
-            return bool(date not in self._dir_cache or dir_time_stamp > self._dir_cache_time[date])
-        return True
+        return date not in self._catalogs or self._catalogs[date].is_outdated()
 
     # warning: date can also be "latest"
     def get_files_in_dir(self, date=None):
@@ -909,35 +1407,42 @@ class DumpDir():
         returns:
             list of DumpFilename
         """
-        if not date:
-            date = self._wiki.date
-        if self.dir_cache_outdated(date):
-            directory = os.path.join(self._wiki.public_dir(), date)
-            if exists(directory):
-                dir_time_stamp = os.stat(directory).st_mtime
-                filenames = os.listdir(directory)
-                dfnames = []
-                for filename in filenames:
-                    dfname = DumpFilename(self._wiki)
-                    dfname.new_from_filename(filename)
-                    dfnames.append(dfname)
-                self._dir_cache[date] = dfnames
-                # The directory listing should get cached. However, some tyical file
-                # system's (eg. ext2, ext3) mtime's resolution is 1s. If we would
-                # unconditionally cache, it might happen that we cache at x.1 seconds
-                # (with mtime x). If a new file is added to the filesystem at x.2,
-                # the directory's mtime would still be set to x. Hence we would not
-                # detect that the cache needs to be purged. Therefore, we cache only,
-                # if adding a file now would yield a /different/ mtime.
-                if time.time() >= dir_time_stamp + 1:
-                    self._dir_cache_time[date] = dir_time_stamp
-                else:
-                    # By setting _dir_cache_time to 0, we provoke an outdated cache
-                    # on the next check. Hence, we effectively do not cache.
-                    self._dir_cache_time[date] = 0
-            else:
-                self._dir_cache[date] = []
-        return self._dir_cache[date]
+        return self.get_catalog(date).get_dfnames()
+
+    def note_file_added(self, path):
+        """
+        we created or moved a file into place at the given path;
+        if it is in one of our catalogued directories, add it
+        """
+        self._update_catalogs([], [path])
+
+    def note_file_removed(self, path):
+        """
+        we removed or moved away the file at the given path;
+        if it is in one of our catalogued directories, drop it
+        """
+        self._update_catalogs([path], [])
+
+    def note_file_renamed(self, old_path, new_path):
+        """
+        we renamed a file; update any catalogs it is in
+        """
+        self._update_catalogs([old_path], [new_path])
+
+    def _update_catalogs(self, removed_paths, added_paths):
+        """
+        drop the removed and add the added files to the catalogs
+        of the directories they are in, if we have those
+        """
+        with self._catalogs_lock:
+            catalogs = list(self._catalogs.values())
+        for catalog in catalogs:
+            removed = [os.path.basename(path) for path in removed_paths
+                       if os.path.dirname(path) == catalog.directory]
+            added = [os.path.basename(path) for path in added_paths
+                     if os.path.dirname(path) == catalog.directory]
+            if removed or added:
+                catalog.update(removed, added)
 
     def _get_files_filtered(self, date=None, dump_name=None, file_type=None,
                             file_ext=None, parts=None, temp=None, checkpoint=None,
@@ -963,25 +1468,20 @@ class DumpDir():
             file type eg "xml", "sql", file ext e.g. "gz", "bz2",
             bool (if subjobs are enabled), ...
         '''
-        if not date:
-            date = self._wiki.date
-        dfnames = self.get_files_in_dir(date)
+        catalog = self.get_catalog(date)
         dfnames_matched = []
         if skip_suffixes is None:
             skip_suffixes_tuple = ()
         else:
             skip_suffixes_tuple = tuple(skip_suffixes)
-        for dfname in dfnames:
+        if required_suffixes is not None:
+            required_suffixes_tuple = tuple(required_suffixes)
+        for dfname in catalog.get_candidates(dump_name, parts):
             if dfname.filename.endswith(skip_suffixes_tuple):
                 continue
-
-            if required_suffixes is not None:
-                matches_required = False
-                for suffix in required_suffixes:
-                    if dfname.filename.endswith(suffix):
-                        matches_required = True
-                if not matches_required:
-                    continue
+            if required_suffixes is not None and not dfname.filename.endswith(
+                    required_suffixes_tuple):
+                continue
 
             if dump_name and dfname.dumpname != dump_name:
                 continue
@@ -1003,8 +1503,7 @@ class DumpDir():
                     (checkpoint and not dfname.is_checkpoint_file)):
                 continue
             dfnames_matched.append(dfname)
-            dfnames_matched = self.sort_dumpfilenames(dfnames_matched)
-        return dfnames_matched
+        return catalog.sort(dfnames_matched)
 
     # taken from a comment by user "Toothy" on Ned Batchelder's blog (no longer on the net)
     def sort_dumpfilenames(self, mylist):
@@ -1013,10 +1512,7 @@ class DumpDir():
         args:
             list of DumpFilename
         """
-        convert = lambda text: int(text) if text.isdigit() else text
-        alphanum_key = lambda key: [convert(c) for c in re.split('([0-9]+)', key.filename)]
-        mylist = sorted(mylist, key=alphanum_key)
-        return mylist
+        return sorted(mylist, key=lambda dfname: DumpFileCatalog.get_sort_key(dfname.filename))
 
     def get_checkpt_files(self, date=None, dump_name=None,
                           file_type=None, file_ext=None, parts=None, temp=False, inprog=False):
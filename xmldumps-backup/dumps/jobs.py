@@ -30,10 +30,7 @@ class ProgressCallback():
         self.progress = line.strip()
 
     def progress_updates(self, runner):
-        runner.report.update_index_html_and_json()
-        runner.statushtml.update_status_file()
-        runner.dumpjobdata.runinfo.save_dump_runinfo(
-            runner.dumpjobdata.runinfo.report_dump_runinfo(runner.dump_item_list.dump_items))
+        runner.publish_status()
 
     def progress_callback(self, runner, line=""):
         """Receive a status line from a shellout and update the status files."""
@@ -103,6 +100,14 @@ class Dump():
         # the item end in the public dir.
         return False
 
+    def parts_cover_page_ranges(self):
+        """
+        return True if the parts of this job cover the page ranges
+        from the pages per part setting, so that their runtimes can
+        be used to choose the page ranges of the next run
+        """
+        return False
+
     def name(self):
         if "name" in self.runinfo:
             return self.runinfo["name"]
@@ -228,11 +233,16 @@ class Dump():
             return False
         return numpages > int(dfname.last_page_id) - int(dfname.first_page_id)
 
-    def move_if_truncated(self, runner, dfname, emptycheck=0, tmpdir=False):
+    def check_output_contents(self, runner, dfname, emptycheck=0, tmpdir=False):
         """
-        check if the given file (DumpFile) is truncated or empty
-        if so, move it out of the way and return True
-        return False otherwise
+        check if the given file (DumpFile) is truncated or empty or
+        has binary junk in it; if so, move it out of the way
+
+        the file contents are read through only once for all the checks;
+        the ContentsVerdict from that is returned, or None if the file
+        doesn't exist or truncation checks are not enabled. For good xml
+        files, the page ids and counts from the verdict are saved in a
+        sidecar file next to the file.
 
         if emptycheck is set to a number, the file will only be checked to
         seee if it is empty, if the file covers a page range with more
@@ -250,7 +260,7 @@ class Dump():
         (or private, if the wiki is private), will be checked for the file.
         """
         if "check_trunc_files" not in runner.enabled or not self.check_truncation():
-            return False
+            return None
 
         if tmpdir:
             path = os.path.join(
@@ -258,34 +268,47 @@ class Dump():
                 dfname.filename)
         else:
             path = runner.dump_dir.filename_public_path(dfname)
+        if not os.path.exists(path):
+            # file doesn't exist, move on
+            return None
         dcontents = DumpContents(runner.wiki, path)
 
-        file_truncated = True
-        if os.path.exists(dcontents.filename):
-            # for some file types we will check that the file has the right closing tag
-            last_tag = None
-            if ('.xml' in dcontents.filename and
-                    ('.bz2' in dcontents.filename or '.gz' in dcontents.filename)):
-                last_tag = b'</mediawiki>'
-
-            # fixme hardcoded at 200? mmmm. but otoh configurable is kinda dumb
-            if (not emptycheck or self.is_larger(dfname, 200)) and dcontents.check_if_empty():
-                # file exists and is empty, move it out of the way
-                dcontents.rename(dcontents.filename + ".empty")
-            elif dcontents.check_if_truncated(last_tag):
-                # The file exists and is truncated, move it out of the way
-                dcontents.rename(dcontents.filename + ".truncated")
-            elif dcontents.check_if_binary_crap():
-                # The file exists and has binary junk in it, move it out of the way
-                dcontents.rename(dcontents.filename + ".truncated")
-            else:
-                # The file exists and is not truncated and doesn't have random crap.
-                # Heck, it's a good file!
-                file_truncated = False
-        else:
-            # file doesn't exist, move on
-            file_truncated = False
-        return file_truncated
+        # for some file types we will check that the file has the right closing tag
+        last_tag = None
+        if ('.xml' in dcontents.filename and
+                ('.bz2' in dcontents.filename or '.gz' in dcontents.filename)):
+            last_tag = b'</mediawiki>'
+        verdict = dcontents.validate(last_tag)
+
+        # fixme hardcoded at 200? mmmm. but otoh configurable is kinda dumb
+        if verdict.empty and emptycheck and not self.is_larger(dfname, 200):
+            # small page ranges may legitimately have no pages in them
+            verdict.empty = False
+
+        if verdict.empty:
+            # file exists and is empty, move it out of the way
+            dcontents.rename(dcontents.filename + ".empty")
+            runner.dump_dir.note_file_renamed(path, path + ".empty")
+        elif verdict.truncated or verdict.binary:
+            # The file exists and is truncated or has random crap, move it out of the way
+            dcontents.rename(dcontents.filename + ".truncated")
+            runner.dump_dir.note_file_renamed(path, path + ".truncated")
+        elif verdict.checked and '.xml' in dcontents.filename:
+            # it's a good file! keep the page ids we found, so nothing
+            # needs to uncompress it again to get them
+            dcontents.write_sidecar(verdict)
+        return verdict
+
+    def move_if_truncated(self, runner, dfname, emptycheck=0, tmpdir=False):
+        """
+        check if the given file (DumpFile) is truncated or empty
+        if so, move it out of the way and return True
+        return False otherwise
+
+        see check_output_contents for the meaning of the args
+        """
+        verdict = self.check_output_contents(runner, dfname, emptycheck, tmpdir)
+        return bool(verdict is not None and verdict.is_bad())
 
     def check_for_truncated_files(self, runner):
         """
@@ -327,6 +350,8 @@ class Dump():
         if not series.exited_successfully():
             return
 
+        # checksums of output computed as it was written, if any
+        digests = series.get_output_digests()
         for commands in self.commands_submitted:
             if commands['series'] == series._command_series:
                 if not commands['output_files']:
@@ -342,6 +367,7 @@ class Dump():
                     final_path = os.path.join(commands['output_dir'], final_dfname.filename)
                     try:
                         os.rename(in_progress_path, final_path)
+                        commands['runner'].dump_dir.note_file_renamed(in_progress_path, final_path)
                     except Exception:
                         if self.verbose:
                             exc_type, exc_value, exc_traceback = sys.exc_info()
@@ -349,7 +375,25 @@ class Dump():
                                 traceback.format_exception(exc_type, exc_value, exc_traceback)))
                         continue
                     # sanity check of file contents, move if bad
-                    self.move_if_truncated(commands['runner'], final_dfname)
+                    verdict = self.check_output_contents(commands['runner'], final_dfname)
+                    if verdict is not None and verdict.is_bad():
+                        if self.verbose:
+                            sys.stderr.write("bad output file %s\n" % verdict.describe())
+                        continue
+                    self.save_output_digests(commands['runner'], final_dfname, final_path,
+                                             digests.get(in_progress_path))
+
+    @staticmethod
+    def save_output_digests(runner, dfname, path, sums):
+        """
+        given the checksums of an output file computed as it was
+        written, save them as its per-file checksums so that the file
+        need not be read again to produce them; the checksummer
+        only looks for these next to files in the public dir
+        """
+        if not sums or path != runner.dump_dir.filename_public_path(dfname):
+            return
+        runner.dumpjobdata.checksummer.save_per_file_checksums(dfname, sums)
 
     def remove_output_file(self, dump_dir, dfname):
         """
@@ -357,10 +401,12 @@ class Dump():
         either in the public dir or the private one, depending on
         where it is
         """
-        if exists(dump_dir.filename_public_path(dfname)):
-            os.remove(dump_dir.filename_public_path(dfname))
-        if exists(dump_dir.filename_public_path(dfname) + DumpFilename.INPROG):
-            os.remove(dump_dir.filename_public_path(dfname) + DumpFilename.INPROG)
+        for path in [dump_dir.filename_public_path(dfname),
+                     dump_dir.filename_public_path(dfname) + DumpFilename.INPROG,
+                     dump_dir.filename_public_path(dfname) + DumpContents.SIDECAR_SUFFIX]:
+            if exists(path):
+                os.remove(path)
+                dump_dir.note_file_removed(path)
 
     def cleanup_old_files(self, dump_dir, runner):
         if "cleanup_old_files" in runner.enabled:
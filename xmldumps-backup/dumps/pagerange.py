@@ -19,6 +19,9 @@ import gzip
 import os
 import sys
 import json
+import mmap
+from array import array
+from bisect import bisect_left, bisect_right
 
 from dumps.wikidump import Config, Wiki
 from dumps.utils import DbServerInfo
@@ -164,6 +167,188 @@ class QueryRunner():
         return get_estimate_from_output(queryout)
 
 
+def get_revinfo_index_path(revinfo_path):
+    """
+    given the path to a revinfo file, return the path
+    to the corresponding binary revinfo index
+    """
+    if revinfo_path.endswith('.gz'):
+        revinfo_path = revinfo_path[:-3]
+    return revinfo_path + '.idx'
+
+
+class RevInfoIndex():
+    """
+    binary index of cumulative revision counts and byte counts by page id,
+    built from a revinfo file, so that page ranges can be cut with
+    binary searches instead of reading through the revinfo file
+
+    layout: magic, number of entries n, then n page ids, n+1 cumulative
+    rev counts and n+1 cumulative byte counts, all native 8-byte ints;
+    entry i covers page ids from page_ids[i] up to page_ids[i+1] - 1,
+    with cum_revs[i+1] - cum_revs[i] revisions (likewise bytes)
+
+    the index is mmapped, so loading it is cheap no matter the size
+    """
+    MAGIC = b'DRVIDX01'
+    HEADER_SIZE = 16
+
+    def __init__(self, index_path):
+        with open(index_path, "rb") as infile:
+            self.mapped = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if self.mapped[:8] != self.MAGIC:
+                raise ValueError("bad magic in revinfo index " + index_path)
+            count = int.from_bytes(self.mapped[8:16], sys.byteorder)
+            if len(self.mapped) != self.HEADER_SIZE + 8 * (3 * count + 2):
+                raise ValueError("bad length for revinfo index " + index_path)
+            values = memoryview(self.mapped)[self.HEADER_SIZE:].cast('q')
+        except ValueError:
+            self.mapped.close()
+            raise
+        self.count = count
+        self.page_ids = values[:count]
+        self.cum_revs = values[count:2 * count + 1]
+        self.cum_bytes = values[2 * count + 1:]
+        self.views = [values, self.page_ids, self.cum_revs, self.cum_bytes]
+
+    def close(self):
+        """
+        release the views of the index and unmap it
+        """
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        self.mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def load(index_path):
+        """
+        return the RevInfoIndex for the path, or None if there
+        is no such file or it is not a good index
+        """
+        if not index_path or not os.path.exists(index_path):
+            return None
+        try:
+            return RevInfoIndex(index_path)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def build(revinfo_path, index_path):
+        """
+        read the revinfo file (gzipped lines of pageid:bytecount:revcount)
+        and write the index for it to index_path
+        """
+        page_ids = array('q')
+        cum_revs = array('q', [0])
+        cum_bytes = array('q', [0])
+        revs_total = 0
+        bytes_total = 0
+        with gzip.open(revinfo_path, "r") as page_info:
+            for entry in page_info:
+                fields = entry.rstrip().split(b':')
+                if len(fields) != 3:
+                    continue
+                page_ids.append(int(fields[0]))
+                bytes_total += int(fields[1])
+                revs_total += int(fields[2])
+                cum_revs.append(revs_total)
+                cum_bytes.append(bytes_total)
+
+        index_path_tmp = index_path + ".tmp"
+        with open(index_path_tmp, "wb") as outfile:
+            outfile.write(RevInfoIndex.MAGIC)
+            outfile.write(len(page_ids).to_bytes(8, sys.byteorder))
+            page_ids.tofile(outfile)
+            cum_revs.tofile(outfile)
+            cum_bytes.tofile(outfile)
+        os.rename(index_path_tmp, index_path)
+
+    def get_ranges(self, maxbytes, maxrevs, minpageid, maxpageid, minpagecount=1):
+        """
+        return the same list of (startpageid, endpageid) tuples as
+        PageRange.get_ranges_via_revinfo would for the revinfo file
+        this index was built from, but with two binary searches per
+        range instead of a scan through the file
+        """
+        if not self.count:
+            # as for the scan of an empty revinfo file
+            if minpageid < maxpageid:
+                return [(minpageid, maxpageid)]
+            return []
+        if maxbytes is None:
+            maxbytes = self.cum_bytes[-1]
+
+        ranges = []
+        first = bisect_left(self.page_ids, minpageid)
+        # entries at or past maxpageid end the last range
+        last = bisect_left(self.page_ids, maxpageid)
+        # the entry just before minpageid counts toward the first range
+        base = max(first - 1, 0)
+        revs_base = self.cum_revs[base]
+        bytes_base = self.cum_bytes[base]
+        range_start = minpageid
+        current = first
+        while True:
+            # first entry that puts us over maxrevs or over maxbytes
+            over = min(bisect_right(self.cum_revs, revs_base + maxrevs, current + 1) - 1,
+                       bisect_right(self.cum_bytes, bytes_base + maxbytes, current + 1) - 1)
+            # first entry far enough along to satisfy minpagecount
+            over = max(over, bisect_left(self.page_ids, range_start + minpagecount, current))
+            if over >= last:
+                if last < self.count or range_start < maxpageid:
+                    ranges.append((range_start, maxpageid))
+                return ranges
+            ranges.append((range_start, self.page_ids[over] - 1))
+            range_start = self.page_ids[over]
+            # the entry we stopped at does not count toward the next range,
+            # as with the scan of the revinfo file
+            current = over + 1
+            revs_base = self.cum_revs[current]
+            bytes_base = self.cum_bytes[current]
+
+    def get_ranges_for_jobs(self, numjobs, minpageid, maxpageid):
+        """
+        return a list of up to numjobs (startpageid, endpageid) tuples
+        covering minpageid through maxpageid, with about the same number
+        of revisions in each range; ranges can only be cut at page ids
+        with entries in the index, so there may be fewer of them
+        """
+        if numjobs < 1:
+            return []
+        if not self.count:
+            # nowhere to cut, as for the scan of an empty revinfo file
+            return [(minpageid, maxpageid)]
+        first = max(bisect_right(self.page_ids, minpageid) - 1, 0)
+        last = bisect_right(self.page_ids, maxpageid)
+        revs_start = self.cum_revs[first]
+        revs_total = self.cum_revs[last] - revs_start
+
+        ranges = []
+        range_start = minpageid
+        for jobnum in range(1, numjobs):
+            target = revs_start + (revs_total * jobnum) / numjobs
+            cut = bisect_left(self.cum_revs, target, first + 1, last)
+            # cut at whichever page id boundary is closest to the target
+            if cut > first + 1 and target - self.cum_revs[cut - 1] < self.cum_revs[cut] - target:
+                cut -= 1
+            if cut >= last:
+                break
+            if self.page_ids[cut] <= range_start:
+                continue
+            ranges.append((range_start, self.page_ids[cut] - 1))
+            range_start = self.page_ids[cut]
+        ranges.append((range_start, maxpageid))
+        return ranges
+
+
 class PageRange():
     '''
     Methods for getting number of revisions for a page range.
@@ -184,19 +369,30 @@ class PageRange():
         self.total_pages = None
         self.total_revs = None
 
-    def get_pageranges_for_jobs(self, numjobs):
+    def get_pageranges_for_jobs(self, numjobs, revinfo_path=None):
         '''
         get and return list of tuples consisting of page id start and end to be passed to
         self.numjobs jobs which should run in approximately the same length of time
         for full history dumps, which is all we care about, really
         numjobs -- number of jobs to be run in parallel, and so number of page ranges
                    we want to produce for these parallel runs
+        revinfo_path -- if there is a revinfo index for this revinfo file, the
+                   ranges are cut from the index instead of via db queries
         '''
 
-        if self.total_revs is None:
-            self.total_revs = self.qrunner.get_max_id('rev')
         if self.total_pages is None:
             self.total_pages = self.qrunner.get_max_id('page')
+        if revinfo_path:
+            index = RevInfoIndex.load(get_revinfo_index_path(revinfo_path))
+            if index is not None:
+                with index:
+                    ranges = index.get_ranges_for_jobs(numjobs, 1, self.total_pages)
+                if ranges:
+                    if self.verbose:
+                        print("page ranges for jobs retrieved via revinfo index")
+                    return ranges
+        if self.total_revs is None:
+            self.total_revs = self.qrunner.get_max_id('rev')
         ranges = []
         page_start = 1
         numrevs = int(self.total_revs / numjobs) + 1
@@ -361,8 +557,14 @@ class PageRange():
             page_end = self.total_pages
 
         if revinfo_path:
-            ranges = self.get_ranges_via_revinfo(revinfo_path, maxbytes, numrevs,
-                                                 page_start, page_end, minpagecount)
+            index = RevInfoIndex.load(get_revinfo_index_path(revinfo_path))
+            if index is not None:
+                with index:
+                    ranges = index.get_ranges(maxbytes, numrevs, page_start, page_end,
+                                              minpagecount)
+            else:
+                ranges = self.get_ranges_via_revinfo(revinfo_path, maxbytes, numrevs,
+                                                     page_start, page_end, minpagecount)
             if ranges:
                 if self.verbose:
                     print("page ranges retrieved via revinfo for", page_start, page_end)
@@ -596,8 +798,8 @@ Usage: pagerange.py --wiki <wikiname> --jobs|--revs <int>
 --jobs        (-j):  generate page ranges for this number of jobs
 --revs        (-r):  generate page ranges for this number of
                      revisions per interval
---revinfopath (-R):  path to revinfo file, default None
-                     this option requires --revs
+--revinfopath (-R):  path to revinfo file, default None; if there is
+                     a revinfo index next to it, that is used instead
 --maxbytes    (-m):  max bytes per pagerange (uncompressed)
 --pagestart   (-s):  page id start for --revs option, default 1
 --pageend     (-e):  page id end for --revs option, default last
@@ -669,7 +871,7 @@ def do_pageranges(prange, range_opts, pad, jsonfmt):
     is passed no padding will be done
     """
     if range_opts['jobs']:
-        ranges = prange.get_pageranges_for_jobs(range_opts['jobs'])
+        ranges = prange.get_pageranges_for_jobs(range_opts['jobs'], range_opts['revinfopath'])
         # convert ranges into the output we need for the pagesperchunkhistory config
         pages_per_job = [page_end - page_start for (page_start, page_end) in ranges]
         if jsonfmt:
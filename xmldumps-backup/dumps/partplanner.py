@@ -0,0 +1,357 @@
+#!/usr/bin/python3
+"""
+keep a history of how long the parts of dump jobs run over page
+ranges took, and use it to choose the page ranges of the parts
+for the next run so that they all finish at about the same time
+"""
+
+
+import json
+import os
+from dumps.fileutils import DumpFilename, FileUtils
+from dumps.utils import FilePartInfo
+
+
+def get_part_bounds(pages_per_part, last_page_id=None):
+    """
+    given a list of the number of pages in each part, return a list
+    of (first page id, last page id) for each part; the last part runs
+    to the end of the wiki, so its last page id is the one given, if
+    any, or None
+    """
+    bounds = []
+    first = 1
+    for pages in pages_per_part:
+        bounds.append((first, first + pages - 1))
+        first += pages
+    if bounds:
+        bounds[-1] = (bounds[-1][0], last_page_id)
+    return bounds
+
+
+class RuntimeHistory():
+    """
+    runtimes of the pieces of dump jobs that were split up into parts,
+    for the last few runs of a wiki, kept in a json file in the wiki's
+    private dir. Each job has for each run date a list of
+    [first page id, last page id, seconds] for the pieces that ran.
+    """
+    FILENAME = "runtimehistory.json"
+    # how many runs of each job we keep
+    KEEP_RUNS = 3
+
+    def __init__(self, wiki):
+        self.wiki = wiki
+        self.jobs = None
+
+    def get_path(self):
+        """
+        return the path of the history file for the wiki
+        """
+        return os.path.join(self.wiki.private_dir(), RuntimeHistory.FILENAME)
+
+    def load(self):
+        """
+        read the history from the file, which another run of the dump
+        script may have updated; a missing or garbled file means no history
+        """
+        self.jobs = {}
+        try:
+            with open(self.get_path(), "r") as infile:
+                self.jobs = json.load(infile)['jobs']
+        except (IOError, ValueError, KeyError, TypeError):
+            pass
+
+    def get_jobs(self):
+        """
+        return the dict of job name: {date: list of [first, last, seconds]}
+        """
+        if self.jobs is None:
+            self.load()
+        return self.jobs
+
+    def record(self, jobname, date, ranges):
+        """
+        given a list of (first page id, last page id, seconds) for pieces
+        of the job that ran in the dump run for the given date, add them
+        to the history, replacing any recorded before for the same page
+        ranges in that run, and write the history out
+        """
+        if not ranges:
+            return
+        self.load()
+        runs = self.jobs.setdefault(jobname, {})
+        entries = {(first, last): seconds for (first, last, seconds) in runs.get(date, [])}
+        for (first, last, seconds) in ranges:
+            entries[(first, last)] = seconds
+        runs[date] = sorted([first, last, seconds] for ((first, last), seconds) in entries.items())
+        for olddate in sorted(runs)[:-RuntimeHistory.KEEP_RUNS]:
+            del runs[olddate]
+        FileUtils.write_file(self.wiki.private_dir(), self.get_path(),
+                             json.dumps({'jobs': self.jobs}), self.wiki.config.fileperms)
+
+    def get_latest_runs(self, before):
+        """
+        return a dict of job name: list of [first, last, seconds] from
+        the most recent run of each job before the given date
+        """
+        latest = {}
+        for jobname, runs in self.get_jobs().items():
+            dates = [date for date in runs if date < before and runs[date]]
+            if dates:
+                latest[jobname] = runs[max(dates)]
+        return latest
+
+    def record_job(self, item, pages_per_part, last_page_id=None):
+        """
+        add the runtimes of the command series run for the parts of the
+        dump job (item) to the history; the page range of each comes from
+        the name of its first output file or, if that has none, from the
+        page ranges of the parts of the run, given as a list of the
+        number of pages in each part and the last page id of the wiki;
+        without the last page id, pieces of the last part that have no
+        page ranges in their names are skipped, and if the job has more
+        parts than the list, all of those pieces are
+        """
+        if not item.parts_cover_page_ranges():
+            return
+        bounds = get_part_bounds(pages_per_part, last_page_id) if pages_per_part else []
+        pieces = []
+        for command_info in item.commands_submitted:
+            if command_info.get('wall') is None or not command_info['output_files']:
+                continue
+            dfname = DumpFilename(self.wiki)
+            dfname.new_from_filename(
+                command_info['output_files'][0][:-1 * len(DumpFilename.INPROG)])
+            if dfname.partnum_int:
+                pieces.append((dfname, command_info['wall']))
+        if any(dfname.partnum_int > len(bounds) for (dfname, _wall) in pieces):
+            # the list isn't the one the job was split up by
+            bounds = []
+        ranges = []
+        for (dfname, wall) in pieces:
+            if dfname.first_page_id_int and dfname.last_page_id_int:
+                ranges.append((dfname.first_page_id_int, dfname.last_page_id_int, wall))
+            elif bounds and bounds[dfname.partnum_int - 1][1]:
+                (first, last) = bounds[dfname.partnum_int - 1]
+                ranges.append((first, last, wall))
+        self.record(item.name(), self.wiki.date, ranges)
+
+
+class PartPlanner():
+    """
+    choose page ranges for a given number of parts from the runtime
+    history, so that the dump run is predicted to take as little time
+    as it can. The jobs of a run go one after another and the parts of
+    each job run side by side, so the predicted time of the run is the
+    sum over the jobs of the predicted time of their slowest part.
+
+    Within each page range of the last run of a job, each page is
+    taken to have cost the same share of the range's runtime. Candidate
+    page ranges are made by cutting the pages into parts of equal cost,
+    by the costs of each job and by the costs of all jobs added up;
+    the candidate with the least predicted time is chosen, unless the
+    configured page ranges are predicted to do at least as well. Pages
+    newer than any in the history go into the last part, as they always have.
+    """
+    def __init__(self, history):
+        self.history = history
+
+    @staticmethod
+    def get_cost_intervals(runs):
+        """
+        given a dict of job name: list of (first page id, last page id, seconds),
+        return a list of (first page id, page id after the last, seconds per page)
+        for the page ranges, with the costs per page of overlapping ranges added
+        up, in page order
+        """
+        changes = {}
+        for ranges in runs.values():
+            for (first, last, seconds) in ranges:
+                if last < first or seconds <= 0:
+                    continue
+                rate = seconds / (last - first + 1)
+                changes[first] = changes.get(first, 0) + rate
+                changes[last + 1] = changes.get(last + 1, 0) - rate
+        intervals = []
+        rate = 0
+        points = sorted(changes)
+        for (start, end) in zip(points, points[1:]):
+            rate += changes[start]
+            intervals.append((start, end, max(rate, 0)))
+        return intervals
+
+    @staticmethod
+    def cut(intervals, numparts):
+        """
+        given a list of (first page id, page id after the last, seconds per page)
+        in page order, return a list of the number of pages in each of the given
+        number of parts so that each part costs the same, or None if that can't be done
+        """
+        if not intervals:
+            return None
+        maxpage = intervals[-1][1] - 1
+        total = sum((end - start) * rate for (start, end, rate) in intervals)
+        if total <= 0 or maxpage < numparts:
+            return None
+
+        # the first page id of each part after the first
+        cuts = []
+        share = total / numparts
+        done = 0
+        for (start, end, rate) in intervals:
+            cost = (end - start) * rate
+            while len(cuts) < numparts - 1 and rate and done + cost >= share * (len(cuts) + 1):
+                cuts.append(start + int(round((share * (len(cuts) + 1) - done) / rate)))
+            done += cost
+        while len(cuts) < numparts - 1:
+            cuts.append(maxpage)
+
+        # every part gets at least one page
+        for index in range(numparts - 1):
+            lowest = cuts[index - 1] + 1 if index else 2
+            highest = maxpage - (numparts - 2 - index)
+            cuts[index] = min(max(cuts[index], lowest), highest)
+        firsts = [1] + cuts
+        return ([second - first for (first, second) in zip(firsts, cuts)] +
+                [maxpage - firsts[-1] + 1])
+
+    @staticmethod
+    def get_run_time(predicted):
+        """
+        given a dict of job name: list of predicted seconds for each part,
+        return the predicted seconds for all of the jobs, one after another
+        """
+        return sum(max(seconds) for seconds in predicted.values() if seconds)
+
+    def plan(self, numparts, before, configured=None):
+        """
+        return a list of the number of pages in each of the given number of
+        parts, with the page ranges chosen from the history of runs before
+        the given date, or None if there is not enough history to go on or
+        the configured list of pages per part, if any, would do as well
+        """
+        runs = self.history.get_latest_runs(before)
+        candidates = [self.cut(self.get_cost_intervals(runs), numparts)]
+        for jobname in sorted(runs):
+            candidates.append(self.cut(self.get_cost_intervals({jobname: runs[jobname]}),
+                                       numparts))
+        best = None
+        best_time = None
+        if configured:
+            best_time = self.get_run_time(self.predict(configured, before))
+        for candidate in candidates:
+            if candidate is None:
+                continue
+            run_time = self.get_run_time(self.predict(candidate, before))
+            if best_time is None or run_time < best_time:
+                best = candidate
+                best_time = run_time
+        return best
+
+    def predict(self, pages_per_part, before):
+        """
+        return a dict of job name: list of the predicted seconds for each part,
+        given the number of pages in each part, for each job in the history
+        of runs before the given date
+        """
+        bounds = get_part_bounds(pages_per_part)
+        predicted = {}
+        for jobname, ranges in self.history.get_latest_runs(before).items():
+            seconds = [0.0] * len(bounds)
+            for (first, last, runtime) in ranges:
+                if last < first:
+                    continue
+                for index, (part_first, part_last) in enumerate(bounds):
+                    overlap = min(last, part_last or last) - max(first, part_first) + 1
+                    if overlap > 0:
+                        seconds[index] += runtime * overlap / (last - first + 1)
+            predicted[jobname] = [round(value, 1) for value in seconds]
+        return predicted
+
+
+class PartPlan():
+    """
+    the page ranges chosen for the parts of the page content jobs of
+    a dump run, with the runtime predicted for each part of each job,
+    kept in the private dump run directory
+    """
+    FILENAME = "partplan.json"
+
+    def __init__(self, wiki, history=None):
+        self.wiki = wiki
+        self.history = history if history is not None else RuntimeHistory(wiki)
+
+    def get_path(self):
+        """
+        return the path of the plan file for the dump run
+        """
+        return os.path.join(self.wiki.private_dir(), self.wiki.date, PartPlan.FILENAME)
+
+    def load(self):
+        """
+        return the contents of the plan file, or None if there is no plan
+        """
+        try:
+            with open(self.get_path(), "r") as infile:
+                return json.load(infile)
+        except (IOError, ValueError):
+            return None
+
+    def make(self, pages_per_part):
+        """
+        given the setting for the number of pages per part from the config,
+        choose page ranges for the same number of parts from the runtime
+        history, save them with the predicted runtimes, and return them
+        in the same comma-separated format; return None if the setting
+        is not a list of parts, there is not enough history to go on, or
+        the configured page ranges are predicted to do as well
+        """
+        configured = FilePartInfo.convert_comma_sep(str(pages_per_part))
+        if not configured or len(configured) < 2:
+            return None
+        planner = PartPlanner(self.history)
+        planned = planner.plan(len(configured), self.wiki.date, configured)
+        if planned is None:
+            return None
+        contents = {'configured': configured, 'pagesperpart': planned,
+                    'predicted': planner.predict(planned, self.wiki.date)}
+        rundir = os.path.join(self.wiki.private_dir(), self.wiki.date)
+        FileUtils.write_file(rundir, self.get_path(), json.dumps(contents),
+                             self.wiki.config.fileperms)
+        return ",".join(str(pages) for pages in planned)
+
+    def get_part_runtimes(self, pages_per_part):
+        """
+        given the list of the number of pages in each part for the run,
+        return a dict of job name: list with a dict for each part, with
+        its page range, the runtime predicted when the page ranges were
+        chosen (if they were) and the runtime recorded in this run (if it ran)
+        """
+        if not pages_per_part or len(pages_per_part) < 2:
+            return {}
+        bounds = get_part_bounds(pages_per_part)
+        plan = self.load()
+        predicted = {}
+        if plan and plan['pagesperpart'] == pages_per_part:
+            predicted = plan['predicted']
+        actual = {}
+        # other runs of the dump script may have recorded runtimes since
+        self.history.load()
+        for jobname, runs in self.history.get_jobs().items():
+            if self.wiki.date not in runs:
+                continue
+            actual[jobname] = [None] * len(bounds)
+            for (first, _last, seconds) in runs[self.wiki.date]:
+                for index, (part_first, part_last) in enumerate(bounds):
+                    if first >= part_first and (part_last is None or first <= part_last):
+                        actual[jobname][index] = round((actual[jobname][index] or 0) + seconds, 1)
+        runtimes = {}
+        for jobname in set(predicted) | set(actual):
+            runtimes[jobname] = []
+            for index, (first, last) in enumerate(bounds):
+                runtimes[jobname].append({
+                    'part': index + 1, 'firstpageid': first, 'lastpageid': last,
+                    'predicted': predicted[jobname][index] if jobname in predicted else None,
+                    'actual': actual[jobname][index] if jobname in actual else None})
+        return runtimes
@@ -5,12 +5,129 @@ All xml content dump jobs are defined here
 
 import os
 from os.path import exists
+import json
 
-from dumps.fileutils import DumpContents, PARTS_ANY
+from dumps.fileutils import DumpContents, DumpFilename, FileUtils, PARTS_ANY
 from dumps.filelister import JobFileLister
+from dumps.runnerutils import RunInfo
+import dumps.intervals
 import dumps.pagerange
 
 
+class PrefetchCatalog():
+    """
+    catalog of the page content files from earlier dump runs of a wiki,
+    with the page range each file covers, and of which jobs in those runs
+    completed, so that finding prefetch files for a page range doesn't
+    mean listing directories and digging page ids out of files every time
+
+    it's kept as a json file in the private directory of the wiki; the
+    entries for a run are thrown away whenever the run directory or its
+    status files change, so a run that is still going gets looked at
+    again once it has completed
+    """
+    FILENAME = "prefetchcatalog.json"
+
+    def __init__(self, wiki):
+        self.wiki = wiki
+        self.path = os.path.join(wiki.private_dir(), self.FILENAME)
+        self.runs = None
+        self.changed = False
+
+    def load(self):
+        """
+        read in the catalog file if we haven't already; a file
+        we can't read means we start over with an empty catalog
+        """
+        if self.runs is not None:
+            return
+        self.runs = {}
+        if not exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as infile:
+                self.runs = json.load(infile)['runs']
+        except (OSError, ValueError, KeyError):
+            self.runs = {}
+
+    def save(self):
+        """
+        write the catalog file out if there were any changes
+        """
+        if not self.changed or not exists(self.wiki.private_dir()):
+            return
+        FileUtils.write_file(self.wiki.config.temp_dir, self.path,
+                             json.dumps({'runs': self.runs}), self.wiki.config.fileperms)
+        self.changed = False
+
+    def get_stamp(self, date):
+        """
+        return the mtimes of the run directory for the given date and
+        of the files the status of its jobs can be read from
+        """
+        rundir = os.path.join(self.wiki.public_dir(), date)
+        paths = [rundir, os.path.join(rundir, RunInfo.get_runinfo_basename() + ".txt"),
+                 os.path.join(rundir, self.wiki.config.perdump_index)]
+        stamp = []
+        for path in paths:
+            try:
+                stamp.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                stamp.append(None)
+        return stamp
+
+    def get_run(self, date):
+        """
+        return the catalog entry for the run of the given date,
+        starting a new one if there is none or it is out of date
+        """
+        self.load()
+        stamp = self.get_stamp(date)
+        if date not in self.runs or self.runs[date]['stamp'] != stamp:
+            self.runs[date] = {'stamp': stamp, 'jobs': {}}
+            self.changed = True
+        return self.runs[date]
+
+    def get_job(self, date, jobname):
+        """
+        return the catalog entry for the job in the run of
+        the given date, starting a new one if need be
+        """
+        jobs = self.get_run(date)['jobs']
+        if jobname not in jobs:
+            jobs[jobname] = {'done': None, 'files': {}}
+        return jobs[jobname]
+
+    def get_job_done(self, date, jobname):
+        """
+        return True if the job completed in the run of the given date,
+        False if it did not, None if we don't know
+        """
+        return self.get_job(date, jobname)['done']
+
+    def set_job_done(self, date, jobname, done):
+        """
+        record whether or not the job completed in the run of the given date
+        """
+        self.get_job(date, jobname)['done'] = bool(done)
+        self.changed = True
+
+    def get_files(self, date, jobname, file_ext):
+        """
+        return the info about output files with the given extension for the
+        job in the run of the given date, or None if we don't have it
+        """
+        return self.get_job(date, jobname)['files'].get(file_ext)
+
+    def set_files(self, date, jobname, file_ext, files):
+        """
+        record the info about output files with the given extension
+        for the job in the run of the given date
+        """
+        self.get_job(date, jobname)['files'][file_ext] = files
+        self.changed = True
+
+
 class PrefetchFinder():
     """
     finding appropriate prefetch files for a page
@@ -21,6 +138,73 @@ class PrefetchFinder():
         self.jobinfo = jobinfo
         self.prefetchinfo = prefetchinfo
         self.verbose = verbose
+        self.catalog = PrefetchCatalog(wiki)
+
+    def get_page_coverage(self, file_list, date, runner):
+        """
+        given list of page content files from a dump run and its date,
+        return a list of the files with the page ranges they cover, sorted
+        by starting page id
+
+        args: list of DumpFilename, string in format YYYYMMDD, Runner
+        returns: list of {'filename': <name>, 'first': <num>, 'last': <num> or None}
+        """
+        # collect copies of all the dfnames with the first page id of each
+        dfnames_page_coverage = []
+        for dfname in file_list:
+            if dfname.first_page_id:
+                first_page = dfname.first_page_id_int
+            else:
+                path = runner.dump_dir.filename_public_path(dfname, date)
+                dcontents = DumpContents(self.wiki, path, dfname, self.verbose)
+                first_page = dcontents.find_first_page_id_in_file()
+            dfnames_page_coverage.append({'dfname': dfname, 'first': first_page, 'last': None})
+
+        dfnames_page_coverage_sorted = sorted(
+            dfnames_page_coverage, key=lambda thing: thing['first'])
+
+        for index, coverage in enumerate(dfnames_page_coverage_sorted):
+            if coverage['dfname'].last_page_id:
+                coverage['last'] = coverage['dfname'].last_page_id_int
+            elif index < len(dfnames_page_coverage_sorted) - 1:
+                # claim this file covers up to the page just before the next file's
+                # starting page, may not literally be true because of deletes, but
+                # because this is prefetch, we can't rely on using the config
+                # settings, they may have changed
+                coverage['last'] = dfnames_page_coverage_sorted[index + 1]['first'] - 1
+            else:
+                # the last file; if its contents were checked when it was written,
+                # we know its last page, otherwise it remains 'None' and it will
+                # be treated as covering everything to infinity, which is ok in
+                # this context.
+                path = runner.dump_dir.filename_public_path(coverage['dfname'], date)
+                sidecar = DumpContents(self.wiki, path, coverage['dfname'],
+                                       self.verbose).read_sidecar()
+                if sidecar and sidecar['last_page_id'] is not None:
+                    coverage['last'] = int(sidecar['last_page_id'])
+
+        return [{'filename': coverage['dfname'].filename, 'first': coverage['first'],
+                 'last': coverage['last']} for coverage in dfnames_page_coverage_sorted]
+
+    def get_dfname(self, filename):
+        """
+        return a DumpFilename for the given filename
+        """
+        dfname = DumpFilename(self.wiki)
+        dfname.new_from_filename(filename)
+        return dfname
+
+    def get_covering_dfnames(self, page_coverage, pagerange):
+        """
+        given a list of files with the page ranges they cover, as returned
+        by get_page_coverage(), return the files that cover the page range
+        pagerange = {'start': <num>, 'end': <num>}
+
+        returns: list of DumpFilename
+        """
+        return [self.get_dfname(coverage['filename']) for coverage in page_coverage
+                if dumps.intervals.interval_overlaps(coverage['first'], coverage['last'],
+                                                     pagerange['start'], pagerange['end'])]
 
     def get_relevant_prefetch_dfnames(self, file_list, pagerange, date, runner):
         """
@@ -31,41 +215,10 @@ class PrefetchFinder():
         args: list of DumpFilename, pagerange dict, string in format YYYYMMDD, Runner
         returns: list of DumpFilename
         """
-        possibles = []
-        if file_list:
-            # collect copies of all the dfnames with the first page id of each
-            dfnames_page_coverage = []
-            for dfname in file_list:
-                if dfname.first_page_id:
-                    first_page = dfname.first_page_id_int
-                else:
-                    path = runner.dump_dir.filename_public_path(dfname, date)
-                    dcontents = DumpContents(self.wiki, path, dfname, self.verbose)
-                    first_page = dcontents.find_first_page_id_in_file()
-                dfnames_page_coverage.append({'dfname': dfname, 'first': first_page, 'last': None})
-
-            dfnames_page_coverage_sorted = sorted(
-                dfnames_page_coverage, key=lambda thing: thing['first'])
-
-            for index, coverage in enumerate(dfnames_page_coverage_sorted):
-                if coverage['dfname'].last_page_id:
-                    coverage['last'] = coverage['dfname'].last_page_id_int
-                else:
-                    # here we can fill it in. if it's the last file we can't, it remains
-                    # 'None' and it will be treated as covering everything to infinity,
-                    # which is ok in this context.
-                    if index < len(dfnames_page_coverage_sorted) + 1:
-                        # claim this file covers up to the page just before the next file's
-                        # starting page, may not literally be true because of deletes, but
-                        # because this is prefetch, we can't rely on using the config
-                        # settings, they may have changed
-                        coverage['last'] = dfnames_page_coverage_sorted[index]['first'] - 1
-
-                if dumps.intervals.interval_overlaps(coverage['first'], coverage['last'],
-                                                     pagerange['start'], pagerange['end']):
-                    possibles.append(coverage['dfname'])
-
-        return possibles
+        if not file_list:
+            return []
+        return self.get_covering_dfnames(self.get_page_coverage(file_list, date, runner),
+                                         pagerange)
 
     def get_pagerange_to_prefetch(self, partnum):
         """
@@ -89,13 +242,13 @@ class PrefetchFinder():
             pagerange['end'] = None
         return pagerange
 
-    def find_prefetch_files_from_run(self, runner, date,
-                                     pagerange, file_ext):
+    def get_run_files(self, runner, date, file_ext):
         """
-        for a given wiki and date, see if there are dump content
-        files lying about that can be used for prefetch to the
-        current job, with the given file extension (might be bz2s
-        or 7zs or whatever) for the given range of pages
+        for a given wiki and date, find the content files from the run with
+        the given file extension (might be bz2s or 7zs or whatever) and return
+        info about them for the prefetch catalog: checkpoint files and file
+        parts with the page ranges they cover, and single output files
+        containing all pages with their sizes
         """
         flister = JobFileLister(self.jobinfo['dumpname'], self.jobinfo['ftype'], file_ext,
                                 None, None)
@@ -104,38 +257,67 @@ class PrefetchFinder():
         # may have been different
         dfnames = flister.list_checkpt_files(flister.makeargs(
             runner.dump_dir, self.jobinfo['dumpname'], parts=PARTS_ANY, date=date))
-        possible_prefetch_dfnames = self.get_relevant_prefetch_dfnames(
-            dfnames, pagerange, date, runner)
-        if possible_prefetch_dfnames:
-            return possible_prefetch_dfnames
+        files = {'checkpoint': self.get_page_coverage(dfnames, date, runner)}
 
-        # ok, let's check for file parts only (no checkpt) instead, from any run; again
-        # parts config may not be the same as current run
+        # file parts only (no checkpt); again parts config may not be the same as current run
         dfnames = flister.list_reg_files(flister.makeargs(
             runner.dump_dir, self.jobinfo['dumpname'], parts=PARTS_ANY, date=date))
-        possible_prefetch_dfnames = self.get_relevant_prefetch_dfnames(
-            dfnames, pagerange, date, runner)
-        if possible_prefetch_dfnames:
-            return possible_prefetch_dfnames
+        files['parts'] = self.get_page_coverage(dfnames, date, runner)
 
-        # last shot, get single output file that contains all the pages, if there is one
+        # single output file that contains all the pages, if there is one
         dfnames = flister.list_reg_files(flister.makeargs(
             runner.dump_dir, self.jobinfo['dumpname'], parts=None, date=date))
+        files['single'] = [
+            {'filename': dfname.filename,
+             'size': os.path.getsize(runner.dump_dir.filename_public_path(dfname, date))}
+            for dfname in dfnames]
+        return files
+
+    def find_prefetch_files_from_run(self, runner, date,
+                                     pagerange, file_ext):
+        """
+        for a given wiki and date, see if there are dump content
+        files lying about that can be used for prefetch to the
+        current job, with the given file extension (might be bz2s
+        or 7zs or whatever) for the given range of pages
+        """
+        files = self.catalog.get_files(date, self.jobinfo['name'], file_ext)
+        if files is None:
+            files = self.get_run_files(runner, date, file_ext)
+            self.catalog.set_files(date, self.jobinfo['name'], file_ext, files)
+            self.catalog.save()
+
+        # checkpoint files first, then file parts only (no checkpt)
+        for kind in ['checkpoint', 'parts']:
+            possible_prefetch_dfnames = self.get_covering_dfnames(files[kind], pagerange)
+            if possible_prefetch_dfnames:
+                return possible_prefetch_dfnames
+
+        # last shot, get single output file that contains all the pages, if there is one
         # there is only one, don't bother to check for relevance :-P
-        possible_prefetch_dfnames = dfnames
         dfnames = []
-        for prefetch_dfname in possible_prefetch_dfnames:
-            possible_path = runner.dump_dir.filename_public_path(prefetch_dfname, date)
-            size = os.path.getsize(possible_path)
-            if size < 70000:
+        for entry in files['single']:
+            if entry['size'] < 70000:
                 runner.debug("small %d-byte prefetch dump at %s, skipping" % (
-                    size, possible_path))
+                    entry['size'], entry['filename']))
                 continue
-            dfnames.append(prefetch_dfname)
+            dfnames.append(self.get_dfname(entry['filename']))
         if dfnames:
             return dfnames
         return None
 
+    def old_job_is_done(self, runner, date):
+        """
+        return True if this job from the run of the given date
+        was successful, looking in the catalog first
+        """
+        done = self.catalog.get_job_done(date, self.jobinfo['name'])
+        if done is None:
+            done = runner.dumpjobdata.runinfo.status_of_old_dump_is_done(
+                runner, date, self.jobinfo['name'], self.jobinfo['desc'])
+            self.catalog.set_job_done(date, self.jobinfo['name'], done)
+        return done
+
     def find_previous_dump(self, runner, partnum=None):
         """
         this finds the content file or files from the first previous successful dump
@@ -152,27 +334,29 @@ class PrefetchFinder():
         else:
             dumpdates = self.wiki.dump_dirs()
         dumpdates = sorted(dumpdates, reverse=True)
-        for date in dumpdates:
-            if date == self.wiki.date:
-                runner.debug("skipping current dump for prefetch of job %s, date %s" %
-                             (self.jobinfo['name'], self.wiki.date))
-                continue
+        try:
+            for date in dumpdates:
+                if date == self.wiki.date:
+                    runner.debug("skipping current dump for prefetch of job %s, date %s" %
+                                 (self.jobinfo['name'], self.wiki.date))
+                    continue
 
-            # see if this job from that date was successful
-            if not runner.dumpjobdata.runinfo.status_of_old_dump_is_done(
-                    runner, date, self.jobinfo['name'], self.jobinfo['desc']):
-                runner.debug("skipping incomplete or failed dump for prefetch date %s" % date)
-                continue
+                # see if this job from that date was successful
+                if not self.old_job_is_done(runner, date):
+                    runner.debug("skipping incomplete or failed dump for prefetch date %s" % date)
+                    continue
 
-            # might look first for 7z files, then for bz2,
-            # in any case go through the entire dance for each extension
-            # before giving up and moving to next one
-            for file_ext in self.jobinfo['fexts']:
+                # might look first for 7z files, then for bz2,
+                # in any case go through the entire dance for each extension
+                # before giving up and moving to next one
+                for file_ext in self.jobinfo['fexts']:
 
-                dfnames_found = self.find_prefetch_files_from_run(
-                    runner, date, pagerange, file_ext)
-                if dfnames_found:
-                    return dfnames_found
+                    dfnames_found = self.find_prefetch_files_from_run(
+                        runner, date, pagerange, file_ext)
+                    if dfnames_found:
+                        return dfnames_found
+        finally:
+            self.catalog.save()
 
         runner.debug("Could not locate a prefetchable dump.")
         return None
@@ -7,6 +7,9 @@ dump jobs are defined here
 import os
 from os.path import exists
 import bz2
+import shutil
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from dumps.exceptions import BackupError
 from dumps.jobs import Dump, ProgressCallback
 from dumps.fileutils import DumpFilename
@@ -15,6 +18,79 @@ from dumps.utils import MiscUtils
 from dumps.outfilelister import OutputFileLister
 
 
+INDEX_READ_SIZE = 4 * 1024 * 1024
+
+
+def rewrite_index_lines(data, added_offset):
+    '''
+    given a chunk of multistream index lines (offset:pageid:title),
+    return them with added_offset added to each offset
+    '''
+    lines = []
+    for line in data.split(b'\n'):
+        if line:
+            partial_offset, title = line.split(b':', 1)
+            lines.append(b'%d:%s' % (int(partial_offset) + added_offset, title))
+    return b'\n'.join(lines)
+
+
+def rewrite_index_part(input_path, output_path, added_offset):
+    '''
+    read the bz2-compressed multistream index file input_path, add
+    added_offset to the offset in each line, and write the result
+    to output_path as one bz2 stream
+
+    this runs in a separate process, so it gets only
+    paths and numbers passed in
+    '''
+    leftover = b''
+    with bz2.open(input_path, 'rb') as infile, bz2.open(output_path, 'wb') as outfile:
+        while True:
+            data = infile.read(INDEX_READ_SIZE)
+            if not data:
+                break
+            data = leftover + data
+            end = data.rfind(b'\n') + 1
+            leftover = data[end:]
+            if end:
+                outfile.write(rewrite_index_lines(data[:end], added_offset) + b'\n')
+        if leftover:
+            # last line with no newline, leave it that way
+            outfile.write(rewrite_index_lines(leftover, added_offset))
+
+
+def recombine_index_parts(parts, output_path, workers):
+    '''
+    given a list of (path to bz2-compressed index file, offset to add)
+    tuples, write the combined index file with adjusted offsets to
+    output_path, rewriting up to workers index files at once
+
+    each index file is rewritten into its own bz2 stream in a file
+    next to the output file, and the streams are concatenated in order
+    at the end; bzip2 and python's bz2 module read the result as
+    one file
+    '''
+    piece_paths = ["%s.part%d" % (output_path, count) for count in range(len(parts))]
+    try:
+        if workers > 1 and len(parts) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(parts))) as executor:
+                futures = [executor.submit(rewrite_index_part, input_path, piece_path, added_offset)
+                           for (input_path, added_offset), piece_path in zip(parts, piece_paths)]
+                for future in futures:
+                    future.result()
+        else:
+            for (input_path, added_offset), piece_path in zip(parts, piece_paths):
+                rewrite_index_part(input_path, piece_path, added_offset)
+        with open(output_path, "wb") as outfile:
+            for piece_path in piece_paths:
+                with open(piece_path, "rb") as infile:
+                    shutil.copyfileobj(infile, outfile, INDEX_READ_SIZE)
+    finally:
+        for piece_path in piece_paths:
+            if exists(piece_path):
+                os.unlink(piece_path)
+
+
 class RecombineDump(Dump):
     GZIPMARKER = b'\x1f\x8b\x08\x00'
     BZIP2MARKER = b'\x42\x5a\x68\x39\x31\x41\x59\x26\x53\x59'
@@ -75,6 +151,46 @@ class RecombineDump(Dump):
                 return filesize - (len(buffer) - buffer_offset)
         return None
 
+    def decompress_streams(self, data):
+        '''
+        decompress data made up of one or more complete compressed
+        streams (or gzip members) and return the result, or None
+        if the data is anything else
+        '''
+        output = b''
+        try:
+            while data:
+                if self.marker == self.GZIPMARKER:
+                    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+                else:
+                    decompressor = bz2.BZ2Decompressor()
+                output += decompressor.decompress(data)
+                if not decompressor.eof:
+                    return None
+                data = decompressor.unused_data
+        except (OSError, zlib.error):
+            return None
+        return output
+
+    def has_separate_streams(self, filename):
+        '''
+        return True if the xml header and the xml footer in the compressed
+        file have compressed streams (or gzip members) of their own, so that
+        the body can be copied out of it without decompressing anything
+        '''
+        if self.marker is None:
+            return False
+        header_offset = self.get_header_offset(filename)
+        footer_offset = self.get_footer_offset(filename)
+        if not header_offset or not footer_offset or footer_offset < header_offset:
+            return False
+        with open(filename, "rb") as infile:
+            header = self.decompress_streams(infile.read(header_offset))
+            infile.seek(footer_offset)
+            footer = self.decompress_streams(infile.read())
+        return (header is not None and header.endswith(b'</siteinfo>\n') and
+                footer is not None and footer.strip() == b'</mediawiki>')
+
     @staticmethod
     def get_dd_command(runner, filename, outfile, header_offset, footer_offset):
         # return it as a CommandPipeline with one command in it
@@ -280,7 +396,7 @@ class RecombineXmlDump(RecombineDump):
         self.item_for_xml_dumps = item_for_xml_dumps
         self._detail = detail
         self._prerequisite_items = [self.item_for_xml_dumps]
-        super().__init__(name, desc)
+        super().__init__(name, desc, 'bz2')
         # the input may have checkpoints but the output will not.
         self._checkpoints_enabled = False
 
@@ -325,14 +441,23 @@ class RecombineXmlDump(RecombineDump):
             raise BackupError("recombine XML Dump trying to "
                               "produce more than one output file")
 
-        command_series = self.build_command(runner, input_dfnames, output_dfnames[0])
+        if input_dfnames and all(
+                self.has_separate_streams(runner.dump_dir.filename_public_path(dfname))
+                for dfname in input_dfnames):
+            # header, body and footer compressed separately, so
+            # we can just copy the bodies over
+            command_series = self.build_command_for_dd(runner, input_dfnames, output_dfnames[0])
+            shell = False
+        else:
+            command_series = self.build_command(runner, input_dfnames, output_dfnames[0])
+            shell = True
         self.setup_command_info(runner, command_series, [output_dfnames[0]])
 
         prog = ProgressCallback()
         error = 0
         error, _broken = runner.run_command(
             [command_series], callback_timed=prog.progress_callback,
-            callback_timed_arg=runner, shell=True,
+            callback_timed_arg=runner, shell=shell,
             callback_on_completion=self.command_completion_callback)
 
         if error:
@@ -494,6 +619,10 @@ class RecombineXmlMultiStreamDump(RecombineDump):
         size as it grows, because a) it's easier and b) as of this writing
         it takes all of 2 minutes to write the combined index file so who cares.
 
+        the offsets to add for each index file are worked out first from the
+        sizes of the content files, then the index files are rewritten in
+        parallel
+
         return False on error, True otherwise
         '''
         if not exists(runner.wiki.config.bzip2):
@@ -510,8 +639,8 @@ class RecombineXmlMultiStreamDump(RecombineDump):
         first_header_size = self.get_header_offset(self.get_filepath(runner, first_content_dfname))
         output_prog_path = DumpFilename.get_inprogress_name(
             self.get_filepath(runner, output_dfname))
-        combined_indexfile_inprog = bz2.open(output_prog_path, 'wt', encoding='utf-8')
 
+        parts = []
         for infile_counter, input_dfname in enumerate(input_dfnames):
             content_dfname = self.get_content_dfname_from_index(runner, input_dfname)
             if infile_counter == 1:
@@ -521,18 +650,12 @@ class RecombineXmlMultiStreamDump(RecombineDump):
             else:
                 # include the header count from the first file, it gets written
                 header_size = 0
-            input_path = self.get_filepath(runner, input_dfname)
-            with bz2.open(input_path, mode='rt', encoding='utf-8') as partial_indexfile:
-                added_offset = offset - header_size
-                for line in partial_indexfile:
-                    if line:
-                        partial_offset, title = line.split(':', 1)
-                        partial_offset = str(int(partial_offset) + added_offset)
-                        # title will still have the newline on the end of it
-                        combined_indexfile_inprog.write(partial_offset + ":" + title)
+            parts.append((self.get_filepath(runner, input_dfname), offset - header_size))
             offset = self.get_new_offset(runner, content_dfname, offset)
-        combined_indexfile_inprog.close()
+
+        recombine_index_parts(parts, output_prog_path, runner.wiki.config.recombine_index_workers)
         os.rename(output_prog_path, self.get_filepath(runner, output_dfname))
+        runner.dump_dir.note_file_renamed(output_prog_path, self.get_filepath(runner, output_dfname))
         if self.move_if_truncated(runner, output_dfname):
             return False
         return True
@@ -37,6 +37,9 @@ class RecompressDump(Dump):
     def get_filetype(self):
         return "xml"
 
+    def parts_cover_page_ranges(self):
+        return bool(self._pages_per_part)
+
 
 class RecompressFileLister(OutputFileLister):
     """
@@ -175,8 +178,8 @@ class XmlMultiStreamDump(RecompressDump):
     def run_in_batches(self, runner):
         '''
         generate one multistream content/index file pair for each numbered
-        or numbered/checkpointed content input file, doing batches of these
-        at a time
+        or numbered/checkpointed content input file, running up to one of these
+        per part at a time
         '''
         # new code cobbled together
         commands = []
@@ -189,24 +192,17 @@ class XmlMultiStreamDump(RecompressDump):
                 output_dfnames = [self.get_multistream_dfname(content_dfname),
                                   self.get_multistream_index_dfname(content_dfname)]
                 self.setup_command_info(runner, command_series, output_dfnames)
-        # now we have all the commands, run them in batches til we are done
-        batchsize = len(self._pages_per_part)
-        errors = False
-
+        # now we have all the commands, run them with one slot per part til we are done
         prog = ProgressCallback()
-        while commands:
-            command_batch = commands[:batchsize]
-            error, broken = runner.run_command(
-                command_batch, callback_timed=prog.progress_callback,
-                callback_timed_arg=runner, shell=True,
-                callback_on_completion=self.command_completion_callback)
-            if error:
-                for series in broken:
-                    for pipeline in series:
-                        runner.log_and_print("error from commands: %s" % " ".join(pipeline))
-                errors = True
-            commands = commands[batchsize:]
-        if errors:
+        error, broken = runner.run_command(
+            commands, callback_timed=prog.progress_callback,
+            callback_timed_arg=runner, shell=True,
+            callback_on_completion=self.command_completion_callback,
+            slots=len(self._pages_per_part))
+        if error:
+            for series in broken:
+                for pipeline in series:
+                    runner.log_and_print("error from commands: %s" % " ".join(pipeline))
             raise BackupError("error recompressing bz2 file(s)")
 
     def run(self, runner):
@@ -438,22 +434,20 @@ class XmlRecompressDump(RecompressDump):
                 commands_filtered.append(command_series)
         return commands_filtered
 
-    def get_command_batch(self, commands, runner):
+    def output_not_yet_produced(self, runner, series):
         '''
-        return a batch of commands, filtered so that any which
-        produce an output file that already exists, are omitted;
-        this prevents us from interfering with runs on another
-        host or manual runs that we may not know about
+        return False if the output file of the command series already exists,
+        True otherwise; this is checked right before each command is started
+
+        args: Runner, CommandSeries
         '''
-        commands = self.filter_commands(commands, runner)
-        batchsize = len(self._pages_per_part)
-        commands_todo = commands[:batchsize]
-        commands_left = commands[batchsize:]
-        return (commands_todo, commands_left)
+        final_output_dfname = self.get_final_output_dfname(series.command_series(), runner)
+        return final_output_dfname is None or not exists(
+            runner.dump_dir.filename_public_path(final_output_dfname))
 
-    def do_one_batch(self, batch, runner):
+    def do_one_batch(self, batch, runner, slots=None):
         '''
-        run one batch of commands, whine about errors
+        run one batch of commands, at most 'slots' at once if set, whine about errors
         return True (success) if no errors, False otherwise
         if there are no commands, return True
         '''
@@ -464,7 +458,9 @@ class XmlRecompressDump(RecompressDump):
         error, broken = runner.run_command(
             batch, callback_timed=prog.progress_callback,
             callback_timed_arg=runner, shell=True,
-            callback_on_completion=self.command_completion_callback)
+            callback_on_completion=self.command_completion_callback,
+            slots=slots, callback_should_start=self.output_not_yet_produced,
+            callback_should_start_arg=runner)
         if error:
             for series in broken:
                 for pipeline in series:
@@ -491,20 +487,14 @@ class XmlRecompressDump(RecompressDump):
         """
         queue up a bunch of commands to compress files with part numbers
         and possibly also page ranges;
-        run them in batches of no more than self._parts at once
+        run no more than self._parts at once, starting the next one
+        as soon as any running command completes
 
         no auto-retry for these, if something went wrong we probably
         want human intervention
         """
-        commands = self.get_all_commands(runner)
-        errors = False
-        commands_left = commands
-        while commands_left:
-            commands_todo, commands_left = self.get_command_batch(commands_left, runner)
-            success = self.do_one_batch(commands_todo, runner)
-            if not success:
-                errors = True
-        if errors:
+        commands = self.filter_commands(self.get_all_commands(runner), runner)
+        if not self.do_one_batch(commands, runner, slots=len(self._pages_per_part)):
             raise BackupError("error recompressing bz2 file(s) %s")
 
     def toss_inprog_files(self, dump_dir, runner):
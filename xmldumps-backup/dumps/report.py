@@ -137,6 +137,9 @@ class Report(Registered):
         self.verbose = verbose
         self._enabled = enabled
         self.failhandler = failhandler
+        # status info from the last report for each item, with the item
+        # settings it was generated from
+        self._step_status = {}
 
     @staticmethod
     def add_file_property(jobname, filename, prop, value, reportinfo):
@@ -206,7 +209,7 @@ class Report(Registered):
         status_items_html.reverse()
         html = "\n".join(status_items_html)
         checksums = [self.get_checksum_html(htype)
-                     for htype in Checksummer.HASHTYPES]
+                     for htype in Checksummer.get_hashtypes(self.wiki.config)]
         checksums_html = ", ".join(checksums)
         failed_jobs = sum(1 for item in self.items if item.status() == "failed")
         txt = self.wiki.config.read_template("report.html") % {
@@ -222,7 +225,8 @@ class Report(Registered):
         try:
             indexpath = os.path.join(self.wiki.public_dir(), self.wiki.date,
                                      self.wiki.config.perdump_index)
-            FileUtils.write_file_in_place(indexpath, txt, self.wiki.config.fileperms)
+            FileUtils.write_file_in_place(indexpath, txt, self.wiki.config.fileperms,
+                                          skip_unchanged=True)
         except Exception:
             if self.verbose:
                 exc_type, exc_value, exc_traceback = sys.exc_info()
@@ -243,11 +247,17 @@ class Report(Registered):
         for item in status_items:
             for jobname in item['json']:
                 json_out['jobs'][jobname] = item['json'][jobname]
+        if self.dumpjobdata is not None:
+            # predicted and actual runtimes of the parts of jobs
+            for jobname, runtimes in self.dumpjobdata.get_part_runtimes().items():
+                if jobname in json_out['jobs']:
+                    json_out['jobs'][jobname] = dict(json_out['jobs'][jobname],
+                                                     partruntimes=runtimes)
         try:
             json_filepath = os.path.join(self.wiki.public_dir(), self.wiki.date,
                                          Report.JSONFILE)
             FileUtils.write_file_in_place(json_filepath, json.dumps(json_out),
-                                          self.wiki.config.fileperms)
+                                          self.wiki.config.fileperms, skip_unchanged=True)
         except Exception:
             if self.verbose:
                 exc_type, exc_value, exc_traceback = sys.exc_info()
@@ -259,17 +269,41 @@ class Report(Registered):
             else:
                 sys.stderr.write("%s\n" % message)
 
-    def update_index_html_and_json(self, dump_status=""):
+    def get_status_items(self, changed_only=False):
+        '''
+        return the html and json status info for each dump item
+
+        if changed_only is set, the info from the last report is reused for
+        each item that is not in progress and whose status, update time and
+        progress have not changed since, so that we don't list and stat
+        all of its output files again
+        '''
+        status_items = []
+        for item in self.items:
+            settings = (item.status(), item.updated(), item.progress)
+            if (changed_only and item.status() != "in-progress" and
+                    item.name() in self._step_status and
+                    self._step_status[item.name()][0] == settings):
+                status_items.append(self._step_status[item.name()][1])
+                continue
+            content = Report.report_dump_step_status(self.dump_dir, item)
+            self._step_status[item.name()] = (settings, content)
+            status_items.append(content)
+        return status_items
+
+    def update_index_html_and_json(self, dump_status="", changed_only=False):
         '''
         generate the index.html file for the wiki's dump run which contains
         information on each dump step as well as links to completed files
         for download, hash files, etc. and links to completed files;
-        generate the json file with the same information as well'''
+        generate the json file with the same information as well
+
+        if changed_only is set, only the status of items that changed
+        since the last update is regenerated'''
         if Report.NAME in self._enabled:
 
             self.dumpjobdata.notice.refresh_notice()
-            status_items = [Report.report_dump_step_status(self.dump_dir, item)
-                            for item in self.items]
+            status_items = self.get_status_items(changed_only)
             self.update_index_html(status_items, dump_status)
             self.update_report_json(status_items, dump_status)
 
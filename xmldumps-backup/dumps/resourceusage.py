@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+"""
+classes and methods for writing out the resource usage
+of the commands run for each dump job, in json format
+and as a Prometheus textfile
+"""
+
+
+import os
+import sys
+import traceback
+from dumps.specialfilesregistry import SpecialFileWriter
+from dumps.fileutils import FileUtils
+
+
+class ResourceUsage(SpecialFileWriter):
+    """
+    collect the resource usage of each command run for each dump job,
+    as recorded by CommandPipeline, and write it out with totals per
+    job to a json file next to the report json file, and as metrics
+    in the Prometheus textfile format
+    """
+
+    NAME = "resourceusage"
+    FILENAME = "resourceusage"
+    PROMFILE = "resourceusage.prom"
+    VERSION = "0.1"
+
+    known_formats = ["json"]
+
+    # name, help text, field in the job totals, multiplier
+    METRICS = [
+        ("dumps_job_commands", "Number of commands run for the dump job", "commands", 1),
+        ("dumps_job_wall_seconds", "Wall clock time of all commands run for the dump job",
+         "wall", 1),
+        ("dumps_job_cpu_user_seconds", "User cpu time of all commands run for the dump job",
+         "user", 1),
+        ("dumps_job_cpu_system_seconds", "System cpu time of all commands run for the dump job",
+         "sys", 1),
+        ("dumps_job_wait_seconds", "Time commands run for the dump job spent off the cpu, "
+         "waiting on pipes, disk or the scheduler", "wait", 1),
+        ("dumps_job_max_rss_bytes", "Largest peak rss of any command run for the dump job",
+         "maxrss_kb", 1024),
+        ("dumps_job_written_bytes", "Bytes written to storage by commands run for the dump job",
+         "write_bytes", 1),
+        ("dumps_job_written_chars_bytes", "Bytes written to files or pipes by commands "
+         "run for the dump job", "wchar", 1),
+    ]
+
+    @staticmethod
+    def get_totals(commands):
+        """
+        given a list of resource usage dicts for commands,
+        return a dict of totals over all of them; peak rss
+        is the largest of the peaks instead
+        """
+        totals = {'commands': len(commands), 'wall': 0, 'user': 0, 'sys': 0, 'wait': 0,
+                  'maxrss_kb': 0, 'write_bytes': 0, 'wchar': 0}
+        for command in commands:
+            for field in ['wall', 'user', 'sys', 'wait', 'write_bytes', 'wchar']:
+                if command.get(field) is not None:
+                    totals[field] += command[field]
+            if command.get('maxrss_kb') is not None:
+                totals['maxrss_kb'] = max(totals['maxrss_kb'], command['maxrss_kb'])
+        for field in ['wall', 'user', 'sys', 'wait']:
+            totals[field] = round(totals[field], 3)
+        return totals
+
+    def __init__(self, wiki, enabled=None, fileformat="json", error_callback=None,
+                 verbose=False):
+        super().__init__(wiki, fileformat="json",
+                         error_callback=error_callback, verbose=verbose)
+        self._enabled = enabled if enabled is not None else {}
+        self.jobs = None
+
+    def load_jobs(self):
+        """
+        get the resource usage recorded for this run by earlier
+        invocations of the dump script, if any, so that rerunning
+        one job does not lose the info for the others
+        """
+        self.jobs = {}
+        contents = self.get_json_file_contents(self.FILENAME + "." + self.fileformat)
+        if contents and 'jobs' in contents:
+            self.jobs = contents['jobs']
+
+    def start_job(self, jobname):
+        """
+        toss any commands recorded for the job before,
+        since the job is being run over
+        """
+        if self.jobs is None:
+            self.load_jobs()
+        if jobname in self.jobs:
+            del self.jobs[jobname]
+
+    def add_commands(self, jobname, commands):
+        """
+        add the resource usage dicts for a list of commands run for the given job
+        """
+        if self.jobs is None:
+            self.load_jobs()
+        if jobname not in self.jobs:
+            self.jobs[jobname] = {'commands': []}
+        self.jobs[jobname]['commands'].extend(commands)
+        self.jobs[jobname]['totals'] = ResourceUsage.get_totals(self.jobs[jobname]['commands'])
+
+    def get_prometheus_text(self):
+        """
+        return the job totals as metrics in the Prometheus text format
+        """
+        lines = []
+        for (metric, helptext, field, multiplier) in ResourceUsage.METRICS:
+            lines.append("# HELP %s %s" % (metric, helptext))
+            lines.append("# TYPE %s gauge" % metric)
+            for jobname in sorted(self.jobs):
+                value = self.jobs[jobname]['totals'][field] * multiplier
+                lines.append('%s{wiki="%s",date="%s",job="%s"} %s' % (
+                    metric, self.wiki.db_name, self.wiki.date, jobname, value))
+        return "\n".join(lines) + "\n"
+
+    def get_all_output_files(self):
+        """
+        return list of resource usage file names in all formats
+        """
+        return super().get_all_output_files() + [ResourceUsage.PROMFILE]
+
+    def write_resourceusage_files(self):
+        """
+        write the resource usage info for all jobs to the json file and
+        the Prometheus textfile in the dump run directory, and to the
+        Prometheus textfile collector directory if one is configured
+        """
+        if ResourceUsage.NAME not in self._enabled or not self.jobs:
+            return
+
+        try:
+            self.write_contents({'jobs': self.jobs, 'version': ResourceUsage.VERSION})
+            rundir = os.path.join(self.wiki.public_dir(), self.wiki.date)
+            promtext = self.get_prometheus_text()
+            FileUtils.write_file(rundir, os.path.join(rundir, ResourceUsage.PROMFILE),
+                                 promtext, self.wiki.config.fileperms)
+            promdir = self.wiki.config.prometheus_dir
+            if promdir:
+                # the collector picks up every *.prom file there, so the
+                # temp file must not look like one
+                FileUtils.write_file(
+                    promdir, os.path.join(promdir, "dumps-%s.prom" % self.wiki.db_name),
+                    promtext, self.wiki.config.fileperms)
+        except Exception:
+            if self.verbose:
+                exc_type, exc_value, exc_traceback = sys.exc_info()
+                sys.stderr.write(repr(traceback.format_exception(exc_type, exc_value,
+                                                                 exc_traceback)))
+            message = "Couldn't update resource usage files. Continuing anyways"
+            if self.error_callback:
+                self.error_callback(message)
+            else:
+                sys.stderr.write("%s\n" % message)
@@ -9,11 +9,13 @@ from os.path import exists
 import sys
 import shutil
 import threading
+import time
 import traceback
 import queue
 import socket
 
-from dumps.commandmanagement import CommandsInParallel, CommandPipeline
+from dumps.commandmanagement import CommandsInParallel, CommandsInParallelEventLoop
+from dumps.commandmanagement import CommandPipeline
 from dumps.exceptions import BackupError
 from dumps.fileutils import DumpDir, DumpFilename, FileUtils
 
@@ -25,8 +27,10 @@ from dumps.runnerutils import Maintenance, RunInfo, DumpRunJobData
 
 from dumps.utils import DbServerInfo, FilePartInfo, TimeUtils
 from dumps.runstatusapi import StatusAPI
+from dumps.resourceusage import ResourceUsage
 from dumps.specialfileinfo import SpecialFileInfo
 from dumps.dumpitemlist import DumpItemList
+from dumps.tablesjobs import TableDumpGroup
 
 
 class Logger(threading.Thread):
@@ -116,7 +120,6 @@ class Runner():
         self.prefetch = prefetch
         self.prefetchdate = prefetchdate
         self.spawn = spawn
-        self.filepart_info = FilePartInfo(wiki, self.db_name, self.log_and_print)
         self.restart = restart
         self.html_notice_file = None
         self.log = None
@@ -149,7 +152,7 @@ class Runner():
         for setting in [StatusHtml.NAME, Report.NAME, Checksummer.NAME,
                         RunInfo.NAME, SymLinks.NAME, RunSettings.NAME,
                         Feeds.NAME, Notice.NAME, StatusAPI.NAME,
-                        SpecialFileInfo.NAME,
+                        SpecialFileInfo.NAME, ResourceUsage.NAME,
                         "makedir", "clean_old_dumps", "cleanup_old_files",
                         "check_trunc_files", "cleanup_tmp_files"]:
             self.enabled[setting] = True
@@ -163,7 +166,7 @@ class Runner():
             # cleanup_tmp_files is likely dead code
             for setting in [StatusHtml.NAME, Report.NAME, Checksummer.NAME,
                             RunInfo.NAME, StatusAPI.NAME, SpecialFileInfo.NAME,
-                            SymLinks.NAME, RunSettings.NAME, Feeds.NAME, Notice.NAME,
+                            ResourceUsage.NAME, SymLinks.NAME, RunSettings.NAME, Feeds.NAME, Notice.NAME,
                             "clean_old_dumps"]:
                 if setting in self.enabled:
                     del self.enabled[setting]
@@ -174,7 +177,7 @@ class Runner():
 
         if self.dryrun or self._partnum_todo is not None or self.checkpoint_file is not None:
             for setting in [StatusHtml.NAME, Report.NAME, Checksummer.NAME,
-                            StatusAPI.NAME, SpecialFileInfo.NAME,
+                            StatusAPI.NAME, SpecialFileInfo.NAME, ResourceUsage.NAME,
                             RunInfo.NAME, SymLinks.NAME, RunSettings.NAME,
                             Feeds.NAME, Notice.NAME, "makedir", "clean_old_dumps"]:
                 if setting in self.enabled:
@@ -191,13 +194,14 @@ class Runner():
 
         if self.job_requested == "latestlinks":
             for setting in [StatusHtml.NAME, Report.NAME, RunInfo.NAME, StatusAPI.NAME,
-                            SpecialFileInfo.NAME, "cleanup_old_files", "cleanup_tmp_files"]:
+                            SpecialFileInfo.NAME, ResourceUsage.NAME,
+                            "cleanup_old_files", "cleanup_tmp_files"]:
                 if setting in self.enabled:
                     del self.enabled[setting]
 
         if self.job_requested == "createdirs":
             for setting in [SymLinks.NAME, Feeds.NAME, RunSettings.NAME, StatusAPI.NAME,
-                            SpecialFileInfo.NAME]:
+                            SpecialFileInfo.NAME, ResourceUsage.NAME]:
                 if setting in self.enabled:
                     del self.enabled[setting]
 
@@ -237,6 +241,10 @@ class Runner():
                                           self.log_and_print, self.debug, self.enabled,
                                           self.verbose)
 
+        # the run settings, which may have page ranges for the parts
+        # chosen from the runtimes of earlier runs, are in the config now
+        self.filepart_info = FilePartInfo(wiki, self.db_name, self.log_and_print)
+
         # some or all of these dump_items will be marked to run
         self.dump_item_list = DumpItemList(self.wiki, self.prefetch, self.prefetchdate,
                                            self.spawn,
@@ -264,6 +272,14 @@ class Runner():
                                            self.log_and_print, self.verbose)
         self.specialfiles_updater = SpecialFileInfo(self.wiki, self.enabled, "json",
                                                     self.log_and_print, self.verbose)
+        self.resource_usage = ResourceUsage(self.wiki, self.enabled, "json",
+                                            self.log_and_print, self.verbose)
+        # dump job now running, its commands' resource usage is recorded
+        self.current_item = None
+        # table dump jobs now running together, likewise
+        self.current_group = []
+        # time of the last update of status files
+        self.status_published = 0
 
     def get_logfile_path(self):
         '''
@@ -303,8 +319,27 @@ class Runner():
         status files that could be provided for download to users
         so they can track the job's progress
         """
-        self.report.update_index_html_and_json()
+        self.publish_status()
+
+    def publish_status(self, force=False):
+        """
+        update index.html, the report json file, the status html file,
+        dumpruninfo, the status api file and the special files info
+
+        unless force is set, calls less than statusinterval seconds
+        after the last update do nothing, so bursts of progress
+        messages don't turn into bursts of file writes, and only
+        the status of dump items that changed is regenerated;
+        files whose contents would not change are not rewritten
+        """
+        now = time.time()
+        if not force and now - self.status_published < self.wiki.config.status_interval:
+            return
+        self.status_published = now
+        self.report.update_index_html_and_json(changed_only=not force)
         self.statushtml.update_status_file()
+        self.dumpjobdata.runinfo.save_dump_runinfo(
+            RunInfo.report_dump_runinfo(self.dump_item_list.dump_items))
         self.runstatus_updater.write_statusapi_file()
         self.specialfiles_updater.write_specialfilesinfo_file()
 
@@ -324,7 +359,18 @@ class Runner():
             self.pretty_print_commands([series])
             return 0, None
         return self.run_command([series], callback_timed=self.html_update_callback,
-                                callback_on_completion=completion_callback)
+                                callback_on_completion=completion_callback,
+                                hashtypes=self.get_output_hashtypes())
+
+    def get_output_hashtypes(self):
+        """
+        return the hash types for which checksums of output files are
+        to be computed as the files are written, or None if they are
+        to be read back in for that after the job as usual
+        """
+        if not self.wiki.config.inline_checksums or Checksummer.NAME not in self.enabled:
+            return None
+        return Checksummer.get_hashtypes(self.wiki.config)
 
     def pretty_print_commands(self, command_series_list):
         """
@@ -339,6 +385,15 @@ class Runner():
                 pipeline_string = " | ".join(command_strings)
                 print("Command to run: ", pipeline_string)
 
+    def get_commands_in_parallel(self, command_series_list, **kwargs):
+        """
+        return an object to run the command series in parallel, supervised
+        by threads or by an event loop according to the config setting
+        """
+        if self.wiki.config.command_supervisor == "eventloop":
+            return CommandsInParallelEventLoop(command_series_list, **kwargs)
+        return CommandsInParallel(command_series_list, **kwargs)
+
     # command series list: list of (commands plus args)
     # is one pipeline. list of pipelines = 1 series.
     # this function wants a list of series.
@@ -346,10 +401,16 @@ class Runner():
     # If the shell option is true, all pipelines will be run under the shell.
     # callbackinterval: how often we will call callback_timed (in milliseconds),
     # defaults to every 5 secs
+    # slots: if set, run at most this many series at once, starting the next one
+    # as soon as any running series completes
+    # hashtypes: if set, checksum output written to files by the pipelines as it is
+    # written, for the completion callback to pick up via get_output_digests()
     def run_command(self, command_series_list, callback_stderr=None,
                     callback_stderr_arg=None, callback_timed=None,
                     callback_timed_arg=None, shell=False, callback_interval=5000,
-                    callback_on_completion=None):
+                    callback_on_completion=None, slots=None,
+                    callback_should_start=None, callback_should_start_arg=None,
+                    hashtypes=None):
         """Nonzero return code from the shell from any command in any pipeline will cause
         this function to print an error message and return 1, indicating error.
         Returns 0 on success.
@@ -365,13 +426,19 @@ class Runner():
             self.pretty_print_commands(command_series_list)
             return 0, None
 
-        commands = CommandsInParallel(command_series_list, callback_stderr=callback_stderr,
-                                      callback_stderr_arg=callback_stderr_arg,
-                                      callback_timed=callback_timed,
-                                      callback_timed_arg=callback_timed_arg,
-                                      shell=shell, callback_interval=callback_interval,
-                                      callback_on_completion=callback_on_completion)
+        commands = self.get_commands_in_parallel(
+            command_series_list, callback_stderr=callback_stderr,
+            callback_stderr_arg=callback_stderr_arg,
+            callback_timed=callback_timed,
+            callback_timed_arg=callback_timed_arg,
+            shell=shell, callback_interval=callback_interval,
+            callback_on_completion=callback_on_completion,
+            slots=slots,
+            callback_should_start=callback_should_start,
+            callback_should_start_arg=callback_should_start_arg,
+            hashtypes=hashtypes)
         commands.run_commands()
+        self.record_resource_usage(commands.get_process_stats())
         if commands.exited_successfully():
             return 0, None
         problem_commands = commands.commands_with_errors()
@@ -381,24 +448,53 @@ class Runner():
             self.log_and_print(error_string)
         return 1, commands.commands_with_errors(stringfmt=False)
 
-    def run_command_without_errorcheck(self, command_series_list):
+    def run_command_without_errorcheck(self, command_series_list, slots=None):
         """Nonzero return code from the shell from any command in any pipeline will cause
         this function to return 1, indicating error, and the pipelines that failed
         are returned so that the caller can check return codes.
         Returns 0 on success and None for the pipelines.
-        This function spawns multiple series of pipelines  in parallel.
+        This function spawns multiple series of pipelines  in parallel, at most
+        'slots' of them at once if that is set.
 
         """
         if self.dryrun:
             self.pretty_print_commands(command_series_list)
             return 0, None
 
-        commands = CommandsInParallel(command_series_list)
+        commands = self.get_commands_in_parallel(command_series_list, slots=slots)
         commands.run_commands()
+        self.record_resource_usage(commands.get_process_stats())
         if commands.exited_successfully():
             return 0, None
         return 1, commands.pipelines_with_errors()
 
+    def record_resource_usage(self, series_stats):
+        """
+        given a list of dicts, each with a command series that was run
+        and the resource usage of each of its commands as returned by
+        CommandsInParallel.get_process_stats(), add the usage to that of
+        the dump job now running and attach it to the matching entries
+        in the job's commands_submitted; update the resource usage files
+        """
+        if self.current_item is None and not self.current_group:
+            return
+        for entry in series_stats:
+            if not entry['commands']:
+                continue
+            owner = self.current_item
+            for item in self.current_group:
+                for command_info in item.commands_submitted:
+                    if command_info['series'] == entry['series']:
+                        owner = item
+            if owner is None:
+                continue
+            self.resource_usage.add_commands(owner.name(), entry['commands'])
+            for command_info in owner.commands_submitted:
+                if command_info['series'] == entry['series']:
+                    command_info['resources'] = entry['commands']
+                    command_info['wall'] = entry.get('wall')
+        self.resource_usage.write_resourceusage_files()
+
     def run_command_pipeline(self, command_pipeline):
         """
         run one command pipeline and retrn
@@ -409,6 +505,8 @@ class Runner():
             return 0, None
 
         commands.run_pipeline_get_output()
+        self.record_resource_usage([{'series': [command_pipeline],
+                                     'commands': commands.get_process_stats()}])
 
         if commands.exited_successfully():
             return 0, None
@@ -443,10 +541,9 @@ class Runner():
             % (self.db_name, item.name()))
         if item.to_run():
             item.start()
-            self.report.update_index_html_and_json()
-            self.statushtml.update_status_file()
-            self.runstatus_updater.write_statusapi_file()
-            self.specialfiles_updater.write_specialfilesinfo_file()
+            self.current_item = item
+            self.resource_usage.start_job(item.name())
+            self.publish_status(force=True)
 
             self.dumpjobdata.do_before_job(self.dump_item_list.dump_items)
 
@@ -469,11 +566,23 @@ class Runner():
                     self.debug(repr(traceback.format_exception(
                         exc_type, exc_value, exc_traceback)))
                     item.set_status("failed")
+            self.current_item = None
+
+        self.finish_item(item)
+        return prereq_job
 
+    def finish_item(self, item):
+        """
+        after the specified dump job (item) has been run or skipped,
+        publish its files if it is done, or handle its failure
+        """
         if item.status() == "done" or item.status() == "in-progress":
             # in progress can happen if we have done some but not all
             # batches of page content jobs
             self.dumpjobdata.do_after_job(item, self.dump_item_list.dump_items)
+            self.dumpjobdata.record_part_runtimes(
+                item, self.filepart_info.get_pages_per_part_history(),
+                self.filepart_info.get_last_page_id())
         elif item.status() == "waiting" or item.status() == "skipped":
             # don't update the checksum files for this item.
             pass
@@ -482,7 +591,48 @@ class Runner():
             # "in-progress", if an item chooses to override dump(...) and
             # forgets to set the status. This is a failure as well.
             self.run_handle_failure()
-        return prereq_job
+
+    def get_table_group(self, index):
+        """
+        if table dump jobs are configured to run concurrently, return
+        the table dump jobs in the job list starting at the given
+        index, if at least two of them are to run; otherwise return
+        an empty list
+        """
+        if self.dryrun or self.wiki.config.tabledump_workers < 2:
+            return []
+        items = self.dump_item_list.dump_items
+        group = []
+        while index < len(items) and TableDumpGroup.is_member(items[index]):
+            group.append(items[index])
+            index += 1
+        if len([item for item in group if item.to_run()]) < 2:
+            return []
+        return group
+
+    def do_run_table_group(self, group):
+        """
+        run the table dump jobs in the group that are marked to be run
+        all together, then handle each job in the group as do_run_item
+        would
+        """
+        Maintenance.exit_if_in_maintenance_mode(
+            "In maintenance mode, exiting dump of %s at step %s"
+            % (self.db_name, group[0].name()))
+        self.current_group = [item for item in group if item.to_run()]
+        for item in self.current_group:
+            item.start()
+            self.resource_usage.start_job(item.name())
+        self.publish_status(force=True)
+        self.dumpjobdata.do_before_job(self.dump_item_list.dump_items)
+
+        self.debug("running %d table dump jobs together" % len(self.current_group))
+        TableDumpGroup(self.current_group, self.wiki.config.tabledump_workers,
+                       self.wiki.config.tabledumps_per_dbhost).run(self)
+        self.current_group = []
+
+        for item in group:
+            self.finish_item(item)
 
     def do_run_setup(self):
         '''
@@ -595,8 +745,15 @@ class Runner():
 
         self.dumpjobdata.do_before_dump()
 
-        for item in self.dump_item_list.dump_items:
-            self.run_prereqs_and_job(item)
+        index = 0
+        while index < len(self.dump_item_list.dump_items):
+            group = self.get_table_group(index)
+            if group:
+                self.do_run_table_group(group)
+                index += len(group)
+            else:
+                self.run_prereqs_and_job(self.dump_item_list.dump_items[index])
+                index += 1
 
         if self.job_requested == "createdirs":
             self.make_dir(os.path.join(self.wiki.public_dir(), self.wiki.date))
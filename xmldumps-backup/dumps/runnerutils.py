@@ -8,12 +8,14 @@ import traceback
 from email.mime import text as MIMEText
 import smtplib
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 from dumps.exceptions import BackupError
 from dumps.checksummers import Checksummer
 from dumps.fileutils import DumpFilename, FileUtils
+from dumps.partplanner import PartPlan, RuntimeHistory
 from dumps.symlinks import SymLinks, Feeds
-from dumps.utils import TimeUtils
+from dumps.utils import FilePartInfo, TimeUtils
 from dumps.specialfilesregistry import Registered
 
 
@@ -198,6 +200,15 @@ class RunSettings():
         if not os.path.exists(os.path.join(self.wiki.private_dir(), self.wiki.date)):
             os.makedirs(os.path.join(self.wiki.private_dir(), self.wiki.date))
 
+        if self.wiki.config.parts_enabled and self.wiki.config.rebalance_parts:
+            planned = PartPlan(self.wiki).make(self.wiki.config.pages_per_filepart_history)
+            if planned is not None:
+                if self.logfn:
+                    self.logfn("Using page ranges from runtimes of earlier runs for parts: %s"
+                               % planned)
+                self.wiki.config.pages_per_filepart_history = planned
+                setting_info = self.get_settings_from_config()
+
         with open(settings_path, "w+") as settings_fhandle:
             settings_fhandle.write(json.dumps(setting_info) + "\n")
 
@@ -239,6 +250,67 @@ class RunSettings():
         self.wiki.config.checkpoint_time = settings[6]
 
 
+class PublishJournal():
+    """
+    record of the output files of a dump job that are being published
+    (linked from 'latest', given rss feeds, checksummed), kept in the
+    private dir of the dump run until they all have been, so that the
+    next run of the dump script can finish the job if we die partway
+
+    there is one journal for the run, so it must only be kept by runs
+    that publish files; dry runs, runs of a single part or from a
+    checkpoint, and batch workers don't, and may run alongside others
+    """
+    def __init__(self, wiki):
+        self.wiki = wiki
+
+    def get_path(self):
+        """
+        returns:
+            full path to the journal file
+        """
+        return os.path.join(self.wiki.private_dir(), self.wiki.date, "publishjournal.json")
+
+    def start(self, jobname, dfnames):
+        """
+        write the journal entry for the files about to be published
+        """
+        FileUtils.write_file(
+            FileUtils.wiki_tempdir(self.wiki.db_name, self.wiki.config.temp_dir),
+            self.get_path(),
+            json.dumps({'job': jobname, 'files': [dfname.filename for dfname in dfnames]}),
+            self.wiki.config.fileperms)
+
+    def finish(self):
+        """
+        remove the journal entry, all files have been published
+        """
+        try:
+            os.unlink(self.get_path())
+        except FileNotFoundError:
+            pass
+
+    def get_unfinished(self):
+        """
+        returns:
+            the job name and the list of DumpFilenames from a journal
+            entry left behind by a publish that never finished, or
+            None, [] if there is no such entry
+        """
+        try:
+            contents = json.loads(FileUtils.read_file(self.get_path()))
+            jobname = contents['job']
+            filenames = contents['files']
+        except (OSError, ValueError, KeyError, TypeError):
+            return None, []
+        dfnames = []
+        for filename in filenames:
+            dfname = DumpFilename(self.wiki)
+            dfname.new_from_filename(filename)
+            dfnames.append(dfname)
+        return jobname, dfnames
+
+
 class DumpRunJobData():
     """
     management of all metadata around a dump run for the specified wiki
@@ -268,12 +340,84 @@ class DumpRunJobData():
         self.feeds = Feeds(wiki, dump_dir, wiki.db_name, debugfn, enabled)
         self.symlinks = SymLinks(wiki, dump_dir, logfn, debugfn, enabled)
         self.notice = Notice(wiki, notice, enabled)
+        self.journal = PublishJournal(wiki)
+        self.runtime_history = RuntimeHistory(wiki)
+        self.part_plan = PartPlan(wiki, self.runtime_history)
+        self.part_runtimes = None
 
     def do_before_dump(self):
         """
         tasks that should be done before any dump jobs start
         """
         self.checksummer.prepare_checksums()
+        self.resume_publishing()
+
+    def publishing_enabled(self):
+        """
+        returns:
+            True if this run publishes output files (links them from
+            'latest', gives them feeds or checksums them), False otherwise
+        """
+        return any(name in self.enabled for name in [SymLinks.NAME, Checksummer.NAME, Feeds.NAME])
+
+    def resume_publishing(self):
+        """
+        if an earlier run of the dump script died while publishing
+        the output files of a job, publish the rest of them now
+        """
+        if not self.publishing_enabled():
+            return
+        jobname, dfnames = self.journal.get_unfinished()
+        if jobname is None:
+            return
+        if self.logfn:
+            self.logfn("Resuming publishing of %d output files for job %s" % (
+                len(dfnames), jobname))
+        self.publish_files([dfname for dfname in dfnames
+                            if os.path.exists(self.dump_dir.filename_public_path(dfname))])
+        self.journal.finish()
+
+    def publish_files(self, dfnames):
+        """
+        make the 'latest' links and the rss feeds for the given output
+        files in one pass each, while they are checksummed alongside,
+        then clean up stale links and feeds
+        """
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            checksumming = executor.submit(self.checksummer.checksums_for_files, dfnames, self)
+            self.symlinks.save_symlinks(dfnames)
+            self.feeds.save_feeds(dfnames)
+            checksumming.result()
+        self.symlinks.cleanup_symlinks()
+        self.feeds.cleanup_feeds()
+
+    def get_pages_per_part(self):
+        """
+        return the list of the number of pages in each part for the
+        run, or None if the run does not have a list of them
+        """
+        return FilePartInfo.convert_comma_sep(str(self.wiki.config.pages_per_filepart_history))
+
+    def record_part_runtimes(self, item, pages_per_part, last_page_id=None):
+        """
+        add the runtimes of the parts of the dump job (item) to the
+        runtime history of the wiki, given the number of pages in each
+        part of the run and the last page id of the wiki, if they are known
+        """
+        if self.wiki.config.parts_enabled:
+            self.runtime_history.record_job(item, pages_per_part, last_page_id)
+            self.part_runtimes = None
+
+    def get_part_runtimes(self):
+        """
+        return a dict of job name: predicted and recorded runtimes
+        for each part of the job in this run, see PartPlan
+        """
+        if self.part_runtimes is None:
+            self.part_runtimes = {}
+            if self.wiki.config.parts_enabled:
+                self.part_runtimes = self.part_plan.get_part_runtimes(self.get_pages_per_part())
+        return self.part_runtimes
 
     def do_after_dump(self, dump_items):
         """
@@ -283,13 +427,12 @@ class DumpRunJobData():
         # files from different runs, in which case the checksum files
         # will have accurate checksums for the run for which it was
         # produced, but not the other files. FIXME
-        for htype in Checksummer.HASHTYPES:
+        for htype in self.checksummer.hashtypes:
             dfname = DumpFilename(
                 self.wiki, None, self.checksummer.get_checksum_filename_basename(htype))
             self.symlinks.save_symlink(dfname)
-            self.symlinks.cleanup_symlinks()
+        self.symlinks.cleanup_symlinks()
         for item in dump_items:
-            self.runinfo.save_dump_runinfo(RunInfo.report_dump_runinfo(dump_items))
             if item.to_run():
                 dump_names = item.list_dumpnames()
                 if type(dump_names).__name__ != 'list':
@@ -316,7 +459,8 @@ class DumpRunJobData():
                     self.symlinks.remove_symlinks_from_old_runs(
                         self.wiki.date, dump, partnum, checkpoint, onlyparts=item.onlyparts)
 
-                self.feeds.cleanup_feeds()
+        self.feeds.cleanup_feeds()
+        self.runinfo.save_dump_runinfo(RunInfo.report_dump_runinfo(dump_items))
 
     def do_before_job(self, dump_items):
         """
@@ -337,16 +481,17 @@ class DumpRunJobData():
         """
         self.checksummer.cp_chksum_tmpfiles_to_permfile()
         # this will include checkpoint files if they are enabled.
-        for dfname in item.oflister.list_outfiles_to_publish(item.oflister.makeargs(self.dump_dir)):
-            if os.path.exists(self.dump_dir.filename_public_path(dfname)):
-                # why would the file not exist? because we changed number of file parts in the
-                # middle of a run, and now we list more files for the next stage than there
-                # were for earlier ones
-                self.symlinks.save_symlink(dfname)
-                self.feeds.save_feed(dfname)
-                self.checksummer.checksums(dfname, self)
-        self.symlinks.cleanup_symlinks()
-        self.feeds.cleanup_feeds()
+        # why would a file not exist? because we changed number of file parts in the
+        # middle of a run, and now we list more files for the next stage than there
+        # were for earlier ones
+        dfnames = item.oflister.list_outfiles_to_publish(item.oflister.makeargs(self.dump_dir))
+        dfnames = [dfname for dfname in dfnames
+                   if os.path.exists(self.dump_dir.filename_public_path(dfname))]
+        if self.publishing_enabled():
+            self.journal.start(item.name(), dfnames)
+        self.publish_files(dfnames)
+        if self.publishing_enabled():
+            self.journal.finish()
         self.runinfo.save_dump_runinfo(
             RunInfo.report_dump_runinfo(dump_items))
 
@@ -541,7 +686,7 @@ class RunInfo(Registered):
             #  FileUtils.write_file(directory, dumpRunInfoFilename, text,
             #    self.wiki.config.fileperms)
             FileUtils.write_file_in_place(dump_runinfo_filename, content[fmt],
-                                          self.wiki.config.fileperms)
+                                          self.wiki.config.fileperms, skip_unchanged=True)
 
     @staticmethod
     def _get_status_from_runinfo_line(line, job_name):
@@ -97,7 +97,7 @@ class StatusAPI(SpecialFileWriter):
         each entry containing the hashes and names of all files produced
         """
         contents = []
-        for hashtype in Checksummer.HASHTYPES:
+        for hashtype in Checksummer.get_hashtypes(self.wiki.config):
             dfname = DumpFilename(
                 self.wiki, None, Checksummer.get_checksum_filename_basename(hashtype, "json"))
             path = os.path.join(self.wiki.public_dir(), self.wiki.date, dfname.filename)
@@ -8,6 +8,7 @@ json format, for downloaders' use
 
 import os
 import json
+from dumps.fileutils import FileUtils
 
 
 class SpecialFilesRegistry(type):
@@ -119,12 +120,13 @@ class SpecialFileWriter(Registered):
 
     def write_contents_json(self, contents):
         """
-        convert contents to json and write the results to output file
+        convert contents to json and write the results to output file,
+        unless it already has exactly these contents
         """
         if not self.filepath:
             return
-        with open(self.filepath, "w+") as fhandle:
-            fhandle.write(json.dumps(contents) + "\n")
+        FileUtils.write_file_in_place(self.filepath, json.dumps(contents) + "\n",
+                                      skip_unchanged=True)
 
     def write_contents(self, contents):
         """
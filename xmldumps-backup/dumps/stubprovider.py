@@ -3,9 +3,11 @@
 All xml content dump jobs are defined here
 '''
 
+import json
 import os
 from os.path import exists
 import functools
+import stat
 
 from dumps.exceptions import BackupError
 from dumps.fileutils import DumpContents, DumpFilename, FileUtils
@@ -129,13 +131,14 @@ class StubProvider():
     def run_temp_stub_commands(runner, commands, batchsize):
         """
         run the commands to generate the temp stub files, without
-        output file checking
+        output file checking; at most batchsize commands run at once,
+        and as each completes the next one waiting is started
         """
         errors = False
 
-        while commands:
-            command_batch = commands[:batchsize]
-            error, broken_pipelines = runner.run_command_without_errorcheck(command_batch)
+        if commands:
+            error, broken_pipelines = runner.run_command_without_errorcheck(
+                commands, slots=batchsize)
             if error:
                 for pipeline in broken_pipelines:
                     failed_cmds_retcodes = pipeline.get_failed_cmds_with_retcode()
@@ -147,7 +150,6 @@ class StubProvider():
                                                  pipeline.pipeline_string())
                             errors = True
 
-            commands = commands[batchsize:]
         if errors:
             raise BackupError("failed to write pagerange stub files")
 
@@ -176,6 +178,84 @@ class StubProvider():
             raise BackupError(
                 "failed to write pagerange stub files (bad contents) " + error_string)
 
+    @staticmethod
+    def get_page_bounds(output_dfname):
+        """
+        return the first page id of the page range stub file, and the
+        page id after the last one, or the empty string if the range
+        goes to the end of the stub input file
+        """
+        if (output_dfname.last_page_id is not None and
+                output_dfname.last_page_id != "00000"):
+            last_page_id = str(int(output_dfname.last_page_id) + 1)
+        else:
+            last_page_id = ""
+        return output_dfname.first_page_id, last_page_id
+
+    def get_stub_slice_paths(self, stub_dfname):
+        """
+        return the paths of the named pipe through which the page range
+        stub is streamed, instead of being written as a temp stub file,
+        and of the file with the numbers of pages and revisions in it
+        """
+        path = os.path.join(FileUtils.wiki_tempdir(self.wiki.db_name, self.wiki.config.temp_dir),
+                            stub_dfname.filename)
+        return path + ".fifo", path + ".counts"
+
+    def get_stub_slice_cmd(self, input_dfname, output_dfname, runner, slicer):
+        """
+        return the command that streams the page range stub for the
+        output file from the stub input file into a named pipe, for
+        the page content command that comes after it in the same pipeline;
+        the named pipe must be made with make_stub_slice_fifo before
+        the command is started
+
+        args: DumpFilename, DumpFilename, Runner, path to xmlslice.py
+        """
+        fifo_path, counts_path = self.get_stub_slice_paths(output_dfname)
+        first_page_id, last_page_id = self.get_page_bounds(output_dfname)
+        command = ["/usr/bin/python3", slicer,
+                   "--infile", runner.dump_dir.filename_public_path(input_dfname),
+                   "--outfile", fifo_path, "--countfile", counts_path,
+                   "--start", str(int(first_page_id))]
+        if last_page_id:
+            command.extend(["--end", last_page_id])
+        return command
+
+    def make_stub_slice_fifo(self, stub_dfname):
+        """
+        make the named pipe for the page range stub, if it is not
+        there already, replacing anything else left at its path
+        """
+        fifo_path = self.get_stub_slice_paths(stub_dfname)[0]
+        FileUtils.wiki_tempdir(self.wiki.db_name, self.wiki.config.temp_dir, create=True)
+        if os.path.exists(fifo_path) and not stat.S_ISFIFO(os.stat(fifo_path).st_mode):
+            os.unlink(fifo_path)
+        if not os.path.exists(fifo_path):
+            os.mkfifo(fifo_path, 0o600)
+
+    def stub_slice_has_no_pages(self, stub_dfname):
+        """
+        return True if the page range stub streamed for the output file
+        had no pages in it, going by the counts written by the slicer
+        once it finished; if there are no counts we can't tell, and
+        return False
+        """
+        counts_path = self.get_stub_slice_paths(stub_dfname)[1]
+        try:
+            with open(counts_path, "r") as infile:
+                return json.load(infile)['pages'] == 0
+        except (IOError, ValueError, KeyError, TypeError):
+            return False
+
+    def cleanup_stub_slice(self, stub_dfname):
+        """
+        remove the named pipe and the counts file for the page range stub
+        """
+        for path in self.get_stub_slice_paths(stub_dfname):
+            if os.path.exists(path):
+                os.unlink(path)
+
     def get_stub_gen_cmd_for_input(self, input_dfname, output_dfnames, runner):
         """
         for the given input dumpfile (stub), write the requested output file (stub)
@@ -193,14 +273,9 @@ class StubProvider():
             output_fname = output_dfname.filename
             # don't generate the file if we already have it (i.e. this is a retry)
             if not os.path.exists(os.path.join(output_dir, output_fname)):
-                first_age_id = output_dfname.first_page_id
-                if (output_dfname.last_page_id is not None and
-                        output_dfname.last_page_id != "00000"):
-                    last_page_id = str(int(output_dfname.last_page_id) + 1)
-                else:
-                    last_page_id = ""
+                first_page_id, last_page_id = self.get_page_bounds(output_dfname)
                 argstrings.append("{outfile}:{firstpage}:{lastpage}".format(
-                    outfile=output_fname, firstpage=first_age_id, lastpage=last_page_id))
+                    outfile=output_fname, firstpage=first_page_id, lastpage=last_page_id))
 
         # don't generate an output file if there are no filespecs
         if not argstrings:
@@ -47,7 +47,18 @@ class SymLinks():
                 self.debugfn("Creating %s ..." % dirname)
                 os.makedirs(dirname)
 
-    def save_symlink(self, dumpfile):
+    def save_symlinks(self, dumpfiles):
+        """
+        given a list of DumpFilenames of dump content files, make
+        symlinks to them in the 'latest' directory as save_symlink does,
+        checking for the directory just once
+        """
+        if SymLinks.NAME in self._enabled and dumpfiles:
+            self.make_dir(self.dump_dir.latest_dir())
+            for dumpfile in dumpfiles:
+                self.save_symlink(dumpfile, checkdir=False)
+
+    def save_symlink(self, dumpfile, checkdir=True):
         """
         given the base filename of a dump content file,
         make a symlink to it in the 'latest' directory, removing any
@@ -55,7 +66,8 @@ class SymLinks():
         file.
         """
         if SymLinks.NAME in self._enabled:
-            self.make_dir(self.dump_dir.latest_dir())
+            if checkdir:
+                self.make_dir(self.dump_dir.latest_dir())
             realfilepath = self.dump_dir.filename_public_path(dumpfile)
             latest_filename = dumpfile.new_filename(dumpfile.dumpname, dumpfile.file_type,
                                                     dumpfile.file_ext, 'latest',
@@ -217,6 +229,21 @@ class Feeds():
             pass
         return False
 
+    def save_feeds(self, dfnames):
+        """
+        produce rss feed files for the specified dump output files
+        as save_feed does, checking for the directory and reading
+        the template just once
+
+        args:
+            list of DumpFilename
+        """
+        if Feeds.NAME in self._enabled and dfnames:
+            self.make_dir(self.dump_dir.latest_dir())
+            template = self.wiki.config.read_template("feed.xml")
+            for dfname in dfnames:
+                self.write_feed(dfname, template)
+
     def save_feed(self, dfname):
         """
         produce an rss feed file for the specified dump output file
@@ -231,30 +258,40 @@ class Feeds():
             DumpFilename
         """
         if Feeds.NAME in self._enabled:
-            rss_path = os.path.join(self.dump_dir.latest_dir(),
-                                    self.db_name + "-latest-" + dfname.basename +
-                                    "-rss.xml")
-
             self.make_dir(self.dump_dir.latest_dir())
-            filename_and_path = self.dump_dir.web_path(dfname)
-            web_path = os.path.dirname(filename_and_path)
-            if self.feed_newer_than_file(rss_path, dfname):
-                return
-            rss_text = self.wiki.config.read_template("feed.xml") % {
-                "chantitle": dfname.basename,
-                "chanlink": web_path,
-                "chandesc": "Wikimedia dump updates for %s" % self.db_name,
-                "title": web_path,
-                "link": web_path,
-                "description": xml_escape("<a href=\"%s\">%s</a>" % (
-                    filename_and_path, dfname.filename)),
-                "date": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime())
-            }
-            self.debugfn("adding rss feed file %s " % rss_path)
-            FileUtils.write_file(
-                FileUtils.wiki_tempdir(self.wiki.db_name, self.wiki.config.temp_dir),
-                rss_path,
-                rss_text, self.wiki.config.fileperms)
+            self.write_feed(dfname, self.wiki.config.read_template("feed.xml"))
+
+    def write_feed(self, dfname, template):
+        """
+        write the rss feed file for the dump output file, filling in
+        the given template, unless there is one for a newer file
+
+        args:
+            DumpFilename, contents of feed template
+        """
+        rss_path = os.path.join(self.dump_dir.latest_dir(),
+                                self.db_name + "-latest-" + dfname.basename +
+                                "-rss.xml")
+
+        filename_and_path = self.dump_dir.web_path(dfname)
+        web_path = os.path.dirname(filename_and_path)
+        if self.feed_newer_than_file(rss_path, dfname):
+            return
+        rss_text = template % {
+            "chantitle": dfname.basename,
+            "chanlink": web_path,
+            "chandesc": "Wikimedia dump updates for %s" % self.db_name,
+            "title": web_path,
+            "link": web_path,
+            "description": xml_escape("<a href=\"%s\">%s</a>" % (
+                filename_and_path, dfname.filename)),
+            "date": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime())
+        }
+        self.debugfn("adding rss feed file %s " % rss_path)
+        FileUtils.write_file(
+            FileUtils.wiki_tempdir(self.wiki.db_name, self.wiki.config.temp_dir),
+            rss_path,
+            rss_text, self.wiki.config.fileperms)
 
     def cleanup_feeds(self):
         """
@@ -3,6 +3,7 @@
 Jobs that dump sql tables are defined here
 '''
 
+import fcntl
 import time
 
 import os.path
@@ -63,14 +64,25 @@ class PublicTable(Dump):
                                 os.path.join(output_dir, runner.wiki.date))
         return command_series
 
-    def run_with_retries(self, runner, command_series):
+    def get_size_estimate(self, runner):
+        '''
+        return the size of the output file of the last dump run
+        that produced one, or 0 if there is none to be found
+        '''
+        return get_latest_output_size(self, runner)
+
+    def run_with_retries(self, runner, command_series, tried=False):
         '''
         run the given command series with retries and errors
-        as necessary
+        as necessary; if tried is True, the commands were already
+        run once and failed, so go straight to the retries
         '''
         retries = 0
         maxretries = runner.wiki.config.max_retries
-        error, _broken = self.save_table(runner, command_series)
+        if tried:
+            error = 1
+        else:
+            error, _broken = self.save_table(runner, command_series)
         while error and retries < maxretries:
             retries = retries + 1
             time.sleep(5)
@@ -96,6 +108,10 @@ class PublicTable(Dump):
 class TitleDump(Dump):
     """This is used by "wikiproxy", a program to add Wikipedia links to BBC news online"""
 
+    QUERY = "select page_title from page where page_namespace=0;"
+    LABEL = "page title dump"
+    CONTENTS = "titles list"
+
     def get_dumpname(self):
         return "all-titles-in-ns0"
 
@@ -105,24 +121,48 @@ class TitleDump(Dump):
     def get_file_ext(self):
         return "gz"
 
-    def run(self, runner):
-        retries = 0
-        maxretries = runner.wiki.config.max_retries
-        query = "select page_title from page where page_namespace=0;"
+    def do_prep(self, runner):
+        '''
+        do prep work of getting commands set up to run
+        '''
         dfnames = self.oflister.list_outfiles_for_build_command(
             self.oflister.makeargs(runner.dump_dir))
         if len(dfnames) > 1:
-            raise BackupError("page title dump trying to produce more than one output file")
+            raise BackupError("%s trying to produce more than one output file" % self.LABEL)
         dfname = dfnames[0]
-        command_series = self.build_command(runner, query, dfname)
+        command_series = self.build_command(runner, self.QUERY, dfname)
         self.setup_command_info(runner, command_series, [dfname])
-        error, _broken = self.save_sql(runner, command_series)
+        return command_series
+
+    def get_size_estimate(self, runner):
+        '''
+        return the size of the output file of the last dump run
+        that produced one, or 0 if there is none to be found
+        '''
+        return get_latest_output_size(self, runner)
+
+    def run_with_retries(self, runner, command_series, tried=False):
+        '''
+        run the given command series with retries and errors
+        as necessary; if tried is True, the commands were already
+        run once and failed, so go straight to the retries
+        '''
+        retries = 0
+        maxretries = runner.wiki.config.max_retries
+        if tried:
+            error = 1
+        else:
+            error, _broken = self.save_sql(runner, command_series)
         while error and retries < maxretries:
             retries = retries + 1
             time.sleep(5)
             error, _broken = self.save_sql(runner, command_series)
         if error:
-            raise BackupError("error dumping titles list")
+            raise BackupError("error dumping %s" % self.CONTENTS)
+
+    def run(self, runner):
+        command_series = self.do_prep(runner)
+        self.run_with_retries(runner, command_series)
         return True
 
     def build_command(self, runner, query, out_dfname):
@@ -140,26 +180,171 @@ class TitleDump(Dump):
 
 class AllTitleDump(TitleDump):
 
+    QUERY = "select page_namespace, page_title from page;"
+    LABEL = "all titles dump"
+    CONTENTS = "all titles list"
+
     def get_dumpname(self):
         return "all-titles"
 
+
+def get_latest_output_size(item, runner):
+    '''
+    given a table dump job, return the size of its output file
+    from the most recent run, as found via the link in the
+    'latest' directory, or 0 if there is no such file
+    '''
+    dfnames = item.oflister.list_outfiles_for_build_command(
+        item.oflister.makeargs(runner.dump_dir))
+    if not dfnames:
+        return 0
+    dfname = dfnames[0]
+    latest_filename = dfname.new_filename(dfname.dumpname, dfname.file_type, dfname.file_ext,
+                                          'latest', dfname.partnum, dfname.checkpoint,
+                                          dfname.temp)
+    try:
+        return os.path.getsize(os.path.join(runner.dump_dir.latest_dir(), latest_filename))
+    except OSError:
+        return 0
+
+
+class DbHostSlots():
+    '''
+    slots for running commands against a db server, shared by all
+    dump processes on this host by way of lock files: whoever holds
+    the lock on a slot file has that slot, and the lock goes away
+    with the process if it dies
+    '''
+    def __init__(self, lockdir, db_server, limit):
+        self.lockdir = lockdir
+        self.db_server = db_server if db_server else "default"
+        self.limit = limit
+        # list of (slot number, open lock file)
+        self.held = []
+
+    def get_slot_path(self, slot):
+        '''
+        return the path to the lock file for the given slot number
+        '''
+        return os.path.join(self.lockdir, "dbhost-%s-%d.lock" % (
+            self.db_server.replace('/', '_'), slot))
+
+    def try_acquire(self):
+        '''
+        take the first free slot, if there is one; return True
+        if we got one, False otherwise
+        '''
+        # locks are per process, so we'd succeed at locking our own slots again
+        held_slots = [slot for slot, _lockfile in self.held]
+        for slot in range(self.limit):
+            if slot in held_slots:
+                continue
+            lockfile = open(self.get_slot_path(slot), "a")
+            try:
+                fcntl.lockf(lockfile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lockfile.close()
+                continue
+            self.held.append((slot, lockfile))
+            return True
+        return False
+
+    def acquire(self, wanted, wait=5):
+        '''
+        take as many free slots as we can get, up to the number wanted,
+        waiting until at least one is free; return the number we hold
+        '''
+        os.makedirs(self.lockdir, exist_ok=True)
+        while True:
+            while len(self.held) < wanted and self.try_acquire():
+                pass
+            if self.held:
+                return len(self.held)
+            time.sleep(wait)
+
+    def release(self):
+        '''
+        give back all slots we hold
+        '''
+        for _slot, lockfile in self.held:
+            fcntl.lockf(lockfile.fileno(), fcntl.LOCK_UN)
+            lockfile.close()
+        self.held = []
+
+
+class TableDumpGroup():
+    '''
+    run the commands for several table dump jobs at once, largest
+    tables first, with at most 'workers' of them going at a time, and
+    if 'perhost' is set, no more than that many running against the db
+    server from all dump processes on this host; jobs whose commands
+    fail are then retried one at a time as they would be if run alone
+
+    each job gets its own status, output files and completion
+    callback just as when run by itself
+    '''
+    def __init__(self, items, workers, perhost=0):
+        self.items = items
+        self.workers = workers
+        self.perhost = perhost
+
+    @staticmethod
+    def is_member(item):
+        '''
+        return True if the job is one that can be run in a group
+        '''
+        return isinstance(item, (PublicTable, TitleDump))
+
+    @staticmethod
+    def fail(runner, item, ex):
+        '''
+        report the exception from a job in the group and mark it failed
+        '''
+        runner.debug("*** exception! " + str(ex))
+        item.set_status("failed")
+
     def run(self, runner):
-        retries = 0
-        maxretries = runner.wiki.config.max_retries
-        query = "select page_namespace, page_title from page;"
-        dfnames = self.oflister.list_outfiles_for_build_command(
-            self.oflister.makeargs(runner.dump_dir))
-        if len(dfnames) > 1:
-            raise BackupError("all titles dump trying to produce more than one output file")
-        dfname = dfnames[0]
-        command_series = self.build_command(runner, query, dfname)
-        self.setup_command_info(runner, command_series, [dfname])
+        '''
+        run all jobs in the group, setting the status of each when done
+        '''
+        prepared = []
+        for item in sorted(self.items, key=lambda item: item.get_size_estimate(runner),
+                           reverse=True):
+            try:
+                prepared.append((item, item.do_prep(runner)))
+            except Exception as ex:
+                self.fail(runner, item, ex)
+        if not prepared:
+            return
 
-        error, _broken = self.save_sql(runner, command_series)
-        while error and retries < maxretries:
-            retries = retries + 1
-            time.sleep(5)
-            error = self.save_sql(runner, command_series)
-        if error:
-            raise BackupError("error dumping all titles list")
-        return True
+        succeeded = []
+
+        def completion_callback(series):
+            if series.exited_successfully():
+                succeeded.append(series.command_series())
+            for item, command_series in prepared:
+                if command_series == series.command_series():
+                    item.command_completion_callback(series)
+
+        hostslots = None
+        slots = self.workers
+        if self.perhost:
+            hostslots = DbHostSlots(runner.wiki.config.temp_dir, runner.db_server_info.db_server,
+                                    self.perhost)
+            slots = hostslots.acquire(min(self.workers, self.perhost))
+        try:
+            runner.run_command([command_series for _item, command_series in prepared],
+                               callback_timed=runner.html_update_callback,
+                               callback_on_completion=completion_callback, slots=slots,
+                               hashtypes=runner.get_output_hashtypes())
+            for item, command_series in prepared:
+                try:
+                    if command_series not in succeeded:
+                        item.run_with_retries(runner, command_series, tried=True)
+                    item.post_run(runner)
+                    item.set_status("done")
+                except Exception as ex:
+                    self.fail(runner, item, ex)
+        finally:
+            if hostslots is not None:
+                hostslots.release()
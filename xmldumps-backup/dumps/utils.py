@@ -11,7 +11,8 @@ import socket
 import signal
 
 from subprocess import Popen, PIPE
-from dumps.commandmanagement import CommandPipeline
+from dumps.dbinfocache import DbInfoCache
+from dumps.dbquery import QueryService
 from dumps.exceptions import BackupError
 
 
@@ -32,6 +33,22 @@ class MiscUtils():
             dbs = sorted(dbs)
         return dbs
 
+    @staticmethod
+    def db_sections(paths):
+        """
+        given a comma-separated list of dblist files, one per db section
+        (e.g. /srv/dblists/s1.dblist), return a dict of db name to section
+        name, the section name being the filename without the extension
+        """
+        sections = {}
+        if not paths:
+            return sections
+        for path in paths.split(','):
+            section = os.path.splitext(os.path.basename(path))[0]
+            for dbname in MiscUtils.db_list(path):
+                sections[dbname] = section
+        return sections
+
     @staticmethod
     def shell_escape(param):
         """Escape a string parameter, or set of strings, for the shell."""
@@ -101,8 +118,9 @@ class DbServerInfo():
         self.db_server = None
         self.db_port = None
         self.apibase = None
+        self.canonical_server = None
 
-    def get_db_server_and_prefix(self, do_globals=True):
+    def get_db_server_and_prefix(self, do_globals=True, use_cache=True):
         """
         Get the name of a db replica for our cluster; also get
         the prefix for all tables for the specific wiki ($wgDBprefix),
@@ -110,6 +128,29 @@ class DbServerInfo():
 
         if do_globals is True, also get global variables
         and set attributes db_table_prefix, apibase
+
+        values recently retrieved by any process are taken from the
+        db info cache if there is one, unless use_cache is False, in
+        which case they are retrieved again and the cache updated
+        """
+        cache = DbInfoCache.get_cache(self.wiki.config)
+        entry = None
+        if cache is not None and use_cache:
+            entry = cache.get(self.db_name, ['db_server', 'db_port'])
+        if entry is not None:
+            self.db_server = entry['db_server']
+            self.db_port = entry['db_port']
+        else:
+            self.get_db_server_from_script()
+            self.put_in_cache(cache, {'db_server': self.db_server, 'db_port': self.db_port})
+
+        if do_globals:
+            self.get_config_variables(use_cache)
+
+    def get_db_server_from_script(self):
+        """
+        run the maintenance script that tells us the db replica
+        for the wiki and set attributes db_server, db_port
         """
         if not exists(self.wiki.config.php):
             raise BackupError("php command %s not found" % self.wiki.config.php)
@@ -131,16 +172,55 @@ class DbServerInfo():
         if ':' in self.db_server:
             self.db_server, _, self.db_port = self.db_server.rpartition(':')
 
-        if do_globals:
-            self.get_config_variables()
+    def put_in_cache(self, cache, values):
+        """
+        add the values for our wiki to the db info cache, if there
+        is one; failure to update the cache is not fatal
+        """
+        if cache is None:
+            return
+        try:
+            cache.put(self.db_name, values)
+        except OSError as ex:
+            if self.error_callback is not None:
+                self.error_callback("Failed to update db info cache %s: %s" % (cache.path, ex))
 
-    def get_config_variables(self):
+    def get_config_variables(self, use_cache=True):
         '''
         retrieve settings for certain MW global variables
-        via maintenance script
+        via maintenance script, or from the db info cache
         then set the db table prefix, and the base path to
         the MW api for the wiki
         '''
+        cache = DbInfoCache.get_cache(self.wiki.config)
+        entry = None
+        if cache is not None and use_cache:
+            entry = cache.get(self.db_name, ['config_vars'])
+        if entry is not None:
+            settings = entry['config_vars']
+        else:
+            settings = self.get_config_variables_from_script()
+            self.put_in_cache(cache, {'config_vars': settings})
+
+        self.db_table_prefix = settings['wgDBprefix']
+        self.canonical_server = settings['wgCanonicalServer']
+        self.api_host = settings['wgCanonicalServer'].replace('https://', '')
+        if is_runnning_in_kubernetes():
+            wgcanonserver = os.environ['ENVOY_MW_API_HOST']
+        else:
+            wgcanonserver = settings['wgCanonicalServer']
+        wgscriptpath = settings['wgScriptPath']
+
+        self.apibase = "/".join([
+            wgcanonserver.rstrip('/'),
+            wgscriptpath.strip('/'),
+            "api.php"])
+
+    def get_config_variables_from_script(self):
+        '''
+        run the maintenance script that retrieves the MW global
+        variables we want and return a dict of their values
+        '''
         command_list = MultiVersion.mw_script_as_array(self.wiki.config, "getConfiguration.php")
         pull_vars = ["wgDBprefix", "wgCanonicalServer", "wgScriptPath"]
         command = "{php} {command} --wiki={dbname} --format=json --regex='{vars}'"
@@ -156,19 +236,7 @@ class DbServerInfo():
             raise BackupError(
                 "Failed to get values for wgDBprefix, wgCanonicalServer, " +
                 "wgScriptPath for {wiki}".format(wiki=self.db_name))
-
-        self.db_table_prefix = settings['wgDBprefix']
-        self.api_host = settings['wgCanonicalServer'].replace('https://', '')
-        if is_runnning_in_kubernetes():
-            wgcanonserver = os.environ['ENVOY_MW_API_HOST']
-        else:
-            wgcanonserver = settings['wgCanonicalServer']
-        wgscriptpath = settings['wgScriptPath']
-
-        self.apibase = "/".join([
-            wgcanonserver.rstrip('/'),
-            wgscriptpath.strip('/'),
-            "api.php"])
+        return settings
 
     def mysql_standard_parameters(self):
         host = self.get_attr('db_server')
@@ -211,15 +279,13 @@ class DbServerInfo():
         return command
 
     def run_sql_and_get_output(self, query):
+        """
+        run the query via the shared connection to our db server and
+        return the output, or None on error or if there was no output
+        """
         if self.db_server is None:
             self.get_db_server_and_prefix()
-        command = self.build_sql_command(query)
-        proc = CommandPipeline(command, quiet=True)
-        proc.run_pipeline_get_output()
-        # fixme best to put the return code someplace along with any errors....
-        if proc.exited_successfully() and (proc.output()):
-            return proc.output()
-        return None
+        return QueryService.get_service(self).run(self.db_name, query)
 
     def run_sql_query_with_retries(self, query, maxretries=3):
         """
@@ -238,7 +304,7 @@ class DbServerInfo():
             if results is None:
                 time.sleep(5)
                 # get db config again in case something's changed
-                self.get_db_server_and_prefix()
+                self.get_db_server_and_prefix(use_cache=False)
                 continue
             return results
         return results
@@ -571,6 +637,29 @@ class FilePartInfo():
     def parts_enabled(self):
         return self._parts_enabled
 
+    def get_pages_per_part_history(self):
+        """
+        return the list of the number of pages in each part of the page
+        content jobs, or None if there are no parts, if they are split up
+        by revision count, or if a single number of pages per part is
+        configured and the db lookup that tells how many parts that makes
+        has not been done
+        """
+        if not self._pages_per_filepart_history or self._revs_per_filepart_history:
+            return None
+        if self.stats is None and len(self._pages_per_filepart_history) == 1:
+            return None
+        return self._pages_per_filepart_history
+
+    def get_last_page_id(self):
+        """
+        return the largest page id of the wiki as of the db lookup done to
+        set up the parts, or None if that lookup has not been done
+        """
+        if self.stats is None:
+            return None
+        return self.stats.total_pages
+
     # args: total (pages or revs), and the number of (pages or revs) per filepart.
     def get_num_parts_for_xml_dumps(self, total, per_filepart):
         if not total:
@@ -158,6 +158,15 @@ class Config(ConfigParsing):
         self.apijobs = self.get_opt_in_overrides_or_default(
             "wiki", "apijobs", 0)
 
+        self.db_sections = MiscUtils.db_sections(self.get_opt_in_overrides_or_default(
+            "wiki", "sectionlists", 0))
+        self.section_workers = self.get_opt_in_overrides_or_default(
+            "wiki", "sectionworkers", 1)
+        # the db info cache is out of date when any of these change
+        dblists = [self.get_opt_in_overrides_or_default("wiki", "dblist", 0)]
+        dblists.extend(self.get_opt_in_overrides_or_default("wiki", "sectionlists", 0).split(','))
+        self.dbinfo_cache_lists = [path for path in dblists if path]
+
         self.db_list_unsorted = [dbname for dbname in self.db_list_unsorted
                                  if dbname not in self.skip_db_list]
         self.db_list = sorted(self.db_list_unsorted)
@@ -179,6 +188,13 @@ class Config(ConfigParsing):
             self.conf.add_section('misc')
         self.fixed_dump_order = self.get_opt_in_overrides_or_default("misc", "fixeddumporder", 0)
         self.fixed_dump_order = int(self.fixed_dump_order, 0)
+        self.checksum_extras = self.get_opt_in_overrides_or_default(
+            "misc", "checksumextras", 0).split(',')
+        self.checksum_extras = list(filter(None, self.checksum_extras))
+        self.checksum_threads = self.get_opt_in_overrides_or_default(
+            "misc", "checksumthreads", 1)
+        self.inline_checksums = self.get_opt_in_overrides_or_default(
+            "misc", "inlinechecksums", 1)
 
     def parse_conffile_globally(self):
 
@@ -188,6 +204,13 @@ class Config(ConfigParsing):
             self.conf.add_section('database')
         self.max_allowed_packet = self.conf.get("database", "max_allowed_packet")
         self.db_client_config_file = self.conf.get("database", "client_config_file")
+        self.query_backend = self.conf.get("database", "querybackend")
+        self.query_sqlite_db = self.conf.get("database", "querysqlitedb")
+        self.query_timeout = self.conf.getint("database", "querytimeout")
+        self.dbinfo_cache = self.conf.get("database", "dbinfocache")
+        if self.dbinfo_cache:
+            self.dbinfo_cache = os.path.join(self.private_dir, self.dbinfo_cache)
+        self.dbinfo_cache_ttl = self.conf.getint("database", "dbinfocachettl")
 
         if not self.conf.has_section('reporting'):
             self.conf.add_section('reporting')
@@ -197,6 +220,10 @@ class Config(ConfigParsing):
         self.stale_age = self.conf.getint("reporting", "staleage")
         self.batchjobs_stale_age = self.conf.getint("reporting", "batchjobsstaleage")
         self.skip_privatetables = self.conf.getint("reporting", "skipprivatetables")
+        self.monitor_cache = self.conf.get("reporting", "monitorcache")
+        self.monitor_threads = self.conf.getint("reporting", "monitorthreads")
+        self.status_interval = self.conf.getint("reporting", "statusinterval")
+        self.prometheus_dir = self.conf.get("reporting", "prometheusdir")
 
         if not self.conf.has_section('tools'):
             self.conf.add_section('tools')
@@ -274,6 +301,18 @@ class Config(ConfigParsing):
             'chunks', 'testsleep', 1)
         self.content_batches = self.get_opt_for_proj_or_default(
             'chunks', 'contentbatchesEnabled', 1)
+        self.batch_ledger = self.get_opt_for_proj_or_default(
+            'chunks', 'batchledger', 0)
+        self.batch_ledger_journal = self.get_opt_for_proj_or_default(
+            'chunks', 'batchledgerjournal', 0)
+        self.recombine_index_workers = self.get_opt_for_proj_or_default(
+            'chunks', 'recombineindexworkers', 1)
+        self.separate_streams = self.get_opt_for_proj_or_default(
+            'chunks', 'separatestreams', 1)
+        self.rebalance_parts = self.get_opt_for_proj_or_default(
+            'chunks', 'rebalanceParts', 1)
+        self.stream_temp_stubs = self.get_opt_for_proj_or_default(
+            'chunks', 'streamTempStubs', 1)
 
         if not self.conf.has_section('otherformats'):
             self.conf.add_section('otherformats')
@@ -297,6 +336,12 @@ class Config(ConfigParsing):
         self.lbzip2forhistory = self.get_opt_in_overrides_or_default("misc", "lbzip2forhistory", 0)
         self.lbzip2forhistory = int(self.lbzip2forhistory, 0)
         self.max_retries = self.get_opt_for_proj_or_default("misc", "maxRetries", 1)
+        self.xmlstream_workers = self.get_opt_for_proj_or_default("misc", "xmlstreamworkers", 1)
+        self.tabledump_workers = self.get_opt_for_proj_or_default("misc", "tabledumpworkers", 1)
+        self.tabledumps_per_dbhost = self.get_opt_for_proj_or_default(
+            "misc", "tabledumpsperdbhost", 1)
+        self.command_supervisor = self.get_opt_for_proj_or_default(
+            "misc", "commandsupervisor", 0)
         self.skipjobs = self.get_opt_for_proj_or_default("misc", "skipJobs", 0).split(',')
         self.skipjobs = list(filter(None, self.skipjobs))
 
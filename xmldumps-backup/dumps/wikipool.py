@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+'''
+run a job on each of a list of wikis, several at a time,
+with a limit on how many may run at once against wikis in
+the same db section, so that no one replica gets overloaded
+'''
+
+import heapq
+import itertools
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class WikiPool():
+    '''
+    a bounded pool of workers handling a queue of wikis; wikis whose job
+    does not complete are put back on the queue to become ready again
+    after a wait, rather than the whole list being retried after a sleep
+
+    sections is a dict of wiki name to db section name, as returned by
+    MiscUtils.db_sections(); wikis not in any section are not limited
+    except by the number of workers
+    '''
+    def __init__(self, workers, sections=None, section_workers=1,
+                 retry_wait=300, report=None):
+        self.workers = max(workers, 1)
+        self.sections = sections if sections else {}
+        self.section_workers = max(section_workers, 1)
+        self.retry_wait = retry_wait
+        self.report = report
+        self.sequence = itertools.count()
+
+    def get_section(self, wikiname):
+        '''
+        return the db section for the wiki; wikis not listed in
+        any section are each treated as their own section
+        '''
+        if wikiname in self.sections:
+            return self.sections[wikiname]
+        return (wikiname,)
+
+    def show(self, message):
+        '''
+        pass the message to the report callback if there is one
+        '''
+        if self.report is not None:
+            self.report(message)
+
+    def launch_ready(self, ready, running, busy, executor, do_one):
+        '''
+        start jobs for wikis that are ready, as long as there are free
+        workers and the wiki's section is not at its limit; wikis held
+        back because their section is busy go back on the ready queue
+        '''
+        now = time.time()
+        held = []
+        while ready and ready[0][0] <= now and len(running) < self.workers:
+            entry = heapq.heappop(ready)
+            section = self.get_section(entry[2])
+            if busy[section] >= self.section_workers:
+                held.append(entry)
+                continue
+            busy[section] += 1
+            running[executor.submit(do_one, entry[2])] = (entry[2], section, time.time())
+        for entry in held:
+            heapq.heappush(ready, entry)
+
+    def get_timeout(self, ready, running):
+        '''
+        return how long to wait for a job to finish before looking
+        for wikis on the queue that have become ready, or None to
+        wait as long as it takes
+        '''
+        now = time.time()
+        pending = [entry[0] for entry in ready if entry[0] > now]
+        if not pending:
+            return None if running else 0
+        return min(pending) - now
+
+    def run(self, wikinames, do_one, max_retries):
+        '''
+        call do_one(wikiname) for each wiki in the list; it should return
+        True if the wiki is done, or False if its job should be retried
+        later, up to max_retries times
+
+        returns the list of wikis that were retried too many times
+        '''
+        ready = [(0, next(self.sequence), wikiname) for wikiname in wikinames]
+        heapq.heapify(ready)
+        tries = Counter()
+        busy = Counter()
+        running = {}
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while ready or running:
+                self.launch_ready(ready, running, busy, executor, do_one)
+                timeout = self.get_timeout(ready, running)
+                if not running:
+                    time.sleep(timeout)
+                    continue
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    wikiname, section, started = running.pop(future)
+                    busy[section] -= 1
+                    try:
+                        result = future.result()
+                    except Exception:
+                        self.show("wiki %s job failed: %s" % (wikiname, traceback.format_exc()))
+                        result = False
+                    elapsed = time.time() - started
+                    if result:
+                        self.show("wiki %s done in %.1fs" % (wikiname, elapsed))
+                        continue
+                    tries[wikiname] += 1
+                    if tries[wikiname] > max_retries:
+                        self.show("wiki %s not done after %.1fs, giving up" % (wikiname, elapsed))
+                        failed.append(wikiname)
+                    else:
+                        self.show("wiki %s not done after %.1fs, retrying in %ds" % (
+                            wikiname, elapsed, self.retry_wait))
+                        heapq.heappush(ready, (time.time() + self.retry_wait,
+                                               next(self.sequence), wikiname))
+        return failed
@@ -13,7 +13,7 @@ from dumps.utils import MultiVersion
 from dumps.jobs import Dump, ProgressCallback
 from dumps.wikidump import Locker
 import dumps.pagerange
-from dumps.pagerange import PageRange, QueryRunner
+from dumps.pagerange import PageRange, QueryRunner, RevInfoIndex
 from dumps.pagerangeinfo import PageRangeInfo
 from dumps.prefetch import PrefetchFinder
 import dumps.intervals
@@ -172,6 +172,9 @@ class XmlDump(Dump):
     def check_truncation(cls):
         return True
 
+    def parts_cover_page_ranges(self):
+        return bool(self._pages_per_part)
+
     @classmethod
     def get_dumpname_base(cls):
         """
@@ -412,7 +415,8 @@ class XmlDump(Dump):
     def stash_revinfo(self, runner, batchsize=10):
         '''
         get information from the latest stubs history file about the number and length
-        of revisions for each batch of ten pages and save the output
+        of revisions for each batch of ten pages and save the output, along with
+        an index of cumulative counts for quick page range lookups
 
         this is only generated when full page content history is being produced
         '''
@@ -423,6 +427,7 @@ class XmlDump(Dump):
 
         revinfo_path = self.get_revinfofile_path()
         if os.path.exists(revinfo_path):
+            self.stash_revinfo_index(revinfo_path)
             return
         revinfo_path_tmp = self.get_temp_revinfofile_path()
         stubs_filename = self.stubber.get_stub_dfname_no_parts(runner.dump_dir)
@@ -446,11 +451,21 @@ class XmlDump(Dump):
             raise BackupError("error generating revision count info")
         # check that the file is ok
         dcontents = DumpContents(runner.wiki, revinfo_path_tmp)
-        if (dcontents.check_if_empty() or dcontents.check_if_truncated() or
-                dcontents.check_if_binary_crap()):
+        if dcontents.validate().is_bad():
             os.unlink(revinfo_path_tmp)
             raise BackupError("error in writing revision count info file")
         os.rename(revinfo_path_tmp, revinfo_path)
+        self.stash_revinfo_index(revinfo_path)
+
+    @staticmethod
+    def stash_revinfo_index(revinfo_path):
+        '''
+        write the index of cumulative revision and byte counts for the
+        revinfo file, if it's not already there
+        '''
+        index_path = dumps.pagerange.get_revinfo_index_path(revinfo_path)
+        if not os.path.exists(index_path):
+            RevInfoIndex.build(revinfo_path, index_path)
 
     def get_dfnames_from_cached_pageranges(self, stub_pageranges, dfnames_todo, logger, runner):
         """
@@ -574,9 +589,15 @@ class XmlDump(Dump):
                                              entry['stub'].first_page_id,
                                              entry['stub'].last_page_id),
                                          False)
+            if entry['generate'] and self.streams_temp_stubs():
+                stub_input = entry['stub_input']
+            else:
+                stub_input = None
             entry['command'] = self.build_command(runner, entry['stub'],
-                                                  entry['prefetch'], output_dfname)
+                                                  entry['prefetch'], output_dfname, stub_input)
             self.setup_command_info(runner, entry['command'], [output_dfname])
+            if stub_input is not None:
+                self.commands_submitted[-1]['stub_slice'] = entry['stub']
             commands.append(entry['command'])
         return commands
 
@@ -599,16 +620,19 @@ class XmlDump(Dump):
             return progress.progress_callback
         return None
 
-    def run_batch(self, command_batch, runner, callback_type):
+    def run_batch(self, command_batch, runner, callback_type, slots=None):
         """
-        run one batch of commands, returning all command series that failed;
+        run one batch of commands, at most 'slots' at a time if set, returning
+        all command series that failed;
         this logs and/or displays error messages to the console on failure
         """
 
         error, broken = runner.run_command(
             command_batch, callback_stderr=self.get_callback(callback_type),
             callback_stderr_arg=runner,
-            callback_on_completion=self.command_completion_callback)
+            callback_on_completion=self.command_completion_callback,
+            slots=slots, callback_should_start=self.command_should_start,
+            callback_should_start_arg=runner)
         if error:
             for series in broken:
                 for pipeline in series:
@@ -687,18 +711,37 @@ class XmlDump(Dump):
         dfname.new_from_filename(filename)
         return dfname
 
-    def get_command_batch(self, commands, runner):
+    def output_not_yet_produced(self, runner, series):
+        '''
+        return False if the output file of the command series already exists,
+        True otherwise; this is checked right before each command is started,
+        so that we don't interfere with runs on another host or manual runs
+        that we may not know about
+
+        args: Runner, CommandSeries
         '''
-        return a batch of commands, filtered so that any which
-        produce an output file that already exists, are omitted;
-        this prevents us from interfering with runs on another
-        host or manual runs that we may not know about
+        # each series produces one output file only, and we want the name without INPROG markers
+        final_output_dfname = self.get_final_output_dfname(series.command_series(), runner)
+        return final_output_dfname is None or not exists(
+            runner.dump_dir.filename_public_path(final_output_dfname))
+
+    def command_should_start(self, runner, series):
         '''
-        commands = self.filter_commands(commands, runner)
-        batchsize = self.get_batchsize()
-        commands_todo = commands[:batchsize]
-        commands_left = commands[batchsize:]
-        return (commands_todo, commands_left)
+        return True if the command series should be started now, see
+        output_not_yet_produced; if the page range stub is streamed to
+        it, the named pipe for that is made now, or if the series won't
+        be started, anything left by an earlier attempt is cleaned up
+
+        args: Runner, CommandSeries
+        '''
+        command_info = self.get_stub_slice_info(series)
+        if not self.output_not_yet_produced(runner, series):
+            if command_info is not None:
+                self.stubber.cleanup_stub_slice(command_info['stub_slice'])
+            return False
+        if command_info is not None:
+            self.stubber.make_stub_slice_fifo(command_info['stub_slice'])
+        return True
 
     def filter_commands(self, commands, runner):
         '''
@@ -717,32 +760,13 @@ class XmlDump(Dump):
 
     def run_page_content_commands(self, commands, runner, callback_type):
         """
-        generate page content output in batches, with retries if configured
+        generate page content output, keeping up to one command per part
+        running at the same time; whenever a command completes, the
+        next one waiting is started
         """
-        # don't do them all at once, do only up to _parts commands at the same time
-        batchsize = self.get_batchsize()
-        errors = False
-        failed_commands = []
-        max_retries = self.wiki.config.max_retries
-        retries = 0
-        commands_left = commands
-        while commands_left and (retries < max_retries or retries == 0):
-            commands_todo, commands_left = self.get_command_batch(commands_left, runner)
-            broken = self.run_batch(commands_todo, runner, callback_type)
-            if broken:
-                failed_commands.append(broken)
-                errors = True
-
-            if not commands_todo and failed_commands:
-                retries += 1
-                if retries < max_retries:
-                    # retry failed commands
-                    commands_todo = failed_commands
-                    failed_commands = []
-                    # no instant retries, give the servers a break
-                    time.sleep(self.wiki.config.retry_wait)
-                    errors = False
-        if errors:
+        commands = self.filter_commands(commands, runner)
+        broken = self.run_batch(commands, runner, callback_type, slots=self.get_batchsize())
+        if broken:
             raise BackupError("error producing xml file(s) %s" % self.get_dumpname())
 
     def doing_batch_jobs(self, runner):
@@ -879,23 +903,29 @@ class XmlDump(Dump):
         # figure out how many stub input files we generate at once
         batchsize = self.get_batchsize(stubs=True)
 
-        commands, output_dfnames = self.stubber.get_commands_for_temp_stubs(to_generate, runner)
-
         worker_type = self.doing_batch_jobs(runner)
 
-        # secondary batch workers should not generate temp stubs, that should
-        # be done only if we run without batches or by the primary worker
-        if worker_type != 'secondary_batches':
-            self.stubber.run_temp_stub_commands(runner, commands, batchsize)
-            # check that the temp stubs are not garbage, though they may be empty so
-            # we should (but don't yet) skip that check. FIXME
-            self.stubber.check_temp_stubs(runner, self.move_if_truncated, output_dfnames)
-
-        # if we had to generate or need to use temp stubs, skip over those with no pages in them;
-        # it's possible a page range has nothing in the stub file because they were all deleted.
-        # we have some projects with e.g. 35k pages in a row deleted!
-        todo = [entry for entry in wanted if not entry['generate'] or
-                not self.stubber.has_no_pages(entry['stub'], runner, tempdir=True)]
+        if self.streams_temp_stubs():
+            # page range stubs are streamed to each page content command as
+            # it runs; those with no pages in them are caught once it's done
+            todo = wanted
+        else:
+            commands, output_dfnames = self.stubber.get_commands_for_temp_stubs(
+                to_generate, runner)
+
+            # secondary batch workers should not generate temp stubs, that should
+            # be done only if we run without batches or by the primary worker
+            if worker_type != 'secondary_batches':
+                self.stubber.run_temp_stub_commands(runner, commands, batchsize)
+                # check that the temp stubs are not garbage, though they may be empty so
+                # we should (but don't yet) skip that check. FIXME
+                self.stubber.check_temp_stubs(runner, self.move_if_truncated, output_dfnames)
+
+            # if we had to generate or need to use temp stubs, skip over those with no pages
+            # in them; it's possible a page range has nothing in the stub file because they
+            # were all deleted. we have some projects with e.g. 35k pages in a row deleted!
+            todo = [entry for entry in wanted if not entry['generate'] or
+                    not self.stubber.has_no_pages(entry['stub'], runner, tempdir=True)]
 
         # now figure out how many page content files we generate at once
         batchsize = self.get_batchsize()
@@ -927,16 +957,11 @@ class XmlDump(Dump):
         """Tell the dumper script whether to make ETA estimate on page or revision count."""
         return "--current"
 
-    # takes name of the output file
-    def build_filters(self, runner, input_dfname):
+    def get_bz2mode(self, runner):
         """
-        Construct the output filter options for dumpTextPass.php
-        args:
-            Runner, DumpFilename
+        return the name of the bzip2 compressor dumpTextPass.php
+        should use for the output file
         """
-        # do we need checkpoints? ummm
-        xmlbz2_path = runner.dump_dir.filename_public_path(input_dfname)
-
         if 'history' in self.jobinfo['subset'] and runner.wiki.config.lbzip2forhistory:
             # we will use lbzip2 for compression of pages-meta-history for this wiki
             # if configured
@@ -949,18 +974,61 @@ class XmlDump(Dump):
             bz2mode = "bzip2"
             if not exists(self.wiki.config.bzip2):
                 raise BackupError("bzip2 command %s not found" % self.wiki.config.bzip2)
-        return "--output=%s:%s" % (bz2mode, DumpFilename.get_inprogress_name(xmlbz2_path))
+        return bz2mode
+
+    # takes name of the output file
+    def build_filters(self, runner, input_dfname):
+        """
+        Construct the output filter options for dumpTextPass.php
+        args:
+            Runner, DumpFilename
+        """
+        # do we need checkpoints? ummm
+        xmlbz2_path = runner.dump_dir.filename_public_path(input_dfname)
+        return "--output=%s:%s" % (self.get_bz2mode(runner),
+                                   DumpFilename.get_inprogress_name(xmlbz2_path))
+
+    def build_split_command(self, runner, output_dfname):
+        """
+        if the xml header, the pages and the xml footer are to be written
+        as separate bz2 streams, so that recombining the output files later
+        needs no decompression, return the command that will read the
+        uncompressed dump output and write the output file that way;
+        otherwise return None
+        """
+        if not runner.wiki.config.separate_streams:
+            return None
+        bz2mode = self.get_bz2mode(runner)
+        if bz2mode == "lbzip2":
+            compressor = [self.wiki.config.lbzip2]
+            if self.wiki.config.lbzip2threads:
+                compressor.extend(["-n", str(self.wiki.config.lbzip2threads)])
+        elif bz2mode == "bzip2":
+            compressor = [self.wiki.config.bzip2]
+        else:
+            return None
+        xmlbz2_path = runner.dump_dir.filename_public_path(output_dfname)
+        return ["/usr/bin/python3", self.get_command_abspath("xmlsplit.py"),
+                "--compressor", " ".join(compressor),
+                "--outfile", DumpFilename.get_inprogress_name(xmlbz2_path)]
 
-    def build_command(self, runner, stub_dfname, prefetch, output_dfname):
+    def build_command(self, runner, stub_dfname, prefetch, output_dfname, stub_input_dfname=None):
         """
-        Build the command line for the dump, minus output and filter options
+        Build the command line for the dump, minus output and filter options;
+        if the stub input file is given, the page range stub is streamed from
+        it through a named pipe by a command run first in the pipeline
         args:
-            Runner, stub DumpFilename, ....
+            Runner, stub DumpFilename, ...., stub input DumpFilename
         """
         stub_path = os.path.join(
             FileUtils.wiki_tempdir(self.wiki.db_name, self.wiki.config.temp_dir),
             stub_dfname.filename)
-        if os.path.exists(stub_path):
+        slice_command = None
+        if stub_input_dfname is not None:
+            slice_command = self.stubber.get_stub_slice_cmd(
+                stub_input_dfname, stub_dfname, runner, self.get_command_abspath("xmlslice.py"))
+            stub_option = "--stub=file:%s" % self.stubber.get_stub_slice_paths(stub_dfname)[0]
+        elif os.path.exists(stub_path):
             # if this is a pagerange stub file in temp dir, use that
             stub_option = "--stub=gzip:%s" % stub_path
         else:
@@ -985,12 +1053,58 @@ class XmlDump(Dump):
                              "%s" % spawn])
 
         dump_command = [entry for entry in dump_command if entry is not None]
-        dump_command.extend([self.build_filters(runner, output_dfname), self.build_eta()])
-        pipeline = [dump_command]
+        split_command = self.build_split_command(runner, output_dfname)
+        if split_command is not None:
+            dump_command.extend(["--output=file:/dev/stdout", self.build_eta()])
+            pipeline = [dump_command, split_command]
+        else:
+            dump_command.extend([self.build_filters(runner, output_dfname), self.build_eta()])
+            pipeline = [dump_command]
+        if slice_command is not None:
+            pipeline.insert(0, slice_command)
         # return a command series of one pipeline
         series = [pipeline]
         return series
 
+    def streams_temp_stubs(self):
+        """
+        return True if page range stubs are streamed to the page content
+        commands, rather than written to temp stub files first
+        """
+        return bool(self.wiki.config.stream_temp_stubs)
+
+    def get_stub_slice_info(self, series):
+        """
+        return the info about the submitted command series if the page
+        range stub is streamed to it, None otherwise
+        """
+        for command_info in self.commands_submitted:
+            if command_info['series'] == series.command_series() and 'stub_slice' in command_info:
+                return command_info
+        return None
+
+    def command_completion_callback(self, series):
+        """
+        if the page range stub for the command series was streamed to it,
+        clean up after it, and if there turned out to be no pages in the
+        range, remove the output file rather than making it available;
+        then do the usual
+        """
+        command_info = self.get_stub_slice_info(series)
+        if command_info is not None:
+            no_pages = (series.exited_successfully() and
+                        self.stubber.stub_slice_has_no_pages(command_info['stub_slice']))
+            self.stubber.cleanup_stub_slice(command_info['stub_slice'])
+            if no_pages:
+                # all pages in the range were deleted, as for temp stubs with no
+                # pages in them, we don't produce an output file
+                for filename in command_info['output_files']:
+                    dfname = DumpFilename(self.wiki)
+                    dfname.new_from_filename(filename[:-1 * len(DumpFilename.INPROG)])
+                    self.remove_output_file(command_info['runner'].dump_dir, dfname)
+                return
+        super().command_completion_callback(series)
+
     def get_tmp_files(self, dump_dir, dump_names=None):
         """
         list temporary output files currently existing
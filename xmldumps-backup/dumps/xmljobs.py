@@ -57,6 +57,9 @@ class XmlStub(Dump):
     def check_truncation(self):
         return True
 
+    def parts_cover_page_ranges(self):
+        return bool(self._pages_per_part)
+
     def detail(self):
         return "These files contain no page text, only revision metadata."
 
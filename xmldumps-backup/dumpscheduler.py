@@ -10,6 +10,7 @@ import sys
 import getopt
 from subprocess import Popen
 import logging
+import select
 import time
 import smtplib
 import email.mime.text
@@ -28,8 +29,13 @@ def line_to_entry(line, total_slots):
 
     line has content: slots count onfailure errornotify command
     onfailure may be one of continue exit retry
+    slots may have an estimated runtime in seconds tacked on: slots:seconds
     '''
     slots, count, onfailure, errornotify, command = line.split(' ', 4)
+    estimate = None
+    if ':' in slots:
+        slots, estimate = slots.split(':', 1)
+        estimate = float(estimate)
 
     if count == 'max':
         # figure out how many jobs can run at once given the
@@ -44,7 +50,11 @@ def line_to_entry(line, total_slots):
             'processes': [],
             'processids': [],
             'procidsfromcache': [],
-            'done': 0}
+            'done': 0,
+            'estimate': estimate,
+            'runtimes': [],
+            'starttimes': {},
+            'backfilled': []}
 
 
 def json_obj_dump(obj):
@@ -86,16 +96,19 @@ class Cacher():
         self.restore = restore
         self.rerun = rerun
 
-    def save_to_cache(self, commands):
+    def save_to_cache(self, commands, stats=None):
         '''
         write a cache file recording all commands in series
-        and their state, in case this script meets an untimely demise
+        and their state, in case this script meets an untimely demise,
+        along with scheduling stats if provided
         '''
 
         if self.cachepath is None:
             return
         cache_p = open(self.cachepath + ".tmp", "w+")
         cache_p.write("id:%s\n" % self.my_id)
+        if stats is not None:
+            cache_p.write("stats:%s\n" % json.dumps(stats))
         for entry in commands:
             # dump if there are processes running or processes yet
             # to run for command set
@@ -126,6 +139,8 @@ class Cacher():
             if line.startswith("id:"):
                 self.my_id = line.split(":", 1)[1]
                 continue
+            if line.startswith("stats:"):
+                continue
 
             entry = json.loads(line)
             entry['slots'] = int(entry['slots'])
@@ -133,6 +148,11 @@ class Cacher():
             entry['done'] = int(entry['done'])
             entry['procidsfromcache'] = entry['processids'][:]
             entry['processes'] = []
+            # caches from older versions of this script won't have these
+            entry.setdefault('estimate', None)
+            entry.setdefault('runtimes', [])
+            entry.setdefault('starttimes', {})
+            entry.setdefault('backfilled', [])
             commands.append(entry)
         if self.rerun:
             for entry in commands:
@@ -326,6 +346,28 @@ def scheduler_setup():
     return my_id
 
 
+def forget_start(entry, pid):
+    '''
+    remove start time and backfill info for a process that is no
+    longer running, returning the start time if we had it
+    '''
+    if str(pid) in entry['backfilled']:
+        entry['backfilled'].remove(str(pid))
+    return entry['starttimes'].pop(str(pid), None)
+
+
+def get_estimate(entry):
+    '''
+    return the estimated runtime in seconds of a command from the
+    command set: the average of the runtimes of those that have
+    completed, or the estimate from the command list if none have,
+    or None if we have no idea
+    '''
+    if entry['runtimes']:
+        return sum(entry['runtimes']) / len(entry['runtimes'])
+    return entry['estimate']
+
+
 def update_retries(process, pid, entry):
     '''
     update the number of retries left for
@@ -342,6 +384,7 @@ def update_retries(process, pid, entry):
         entry['processids'].remove(pid)
         if pid in entry['procidsfromcache']:
             entry['procidsfromcache'].remove(pid)
+        forget_start(entry, pid)
         entry['count'] = entry['count'] + 1
         LOG.info("after failure, retry for %s scheduled", entry['command'])
         if retries != "0":
@@ -358,12 +401,16 @@ class Scheduler():
     one 'slot' of resources (think cpu)
     '''
 
-    def __init__(self, plugables, formatvars, my_id):
+    def __init__(self, plugables, formatvars, my_id, backfill=True, interval=30):
         '''
         constructor
         also define a unique id that is set in the environment of every command
         run and can be used later if this script dies, to check to see if a command
         with the same pid and environment variable is still running
+
+        if backfill is set, commands later in the list may be started ahead of a
+        command waiting for slots, as long as they don't delay it
+        interval is how often to check on processes if no child exits
         '''
 
         signal.signal(signal.SIGHUP, self.handle_hup)
@@ -376,6 +423,14 @@ class Scheduler():
         self.checker = plugables['checker']
         self.mailer = plugables['mailer']
         self.formatvars = format_convert(formatvars)
+        self.backfill = backfill
+        self.interval = interval
+        self.wakeup_fd = None
+        self.stats = {'started': 0, 'completed': 0, 'backfilled': 0,
+                      'slot_idle_seconds': 0.0, 'elapsed_seconds': 0.0,
+                      'completed_per_hour': 0.0}
+        self.start_time = None
+        self.last_check = None
 
     def handle_hup(self, signo, _frame):
         """
@@ -417,22 +472,46 @@ class Scheduler():
         this script has no way to tell if such processes ran to
         successful completion which is why a rerun might be a good choice.
 
-        waits 30 seconds in between starting up new commands, assuming
-        free slots (e.g. cpu resources) are available.
+        new commands are started whenever a child process exits and so
+        frees up slots; processes restored from the cache are not our
+        children, so we also check every self.interval seconds.
         '''
 
         self.commands = self.cacher.restore_from_cache()
         if not self.commands:
             self.commands = self.read_commands(inputfile)
 
+        self.setup_wakeup()
         while True:
-            if self.start_command() is None:
-                self.cacher.save_to_cache(self.commands)
+            if self.start_commands() is None:
+                self.cacher.save_to_cache(self.commands, self.stats)
                 LOG.info("all command sets completed.")
                 break
-            # do we want this configurable? meh
-            # 30 seconds is fine, we're dealing with long running commands here
-            time.sleep(30)
+            self.wait_for_event()
+
+    def setup_wakeup(self):
+        '''
+        arrange for SIGCHLD to write to a pipe we can wait on
+        '''
+        wakeup_read, wakeup_write = os.pipe()
+        os.set_blocking(wakeup_read, False)
+        os.set_blocking(wakeup_write, False)
+        signal.set_wakeup_fd(wakeup_write)
+        # the handler need not do anything, the wakeup fd gets written regardless
+        signal.signal(signal.SIGCHLD, lambda signo, frame: None)
+        self.wakeup_fd = wakeup_read
+
+    def wait_for_event(self):
+        '''
+        wait for a child to exit or for the check interval to pass
+        '''
+        ready, _unused, _unused = select.select([self.wakeup_fd], [], [], self.interval)
+        if ready:
+            try:
+                while os.read(self.wakeup_fd, 512):
+                    pass
+            except BlockingIOError:
+                pass
 
     def read_commands(self, inputfile):
         '''
@@ -460,6 +539,10 @@ class Scheduler():
             entry['processes'].remove(process)
         entry['processids'].remove(pid)
         entry['done'] += 1
+        started = forget_start(entry, pid)
+        if started is not None:
+            entry['runtimes'].append(time.time() - started)
+        self.stats['completed'] += 1
         self.allocator.free(entry['slots'], pid)
 
     def handle_nonzero_retcode(self, process, pid, entry):
@@ -549,22 +632,115 @@ class Scheduler():
             LOG.error("exiting after command failure")
             sys.exit(1)
 
-    def start_command(self):
+    def update_stats(self, now):
+        '''
+        add up slots left idle since the last check while commands were
+        waiting to start, and update elapsed time and throughput
+        '''
+        if self.start_time is None:
+            self.start_time = now
+        elif any(entry['count'] > 0 for entry in self.commands):
+            self.stats['slot_idle_seconds'] += (
+                self.allocator.free_slots * (now - self.last_check))
+        self.last_check = now
+        self.stats['elapsed_seconds'] = now - self.start_time
+        if self.stats['elapsed_seconds']:
+            self.stats['completed_per_hour'] = (
+                self.stats['completed'] * 3600 / self.stats['elapsed_seconds'])
+
+    def get_reservation(self, entry_waiting, now):
+        '''
+        for a command set waiting for slots, figure out when it will
+        be able to start (the 'shadow time'), from the estimated end times
+        of running processes, and how many slots will be free at that time
+        beyond what it needs
+
+        processes with no runtime estimate are assumed to finish sometime,
+        except those that were backfilled; if the command can't be
+        started by processes with estimates finishing, the shadow time
+        is None
+
+        returns: shadow time, number of extra slots
+        '''
+        ends = []
+        later = 0
+        for entry in self.commands:
+            estimate = get_estimate(entry)
+            for pid in entry['processids']:
+                started = entry['starttimes'].get(str(pid))
+                if estimate is not None and started is not None:
+                    ends.append((max(started + estimate, now), entry['slots']))
+                elif str(pid) not in entry['backfilled']:
+                    later += entry['slots']
+
+        free = self.allocator.free_slots
+        for end, slots in sorted(ends):
+            free += slots
+            if free >= entry_waiting['slots']:
+                return end, free - entry_waiting['slots']
+        return None, free + later - entry_waiting['slots']
+
+    def start_process(self, entry, backfilled=False):
+        '''
+        start up one process for the command set
+        '''
+        LOG.info("using %s slot(s), starting command %s%s",
+                 str(entry['slots']), entry['command'], " (backfill)" if backfilled else "")
+        # we need setpgrp here so that kills to our children will
+        # propagate through to any subprocesses that might be forked
+        process = Popen(entry['command'],  # pylint: disable=subprocess-popen-preexec-fn
+                        shell=True, bufsize=-1, preexec_fn=os.setpgrp)
+        entry['processes'].append(process)
+        entry['processids'].append(process.pid)
+        entry['starttimes'][str(process.pid)] = time.time()
+        if backfilled:
+            entry['backfilled'].append(str(process.pid))
+            self.stats['backfilled'] += 1
+        self.stats['started'] += 1
+        self.allocator.allocate(entry['slots'])
+        entry['count'] -= 1
+
+    def backfill_commands(self, entry_waiting, entries, now):
+        '''
+        start processes from the command sets after the one that is
+        waiting for slots, as long as doing so won't delay its start:
+        either they are expected to finish before it can start, or they
+        use only slots it won't need
+
+        returns: number of processes started
+        '''
+        shadow, extra = self.get_reservation(entry_waiting, now)
+        started = 0
+        for entry in entries:
+            estimate = get_estimate(entry)
+            while entry['count'] > 0 and self.allocator.available(entry['slots']):
+                if shadow is None or estimate is None or now + estimate > shadow:
+                    if entry['slots'] > extra:
+                        break
+                    extra -= entry['slots']
+                self.start_process(entry, backfilled=True)
+                started += 1
+        return started
+
+    def start_commands(self):
         '''
         see if any command has completed, deal with failure or successful completion,
         (some commands may be requeued on failure)
-        then go through the series of command sets in order and for the first set that
-        has not completed, if there are slots available, start up a command
+        then go through the series of command sets in order and start up as many
+        commands as there are slots for; once we get to a set whose command can't
+        be started for lack of slots, fill in with commands from sets after it, if
+        backfill is enabled
+
+        returns None if all commands have completed, False if all have been
+        started but some are still running, True otherwise
         '''
 
         self.check_running()
-        entry = None
-        for item in self.commands:
-            if item['count'] > 0:
-                entry = item
-                break
+        now = time.time()
+        self.update_stats(now)
+        entries = [item for item in self.commands if item['count'] > 0]
 
-        if entry is None:
+        if not entries:
             for item in self.commands:
                 if item['processids']:
                     # no more commands left to run, waiting for completion
@@ -574,19 +750,19 @@ class Scheduler():
             # no more commands left to run, all completed
             return None
 
-        self.allocator.log_status(entry['slots'])
-        if self.allocator.available(entry['slots']):
-            LOG.info("using %s slot(s), starting command %s",
-                     str(entry['slots']), entry['command'])
-            # we need setpgrp here so that kills to our children will
-            # propagate through to any subprocesses that might be forked
-            process = Popen(entry['command'],  # pylint: disable=subprocess-popen-preexec-fn
-                            shell=True, bufsize=-1, preexec_fn=os.setpgrp)
-            entry['processes'].append(process)
-            entry['processids'].append(process.pid)
-            self.allocator.allocate(entry['slots'])
-            entry['count'] -= 1
-            self.cacher.save_to_cache(self.commands)
+        started = 0
+        for index, entry in enumerate(entries):
+            self.allocator.log_status(entry['slots'])
+            while entry['count'] > 0 and self.allocator.available(entry['slots']):
+                self.start_process(entry)
+                started += 1
+            if entry['count'] > 0:
+                # this one has to wait for slots
+                if self.backfill:
+                    started += self.backfill_commands(entry, entries[index + 1:], now)
+                break
+        if started:
+            self.cacher.save_to_cache(self.commands, self.stats)
         return True
 
 
@@ -603,6 +779,7 @@ def usage(message=None):
 Usage: dumpscheduler.py --slots number [--commands path]
     [--cache path] [--directory path] [--mailhost hostname]
     [--email address] [--formatvars var1=val1,var2=val2...]
+    [--interval seconds] [--nobackfill]
     [--restore] [--rerun] [--verbose] [--help]
 
 Send a SIGHUP to this script to shoot all children and restart the script
@@ -628,6 +805,13 @@ Options:
   --rerun     (-R):     rerun any processes still in process (for interrupted script)
   --formatvars(-f):     comma-separated list of var names and values to be substituted
                         into the command list via format()
+  --interval  (-i):     how often in seconds to check on running processes if none
+                        of them exit in the meantime; processes restored from the
+                        cache are only checked this way
+                        default: 30
+  --nobackfill(-n):     start commands strictly in order; by default, when a command
+                        must wait for slots, commands after it may be started in the
+                        free slots if they won't delay it
   --verbose   (-v):     display progress messages
   --debug     (-d):     display even more progress messages
   --help      (-h):     display this usage message
@@ -641,6 +825,10 @@ Each line of the file of commands or of the list from stdin is of the form:
 where:
 
     numslots is the number of slots (free cores, perhaps) that one process takes,
+             optionally followed by a colon and the number of seconds one process
+             is expected to run, e.g. 4:3600; this lets commands be backfilled
+             into free slots before the process is first run, after that the
+             average of the actual runtimes is used
     numcommands is the max number of copies of this command to run at once,
                 if 'max' is given as the value, the value will be calculated from
                 numslots the command uses vs slots the host has in total as specified
@@ -654,6 +842,9 @@ where:
     command is the whole command string as it would be run at the shell
 
 Fields are space-separated.
+
+Scheduling stats (processes started, backfilled and completed, completions per hour,
+and slot-seconds left idle while commands were waiting) are written to the cache file.
 Lines starting with space or # are skipped.
 
 Example entry:
@@ -695,6 +886,8 @@ def get_defaults():
 
     for flag in ['restore', 'rerun']:
         opts[flag] = False
+    opts['backfill'] = True
+    opts['interval'] = 30
 
     for option in ['slots', 'mailhost', 'formatvars']:
         opts[option] = None
@@ -750,6 +943,12 @@ def set_opt(opts, optname, val):
         opts['restore'] = True
     elif optname in ["-R", "--rerun"]:
         opts['rerun'] = True
+    elif optname in ["-n", "--nobackfill"]:
+        opts['backfill'] = False
+    elif optname in ["-i", "--interval"]:
+        if not val.isdigit():
+            usage("interval option requires a number")
+        opts['interval'] = int(val)
     else:
         usage("Unknown option specified: <%s>" % optname)
 
@@ -764,9 +963,10 @@ def main():
     debug = False
 
     try:
-        (options, remainder) = getopt.gnu_getopt(sys.argv[1:], "c:C:d:e:m:s:f:rDRvh",
+        (options, remainder) = getopt.gnu_getopt(sys.argv[1:], "c:C:d:e:m:s:f:i:nrDRvh",
                                                  ["commands=", "cache=", "directory=",
-                                                  "email=", "slots=", "formatvars=", "restore",
+                                                  "email=", "slots=", "formatvars=",
+                                                  "interval=", "nobackfill", "restore",
                                                   "rerun", "mailhost", "verbose", "debug",
                                                   "help"])
     except getopt.GetoptError as err:
@@ -801,7 +1001,8 @@ def main():
 
     my_id = scheduler_setup()
     plugables = get_scheduler_plugables(opts, my_id)
-    scheduler = Scheduler(plugables, opts['formatvars'], my_id)
+    scheduler = Scheduler(plugables, opts['formatvars'], my_id,
+                          opts['backfill'], opts['interval'])
     scheduler.run(commands_in)
 
 
@@ -3,6 +3,7 @@
 for every wiki, run the specific dump type for today
 or the given date
 '''
+import copy
 import getopt
 import os
 from os.path import exists
@@ -21,6 +22,7 @@ from miscdumpfactory import MiscDumpFactory
 from dumps.wikidump import Wiki
 from dumps.exceptions import BackupError
 from dumps.wikidump import FileUtils, TimeUtils
+from dumps.wikipool import WikiPool
 
 
 # pylint: disable=broad-except
@@ -322,6 +324,39 @@ class MiscDumpLoop():
             index.do_all_wikis()
         return (failures, todos)
 
+    def do_one_wiki_pooled(self, wikiname):
+        '''
+        run dump of given type on one wiki from the worker pool,
+        returning True if it is done and False if it should be
+        tried again later; each wiki gets its own copy of the
+        config since Wiki() alters it
+        '''
+        args = dict(self.args)
+        args['config'] = copy.copy(self.args['config'])
+        dump = MiscDumpOne(args, wikiname, self.flags, self.log)
+        return dump.do_one_wiki() == STATUS_GOOD
+
+    def do_all_wikis_pooled(self, num_fails):
+        '''
+        run dump of given type on all wikis for given date with a pool
+        of workers, no more than the configured number at once for wikis
+        in the same db section; failed or locked wikis are retried on
+        their own, up to num_fails times each
+
+        the index.html file is regenerated once all wikis are done
+        '''
+        config = self.args['config']
+        pool = WikiPool(self.flags['workers'], config.db_sections, config.section_workers,
+                        report=self.log.info)
+        failures = pool.run(config.all_wikis_list, self.do_one_wiki_pooled, num_fails)
+        if self.flags['do_index'] and self.is_most_recent_run():
+            index = Index(self.flags['dryrun'], self.args, self.log)
+            index.do_all_wikis()
+        if failures:
+            raise BackupError("Too many consecutive failures, " +
+                              "giving up: last failures on " +
+                              ",".join(failures))
+
     def do_all_wikis_til_done(self, num_fails):
         '''
         run dump of given type on all wikis for given date; some
@@ -333,6 +368,9 @@ class MiscDumpLoop():
         failed wikis will be retried until they succeed or
         until there are too many failures
         '''
+        if self.flags['workers'] > 1:
+            self.do_all_wikis_pooled(num_fails)
+            return
         fails = 0
         while 1:
             (failures, todos) = self.do_run_on_all_wikis()
@@ -361,7 +399,7 @@ def usage(message=None):
 
 Options: --configfile, --dumptype, --wiki, --date,
          --dumponly, --indexonly, --forcerun,
-         --logfile, --skiplocks, --verbose, --quiet, --dryrun, --wiki
+         --logfile, --skiplocks, --workers, --verbose, --quiet, --dryrun, --wiki
 
  --configfile:  Specify an alternate config file to read. Default
                 file is 'miscdump.conf' in the current directory.
@@ -379,6 +417,12 @@ Options: --configfile, --dumptype, --wiki, --date,
  --skiplocks:   Don't do any file locking (use only if one process is running
                 at a time)
                 Default: false
+ --workers:     Number of wikis to dump at once; no more than the 'sectionworkers'
+                setting in the config file will be dumped at once for wikis in the
+                same db section. With more than one worker, each wiki is retried
+                on its own five minutes after a failure, and the time taken for
+                each wiki is logged.
+                Default: 1
  --verbose:     Print error messages and other informative messages.
                 Default: print errors and warnings
  --quiet:       Print only serious error messages
@@ -463,9 +507,9 @@ def get_flags(options):
     '''
     flags = {'do_dump': True, 'do_index': True,
              'dryrun': False, 'forcerun': False,
-             'skiplocks': True}
+             'skiplocks': True, 'workers': 1}
 
-    for (opt, _) in options:
+    for (opt, val) in options:
         if opt == "--dumpsonly":
             flags['do_index'] = False
         elif opt == "--indexonly":
@@ -476,6 +520,10 @@ def get_flags(options):
             flags['forcerun'] = True
         elif opt == "--skiplocks":
             flags['skiplocks'] = True
+        elif opt == "--workers":
+            if not val.isdigit():
+                usage("A positive number must be specified for workers.")
+            flags['workers'] = int(val)
     return flags
 
 
@@ -516,7 +564,8 @@ def main():
         (options, remainder) = getopt.gnu_getopt(
             sys.argv[1:], "",
             ['date=', 'dumptype=', 'configfile=', 'wiki=', 'dumpsonly',
-             'indexonly', 'logfile=', 'dryrun', 'skiplocks', 'verbose', 'quiet', 'forcerun'])
+             'indexonly', 'logfile=', 'dryrun', 'skiplocks', 'workers=', 'verbose', 'quiet',
+             'forcerun'])
     except Exception:
         usage("Unknown option specified")
 
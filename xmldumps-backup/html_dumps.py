@@ -10,7 +10,7 @@ from miscdumplib import ContentFile
 from miscdumplib import MiscDumpConfig
 from miscdumplib import MiscDumpBase
 from miscdumplib import get_config_defaults
-from dumps.utils import RunSimpleCommand, MultiVersion
+from dumps.utils import RunSimpleCommand, DbServerInfo
 
 
 # pylint: disable=broad-except
@@ -83,20 +83,16 @@ class HTMLDump(MiscDumpBase):
         given the name of the wiki db, turn this into the
         fqdn of the wiki project (i.e. enwiki -> en.wikipedia.org)
         '''
-        script_command = MultiVersion.mw_script_as_array(self.wiki.config,
-                                                         "eval.php")
-        # echo $wgCanonicalServer | php "$multiversionscript" eval.php $wiki
-        command = ["echo", "'echo $wgCanonicalServer;'", "|", self.wiki.config.php]
-        command.extend(script_command)
-        command.append(self.wiki.db_name)
-        command_text = " ".join(command)
-        self.log.info("running with no output: %s", command_text)
-        output = RunSimpleCommand.run_with_output(command_text, shell=True)
-        if not output:
-            self.log.warning("error retrieving domain for wiki %s", self.wiki.db_name)
+        # the settings come from the db info cache if another run
+        # already retrieved them, and that saves bootstrapping MW
+        dbinfo = DbServerInfo(self.wiki, self.wiki.db_name, self.log.warning)
+        try:
+            dbinfo.get_config_variables()
+        except Exception as ex:
+            self.log.warning("error retrieving domain for wiki %s", self.wiki.db_name,
+                             exc_info=ex)
             return None
-        # rstrip gets rid of any trailing newlines from eval.php
-        return output.decode('utf-8').split('//')[1].rstrip()
+        return dbinfo.canonical_server.split('//')[1].rstrip()
 
     def dump_html(self):
         '''
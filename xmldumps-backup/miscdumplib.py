@@ -439,6 +439,8 @@ class MiscDumpConfig(ConfigParsing):
         self.private_wikis_list = MiscUtils.db_list(self.conf.get("wiki", "privatewikislist"))
         self.closed_wikis_list = MiscUtils.db_list(self.conf.get("wiki", "closedwikislist"))
         self.skip_wikis_list = MiscUtils.db_list(self.conf.get("wiki", "skipwikislist"))
+        self.db_sections = MiscUtils.db_sections(self.conf.get("wiki", "sectionlists"))
+        self.section_workers = self.conf.getint("wiki", "sectionworkers")
 
         if not self.conf.has_section('output'):
             self.conf.add_section('output')
@@ -468,6 +470,11 @@ class MiscDumpConfig(ConfigParsing):
             self.conf.add_section('database')
         self.max_allowed_packet = self.conf.get("database", "max_allowed_packet")
         self.db_client_config_file = self.conf.get("database", "client_config_file")
+        self.dbinfo_cache = self.conf.get("database", "dbinfocache")
+        self.dbinfo_cache_ttl = self.conf.getint("database", "dbinfocachettl")
+        self.dbinfo_cache_lists = [path for path in (
+            [self.conf.get("wiki", "allwikislist")] +
+            self.conf.get("wiki", "sectionlists").split(',')) if path]
 
     def parse_conffile_per_project(self, project_name=None):
         if project_name:
@@ -587,6 +594,8 @@ def get_config_defaults():
         "privatewikislist": "",
         "closedwikislist": "",
         "skipwikislist": "",
+        "sectionlists": "",
+        "sectionworkers": "1",
         "mediawiki": "",
         # "output": {
         "dumpdir": "/dumps/public/misc",
@@ -599,6 +608,8 @@ def get_config_defaults():
         "lockstale": "300",
         # "database": {
         "max_allowed_packet": "16M",
+        "dbinfocache": "",
+        "dbinfocachettl": "3600",
         # "tools": {
         "php": "/bin/php",
         "gzip": "/usr/bin/gzip",
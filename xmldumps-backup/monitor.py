@@ -1,13 +1,17 @@
 #!/usr/bin/python3
 # Wiki dump-generation monitor
 
+import copy
 import os
 from os.path import exists
 import sys
+import time
 import traceback
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dumps.wikidump import Wiki, Config, Locker
 from dumps.fileutils import FileUtils
+from dumps.utils import TimeUtils
 from dumps.report import StatusHtml
 from dumps.runstatusapi import StatusAPI
 from dumps.batch import BatchesFile
@@ -21,6 +25,18 @@ def add_to_filename(filename, infix):
     return base + "-" + infix + ("." + suffix if suffix else "")
 
 
+def cleanup_wiki_dumplocks(wiki):
+    '''
+    clean up stale locks for dump runs of the wiki, and
+    return True if there are any locks left (a run is going)
+    '''
+    locker = Locker(wiki)
+    lockfiles = locker.is_stale(all_locks=True)
+    if lockfiles:
+        locker.cleanup_stale_locks(lockfiles)
+    return bool(locker.is_locked(all_locks=True))
+
+
 def cleanup_stale_dumplocks(config, dbs):
     '''
     clean up all stale locks for dump runs, where staleness
@@ -31,11 +47,7 @@ def cleanup_stale_dumplocks(config, dbs):
     for db_name in dbs:
         try:
             wiki = Wiki(config, db_name)
-            locker = Locker(wiki)
-            lockfiles = locker.is_stale(all_locks=True)
-            if lockfiles:
-                locker.cleanup_stale_locks(lockfiles)
-            running = running or locker.is_locked(all_locks=True)
+            running = cleanup_wiki_dumplocks(wiki) or running
             states.append(StatusHtml.status_line(wiki))
         except Exception:
             # if there's a problem with one wiki at least
@@ -73,6 +85,22 @@ def cleanup_batch_jobfile_if_stale(basedir, filename, wiki):
             traceback.print_exc(file=sys.stdout)
 
 
+def cleanup_wiki_batch_jobfiles(wiki, date):
+    '''
+    remove stale batch jobfiles for the given run of the wiki, marking
+    the batches as aborted, and return True if there were any
+    batch jobfiles at all
+    '''
+    basedir = os.path.join(wiki.private_dir(), date)
+    found = False
+    for filename in os.listdir(basedir):
+        if BatchesFile.is_batchjob_file(filename):
+            found = True
+            wiki.set_date(date)
+            cleanup_batch_jobfile_if_stale(basedir, filename, wiki)
+    return found
+
+
 def cleanup_stale_batch_jobfiles(config, dbs):
     '''
     check all existing batch jobfiles (empty files touched periodically
@@ -88,24 +116,233 @@ def cleanup_stale_batch_jobfiles(config, dbs):
         subdirs = wiki.dump_dirs(private=True)
         if not subdirs:
             continue
-        date = subdirs[-1]
-        basedir = os.path.join(wiki.private_dir(), date)
-        files = os.listdir(basedir)
-        for filename in files:
-            if BatchesFile.is_batchjob_file(filename):
-                wiki.set_date(date)
-                cleanup_batch_jobfile_if_stale(basedir, filename, wiki)
+        cleanup_wiki_batch_jobfiles(wiki, subdirs[-1])
+
+
+def get_mtime(path):
+    '''
+    return the mtime in nanoseconds of the file or directory,
+    or None if it does not exist
+    '''
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_wiki_stamp(wiki, cached):
+    '''
+    return the list of mtimes of everything the monitor looks at for
+    the wiki: the public and private wiki directories, the status html
+    and statusapi json files of the latest run, and the private directory
+    of the latest run, where batch jobfiles live
+
+    along with the stamp, return the latest public and private run dates,
+    reusing those from the cached entry if the wiki directories haven't
+    changed since then
+    '''
+    public_mtime = get_mtime(wiki.public_dir())
+    private_mtime = get_mtime(wiki.private_dir())
+    if cached is not None and cached['stamp'][:2] == [public_mtime, private_mtime]:
+        date = cached['date']
+        private_date = cached['private_date']
+    else:
+        date = wiki.latest_dump()
+        subdirs = wiki.dump_dirs(private=True)
+        private_date = subdirs[-1] if subdirs else None
+
+    stamp = [public_mtime, private_mtime]
+    if date:
+        stamp.append(get_mtime(StatusHtml.get_statusfile_path(wiki, date)))
+        stamp.append(get_mtime(os.path.join(wiki.public_dir(), date,
+                                            StatusAPI.FILENAME + ".json")))
+    else:
+        stamp.extend([None, None])
+    if private_date:
+        stamp.append(get_mtime(os.path.join(wiki.private_dir(), private_date)))
+    else:
+        stamp.append(None)
+    return stamp, date, private_date
+
 
+def get_wiki_state(config, db_name, cached=None):
+    '''
+    return a dict with everything the monitor needs to know about the
+    wiki: status line, whether a dump run holds a lock on it, its statusapi
+    json, and what we need to sort it by dump age
+
+    if the cached entry is still good, return that instead; it is good
+    if the mtimes in its stamp haven't changed and it saw no locks or
+    batch jobfiles, which might go stale without anything changing on disk
+
+    stale locks and batch jobfiles are cleaned up along the way
+    '''
+    # Wiki objects pick up per-project settings into the config, we
+    # don't want threads doing that to each other's copy
+    wiki = Wiki(copy.copy(config), db_name)
+    stamp, date, private_date = get_wiki_stamp(wiki, cached)
+    if (cached is not None and cached['stamp'] == stamp and
+            not cached['locked'] and not cached['jobfiles']):
+        return cached
+
+    jobfiles = False
+    if private_date:
+        jobfiles = cleanup_wiki_batch_jobfiles(wiki, private_date)
+    locked = cleanup_wiki_dumplocks(wiki)
+    if jobfiles or locked:
+        # cleanup may have changed files, make sure the stamp
+        # reflects what we read below
+        stamp, date, private_date = get_wiki_stamp(wiki, None)
+
+    state = {'stamp': stamp, 'date': date, 'private_date': private_date,
+             'locked': locked, 'jobfiles': jobfiles,
+             'status_mtime': None, 'failed': True}
+    state['status'] = StatusHtml.status_line(wiki)
+    if date:
+        statusfile = StatusHtml.get_statusfile_path(wiki, date)
+        try:
+            state['status_mtime'] = os.stat(statusfile).st_mtime
+            contents = FileUtils.read_file(statusfile)
+            state['failed'] = (contents == '') or ('dump aborted' in contents)
+        except Exception:
+            pass
+    state['statusapi'] = StatusAPI.get_wiki_info(wiki)
+    return state
 
-def generate_index(config, other_indexhtml=None, sorted_by_db=False):
 
-    if sorted_by_db:
-        dbs = sorted(config.db_list)
+class MonitorCache():
+    '''
+    per-wiki states from the last monitor tick, along with timing info
+    for recent ticks; the states are refreshed for all wikis at once,
+    and only the wikis that changed get read in again
+    '''
+    MAX_TICKS = 50
+
+    def __init__(self, config):
+        self.config = config
+        self.path = None
+        if config.monitor_cache:
+            self.path = os.path.join(config.private_dir, config.monitor_cache)
+        self.states = {}
+        self.ticks = []
+        self.load()
+
+    def load(self):
+        '''
+        read in the cache file if there is one; a cache we can't
+        read is no cache at all, everything will be refreshed
+        '''
+        if self.path is None or not exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as infile:
+                contents = json.load(infile)
+            self.states = contents['wikis']
+            self.ticks = contents['ticks']
+        except Exception:
+            if VERBOSE:
+                traceback.print_exc(file=sys.stdout)
+            self.states = {}
+            self.ticks = []
+
+    def save(self):
+        '''
+        write the cache file out, if we have one
+        '''
+        if self.path is None:
+            return
+        contents = json.dumps({'wikis': self.states, 'ticks': self.ticks[-1 * self.MAX_TICKS:]})
+        FileUtils.write_file(self.config.temp_dir, self.path, contents,
+                             self.config.fileperms)
+
+    def refresh(self):
+        '''
+        bring the state of each wiki up to date, using several threads
+        for the wikis that need reading; return the number of wikis
+        that were read in again
+        '''
+        refreshed = 0
+        states = {}
+        with ThreadPoolExecutor(max_workers=self.config.monitor_threads) as executor:
+            futures = {executor.submit(get_wiki_state, self.config, db_name,
+                                       self.states.get(db_name)): db_name
+                       for db_name in self.config.db_list}
+            for future in as_completed(futures):
+                db_name = futures[future]
+                try:
+                    states[db_name] = future.result()
+                except Exception:
+                    # if there's a problem with one wiki at least
+                    # let's show the rest
+                    if VERBOSE:
+                        traceback.print_exc(file=sys.stdout)
+                    continue
+                if states[db_name] is not self.states.get(db_name):
+                    refreshed += 1
+        self.states = states
+        return refreshed
+
+    def is_running(self):
+        '''
+        return True if any wiki has a dump run going
+        '''
+        return any(state['locked'] for state in self.states.values())
+
+    def db_list_by_age(self):
+        '''
+        return the db names sorted the same way that Config.db_list_by_age()
+        does it, but from the cached status info
+        '''
+        available = []
+        today = int(TimeUtils.today())
+        now = time.time()
+        for db_name in self.config.db_list:
+            state = self.states.get(db_name)
+            if state is None or not state['date']:
+                available.append((True, sys.maxsize, sys.maxsize, db_name))
+                continue
+            age = sys.maxsize
+            if state['status_mtime'] is not None:
+                age = now - state['status_mtime']
+            available.append((state['failed'], today - int(state['date']), age, db_name))
+        return [db_name for (_failed, _date, _age, db_name) in sorted(available)]
+
+    def record_tick(self, timings, refreshed):
+        '''
+        stash the timings for this tick with the rest
+        '''
+        tick = {'start': timings['start'], 'wikis': len(self.config.db_list),
+                'refreshed': refreshed}
+        for phase in ['refresh', 'index', 'json']:
+            tick[phase] = round(timings[phase], 3)
+        tick['total'] = round(sum(tick[phase] for phase in ['refresh', 'index', 'json']), 3)
+        self.ticks.append(tick)
+        self.ticks = self.ticks[-1 * self.MAX_TICKS:]
+        return tick
+
+
+def generate_index(config, other_indexhtml=None, sorted_by_db=False, cache=None):
+    '''
+    return the html for the main index page; if a MonitorCache is
+    passed in, the wiki states in it are used, otherwise they are read
+    from disk (and stale locks and batch jobfiles cleaned up)
+    '''
+    if cache is not None:
+        if sorted_by_db:
+            dbs = sorted(config.db_list)
+        else:
+            dbs = cache.db_list_by_age()
+        running = cache.is_running()
+        states = [cache.states[db_name]['status'] for db_name in dbs
+                  if db_name in cache.states]
     else:
-        dbs = config.db_list_by_age()
+        if sorted_by_db:
+            dbs = sorted(config.db_list)
+        else:
+            dbs = config.db_list_by_age()
+        cleanup_stale_batch_jobfiles(config, dbs)
+        running, states = cleanup_stale_dumplocks(config, dbs)
 
-    cleanup_stale_batch_jobfiles(config, dbs)
-    running, states = cleanup_stale_dumplocks(config, dbs)
     if running:
         status = "Dumps are in progress..."
     elif exists("maintenance.txt"):
@@ -130,7 +367,7 @@ def generate_index(config, other_indexhtml=None, sorted_by_db=False):
         "items": "\n".join(states)}
 
 
-def generate_json(config):
+def generate_json(config, cache=None):
     """
     go through all the latest dump dirs, collect up all the json
     contents from the dumpstatusapi file, and shovel them into
@@ -140,6 +377,12 @@ def generate_json(config):
 
     dbs = config.db_list
 
+    if cache is not None:
+        for db_name in dbs:
+            if db_name in cache.states:
+                json_out["wikis"][db_name] = cache.states[db_name]['statusapi']
+        return json_out
+
     for db_name in dbs:
         try:
             wiki = Wiki(config, db_name)
@@ -152,30 +395,31 @@ def generate_json(config):
     return json_out
 
 
-def update_index(config):
+def update_index(config, cache=None):
     output_fname = os.path.join(config.public_dir, config.index)
     output_fname_sorted_by_db = add_to_filename(os.path.join(
         config.public_dir, config.index), "bydb")
 
     temp_fname = output_fname + ".tmp"
     fhandle = open(temp_fname, "wt")
-    fhandle.write(generate_index(config, other_indexhtml=output_fname_sorted_by_db))
+    fhandle.write(generate_index(config, other_indexhtml=output_fname_sorted_by_db,
+                                 cache=cache))
     fhandle.close()
     os.rename(temp_fname, output_fname)
 
     temp_fname = output_fname_sorted_by_db + ".tmp"
     fhandle = open(temp_fname, "wt")
     fhandle.write(generate_index(config, other_indexhtml=output_fname,
-                                 sorted_by_db=True))
+                                 sorted_by_db=True, cache=cache))
     fhandle.close()
     os.rename(temp_fname, output_fname_sorted_by_db)
 
 
-def update_json(config):
+def update_json(config, cache=None):
     output_fname = os.path.join(config.public_dir, "index.json")
     temp_fname = output_fname + ".tmp"
     fhandle = open(temp_fname, "wt")
-    fhandle.write(json.dumps(generate_json(config)))
+    fhandle.write(json.dumps(generate_json(config, cache)))
     fhandle.close()
     os.rename(temp_fname, output_fname)
 
@@ -193,8 +437,33 @@ recent dump run for each wiki; also cleans up stale locks
         config = Config(sys.argv[1])
     else:
         config = Config()
-    update_index(config)
-    update_json(config)
+    monitor_tick(config)
+
+
+def monitor_tick(config):
+    '''
+    refresh the wiki states that changed since last time, write
+    both index files and the json file from them, and record
+    how long each part took
+    '''
+    cache = MonitorCache(config)
+    timings = {'start': time.time()}
+    refreshed = cache.refresh()
+    timings['refresh'] = time.time() - timings['start']
+
+    start = time.time()
+    update_index(config, cache)
+    timings['index'] = time.time() - start
+
+    start = time.time()
+    update_json(config, cache)
+    timings['json'] = time.time() - start
+
+    tick = cache.record_tick(timings, refreshed)
+    cache.save()
+    if VERBOSE:
+        print("monitor tick: %s" % json.dumps(tick))
+    return tick
 
 
 if __name__ == "__main__":
@@ -6,6 +6,7 @@ with filename both of which may vary by wiki name
 and date
 '''
 
+import copy
 import getopt
 import os
 import re
@@ -17,6 +18,7 @@ from dumps.wikidump import Config, Wiki
 from dumps.utils import MultiVersion, TimeUtils, RunSimpleCommand, DbServerInfo
 from dumps.exceptions import BackupError
 from dumps.fileutils import FileUtils
+from dumps.wikipool import WikiPool
 
 
 class Runner():
@@ -236,11 +238,41 @@ class WikiRunnerLoop():
             if runner.do_one_wiki(overwrite):
                 self.wikis_todo.remove(wiki_name)
 
-    def do_all_wikis_til_done(self, num_fails, overwrite, date):
+    def do_one_wiki_pooled(self, wiki_name, overwrite, date):
+        '''
+        run a script on one wiki from the worker pool; each wiki
+        gets its own copy of the config since Wiki() alters it
+        '''
+        wiki = Wiki(copy.copy(self.config), wiki_name)
+        wiki.set_date(date)
+        runner = WikiRunner(self.runner,
+                            wiki, self.filenameformat,
+                            self.output_dir, self.base)
+        return runner.do_one_wiki(overwrite)
+
+    def do_all_wikis_pooled(self, num_fails, overwrite, date, workers):
+        '''
+        run a script on all wikis with a pool of workers, each wiki
+        being retried up to num_fails times in case of error
+        '''
+        pool = WikiPool(workers, self.config.db_sections, self.config.section_workers,
+                        report=print if self.runner.verbose else None)
+        self.wikis_todo = pool.run(
+            self.wikis_todo,
+            lambda wiki_name: self.do_one_wiki_pooled(wiki_name, overwrite, date),
+            num_fails)
+        if self.wikis_todo:
+            raise BackupError("Too many failures, giving up: last failures on " +
+                              ",".join(self.wikis_todo))
+
+    def do_all_wikis_til_done(self, num_fails, overwrite, date, workers=1):
         """Run through all wikis, retrying up to numFails
         times in case of error"""
         if not date:
             date = TimeUtils.today()
+        if workers > 1:
+            self.do_all_wikis_pooled(num_fails, overwrite, date, workers)
+            return
         fails = 0
         while 1:
             self.do_all_wikis(overwrite, date)
@@ -341,6 +373,13 @@ Options:
 --retries        (r): Number of times to try running the query on all wikis
                       in case of error, before giving up
                       Default: 3
+--workers        (W): Number of wikis to run the script/query on at once;
+                      no more than the 'sectionworkers' setting in the config
+                      file will be run at once on wikis in the same db section.
+                      With more than one worker, each wiki is retried on its
+                      own five minutes after a failure, and the time taken
+                      for each wiki is displayed if verbose is set.
+                      Default: 1
 --nooverwrite    (n): Do not overwrite existing file of the same name, skip
                       run for the specific wiki
 --dryrun         (D): Don't execute commands, show the commands that would
@@ -352,7 +391,7 @@ Options:
     sys.exit(1)
 
 
-def validate_args(date, output_dir, retries, script, query):
+def validate_args(date, output_dir, retries, workers, script, query):
     '''
     check specified args for validity, whining
     and bailing if the values have problems
@@ -367,6 +406,9 @@ def validate_args(date, output_dir, retries, script, query):
     if retries is not None and not retries.isdigit():
         usage("A positive number must be specified for retries.")
 
+    if workers is not None and not workers.isdigit():
+        usage("A positive number must be specified for workers.")
+
     if script is not None and query is not None:
         usage("Only one of the 'script' or 'query' options may be specified.")
 
@@ -383,6 +425,7 @@ def get_args():
     script = None
     query = None
     retries = None
+    workers = None
     wikiname = None
     basename = None
     verbose = False
@@ -390,9 +433,9 @@ def get_args():
 
     try:
         (options, remainder) = getopt.gnu_getopt(
-            sys.argv[1:], "c:d:f:o:w:b:s:q:r:nDvh",
+            sys.argv[1:], "c:d:f:o:w:b:s:q:r:W:nDvh",
             ['configfile=', 'date=', 'filenameformat=',
-             'outdir=', 'script=', 'query=', 'retries=',
+             'outdir=', 'script=', 'query=', 'retries=', 'workers=',
              'wiki=', 'base=', 'dryrun', 'nooverwrite',
              'verbose', 'help'])
 
@@ -419,6 +462,8 @@ def get_args():
             query = val
         elif opt in ["-r", "--retries"]:
             retries = val
+        elif opt in ["-W", "--workers"]:
+            workers = val
         elif opt in ["-n", "--nooverwrite"]:
             overwrite = False
         elif opt in ["-D", "--dryrun"]:
@@ -430,7 +475,7 @@ def get_args():
 
     return (configfile, date, dryrun, filenameformat,
             output_dir, overwrite, wikiname, script,
-            basename, query, retries, verbose, remainder)
+            basename, query, retries, workers, verbose, remainder)
 
 
 def do_main():
@@ -440,13 +485,16 @@ def do_main():
 
     (configfile, date, dryrun, filenameformat,
      output_dir, overwrite, wikiname, script,
-     basename, query, retries, verbose, remainder) = get_args()
+     basename, query, retries, workers, verbose, remainder) = get_args()
 
-    validate_args(date, output_dir, retries, script, query)
+    validate_args(date, output_dir, retries, workers, script, query)
 
     if retries is None:
         retries = "3"
     retries = int(retries)
+    if workers is None:
+        workers = "1"
+    workers = int(workers)
 
     if configfile:
         config = Config(configfile)
@@ -478,7 +526,7 @@ def do_main():
     else:
         wikirunner = WikiRunnerLoop(config, runner, filenameformat,
                                     output_dir, base)
-        wikirunner.do_all_wikis_til_done(retries, overwrite, date)
+        wikirunner.do_all_wikis_til_done(retries, overwrite, date, workers)
 
 
 if __name__ == "__main__":
@@ -20,14 +20,17 @@ def usage(message=None):
         sys.stderr.write("\n")
     usage_message = """
 Usage: rebalance_pagerange.py --wiki <wikiname>
-        --start <int> --end <int>
+        --jobs <int> [--revinfopath <path>]
         [--configfile <path>] [--verbose] [--help]
 
---wiki       (-w):  name of db of wiki for which to run
---jobs       (-j):  generate page ranges for this number of jobs
---configfile (-c):  path to config file
---verbose    (-v):  display messages about what the script is doing
---help       (-h):  display this help message
+--wiki        (-w):  name of db of wiki for which to run
+--jobs        (-j):  generate page ranges for this number of jobs
+--revinfopath (-R):  path to revinfo file; if there is a revinfo index
+                     next to it, ranges are cut from the index instead
+                     of via db queries
+--configfile  (-c):  path to config file
+--verbose     (-v):  display messages about what the script is doing
+--help        (-h):  display this help message
 """
     sys.stderr.write(usage_message)
     sys.exit(1)
@@ -38,12 +41,14 @@ def do_main():
     main entry point
     """
     jobs = None
+    revinfo_path = None
     configpath = "wikidump.conf"
     wikiname = None
     verbose = False
     try:
-        (options, remainder) = getopt.gnu_getopt(sys.argv[1:], "c:j:w:vh",
+        (options, remainder) = getopt.gnu_getopt(sys.argv[1:], "c:j:w:R:vh",
                                                  ["jobs=", "configfile=", "wiki=",
+                                                  "revinfopath=",
                                                   "verbose", "help"])
     except getopt.GetoptError as err:
         usage("Unknown option specified: " + str(err))
@@ -57,6 +62,8 @@ def do_main():
             if not val.isdigit():
                 usage("jobs must be a number")
             jobs = int(val)
+        elif opt in ["-R", "--revinfopath"]:
+            revinfo_path = val
         elif opt in ["-v", "--verbose"]:
             verbose = True
         elif opt in ["-h", "--help"]:
@@ -73,7 +80,7 @@ def do_main():
     wiki_config.parse_conffile_per_project(wikiname)
 
     prange = PageRange(QueryRunner(wikiname, wiki_config, verbose), verbose)
-    ranges = prange.get_pageranges_for_jobs(jobs)
+    ranges = prange.get_pageranges_for_jobs(jobs, revinfo_path)
     # convert ranges into the output we need for the pagesperchunkhistory config
     pages_per_job = [page_end - page_start for (page_start, page_end) in ranges]
     print("for {jobs} jobs, have ranges:".format(jobs=jobs))
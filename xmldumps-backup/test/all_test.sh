@@ -1,11 +1,13 @@
 #!/bin/bash
-tests="basedumpstest batches_test command_management_test \
+tests="basedumpstest batches_test checksummers_test command_management_test \
+       dbinfocache_test dbquery_test dumpscheduler_test \
        dumpitemlist_test \
        filelister_test fileutils_test\
        intervals_test monitor_test pagecontentbatches_test\
-       pagerangeinfo_test prefetch_test\
-       recompressjobs_test report_test tableinfo_test\
-       tablesjobs_test xml_dump_test_fixtures xml_dump_test"
+       pagerange_test pagerangeinfo_test partplanner_test prefetch_test\
+       recombinejobs_test recompressjobs_test report_test runnerutils_test tableinfo_test\
+       tablesjobs_test xml_dump_test_fixtures xml_dump_test xmlslice_test xmlstreams_test\
+       wikipool_test"
 
 for testname in $tests; do
     echo "Running test suite: ${testname}"
@@ -7,6 +7,7 @@ import unittest
 from test.basedumpstest import BaseDumpsTestCase
 import os
 import time
+import json
 import multiprocessing
 import sys
 from dumps.batch import BatchesFile
@@ -30,6 +31,19 @@ def lock_batchesfile(wiki, seconds, maxretries):
     sys.exit(result)
 
 
+def claim_all_from_ledger(wiki, results):
+    '''
+    claim batches from the sqlite ledger until there are none left,
+    adding the claimed ranges to the results list
+    '''
+    batchesfile = BatchesFile(wiki, 'pagesmetahistorybz2dump')
+    while True:
+        batch_range = batchesfile.claim()
+        if not batch_range:
+            break
+        results.append(batch_range)
+
+
 unittest.TestLoader.sortTestMethodsUsing = None
 
 
@@ -307,3 +321,72 @@ class BatchesFileTestCase(BaseDumpsTestCase):
             new_batches = batches[0:4] + [new_batch]
             expected_contents = '{"batches": [' + ''.join(new_batches) + ']}'
             self.assertEqual(produced_contents, expected_contents)
+
+
+class BatchesLedgerTestCase(BaseDumpsTestCase):
+    """
+    test claiming and updating batches kept in an sqlite ledger
+    """
+    def setUp(self):
+        super().setUp()
+        self.wd['wiki'].config.batch_ledger = 'sqlite'
+        self.batchesfile = BatchesFile(self.wd['wiki'], 'pagesmetahistorybz2dump')
+        self.batchesfile.create([(1, 600), (901, 1500), (601, 900), (1501, 2100), (2101, 3500)])
+
+    def get_statuses(self):
+        """
+        return a dict of batch start: status from the exported json
+        """
+        path = self.batchesfile.get_path()
+        self.batchesfile.ledger.export_json(path)
+        with open(path, "r") as infile:
+            batches_info = json.load(infile)
+        return {entry['batch']['range']['start']: entry['batch']['status']
+                for entry in batches_info['batches']}
+
+    def test_updates(self):
+        '''
+        test claims and status changes, with the same results
+        as for the json batches file
+        '''
+        self.assertEqual(self.batchesfile.count_unclaimed_batches(), 5)
+        self.assertEqual(self.batchesfile.claim(('601', '900')), ('601', '900'))
+        self.assertIsNone(self.batchesfile.claim(('601', '900')))
+        with self.assertRaises(Exception):
+            self.batchesfile.claim(('601', '1000'))
+        self.assertEqual(self.batchesfile.claim(), ('1', '600'))
+        self.assertEqual(self.batchesfile.done(('601', '900')), ('601', '900'))
+        self.assertEqual(self.batchesfile.fail(('1', '600')), ('1', '600'))
+        self.assertEqual(self.batchesfile.abort(('901', '1500')), ('901', '1500'))
+        self.assertIsNone(self.batchesfile.done(('1501', '2100')))
+        self.assertEqual(self.batchesfile.count_unclaimed_batches(), 3)
+        self.assertEqual(self.get_statuses(), {
+            '1': 'failed', '601': 'done', '901': 'aborted',
+            '1501': 'unclaimed', '2101': 'unclaimed'})
+
+        # the json batches file is what tools like the monitor know about,
+        # make sure it can be read back in
+        self.batchesfile.create([(1, 100)])
+        self.assertEqual(self.batchesfile.count_unclaimed_batches(), 1)
+        self.batchesfile.ledger.import_json()
+        self.assertEqual(self.batchesfile.count_unclaimed_batches(), 3)
+        self.assertEqual(self.batchesfile.claim(), ('901', '1500'))
+
+    def test_concurrent_claims(self):
+        '''
+        make sure that processes claiming batches at the same time
+        never get the same batch
+        '''
+        self.batchesfile.create([(start, start + 9) for start in range(1, 1001, 10)])
+        mpctx = multiprocessing.get_context('fork')
+        manager = mpctx.Manager()
+        results = manager.list()
+        procs = [mpctx.Process(target=claim_all_from_ledger, args=(self.wd['wiki'], results))
+                 for _count in range(4)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        self.assertEqual(len(results), 100)
+        self.assertEqual(len(set(results)), 100)
+        self.assertEqual(self.batchesfile.count_unclaimed_batches(), 0)
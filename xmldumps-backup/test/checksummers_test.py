@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+"""
+test suite for checksum file generation
+"""
+import hashlib
+import json
+import os
+import shutil
+import unittest
+from test.basedumpstest import BaseDumpsTestCase
+from dumps.checksummers import Checksummer
+from dumps.fileutils import DumpFilename, FileUtils
+
+
+class FakeJobData():
+    """
+    just enough of DumpRunJobData for the checksummer
+    """
+    def __init__(self, dump_dir):
+        self.dump_dir = dump_dir
+        self.messages = []
+
+    def debugfn(self, message):
+        """
+        keep debugging messages around for inspection
+        """
+        self.messages.append(message)
+
+
+class TestChecksummer(BaseDumpsTestCase):
+    """
+    test generation of per-file and per-run checksum files
+    """
+    def setup_output_files(self):
+        """
+        copy some sample files into the run directory, return
+        their DumpFilenames
+        """
+        dfnames = []
+        for pagerange in ['p1p1500', 'p1501p4000', 'p4001p4321']:
+            basename = 'wikidatawiki-{date}-pages-articles1.xml-{prange}.bz2'.format(
+                date=self.today, prange=pagerange)
+            shutil.copyfile('./test/files/pages-articles-sample1.xml-' + pagerange + '.bz2',
+                            os.path.join(BaseDumpsTestCase.PUBLICDIR, 'wikidatawiki',
+                                         self.today, basename))
+            dfname = DumpFilename(self.wd['wiki'])
+            dfname.new_from_filename(basename)
+            dfnames.append(dfname)
+        return dfnames
+
+    def test_checksums_for_files(self):
+        """
+        checksum several files at once and check that the per-file
+        and the per-run txt and json files have the right contents
+        """
+        dfnames = self.setup_output_files()
+        FileUtils.wiki_tempdir(self.wd['wiki'].db_name, self.wd['wiki'].config.temp_dir,
+                               create=True)
+        checksummer = Checksummer(self.wd['wiki'], [Checksummer.NAME], self.wd['dump_dir'])
+        checksummer.prepare_checksums()
+        jobdata = FakeJobData(self.wd['dump_dir'])
+        checksummer.checksums_for_files(dfnames, jobdata)
+
+        for htype in Checksummer.HASHTYPES:
+            expected = {}
+            for dfname in dfnames:
+                with open(self.wd['dump_dir'].filename_public_path(dfname), "rb") as infile:
+                    expected[dfname.filename] = hashlib.new(htype, infile.read()).hexdigest()
+                per_file_path = checksummer.get_per_file_path(htype, dfname.filename)
+                self.assertEqual(Checksummer.get_checksum_from_file(per_file_path),
+                                 expected[dfname.filename])
+
+            with open(checksummer._get_checksum_filename_tmp(htype, "txt")) as infile:
+                self.assertEqual(infile.read(), "".join(
+                    ["%s  %s\n" % (expected[dfname.filename], dfname.filename)
+                     for dfname in dfnames]))
+            with open(checksummer._get_checksum_filename_tmp(htype, "json")) as infile:
+                self.assertEqual(json.load(infile), {htype: {"files": expected}})
+
+        # each file read once for both hash types
+        self.assertEqual(len([message for message in jobdata.messages
+                              if message.startswith("Checksumming")]), len(dfnames))
+
+        # a second pass reads the per-file checksums instead of recomputing them
+        jobdata = FakeJobData(self.wd['dump_dir'])
+        checksummer.checksums_for_files(dfnames, jobdata)
+        self.assertFalse([message for message in jobdata.messages
+                          if message.startswith("Checksumming")])
+
+
+if __name__ == '__main__':
+    unittest.main()
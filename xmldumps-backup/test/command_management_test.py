@@ -2,13 +2,19 @@
 """
 test suite for command management module
 """
+import hashlib
 from io import StringIO
+import json
+import os
+import time
 import unittest
 from unittest.mock import patch
 from test.basedumpstest import BaseDumpsTestCase
 from dumps.utils import MiscUtils
-from dumps.commandmanagement import CommandPipeline
+from dumps.commandmanagement import CommandPipeline, CommandsInParallel
+from dumps.commandmanagement import CommandsInParallelEventLoop
 from dumps.runner import Runner
+from dumps.resourceusage import ResourceUsage
 
 
 class TestCommandManagement(BaseDumpsTestCase):
@@ -148,6 +154,195 @@ class TestCommandManagement(BaseDumpsTestCase):
                     [pipeline.get_failed_cmds_with_retcode() for pipeline in broken_pipelines],
                     expected_broken)
 
+    @staticmethod
+    def get_slot_occupancy(durations, slots, rolling):
+        """
+        run sleep commands of the given durations with the given number
+        of slots, either all through one rolling queue or in fixed-size
+        batches each of which must complete before the next starts; return
+        the fraction of available slot time that was spent running commands
+        """
+        command_series_list = [[[['/bin/sleep', str(duration)]]] for duration in durations]
+        completed = []
+        start = time.time()
+        if rolling:
+            commands = CommandsInParallel(
+                command_series_list, slots=slots,
+                callback_on_completion=lambda series: completed.append(time.time()))
+            commands.run_commands()
+        else:
+            for index in range(0, len(command_series_list), slots):
+                commands = CommandsInParallel(
+                    command_series_list[index:index + slots],
+                    callback_on_completion=lambda series: completed.append(time.time()))
+                commands.run_commands()
+        makespan = max(completed) - start
+        return sum(durations) / (slots * makespan), len(completed)
+
+    def test_rolling_slots(self):
+        """
+        with one long part and several short ones, a rolling queue should
+        keep the slots busier than running fixed-size batches
+        """
+        durations = [1.0, 0.2, 0.2, 0.2, 0.2]
+        with patch('sys.stdout', new=StringIO()):
+            batched, batched_done = self.get_slot_occupancy(durations, 2, rolling=False)
+            rolling, rolling_done = self.get_slot_occupancy(durations, 2, rolling=True)
+
+        self.assertEqual(batched_done, len(durations))
+        self.assertEqual(rolling_done, len(durations))
+        self.assertGreater(rolling, batched)
+        self.assertGreater(rolling, 0.75)
+
+    def test_slots_and_should_start(self):
+        """
+        make sure no more than the requested number of series run at once,
+        and that series vetoed just before starting are skipped
+        """
+        for supervisor in [CommandsInParallel, CommandsInParallelEventLoop]:
+            with self.subTest(supervisor.__name__):
+                self.do_slots_and_should_start(supervisor)
+
+    def do_slots_and_should_start(self, supervisor):
+        """
+        run sleeps in a few slots with the supervisor class given
+        """
+        command_series_list = [[[['/bin/sleep', '0.2']]] for _ in range(6)]
+        running = []
+        most_running = []
+
+        def should_start(series):
+            if series.command_series() is command_series_list[3]:
+                return False
+            running.append(series)
+            most_running.append(len(running))
+            return True
+
+        commands = supervisor(
+            command_series_list, slots=2, callback_should_start=should_start,
+            callback_on_completion=running.remove)
+        with patch('sys.stdout', new=StringIO()):
+            commands.run_commands()
+
+        self.assertEqual(max(most_running), 2)
+        self.assertEqual(len(most_running), 5)
+        self.assertTrue(commands.exited_successfully())
+
+    def test_event_loop(self):
+        """
+        make sure the event loop supervisor hands output to the callbacks
+        a line at a time, runs each series' pipelines in order, does the
+        timed callbacks and gets the exit codes right
+        """
+        command_series_list = [
+            [[['/bin/sh', '-c', 'echo one; echo two >&2; sleep 0.3; printf three']]],
+            [[['/usr/bin/seq', '1', '50000'], ['/usr/bin/wc', '-l']], [['/bin/false']]]]
+        stdout = []
+        stderr = []
+        timed = []
+        completed = []
+        commands = CommandsInParallelEventLoop(
+            command_series_list, callbackStdout=stdout.append,
+            callback_stderr=stderr.append, callback_timed=lambda: timed.append(1),
+            callback_interval=100, callback_on_completion=completed.append)
+        with patch('sys.stdout', new=StringIO()):
+            commands.run_commands()
+
+        self.assertEqual(sorted(stdout), [b'50000\n', b'one\n', b'three'])
+        self.assertEqual(stderr, [b'two\n'])
+        self.assertGreaterEqual(len(timed), 2)
+        self.assertEqual(len(completed), 2)
+        self.assertTrue(commands.all_commands_completed())
+        self.assertEqual(commands.commands_with_errors(), ['/bin/false'])
+        self.assertEqual([stats['exitcode'] for entry in commands.get_process_stats()
+                          for stats in entry['commands']], [0, 0, 0, 1])
+
+    def test_pipeline_stderr(self):
+        """
+        make sure errors written by commands before the last one in a
+        pipeline get to the stderr callback with either supervisor, and
+        that lots of them don't block the pipeline
+        """
+        for supervisor in [CommandsInParallel, CommandsInParallelEventLoop]:
+            command_series_list = [[[['/bin/sh', '-c', 'seq 1 100000 >&2; echo done'],
+                                     ['/bin/cat']]]]
+            stderr = []
+            stdout = []
+            commands = supervisor(command_series_list, callback_stderr=stderr.append,
+                                  callbackStdout=stdout.append)
+            with patch('sys.stdout', new=StringIO()):
+                commands.run_commands()
+            self.assertTrue(commands.exited_successfully())
+            self.assertEqual(b''.join(stdout), b'done\n')
+            self.assertEqual(b''.join(stderr).count(b'\n'), 100000)
+
+    def test_resource_usage(self):
+        """
+        make sure we get resource usage for each process in each
+        series, and that the totals per job get written out
+        """
+        command_series_list = [[[['/usr/bin/head', '-c', '3000000', '/dev/zero'],
+                                 ['/usr/bin/gzip', '-c']]],
+                               [[['/bin/sleep', '0.3']], [['/bin/false']]]]
+        commands = CommandsInParallel(command_series_list, callbackStdout=lambda output: None)
+        with patch('sys.stdout', new=StringIO()):
+            commands.run_commands()
+        series_stats = commands.get_process_stats()
+
+        self.assertEqual([entry['series'] for entry in series_stats], command_series_list)
+        head, gzip = series_stats[0]['commands']
+        sleep, false = series_stats[1]['commands']
+        self.assertEqual(head['command'], '/usr/bin/head -c 3000000 /dev/zero')
+        self.assertEqual([head['exitcode'], gzip['exitcode'], false['exitcode']], [0, 0, 1])
+        self.assertGreaterEqual(head['wchar'], 3000000)
+        for stats in [head, gzip, sleep, false]:
+            self.assertIsNotNone(stats['user'])
+            self.assertGreater(stats['maxrss_kb'], 0)
+        self.assertGreater(sleep['wall'], 0.25)
+        self.assertGreater(sleep['wait'], 0.25)
+
+        usage = ResourceUsage(self.en['wiki'], {ResourceUsage.NAME: True})
+        for entry in series_stats:
+            usage.add_commands('articlesdump', entry['commands'])
+        usage.write_resourceusage_files()
+        rundir = os.path.join(BaseDumpsTestCase.PUBLICDIR, 'enwiki', self.today)
+        with open(os.path.join(rundir, 'resourceusage.json')) as infile:
+            totals = json.load(infile)['jobs']['articlesdump']['totals']
+        self.assertEqual(totals['commands'], 4)
+        self.assertEqual(totals['wchar'], sum(
+            stats['wchar'] for stats in [head, gzip, sleep, false]))
+        with open(os.path.join(rundir, 'resourceusage.prom')) as infile:
+            self.assertIn('dumps_job_commands{wiki="enwiki",date="%s",job="articlesdump"} 4\n'
+                          % self.today, infile.read())
+
+    def test_output_digests(self):
+        """
+        make sure output saved to a file is checksummed on the way
+        through with either supervisor, the same as reading the file
+        back would do, and that a failure to write it fails the pipeline
+        """
+        outpath = os.path.join(BaseDumpsTestCase.TEMPDIR, 'digested.gz')
+        for supervisor in [CommandsInParallel, CommandsInParallelEventLoop]:
+            command_series_list = [[[['/usr/bin/seq', '1', '300000'],
+                                     ['/usr/bin/gzip', '-c', '>', outpath]]]]
+            completed = []
+            commands = supervisor(command_series_list, callback_on_completion=completed.append,
+                                  hashtypes=['md5', 'sha1'])
+            with patch('sys.stdout', new=StringIO()):
+                commands.run_commands()
+            self.assertTrue(commands.exited_successfully())
+            with open(outpath, "rb") as infile:
+                contents = infile.read()
+            self.assertEqual(completed[0].get_output_digests(), {
+                outpath: {'md5': hashlib.md5(contents).hexdigest(),
+                          'sha1': hashlib.sha1(contents).hexdigest()}})
+
+        proc = CommandPipeline([['/usr/bin/seq', '1', '300000', '>', '/dev/full']],
+                               quiet=True, hashtypes=['md5'])
+        proc.run_pipeline_get_output()
+        self.assertFalse(proc.exited_successfully())
+        self.assertIsNone(proc.get_digests())
+
 
 if __name__ == '__main__':
     unittest.main()
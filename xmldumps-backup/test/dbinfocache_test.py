@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+"""
+test suite for the cache of db servers and wiki settings
+"""
+import os
+import time
+import unittest
+from test.basedumpstest import BaseDumpsTestCase
+from dumps.dbinfocache import DbInfoCache
+
+
+class TestDbInfoCache(BaseDumpsTestCase):
+    """
+    make sure cached entries are returned only while they are
+    fresh and the dblists are unchanged
+    """
+    def setUp(self):
+        super().setUp()
+        self.cache_path = os.path.join(BaseDumpsTestCase.TEMPDIR, "dbinfocache.json")
+        self.dblist = os.path.join(BaseDumpsTestCase.TEMPDIR, "all.dblist")
+        with open(self.dblist, "w") as outfile:
+            outfile.write("enwiki\nwikidatawiki\n")
+
+    def get_cache(self, ttl=3600):
+        """
+        return a cache at the usual path with the given ttl
+        """
+        return DbInfoCache(self.cache_path, ttl, [self.dblist])
+
+    def test_put_get(self):
+        """
+        fields put in the cache by one instance should be
+        available to another, but only if all are there
+        """
+        self.get_cache().put('enwiki', {'db_server': 'db1', 'db_port': None})
+        self.get_cache().put('enwiki', {'config_vars': {'wgDBprefix': ''}})
+        entry = self.get_cache().get('enwiki', ['db_server', 'db_port', 'config_vars'])
+        self.assertEqual(entry['db_server'], 'db1')
+        self.assertEqual(entry['config_vars'], {'wgDBprefix': ''})
+        self.assertIsNone(self.get_cache().get('wikidatawiki', ['db_server']))
+        self.assertIsNone(self.get_cache().get('enwiki', ['no_such_field']))
+
+    def test_ttl(self):
+        """
+        entries older than the ttl should not be returned
+        """
+        cache = self.get_cache(ttl=1)
+        cache.put('enwiki', {'db_server': 'db1'})
+        self.assertIsNotNone(cache.get('enwiki', ['db_server']))
+        time.sleep(1.1)
+        self.assertIsNone(cache.get('enwiki', ['db_server']))
+
+    def test_dblist_change(self):
+        """
+        changing a dblist should make every entry out of date
+        """
+        cache = self.get_cache()
+        cache.put('enwiki', {'db_server': 'db1'})
+        mtime = os.stat(self.dblist).st_mtime
+        os.utime(self.dblist, (mtime + 10, mtime + 10))
+        self.assertIsNone(cache.get('enwiki', ['db_server']))
+
+    def test_invalidate(self):
+        """
+        invalidating one wiki should leave the others alone;
+        invalidating with no wiki should remove them all
+        """
+        cache = self.get_cache()
+        cache.put('enwiki', {'db_server': 'db1'})
+        cache.put('wikidatawiki', {'db_server': 'db2'})
+        cache.invalidate('enwiki')
+        self.assertIsNone(cache.get('enwiki', ['db_server']))
+        self.assertEqual(cache.get('wikidatawiki', ['db_server'])['db_server'], 'db2')
+        cache.invalidate()
+        self.assertIsNone(cache.get('wikidatawiki', ['db_server']))
+
+    def test_bad_file(self):
+        """
+        a garbled cache file should be treated as empty and be replaced
+        """
+        with open(self.cache_path, "w") as outfile:
+            outfile.write("{not json")
+        cache = self.get_cache()
+        self.assertIsNone(cache.get('enwiki', ['db_server']))
+        cache.put('enwiki', {'db_server': 'db1'})
+        self.assertEqual(cache.get('enwiki', ['db_server'])['db_server'], 'db1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+"""
+test suite for the db query service
+"""
+import os
+import sqlite3
+import stat
+import unittest
+from test.basedumpstest import BaseDumpsTestCase
+from dumps.dbquery import QueryService
+from dumps.pagerange import get_count_from_output
+from dumps.utils import DbServerInfo
+
+
+# stand-in for the mysql client in batch mode, knows just
+# enough to answer the queries in these tests; like the real
+# thing without --force, it exits on the first error
+FAKE_MYSQL = '''#!/usr/bin/python3
+import sys
+import time
+if "--force" in sys.argv:
+    sys.exit(2)
+for line in sys.stdin:
+    statement = line.strip().rstrip(";")
+    if statement == "select go away":
+        sys.exit(1)
+    if statement == "select lost connection":
+        sys.stderr.write("ERROR 2013 (HY000) at line 2: Lost connection to server\\n")
+        sys.exit(1)
+    if statement.startswith("select * from nosuchtable"):
+        sys.stderr.write("ERROR 1146 (42S02) at line 2: Table doesn't exist\\n")
+        sys.exit(1)
+    if statement == "select sleep":
+        time.sleep(3)
+    if statement.startswith("select MAX(page_id)"):
+        sys.stdout.write("MAX(page_id)\\n4321\\n")
+    elif "dumps_query_marker" in statement:
+        sys.stdout.write("dumps_query_marker\\n%s\\n" % statement.split()[1])
+    sys.stdout.flush()
+'''
+
+
+class TestQueryService(BaseDumpsTestCase):
+    """
+    test running queries via the various backends
+    """
+    def setUp(self):
+        super().setUp()
+        self.config.query_sqlite_db = os.path.join(BaseDumpsTestCase.TEMPDIR, 'wiki.sqlite')
+        conn = sqlite3.connect(self.config.query_sqlite_db)
+        conn.execute("create table revision (rev_id integer, rev_page integer)")
+        conn.executemany("insert into revision values (?, ?)",
+                         [(rev_id, rev_id % 7) for rev_id in range(1, 101)])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        QueryService.close_all()
+        super().tearDown()
+
+    def get_dbinfo(self, server='db1001'):
+        """
+        return a DbServerInfo with the server info filled in,
+        so no maintenance scripts get run
+        """
+        dbinfo = DbServerInfo(self.en['wiki'], 'enwiki')
+        dbinfo.db_server = server
+        dbinfo.db_port = ''
+        dbinfo.db_table_prefix = ''
+        return dbinfo
+
+    def test_sqlite_backend(self):
+        """
+        make sure queries get mysql-style output, and that
+        connections are shared per db server
+        """
+        self.config.query_backend = 'sqlite'
+        query = "select count(rev_id) from revision where rev_page >= 1 and rev_page < 3"
+        output = self.get_dbinfo().run_sql_and_get_output(query)
+        self.assertEqual(output, b'count(rev_id)\n30\n')
+        self.assertEqual(get_count_from_output(output), 30)
+        self.assertEqual(self.get_dbinfo().run_sql_query_with_retries(
+            "select max(rev_id) from revision where rev_page = 99"), b'max(rev_id)\nNULL\n')
+        self.get_dbinfo('db1002').run_sql_and_get_output("select 1")
+
+        stats = QueryService.get_all_stats()
+        self.assertEqual(sorted(stats.keys()), ['db1001:', 'db1002:'])
+        self.assertEqual(stats['db1001:']['queries'], 2)
+        self.assertEqual(stats['db1001:']['failures'], 0)
+
+        self.assertIsNone(self.get_dbinfo().run_sql_and_get_output("select * from nosuchtable"))
+        self.assertEqual(QueryService.get_all_stats()['db1001:']['failures'], 1)
+
+    def test_session_backend(self):
+        """
+        make sure output of several queries fed to one client is split
+        up correctly, and that we reconnect if the client goes away
+        """
+        fake_mysql = os.path.join(BaseDumpsTestCase.TEMPDIR, 'mysql')
+        with open(fake_mysql, "w") as outfile:
+            outfile.write(FAKE_MYSQL)
+        os.chmod(fake_mysql, stat.S_IRWXU)
+        self.config.mysql = fake_mysql
+        self.config.query_backend = 'session'
+
+        dbinfo = self.get_dbinfo()
+        for _count in range(3):
+            self.assertEqual(dbinfo.run_sql_and_get_output("select MAX(page_id) from page;"),
+                             b'MAX(page_id)\n4321\n')
+        # no output from the query at all
+        self.assertIsNone(dbinfo.run_sql_and_get_output("select nothing"))
+        backend = QueryService.get_service(dbinfo).backend
+        first_proc = backend.proc
+        self.assertIsNotNone(first_proc)
+
+        # the client exits, we should start up a new one and retry once
+        self.assertIsNone(dbinfo.run_sql_and_get_output("select go away"))
+        self.assertEqual(dbinfo.run_sql_and_get_output("select MAX(page_id) from page"),
+                         b'MAX(page_id)\n4321\n')
+        self.assertIsNot(backend.proc, first_proc)
+        stats = QueryService.get_service(dbinfo).get_stats()
+        self.assertEqual((stats['queries'], stats['failures']), (6, 2))
+        self.assertGreaterEqual(stats['reconnects'], 1)
+
+        # the server turned down the query: no retry, and the next
+        # query gets a new client with the db selected again
+        self.assertIsNone(dbinfo.run_sql_and_get_output("select * from nosuchtable"))
+        self.assertIsNone(backend.current_db)
+        stats = QueryService.get_service(dbinfo).get_stats()
+        self.assertEqual((stats['failures'], stats['reconnects']), (3, 1))
+        self.assertEqual(dbinfo.run_sql_and_get_output("select MAX(page_id) from page"),
+                         b'MAX(page_id)\n4321\n')
+        self.assertEqual(backend.current_db, 'enwiki')
+
+        # the connection to the server was lost: retry with a new client
+        self.assertIsNone(dbinfo.run_sql_and_get_output("select lost connection"))
+        stats = QueryService.get_service(dbinfo).get_stats()
+        self.assertEqual((stats['failures'], stats['reconnects']), (4, 2))
+
+        # no answer in time: give up rather than wait forever
+        self.config.query_timeout = 1
+        self.assertIsNone(dbinfo.run_sql_and_get_output("select sleep"))
+        self.assertIsNone(backend.proc)
+        self.assertEqual(dbinfo.run_sql_and_get_output("select MAX(page_id) from page"),
+                         b'MAX(page_id)\n4321\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
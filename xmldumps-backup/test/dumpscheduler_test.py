@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+"""
+test suite for the dumpscheduler script
+"""
+import io
+import json
+import os
+import signal
+import time
+import unittest
+from test.basedumpstest import BaseDumpsTestCase
+import dumpscheduler
+
+
+class TestScheduler(BaseDumpsTestCase):
+    """
+    run some small simulated workloads through the scheduler
+    """
+    # a 2-slot command that runs a while, then a 4-slot command that must
+    # wait for it, then short 1-slot commands that fit in the gap
+    WORKLOAD = ["2:1.5 1 continue none sleep 1.5",
+                "4:0.5 1 continue none sleep 0.5",
+                "1:0.5 4 continue none sleep 0.5"]
+
+    def tearDown(self):
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        super().tearDown()
+
+    def run_workload(self, backfill):
+        """
+        run the workload on 4 slots and return how long it took
+        and the scheduling stats from the cache file
+        """
+        cachepath = os.path.join(BaseDumpsTestCase.TEMPDIR, 'running_cache.txt')
+        my_id = dumpscheduler.scheduler_setup()
+        plugables = dumpscheduler.get_scheduler_plugables(
+            {'slots': 4, 'cache': cachepath, 'restore': False, 'rerun': False,
+             'mailhost': None, 'email_from': 'root'}, my_id)
+        # we should be woken by child exits, never by the interval
+        scheduler = dumpscheduler.Scheduler(plugables, None, my_id, backfill, interval=60)
+        start = time.time()
+        scheduler.run(io.StringIO("\n".join(self.WORKLOAD) + "\n"))
+        elapsed = time.time() - start
+        with open(cachepath, "r") as infile:
+            stats = [json.loads(line[len("stats:"):]) for line in infile
+                     if line.startswith("stats:")][0]
+        return elapsed, stats
+
+    def test_backfill(self):
+        """
+        make sure that filling free slots with later commands gets
+        the work done sooner than running commands strictly in order
+        """
+        in_order_elapsed, in_order_stats = self.run_workload(backfill=False)
+        backfill_elapsed, backfill_stats = self.run_workload(backfill=True)
+
+        self.assertEqual(in_order_stats['completed'], 6)
+        self.assertEqual(backfill_stats['completed'], 6)
+        self.assertEqual(in_order_stats['backfilled'], 0)
+        self.assertEqual(backfill_stats['backfilled'], 4)
+        # strictly in order takes about 2.5 seconds, with backfill about 2
+        self.assertLess(backfill_elapsed, in_order_elapsed - 0.25)
+        self.assertLess(backfill_stats['slot_idle_seconds'],
+                        in_order_stats['slot_idle_seconds'])
+
+    def test_line_to_entry(self):
+        """
+        make sure runtime estimates are optional in the command list
+        """
+        entry = dumpscheduler.line_to_entry("2 max retry=1 none bash ./worker --job x", 8)
+        self.assertEqual((entry['slots'], entry['count'], entry['estimate']), (2, 4, None))
+        self.assertEqual(entry['command'], "bash ./worker --job x")
+        entry = dumpscheduler.line_to_entry("3:600 1 continue none ./worker", 8)
+        self.assertEqual((entry['slots'], entry['estimate']), (3, 600.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,11 +2,34 @@
 """
 test suite for xml content job
 """
+import bz2
+import gzip
+import hashlib
 import os
+import shutil
+import stat
+import threading
 import unittest
 from test.basedumpstest import BaseDumpsTestCase
 from dumps.wikidump import Wiki
-from dumps.fileutils import DumpFilename, DumpDir
+from dumps.fileutils import DumpFilename, DumpDir, DumpContents, FileUtils, PARTS_ANY
+
+
+# stand-ins for the mwbzutils tools, which read all of the file
+# rather than just the last block, but that's fine for tests
+FOOTER_CHECKER = """#!/usr/bin/python3
+import bz2
+import sys
+try:
+    bz2.open(sys.argv[1]).read()
+except (EOFError, OSError):
+    sys.exit(1)
+"""
+LAST_BLOCK_DUMPER = """#!/usr/bin/python3
+import bz2
+import sys
+sys.stdout.buffer.write(bz2.open(sys.argv[1]).read()[-1000:])
+"""
 
 
 class TestFileUtils(BaseDumpsTestCase):
@@ -68,6 +91,252 @@ class TestFileUtils(BaseDumpsTestCase):
         other_dfname = None
         self.assertFalse(some_dfname == other_dfname)
 
+    def test_dumpcontents_checksums(self):
+        """
+        make sure that computing several checksums in one pass
+        gives the same results as computing each one separately
+        """
+        path = './test/files/pages-articles-sample1.xml-p1p1500.bz2'
+        with open(path, "rb") as infile:
+            contents = infile.read()
+        expected = {htype: hashlib.new(htype, contents).hexdigest()
+                    for htype in ['md5', 'sha1', 'sha256']}
+
+        dcontents = DumpContents(self.en['wiki'], path)
+        self.assertEqual(dcontents.checksums(['md5', 'sha1', 'sha256']), expected)
+        self.assertEqual(dcontents.checksum('sha1'), expected['sha1'])
+        self.assertEqual(dcontents.md5sum(), expected['md5'])
+        self.assertEqual(dcontents.checksum('nosuchhash'), None)
+
+    def get_validation_path(self, filename):
+        """
+        return a path in the temp dir for a test file to be validated
+        """
+        return os.path.join(BaseDumpsTestCase.TEMPDIR, filename.format(today=self.today))
+
+    def test_dumpcontents_validate_good(self):
+        """
+        make sure good files get a clean verdict with the right page ids,
+        no matter how the content is split up as we read it
+        """
+        for path, first_id, last_id in [
+                ('./test/files/pages-articles-sample1.xml-p1501p4000.bz2', '1515', '1516'),
+                ('./test/files/stub-articles-sample2.xml.gz', '4340', '4442')]:
+            for bufsize in [DumpContents.VALIDATE_BUFSIZE, 97]:
+                dcontents = DumpContents(self.en['wiki'], path)
+                dcontents.VALIDATE_BUFSIZE = bufsize
+                verdict = dcontents.validate(b'</mediawiki>')
+                self.assertTrue(verdict.checked)
+                self.assertFalse(verdict.is_bad(), verdict.describe())
+                self.assertEqual((verdict.first_page_id, verdict.last_page_id),
+                                 (first_id, last_id))
+                self.assertEqual(dcontents.last_page_id_int, int(last_id))
+
+    def test_dumpcontents_validate_bad(self):
+        """
+        make sure empty, truncated and junk-filled files are detected
+        """
+        with open('./test/files/pages-articles-sample1.xml-p1501p4000.bz2', "rb") as infile:
+            compressed = infile.read()
+        with bz2.open('./test/files/pages-articles-sample1.xml-p1501p4000.bz2') as infile:
+            content = infile.read()
+
+        path = self.get_validation_path('enwiki-{today}-pages-articles.xml-p1p2.bz2')
+        with open(path, "wb") as outfile:
+            outfile.write(compressed[:len(compressed) // 2])
+        verdict = DumpContents(self.en['wiki'], path).validate()
+        self.assertTrue(verdict.truncated)
+        self.assertTrue(verdict.is_bad())
+
+        # complete compressed stream, but missing the closing tag
+        path = self.get_validation_path('enwiki-{today}-pages-articles.xml-p3p4.gz')
+        with gzip.open(path, "wb") as outfile:
+            outfile.write(content[:-1 * len(b'</mediawiki>\n')])
+        dcontents = DumpContents(self.en['wiki'], path)
+        self.assertFalse(dcontents.validate().truncated)
+        self.assertTrue(dcontents.validate(b'</mediawiki>').truncated)
+
+        path = self.get_validation_path('enwiki-{today}-pages-articles.xml-p5p6.gz')
+        with gzip.open(path, "wb") as outfile:
+            outfile.write(b'')
+        verdict = DumpContents(self.en['wiki'], path).validate()
+        self.assertTrue(verdict.empty)
+        self.assertTrue(verdict.is_bad())
+
+        path = self.get_validation_path('enwiki-{today}-pages-articles.xml-p7p8.bz2')
+        with bz2.open(path, "wb") as outfile:
+            outfile.write(content[:500] + b'\0' * 10 + content[500:])
+        verdict = DumpContents(self.en['wiki'], path).validate(b'</mediawiki>')
+        self.assertTrue(verdict.binary)
+        self.assertFalse(verdict.truncated)
+
+        # sql files may have anything in them
+        path = self.get_validation_path('enwiki-{today}-page.sql.gz')
+        with gzip.open(path, "wb") as outfile:
+            outfile.write(b'\0' * 10)
+        self.assertFalse(DumpContents(self.en['wiki'], path).validate().is_bad())
+
+    def test_dumpcontents_validate_bz2_ends(self):
+        """
+        make sure bz2 files are checked by their start and last block only,
+        when the tools for the last block are there
+        """
+        tools = {'checkforbz2footer': FOOTER_CHECKER, 'dumplastbz2block': LAST_BLOCK_DUMPER}
+        for tool, script in tools.items():
+            path = os.path.join(BaseDumpsTestCase.TEMPDIR, tool)
+            with open(path, "w") as outfile:
+                outfile.write(script)
+            os.chmod(path, stat.S_IRWXU)
+            setattr(self.en['wiki'].config, tool, path)
+
+        with open('./test/files/pages-articles-sample1.xml-p1501p4000.bz2', "rb") as infile:
+            compressed = infile.read()
+        path = self.get_validation_path('enwiki-{today}-pages-articles.xml-p1501p4000.bz2')
+        for content, truncated in [(compressed, False), (compressed[:-100], True)]:
+            with open(path, "wb") as outfile:
+                outfile.write(content)
+            dcontents = DumpContents(self.en['wiki'], path)
+            # don't read far enough to get to the end of the file
+            dcontents.VALIDATE_BUFSIZE = 97
+            dcontents.VALIDATE_BINARY_LINES = 50
+            verdict = dcontents.validate(b'</mediawiki>')
+            self.assertEqual(verdict.truncated, truncated)
+            if not truncated:
+                self.assertEqual((verdict.first_page_id, verdict.last_page_id),
+                                 ('1515', '1516'))
+                self.assertEqual((verdict.pages, verdict.revisions), (None, None))
+
+    def test_dumpcontents_sidecar(self):
+        """
+        make sure page ids come from the sidecar file when it is there
+        and current, and from the file contents otherwise
+        """
+        path = self.get_validation_path('enwiki-{today}-stub-articles.xml.gz')
+        shutil.copyfile('./test/files/stub-articles-sample2.xml.gz', path)
+        dcontents = DumpContents(self.en['wiki'], path)
+        verdict = dcontents.validate()
+        self.assertEqual((verdict.pages, verdict.revisions), (6, 6))
+        self.assertIsNone(dcontents.read_sidecar())
+
+        # fake some ids so we can tell they are read from the sidecar
+        verdict.first_page_id = '10'
+        verdict.last_page_id = '20'
+        dcontents.write_sidecar(verdict)
+        self.assertEqual(dcontents.read_sidecar()['pages'], 6)
+        dcontents = DumpContents(self.en['wiki'], path)
+        self.assertEqual(dcontents.find_first_page_id_in_file(), 10)
+        self.assertEqual(dcontents.find_last_page_id(), 20)
+
+        # ids that weren't found when the file was checked come from the file
+        verdict.first_page_id = None
+        verdict.last_page_id = None
+        dcontents.write_sidecar(verdict)
+        dcontents = DumpContents(self.en['wiki'], path)
+        self.assertEqual(dcontents.find_first_page_id_in_file(), 4340)
+        self.assertEqual(dcontents.find_last_page_id(), 4442)
+
+        # the dump file changed after the sidecar was written
+        os.utime(path, ns=(0, 0))
+        dcontents = DumpContents(self.en['wiki'], path)
+        self.assertIsNone(dcontents.read_sidecar())
+        self.assertEqual(dcontents.validate().first_page_id, '4340')
+
+    def test_write_file_skip_unchanged(self):
+        """
+        make sure files with the same contents are left alone
+        when we ask for that, and written otherwise
+        """
+        path = os.path.join(BaseDumpsTestCase.TEMPDIR, 'status.html')
+        self.assertTrue(FileUtils.write_file_in_place(path, "in progress\n", skip_unchanged=True))
+        os.utime(path, ns=(0, 0))
+        self.assertFalse(FileUtils.write_file_in_place(path, "in progress\n", skip_unchanged=True))
+        self.assertFalse(FileUtils.write_file(BaseDumpsTestCase.TEMPDIR, path, "in progress\n",
+                                              skip_unchanged=True))
+        self.assertEqual(os.stat(path).st_mtime, 0)
+        self.assertTrue(FileUtils.write_file_in_place(path, "in progreß\n", skip_unchanged=True))
+        self.assertTrue(FileUtils.has_contents(path, "in progreß\n"))
+        self.assertTrue(FileUtils.write_file_in_place(path, "in progreß\n"))
+
+    def test_dumpdir_catalog(self):
+        """
+        make sure DumpDir lists files from its catalog filtered and
+        in natural order, and sees files added or removed by us or
+        by others
+        """
+        rundir = os.path.join(BaseDumpsTestCase.PUBLICDIR, 'enwiki', self.today)
+        basenames = ['pages-articles10.xml-p101p200.bz2', 'pages-articles2.xml-p11p20.bz2',
+                     'pages-articles2.xml-p1p10.bz2', 'pages-articles2.xml-p21p30.bz2.inprog',
+                     'pages-articles.xml.bz2', 'stub-articles2.xml.gz', 'dumpruninfo.json']
+        for basename in basenames:
+            with open(os.path.join(rundir, 'enwiki-{today}-{name}'.format(
+                    today=self.today, name=basename)), "w") as outfile:
+                outfile.write("stuff\n")
+        # no trusting listings made within a second of a change
+        os.utime(rundir, (0, 0))
+
+        dumpdir = DumpDir(self.en['wiki'], 'enwiki')
+        self.assertEqual(len(dumpdir.get_files_in_dir()), len(basenames))
+        names = [dfname.filename.split('-', 2)[2] for dfname in dumpdir.get_checkpt_files(
+            None, 'pages-articles', 'xml', 'bz2', PARTS_ANY)]
+        self.assertEqual(names, ['pages-articles2.xml-p1p10.bz2', 'pages-articles2.xml-p11p20.bz2',
+                                 'pages-articles10.xml-p101p200.bz2'])
+        names = [dfname.filename.split('-', 2)[2] for dfname in dumpdir.get_checkpt_files(
+            None, 'pages-articles', 'xml', 'bz2', [2], inprog=True)]
+        self.assertEqual(names, ['pages-articles2.xml-p21p30.bz2.inprog'])
+        names = [dfname.filename.split('-', 2)[2] for dfname in dumpdir.get_reg_files(
+            None, 'pages-articles', 'xml', 'bz2')]
+        self.assertEqual(names, ['pages-articles.xml.bz2'])
+        self.assertEqual(dumpdir.get_reg_files(None, 'pages-articles', 'xml', 'bz2', [3]), [])
+
+        # moved into place by us
+        inprog_path = os.path.join(rundir, 'enwiki-{today}-{name}'.format(
+            today=self.today, name='pages-articles2.xml-p21p30.bz2.inprog'))
+        os.rename(inprog_path, inprog_path[:-len(DumpFilename.INPROG)])
+        os.utime(rundir, (0, 0))
+        dumpdir.note_file_renamed(inprog_path, inprog_path[:-len(DumpFilename.INPROG)])
+        self.assertEqual(len(dumpdir.get_checkpt_files(
+            None, 'pages-articles', 'xml', 'bz2', [2])), 3)
+
+        # written by someone else
+        os.unlink(os.path.join(rundir, 'enwiki-{today}-{name}'.format(
+            today=self.today, name='pages-articles.xml.bz2')))
+        self.assertEqual(dumpdir.get_reg_files(None, 'pages-articles', 'xml', 'bz2'), [])
+
+    def test_dumpdir_catalog_threads(self):
+        """
+        make sure files renamed in the catalog from several threads at
+        once, as command monitor threads do, are never missing from
+        or listed twice in the files that DumpDir lists meanwhile
+        """
+        rundir = os.path.join(BaseDumpsTestCase.PUBLICDIR, 'enwiki', self.today)
+        paths = [os.path.join(rundir, 'enwiki-{today}-pages-articles{partnum}.xml-p{first}p{last}.bz2'
+                              .format(today=self.today, partnum=partnum,
+                                      first=partnum * 10 + 1, last=partnum * 10 + 10))
+                 for partnum in range(1, 9)]
+        for path in paths:
+            with open(path, "w") as outfile:
+                outfile.write("stuff\n")
+        # so that the listing is trusted and we see only our own changes
+        os.utime(rundir, (0, 0))
+        dumpdir = DumpDir(self.en['wiki'], 'enwiki')
+        self.assertEqual(len(dumpdir.get_files_in_dir()), len(paths))
+
+        def rename_back_and_forth(path):
+            for _count in range(300):
+                dumpdir.note_file_renamed(path, path + DumpFilename.INPROG)
+                dumpdir.note_file_renamed(path + DumpFilename.INPROG, path)
+
+        threads = [threading.Thread(target=rename_back_and_forth, args=(path,)) for path in paths]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            self.assertEqual(len(dumpdir.get_checkpt_files(
+                None, 'pages-articles', 'xml', 'bz2', PARTS_ANY, inprog=None)), len(paths))
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(dumpdir.get_checkpt_files(
+            None, 'pages-articles', 'xml', 'bz2', PARTS_ANY)), len(paths))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -10,6 +10,7 @@ from unittest.mock import patch
 from test.basedumpstest import BaseDumpsTestCase
 from dumps.pagerangeinfo import PageRangeInfo
 from dumps.batch import PageContentBatches
+from dumps.report import StatusHtml
 import monitor
 
 
@@ -80,6 +81,79 @@ class TestMonitor(BaseDumpsTestCase):
                 batch_entry_status = batches_info['batches'][0]['batch']['status']
                 self.assertEqual(batch_entry_status, 'aborted')
 
+    def write_status(self, wiki, text):
+        """
+        write a status html file and a statusapi json file for the wiki
+        """
+        rundir = os.path.join(wiki.public_dir(), self.today)
+        with open(os.path.join(rundir, StatusHtml.get_statusfilename()), "w") as outfile:
+            outfile.write("<li>%s: %s</li>" % (wiki.db_name, text))
+        with open(os.path.join(rundir, "dumpstatus.json"), "w") as outfile:
+            outfile.write(json.dumps({"jobs": {"status": text}}))
+
+    def test_monitor_tick(self):
+        """
+        make sure that status info is cached between monitor runs and
+        only read again for wikis that changed or might have gone stale
+        """
+        self.config.db_list = ['enwiki', 'wikidatawiki']
+        self.config.monitor_cache = os.path.abspath(
+            os.path.join(BaseDumpsTestCase.TEMPDIR, 'monitorcache.json'))
+        self.config.index = 'index.html'
+        self.config.template_dir = BaseDumpsTestCase.TEMPDIR
+        with open(os.path.join(BaseDumpsTestCase.TEMPDIR, "download-index.html"), "w") as outfile:
+            outfile.write("%(status)s\n%(otherIndexLink)s\n%(items)s\n")
+        self.write_status(self.en['wiki'], "dump complete")
+        self.write_status(self.wd['wiki'], "dump in progress")
+        statusfile = StatusHtml.get_statusfile_path(self.en['wiki'], self.today)
+        os.utime(statusfile, (time.time() - 100, time.time() - 100))
+        # a fresh lock, wikidatawiki is being dumped right now
+        lockfile = os.path.join(self.wd['wiki'].private_dir(), "lock_" + self.today)
+        with open(lockfile, "w") as outfile:
+            outfile.write("1234 somehost\n")
+
+        indexfiles = [os.path.join(BaseDumpsTestCase.PUBLICDIR, name)
+                      for name in ['index.html', 'index-bydb.html', 'index.json']]
+        try:
+            tick = monitor.monitor_tick(self.config)
+            self.assertEqual(tick['refreshed'], 2)
+            with open(indexfiles[1], "r") as infile:
+                self.assertEqual(infile.read().splitlines(), [
+                    "Dumps are in progress...",
+                    'Also view sorted by <a href="index.html">dump date</a>',
+                    "<li>enwiki: dump complete</li>",
+                    "<li>wikidatawiki: dump in progress</li>"])
+            with open(indexfiles[2], "r") as infile:
+                self.assertEqual(json.load(infile)['wikis']['enwiki'],
+                                 {"jobs": {"status": "dump complete"}})
+
+            # only the locked wiki gets looked at again
+            cache = monitor.MonitorCache(self.config)
+            self.assertEqual(cache.refresh(), 1)
+            self.assertEqual(cache.db_list_by_age(), ['wikidatawiki', 'enwiki'])
+            self.assertEqual(cache.db_list_by_age(), self.config.db_list_by_age())
+
+            # now the lock goes away and enwiki gets a new status
+            os.unlink(lockfile)
+            self.write_status(self.en['wiki'], "dump failed")
+            os.utime(statusfile, (time.time() + 10, time.time() + 10))
+            tick = monitor.monitor_tick(self.config)
+            self.assertEqual(tick['refreshed'], 2)
+            with open(indexfiles[0], "r") as infile:
+                contents = infile.read()
+            self.assertIn("Dump process is idle.", contents)
+            self.assertIn("<li>enwiki: dump failed</li>", contents)
+
+            # nothing changed, nothing to read
+            tick = monitor.monitor_tick(self.config)
+            self.assertEqual(tick['refreshed'], 0)
+            with open(self.config.monitor_cache, "r") as infile:
+                self.assertEqual(len(json.load(infile)['ticks']), 3)
+        finally:
+            for path in indexfiles:
+                if os.path.exists(path):
+                    os.unlink(path)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+"""
+test suite for page range generation from revinfo files
+"""
+import gzip
+import os
+import random
+import unittest
+from test.basedumpstest import BaseDumpsTestCase
+from dumps.pagerange import PageRange, RevInfoIndex, get_revinfo_index_path
+
+
+class TestRevInfoIndex(BaseDumpsTestCase):
+    """
+    make sure page ranges cut from a revinfo index are the
+    same as those from scanning the revinfo file
+    """
+    def setUp(self):
+        super().setUp()
+        self.revinfo_path = os.path.join(BaseDumpsTestCase.TEMPDIR, 'wikidatawiki-revinfo.gz')
+        self.index_path = get_revinfo_index_path(self.revinfo_path)
+
+    def write_revinfo(self, entries):
+        """
+        write the list of (pageid, bytecount, revcount) to a revinfo
+        file and build the index for it
+        """
+        with gzip.open(self.revinfo_path, "w") as revinfo_out:
+            for entry in entries:
+                revinfo_out.write(("%d:%d:%d\n" % entry).encode("utf-8"))
+        RevInfoIndex.build(self.revinfo_path, self.index_path)
+
+    def test_revinfo_ranges(self):
+        """
+        check ranges for a known revinfo file, and compare ranges
+        from the index and from the file for lots of random arguments
+        """
+        self.assertEqual(self.index_path, os.path.join(BaseDumpsTestCase.TEMPDIR,
+                                                       'wikidatawiki-revinfo.idx'))
+        self.write_revinfo([(40, 11798, 8), (42, 38582, 11), (44, 449, 7),
+                            (46, 402, 8), (48, 372, 8), (52, 411, 8),
+                            (54, 438, 10), (56, 1321, 11), (58, 440, 9),
+                            (60, 154253, 38)])
+        with RevInfoIndex(self.index_path) as index:
+            self.assertEqual(index.get_ranges(20000, 20, 40, 60, 2),
+                             [(40, 41), (42, 47), (48, 55), (56, 60)])
+
+        randomizer = random.Random(12)
+        entries = []
+        pageid = 1
+        for _count in range(500):
+            entries.append((pageid, randomizer.randint(0, 50000), randomizer.randint(0, 40)))
+            pageid += randomizer.randint(1, 12)
+        self.write_revinfo(entries)
+        with RevInfoIndex(self.index_path) as index:
+            for _count in range(300):
+                minpageid = randomizer.randint(1, pageid + 20)
+                maxpageid = randomizer.randint(minpageid, pageid + 40)
+                args = (randomizer.randint(1, 400000), randomizer.randint(1, 300),
+                        minpageid, maxpageid, randomizer.randint(1, 30))
+                self.assertEqual(index.get_ranges(*args),
+                                 PageRange.get_ranges_via_revinfo(self.revinfo_path, *args),
+                                 "ranges differ for args {args}".format(args=args))
+
+    def test_ranges_for_jobs(self):
+        """
+        make sure ranges for jobs cover all pages and have
+        about the same number of revisions each
+        """
+        self.write_revinfo([(pageid, 100, 10) for pageid in range(1, 1000, 10)] +
+                           [(1001, 100, 400)])
+        with RevInfoIndex(self.index_path) as index:
+            ranges = index.get_ranges_for_jobs(4, 1, 1200)
+        self.assertEqual(ranges, [(1, 350), (351, 700), (701, 1000), (1001, 1200)])
+
+        # an empty revinfo file gives one range for everything either way
+        self.write_revinfo([])
+        with RevInfoIndex(self.index_path) as index:
+            self.assertEqual(index.get_ranges_for_jobs(4, 1, 1200), [(1, 1200)])
+            for args in [(20000, 20, 1, 1200, 2), (20000, 20, 1200, 1200, 2)]:
+                self.assertEqual(index.get_ranges(*args),
+                                 PageRange.get_ranges_via_revinfo(self.revinfo_path, *args))
+        self.assertEqual(PageRange.get_ranges_via_revinfo(self.revinfo_path, 20000, 20, 1, 1200),
+                         [(1, 1200)])
+
+        self.assertIsNone(RevInfoIndex.load(self.index_path + ".nosuchfile"))
+        with open(self.index_path, "r+b") as outfile:
+            outfile.truncate(100)
+        self.assertIsNone(RevInfoIndex.load(self.index_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
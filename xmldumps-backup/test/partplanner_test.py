@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+"""
+test suite for choosing page ranges of parts from earlier runtimes
+"""
+import unittest
+from test.basedumpstest import BaseDumpsTestCase
+from dumps.partplanner import PartPlan, PartPlanner, RuntimeHistory
+
+
+class FakeItem():
+    """
+    just enough of a dump job to record its runtimes
+    """
+    def __init__(self, name, commands_submitted):
+        self._name = name
+        self.commands_submitted = commands_submitted
+
+    def name(self):
+        """
+        return the job name
+        """
+        return self._name
+
+    @staticmethod
+    def parts_cover_page_ranges():
+        """
+        the job is split up by page ranges
+        """
+        return True
+
+
+class TestPartPlanner(BaseDumpsTestCase):
+    """
+    make sure runtimes are recorded and used to even out the parts
+    """
+    def setUp(self):
+        super().setUp()
+        self.wiki = self.en['wiki']
+        self.history = RuntimeHistory(self.wiki)
+        # the first thousand pages took ten times as long as the rest
+        self.history.record('metahistorybz2dump', '20200101',
+                            [(1, 1000, 100.0), (1001, 2000, 10.0), (2001, 3000, 10.0)])
+
+    def test_plan(self):
+        """
+        the expensive pages should be split over the first two parts,
+        and the runtimes predicted for all three should be the same,
+        unless the configured parts would do as well
+        """
+        planner = PartPlanner(RuntimeHistory(self.wiki))
+        planned = planner.plan(3, self.today)
+        self.assertEqual(planned, [400, 400, 2200])
+        self.assertEqual(planner.predict(planned, self.today),
+                         {'metahistorybz2dump': [40.0, 40.0, 40.0]})
+        # nothing from before the first run to go on
+        self.assertIsNone(planner.plan(3, '20190101'))
+        # the configured page ranges would do just as well
+        self.assertIsNone(planner.plan(3, self.today, [400, 400, 2300]))
+
+    def test_plan_by_slowest_job(self):
+        """
+        when the costs of the jobs per page differ, the parts should be
+        cut so that the run as a whole is predicted to take the least time,
+        even if that evens out the parts of neither job
+        """
+        # this job costs the same per page everywhere
+        self.history.record('xmlstubsdump', '20200101',
+                            [(1, 1000, 50.0), (1001, 2000, 50.0), (2001, 3000, 50.0)])
+        planner = PartPlanner(RuntimeHistory(self.wiki))
+        planned = planner.plan(3, self.today)
+        self.assertEqual(planned, [600, 900, 1500])
+        self.assertEqual(planner.get_run_time(planner.predict(planned, self.today)), 135.0)
+        self.assertEqual(planner.get_run_time(planner.predict([400, 400, 2200], self.today)), 150.0)
+
+    def test_record_job(self):
+        """
+        runtimes of a job should be recorded with the page ranges from the
+        output file names, or from the parts if the names have none, and
+        the last page id of the wiki for the end of the last part, and
+        only the last few runs kept
+        """
+        stubs = FakeItem('xmlstubsdump', [
+            {'output_files': ['enwiki-%s-stub-articles%d.xml.gz.inprog' % (self.today, partnum)],
+             'wall': 2.0 * partnum} for partnum in [1, 2, 3]])
+        self.history.record_job(stubs, [1000, 2000, 500], 3400)
+        self.assertEqual(RuntimeHistory(self.wiki).get_jobs()['xmlstubsdump'],
+                         {self.today: [[1, 1000, 2.0], [1001, 3000, 4.0], [3001, 3400, 6.0]]})
+
+        # a single number of pages per part, not expanded to the parts of
+        # the run, tells us nothing about the page ranges of the parts
+        articles = FakeItem('articlesdump', [
+            {'output_files': ['enwiki-%s-pages-articles%d.xml.bz2.inprog' % (self.today, partnum)],
+             'wall': 2.0 * partnum} for partnum in [1, 2, 3]])
+        self.history.record_job(articles, [1000], 3000)
+        self.assertNotIn('articlesdump', RuntimeHistory(self.wiki).get_jobs())
+        self.history.record_job(articles, [1000, 1000, 1000], 3000)
+        self.assertEqual(RuntimeHistory(self.wiki).get_jobs()['articlesdump'],
+                         {self.today: [[1, 1000, 2.0], [1001, 2000, 4.0], [2001, 3000, 6.0]]})
+
+        for date in ['20200201', '20200301', '20200401']:
+            self.history.record('metahistorybz2dump', date, [(1, 10, 1.0)])
+        self.assertEqual(sorted(RuntimeHistory(self.wiki).get_jobs()['metahistorybz2dump']),
+                         ['20200201', '20200301', '20200401'])
+
+    def test_part_runtimes(self):
+        """
+        the plan for a run should be saved, and the predicted and the
+        actual runtimes of the parts reported together
+        """
+        plan = PartPlan(self.wiki)
+        self.assertEqual(plan.make("1000,1000,1000"), "400,400,2200")
+        self.assertIsNone(plan.make("3000"))
+        self.history.record('metahistorybz2dump', self.today,
+                            [(1, 400, 35.0), (401, 800, 45.5), (801, 2500, 30.0), (2501, 3100, 9.0)])
+        runtimes = plan.get_part_runtimes([400, 400, 2200])
+        self.assertEqual(runtimes['metahistorybz2dump'][0],
+                         {'part': 1, 'firstpageid': 1, 'lastpageid': 400,
+                          'predicted': 40.0, 'actual': 35.0})
+        self.assertEqual([(entry['lastpageid'], entry['actual'])
+                          for entry in runtimes['metahistorybz2dump']],
+                         [(400, 35.0), (800, 45.5), (None, 39.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
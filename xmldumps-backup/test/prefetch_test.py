@@ -11,6 +11,7 @@ from unittest.mock import patch
 from test.basedumpstest import BaseDumpsTestCase
 from dumps.xmlcontentjobs import XmlDump, DFNamePageRangeConverter
 from dumps.utils import FilePartInfo
+from dumps.fileutils import DumpContents
 from dumps.runner import Runner
 from dumps.prefetch import PrefetchFinder
 
@@ -179,7 +180,29 @@ class TestPrefetch(BaseDumpsTestCase):
             expected_dfnames = self.dfnames_from_filenames(expected_files)
             self.assertEqual(prefetch_dfnames, expected_dfnames)
 
+        with self.subTest('range past the last existing file, which has no last page id'):
+            pagerange = {'start': 4606, 'end': 4700}
+            prefetch_dfnames = prefetcher.find_prefetch_files_from_run(runner, date,
+                                                                       pagerange, 'bz2')
+            expected_files = ["wikidatawiki-{date}-pages-articles3.xml.bz2".format(date=date)]
+            expected_dfnames = self.dfnames_from_filenames(expected_files)
+            self.assertEqual(prefetch_dfnames, expected_dfnames)
+
+        with self.subTest('file info comes from the prefetch catalog'):
+            with patch('dumps.prefetch.PrefetchFinder.get_run_files') as mock_get_run_files:
+                pagerange = {'start': 4334, 'end': 4480}
+                prefetch_dfnames = PrefetchFinder(
+                    prefetcher.wiki, prefetcher.jobinfo, prefetcher.prefetchinfo,
+                    False).find_prefetch_files_from_run(runner, date, pagerange, 'bz2')
+                self.assertEqual(len(prefetch_dfnames), 2)
+                mock_get_run_files.assert_not_called()
+
         with self.subTest('range not covered in existing files'):
+            # the last page id of the last file is known once its contents are checked
+            path = os.path.join(BaseDumpsTestCase.PUBLICDIR, self.wd['wiki'].db_name, date,
+                                "wikidatawiki-{date}-pages-articles3.xml.bz2".format(date=date))
+            dcontents = DumpContents(self.wd['wiki'], path)
+            dcontents.write_sidecar(dcontents.validate())
             pagerange = {'start': 4606, 'end': 4700}
             prefetch_dfnames = prefetcher.find_prefetch_files_from_run(runner, date,
                                                                        pagerange, 'bz2')
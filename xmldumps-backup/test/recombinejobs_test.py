@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+"""
+test suite for recombine dump jobs
+"""
+import bz2
+import io
+import os
+import shutil
+import unittest
+from test.basedumpstest import BaseDumpsTestCase
+from dumps.recombinejobs import RecombineDump, recombine_index_parts
+from xmlsplit import split_xml_streams
+
+
+XML_HEADER = """<mediawiki xml:lang="en">
+  <siteinfo>
+    <sitename>Wikipedia</sitename>
+  </siteinfo>
+"""
+XML_FOOTER = "</mediawiki>\n"
+
+
+def old_index_recombine(parts, output_path):
+    """
+    the way index files were recombined before they were
+    done in parallel, one line at a time
+    """
+    combined_indexfile_inprog = bz2.open(output_path, 'wt', encoding='utf-8')
+    for input_path, added_offset in parts:
+        with bz2.open(input_path, mode='rt', encoding='utf-8') as partial_indexfile:
+            for line in partial_indexfile:
+                if line:
+                    partial_offset, title = line.split(':', 1)
+                    partial_offset = str(int(partial_offset) + added_offset)
+                    combined_indexfile_inprog.write(partial_offset + ":" + title)
+    combined_indexfile_inprog.close()
+
+
+class TestRecombineJobs(BaseDumpsTestCase):
+    """
+    test (parts of) recombining output files
+    """
+    def make_index_parts(self, count, lines_per_part):
+        """
+        write some bz2 multistream index files, returning a list
+        of (path, offset to add) tuples for them
+        """
+        parts = []
+        offset = 0
+        page_id = 1
+        for partnum in range(1, count + 1):
+            path = os.path.join(BaseDumpsTestCase.TEMPDIR,
+                                'pages-articles-multistream-index%d.txt.bz2' % partnum)
+            lines = []
+            for linenum in range(lines_per_part):
+                # 100 pages per stream, titles with colons and non-ascii
+                lines.append("%d:%d:Título %d: parte %d\n" % (
+                    600 + (linenum // 100) * 51234, page_id, page_id, partnum))
+                page_id += 1
+            with bz2.open(path, "wt", encoding="utf-8") as outfile:
+                outfile.write("".join(lines))
+            parts.append((path, offset))
+            offset += 7654321 * partnum
+        return parts
+
+    def test_index_recombine(self):
+        """
+        make sure that the recombined index file has exactly the same
+        contents as it would have had with the old one-line-at-a-time
+        recombine, whether index files are rewritten in parallel or not
+        """
+        parts = self.make_index_parts(4, 2500)
+        expected_path = os.path.join(BaseDumpsTestCase.TEMPDIR, 'expected-index.txt.bz2')
+        old_index_recombine(parts, expected_path)
+        with bz2.open(expected_path, "rb") as infile:
+            expected = infile.read()
+
+        for workers in [1, 3]:
+            output_path = os.path.join(BaseDumpsTestCase.TEMPDIR,
+                                       'index-%d-workers.txt.bz2' % workers)
+            recombine_index_parts(parts, output_path, workers)
+            with bz2.open(output_path, "rb") as infile:
+                self.assertEqual(infile.read(), expected)
+            # no leftover pieces lying around
+            self.assertEqual([name for name in os.listdir(BaseDumpsTestCase.TEMPDIR)
+                              if '.part' in name], [])
+
+        # with only one index file it's one bz2 stream, same as ever
+        output_path = os.path.join(BaseDumpsTestCase.TEMPDIR, 'index-one.txt.bz2')
+        recombine_index_parts(parts[:1], output_path, 3)
+        old_index_recombine(parts[:1], expected_path)
+        with open(output_path, "rb") as infile:
+            output = infile.read()
+        with open(expected_path, "rb") as infile:
+            self.assertEqual(output, infile.read())
+
+    @unittest.skipUnless(shutil.which("bzip2"), "needs bzip2")
+    def test_split_streams_recombine(self):
+        """
+        make sure that files written with header, body and footer as
+        separate bz2 streams are recognized as such, and that copying
+        out the compressed bodies gives the same xml as decompressing
+        and recombining would
+        """
+        recombiner = RecombineDump("recombinetest", "recombine test", "bz2")
+        pages = []
+        paths = []
+        for partnum in range(1, 4):
+            pages.append("".join(["  <page>\n    <id>%d</id>\n  </page>\n" % (partnum * 1000 + count)
+                                  for count in range(40000)]))
+            paths.append(os.path.join(BaseDumpsTestCase.TEMPDIR,
+                                      'pages-articles%d.xml.bz2' % partnum))
+            xml = (XML_HEADER + pages[-1] + XML_FOOTER).encode('utf-8')
+            self.assertEqual(split_xml_streams(io.BytesIO(xml), paths[-1],
+                                               [shutil.which("bzip2")]), 0)
+            with bz2.open(paths[-1], "rb") as infile:
+                self.assertEqual(infile.read(), xml)
+            self.assertTrue(recombiner.has_separate_streams(paths[-1]))
+
+        # what the dd commands for the recombine do
+        recombined = b''
+        for partnum, path in enumerate(paths):
+            header_offset = recombiner.get_header_offset(path)
+            footer_offset = recombiner.get_footer_offset(path)
+            with open(path, "rb") as infile:
+                contents = infile.read()
+            if partnum == 0:
+                recombined += contents[:header_offset]
+            recombined += contents[header_offset:footer_offset]
+            if partnum == len(paths) - 1:
+                recombined += contents[footer_offset:]
+        self.assertEqual(bz2.decompress(recombined).decode('utf-8'),
+                         XML_HEADER + "".join(pages) + XML_FOOTER)
+
+        # the usual one bz2 stream for everything
+        with bz2.open(paths[0], "wt") as outfile:
+            outfile.write(XML_HEADER + pages[0] + XML_FOOTER)
+        self.assertFalse(recombiner.has_separate_streams(paths[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -100,9 +100,12 @@ class TestRecompressJobs(BaseDumpsTestCase):
                                            checkpoints=True)
 
         commands_left = recompress_job.get_all_commands(runner)
+        # commands are started as slots free up; look at the first few
+        batchsize = len(pages_per_part)
 
         with self.subTest('unfiltered 7z command batch'):
-            commands_todo, commands_left = recompress_job.get_command_batch(commands_left, runner)
+            commands_todo = recompress_job.filter_commands(commands_left, runner)[:batchsize]
+            commands_left = commands_left[batchsize:]
             pageranges = ['1.xml-p1p1500', '1.xml-p1501p4000', '1.xml-p4001p4321', '1.xml-p4322p4330']
             expected_todo = self.get_7z_todo(pageranges)
             self.assertEqual(commands_todo, expected_todo)
@@ -113,7 +116,7 @@ class TestRecompressJobs(BaseDumpsTestCase):
             # are skipped over when command batches are generated
             parts_pageranges = {'2': ['p4351p4380', 'p4381p4443']}
             self.setup_7z_files_chkpts(self.wd['wiki'].db_name, self.today, parts_pageranges)
-            commands_todo, commands_left = recompress_job.get_command_batch(commands_left, runner)
+            commands_todo = recompress_job.filter_commands(commands_left, runner)[:batchsize]
             pageranges = ['2.xml-p4331p4350', '3.xml-p4444p4445', '3.xml-p4446p4600', '3.xml-p4601p4605']
             expected_todo = self.get_7z_todo(pageranges)
             self.assertEqual(commands_todo, expected_todo)
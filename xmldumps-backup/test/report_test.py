@@ -141,3 +141,42 @@ class TestIndexHtml(BaseDumpsTestCase):
             contents = infile.read()
         expected_contents = contents.format(date=self.today)
         self.assertEqual(produced_contents, expected_contents)
+
+    @patch('dumps.wikidump.Wiki.get_known_tables')
+    def test_get_status_items(self, mock_get_known_tables):
+        '''
+        make sure status info is regenerated only for items that changed
+        '''
+        self.setup_dump_jobs_info()
+        mock_get_known_tables.return_value = []
+        filepart_info = FilePartInfo(self.wd['wiki'], self.wd['wiki'].db_name)
+        filepart_info._logitems_per_filepart_pagelogs = [100, 1000, 1000, 1000]
+        dumpjobdata = DumpRunJobData(self.wd['wiki'], self.wd['dump_dir'], notice="",
+                                     enabled=[RunSettings.NAME])
+        items = DumpItemList(self.wd['wiki'], prefetch=True, prefetchdate=None,
+                             spawn=True, partnum_todo=None, checkpoint_file=None,
+                             singleJob='noop', skip_jobs=[],
+                             filepart=filepart_info, page_id_range=None,
+                             dumpjobdata=dumpjobdata, dump_dir=self.wd['dump_dir'],
+                             numbatches=0, verbose=False).dump_items
+        reporter = Report(wiki=self.wd['wiki'], enabled=True, dump_dir=self.wd['dump_dir'],
+                          items=items, dumpjobdata=dumpjobdata)
+        running = [item for item in items if item.name() == 'articlesdump'][0]
+        running.set_status("in-progress")
+        other = [item for item in items if item.name() == 'namespaces'][0]
+
+        with patch('dumps.report.Report.report_dump_step_status',
+                   wraps=Report.report_dump_step_status) as mock_report:
+            status_items = reporter.get_status_items(changed_only=True)
+            self.assertEqual(mock_report.call_count, len(items))
+            mock_report.reset_mock()
+            self.assertEqual(reporter.get_status_items(changed_only=True), status_items)
+            self.assertEqual([call[0][1] for call in mock_report.call_args_list], [running])
+            mock_report.reset_mock()
+            other.set_status("failed")
+            reporter.get_status_items(changed_only=True)
+            self.assertEqual([call[0][1] for call in mock_report.call_args_list],
+                             [item for item in items if item in [running, other]])
+            mock_report.reset_mock()
+            reporter.get_status_items()
+            self.assertEqual(mock_report.call_count, len(items))
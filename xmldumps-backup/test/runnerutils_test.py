@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+"""
+test suite for the bookkeeping done around dump jobs
+"""
+import os
+import unittest
+from test.basedumpstest import BaseDumpsTestCase
+from dumps.checksummers import Checksummer
+from dumps.runnerutils import DumpRunJobData
+from dumps.symlinks import SymLinks
+
+
+class TestPublishing(BaseDumpsTestCase):
+    """
+    make sure output files are published, and that a publish
+    that never finished is picked up by the next run
+    """
+    def setUp(self):
+        super().setUp()
+        self.wiki = self.en['wiki']
+        self.dumpjobdata = DumpRunJobData(self.wiki, self.en['dump_dir'], notice="",
+                                          logfn=lambda message: None,
+                                          debugfn=lambda message: None,
+                                          enabled={SymLinks.NAME: True,
+                                                   Checksummer.NAME: True})
+        self.dfnames = self.dfnames_from_filenames([
+            'enwiki-{today}-pages-articles1.xml.bz2'.format(today=self.today),
+            'enwiki-{today}-pages-articles2.xml.bz2'.format(today=self.today)])
+        for dfname in self.dfnames:
+            with open(self.en['dump_dir'].filename_public_path(dfname), "w") as outfile:
+                outfile.write(dfname.filename)
+
+    def get_latest_links(self):
+        """
+        return the sorted names of the links in the 'latest' dir
+        """
+        latest_dir = self.en['dump_dir'].latest_dir()
+        if not os.path.exists(latest_dir):
+            return []
+        return sorted(filename for filename in os.listdir(latest_dir)
+                      if os.path.islink(os.path.join(latest_dir, filename)))
+
+    def test_resume_publishing(self):
+        """
+        files in a journal entry left behind get linked and checksummed
+        when the next run starts, and the entry is removed
+        """
+        self.dumpjobdata.journal.start('articlesdump', self.dfnames)
+        self.assertEqual(self.get_latest_links(), [])
+
+        self.dumpjobdata.do_before_dump()
+        self.assertEqual(self.get_latest_links(),
+                         ['enwiki-latest-pages-articles1.xml.bz2',
+                          'enwiki-latest-pages-articles2.xml.bz2'])
+        with open(self.dumpjobdata.checksummer._get_checksum_filename_tmp('md5', 'txt')) as infile:
+            self.assertEqual(len(infile.readlines()), 2)
+        self.assertFalse(os.path.exists(self.dumpjobdata.journal.get_path()))
+        self.assertEqual(self.dumpjobdata.journal.get_unfinished(), (None, []))
+
+    def test_resume_publishing_not_enabled(self):
+        """
+        a run that doesn't publish files, such as a dry run or a run of
+        one part, leaves the journal entry of another run alone
+        """
+        self.dumpjobdata.journal.start('articlesdump', self.dfnames)
+        partrun_jobdata = DumpRunJobData(self.wiki, self.en['dump_dir'], notice="",
+                                         logfn=lambda message: None,
+                                         debugfn=lambda message: None, enabled={})
+        partrun_jobdata.do_before_dump()
+        self.assertEqual(self.get_latest_links(), [])
+        self.assertEqual(partrun_jobdata.journal.get_unfinished(),
+                         ('articlesdump', self.dfnames))
+
+
+if __name__ == '__main__':
+    unittest.main()
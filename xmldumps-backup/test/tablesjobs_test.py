@@ -1,6 +1,7 @@
 """
 test suite for tables dumps
 """
+import multiprocessing
 import os
 from unittest.mock import patch
 from test.basedumpstest import BaseDumpsTestCase
@@ -8,6 +9,7 @@ from dumps.utils import FilePartInfo
 from dumps.dumpitemlist import DumpItemList
 from dumps.runnerutils import DumpRunJobData, RunSettings
 from dumps.runner import Runner
+from dumps.tablesjobs import DbHostSlots, TableDumpGroup
 
 
 class TestTablesJobs(BaseDumpsTestCase):
@@ -84,3 +86,73 @@ class TestTablesJobs(BaseDumpsTestCase):
                 with self.assertRaises(Exception) as context:
                     item.do_prep(runner)
                 self.assertTrue('Unknown table type' in str(context.exception))
+
+    @patch('dumps.wikidump.Wiki.get_known_tables')
+    @patch('dumps.runner.FilePartInfo.get_some_stats')
+    def test_table_dump_group(self, _mock_get_some_stats, mock_get_known_tables):
+        '''
+        make sure table dumps run together start with the largest table
+        from the last run, and jobs whose commands fail get retried
+        '''
+        mock_get_known_tables.return_value = ['site_stats', 'langlinks', 'page_props']
+        runner = Runner(self.wd['wiki'], prefetch=False, prefetchdate=None, spawn=True,
+                        job='tables', skip_jobs=None,
+                        restart=False, notice="", dryrun=False, enabled=None,
+                        partnum_todo=None, checkpoint_file=None, page_id_range=None,
+                        skipdone=False, cleanup=False, do_prereqs=False, verbose=False)
+        runner.db_server_info.db_server = 'localhost'
+        items = {item.name(): item for item in runner.dump_item_list.dump_items
+                 if item.name() in ['sitestatstable', 'pagepropstable']}
+
+        latest_dir = runner.dump_dir.latest_dir()
+        os.makedirs(latest_dir, exist_ok=True)
+        with open(os.path.join(latest_dir, '{name}-latest-page_props.sql.gz'.format(
+                name=self.wd['wiki'].db_name)), "w") as outfile:
+            outfile.write("x" * 1000)
+
+        run = {}
+
+        def run_command(series_list, slots=None, **_kwargs):
+            run['tables'] = [series[0][0][-1] for series in series_list]
+            run['slots'] = slots
+            return 1, None
+
+        with patch.object(runner.db_server_info, 'build_sqldump_command',
+                          lambda table, gzip: [['mysqldump', table], [gzip]]), \
+                patch.object(runner, 'run_command', run_command), \
+                patch('dumps.tablesjobs.PublicTable.run_with_retries') as mock_retries, \
+                patch('dumps.tablesjobs.PublicTable.post_run'):
+            TableDumpGroup(list(items.values()), 4).run(runner)
+        self.assertEqual(run['tables'], ['page_props', 'site_stats'])
+        self.assertEqual(run['slots'], 4)
+        self.assertEqual(mock_retries.call_count, 2)
+        self.assertTrue(all(call[1]['tried'] for call in mock_retries.call_args_list))
+        self.assertEqual([item.status() for item in items.values()], ['done', 'done'])
+
+    def test_dbhost_slots(self):
+        '''
+        make sure slots held by another process are not handed out
+        '''
+        lockdir = BaseDumpsTestCase.TEMPDIR
+        held = multiprocessing.Event()
+        done = multiprocessing.Event()
+
+        def hold_slots():
+            slots = DbHostSlots(lockdir, 'db1', 3)
+            slots.acquire(2)
+            held.set()
+            done.wait(10)
+            slots.release()
+
+        other = multiprocessing.Process(target=hold_slots)
+        other.start()
+        try:
+            self.assertTrue(held.wait(10))
+            slots = DbHostSlots(lockdir, 'db1', 3)
+            self.assertEqual(slots.acquire(3), 1)
+            self.assertFalse(slots.try_acquire())
+            slots.release()
+            self.assertEqual(DbHostSlots(lockdir, 'db2', 3).acquire(3), 3)
+        finally:
+            done.set()
+            other.join()
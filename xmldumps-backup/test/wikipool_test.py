@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+"""
+test suite for running jobs on all wikis with a pool of workers
+"""
+import os
+import threading
+import time
+import unittest
+from collections import Counter
+from test.basedumpstest import BaseDumpsTestCase
+from dumps.utils import MiscUtils
+from dumps.wikipool import WikiPool
+
+
+class TestWikiPool(BaseDumpsTestCase):
+    """
+    make sure the pool keeps to its limits on workers and
+    on wikis per section, and retries wikis as it should
+    """
+    def setUp(self):
+        super().setUp()
+        self.lock = threading.Lock()
+        self.running = Counter()
+        self.most = Counter()
+        self.calls = Counter()
+        self.reports = []
+
+    def do_one(self, wikiname):
+        """
+        pretend to do a job on one wiki, keeping track of how many jobs
+        are running at once, in total and per section; wikis with names
+        starting with 'flaky' fail once, 'broken' wikis always fail
+        """
+        section = wikiname[-1]
+        with self.lock:
+            self.calls[wikiname] += 1
+            for key in ['all', section]:
+                self.running[key] += 1
+                self.most[key] = max(self.most[key], self.running[key])
+        time.sleep(0.02)
+        with self.lock:
+            for key in ['all', section]:
+                self.running[key] -= 1
+        if wikiname.startswith('broken'):
+            raise ValueError("this wiki is broken")
+        return not wikiname.startswith('flaky') or self.calls[wikiname] > 1
+
+    def test_pool(self):
+        """
+        run a pool over some wikis in two sections and check the
+        concurrency, the retries and the per-wiki reports
+        """
+        sectionfiles = []
+        for section in ['1', '2']:
+            path = os.path.join(BaseDumpsTestCase.TEMPDIR, 's%s.dblist' % section)
+            with open(path, "w") as outfile:
+                for count in range(5):
+                    outfile.write("wiki%d%s\n" % (count, section))
+                outfile.write("flakywiki%s\nbrokenwiki%s\n" % (section, section))
+            sectionfiles.append(path)
+        sections = MiscUtils.db_sections(','.join(sectionfiles))
+        self.assertEqual(sections['wiki31'], 's1')
+        self.assertEqual(sections['brokenwiki2'], 's2')
+
+        wikis = sorted(sections) + ['wiki0x', 'wiki1x', 'wiki2x']
+        pool = WikiPool(5, sections, 2, retry_wait=0.05, report=self.reports.append)
+        failed = pool.run(wikis, self.do_one, 2)
+
+        self.assertEqual(sorted(failed), ['brokenwiki1', 'brokenwiki2'])
+        self.assertEqual(self.most['1'], 2)
+        self.assertEqual(self.most['2'], 2)
+        self.assertLessEqual(self.most['all'], 5)
+        self.assertEqual(self.calls['flakywiki1'], 2)
+        self.assertEqual(self.calls['brokenwiki2'], 3)
+        self.assertEqual(self.calls['wiki2x'], 1)
+        self.assertEqual(len([report for report in self.reports if ' done in ' in report]),
+                         len(wikis) - 2)
+        self.assertTrue([report for report in self.reports
+                         if report.startswith('wiki flakywiki1 not done after') and
+                         report.endswith('retrying in 0s')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,8 @@ import os
 import unittest
 from unittest.mock import patch
 from test.basedumpstest import BaseDumpsTestCase
+from dumps.commandmanagement import CommandSeries
+from dumps.fileutils import DumpFilename
 from dumps.xmlcontentjobs import XmlDump, DFNamePageRangeConverter
 from dumps.xmljobs import XmlStub
 from dumps.utils import FilePartInfo
@@ -353,6 +355,41 @@ class TestXmlDump(BaseDumpsTestCase):
             dfnames_todo = content_job.get_todos_no_checkpoints(self.en['dump_dir'])
             self.assertEqual(dfnames_todo, expected_dfnames)
 
+    def test_command_should_start_stub_slice(self):
+        """
+        make sure the named pipe for a streamed page range stub is made
+        only when its command series is about to start, and that the
+        named pipe and counts are cleaned up if the series is not started
+        """
+        content_job = XmlDump("articles", "articlesdump", "short description here",
+                              "long description here",
+                              item_for_stubs=None, item_for_stubs_recombine=None,
+                              prefetch=True, prefetchdate=None,
+                              spawn=True, wiki=self.en['wiki'], partnum_todo=False,
+                              pages_per_part=None,
+                              checkpoints=True, checkpoint_file=None,
+                              page_id_range=None, verbose=False)
+        stub_dfname = DumpFilename(self.en['wiki'])
+        stub_dfname.new_from_filename('enwiki-{today}-stub-articles1.xml-p1p100.gz'.format(
+            today=self.today))
+        series = CommandSeries([[["/bin/true"]]])
+        content_job.commands_submitted = [{'series': series.command_series(),
+                                           'stub_slice': stub_dfname}]
+        fifo_path, counts_path = content_job.stubber.get_stub_slice_paths(stub_dfname)
+        self.assertFalse(os.path.exists(fifo_path))
+
+        with patch.object(content_job, 'output_not_yet_produced', return_value=True):
+            self.assertTrue(content_job.command_should_start(None, series))
+        self.assertTrue(os.path.exists(fifo_path))
+
+        # left from an earlier attempt
+        with open(counts_path, "w") as outfile:
+            outfile.write('{"pages": 0, "revisions": 0}')
+        with patch.object(content_job, 'output_not_yet_produced', return_value=False):
+            self.assertFalse(content_job.command_should_start(None, series))
+        self.assertFalse(os.path.exists(fifo_path))
+        self.assertFalse(os.path.exists(counts_path))
+
 
 if __name__ == '__main__':
     unittest.main()
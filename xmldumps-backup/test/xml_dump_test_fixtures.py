@@ -638,9 +638,12 @@ class TestXmlDumpWithFixtures(BaseDumpsTestCase):
         # we don't filter out anything here, no checks for empty stubs, who cares
         todo = wanted
         commands_left = content_job.get_commands_for_pagecontent(todo, runner)
+        # commands are started as slots free up; look at the first few
+        batchsize = content_job.get_batchsize()
 
         with self.subTest('unfiltered bz2 command batch'):
-            commands_todo, commands_left = content_job.get_command_batch(commands_left, runner)
+            commands_todo = content_job.filter_commands(commands_left, runner)[:batchsize]
+            commands_left = commands_left[batchsize:]
             page_ranges = ['1.xml-p1p500', '1.xml-p501p1000',
                            '1.xml-p1001p1500', '1.xml-p1501p2000']
             expected_todo = self.get_bz2_todos(page_ranges)
@@ -653,7 +656,7 @@ class TestXmlDumpWithFixtures(BaseDumpsTestCase):
             page_ranges = {'1': ['p2501p3000', 'p3501p4000']}
             self.setup_fake_bz2_files_chkpts(self.wd['wiki'].db_name, self.today, page_ranges)
 
-            commands_todo, commands_left = content_job.get_command_batch(commands_left, runner)
+            commands_todo = content_job.filter_commands(commands_left, runner)[:batchsize]
             page_ranges = ['1.xml-p2001p2500', '1.xml-p3001p3500',
                            '1.xml-p4001p4330', '2.xml-p4331p4443']
             expected_todo = self.get_bz2_todos(page_ranges)
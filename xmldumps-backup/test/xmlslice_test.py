@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+"""
+test suite for streaming page ranges of stub files
+"""
+import gzip
+import os
+import unittest
+from io import StringIO
+from subprocess import Popen, PIPE
+from unittest.mock import patch
+from test.basedumpstest import BaseDumpsTestCase
+from dumps.fileutils import DumpFilename
+from dumps.stubprovider import StubProvider
+from xmlslice import slice_stub
+
+
+HEADER = b'''<mediawiki xml:lang="en">
+  <siteinfo>
+    <sitename>Wikipedia</sitename>
+  </siteinfo>
+'''
+
+
+def make_page(page_id, revisions):
+    """
+    return the stub xml for a page with the given number of revisions
+    """
+    page = b'  <page>\n    <title>Page %d</title>\n    <ns>0</ns>\n    <id>%d</id>\n' % (
+        page_id, page_id)
+    for rev_id in range(revisions):
+        page += b'    <revision>\n      <id>%d</id>\n    </revision>\n' % (page_id * 10 + rev_id)
+    return page + b'  </page>\n'
+
+
+class FakeRunner():
+    """
+    just enough of a runner to get commands from the stub provider
+    """
+    def __init__(self, dump_dir):
+        self.dump_dir = dump_dir
+        self.dryrun = False
+
+
+class TestXmlSlice(BaseDumpsTestCase):
+    """
+    make sure page ranges are sliced out of stubs as writeuptopageid
+    would, and are streamed through a named pipe to a reader
+    """
+    def setUp(self):
+        super().setUp()
+        self.wiki = self.en['wiki']
+        # pages 4 through 6 were deleted
+        self.pages = {page_id: make_page(page_id, page_id % 3 + 1)
+                      for page_id in [1, 2, 3, 7, 8, 9]}
+        self.stub_dfname = DumpFilename(self.wiki)
+        self.stub_dfname.new_from_filename(
+            'enwiki-{today}-stub-meta-history1.xml.gz'.format(today=self.today))
+        self.stub_path = self.en['dump_dir'].filename_public_path(self.stub_dfname)
+        with gzip.open(self.stub_path, "wb") as outfile:
+            outfile.write(HEADER + b''.join(self.pages.values()) + b'</mediawiki>\n')
+
+    def test_slice_stub(self):
+        """
+        a page range should get the header, the pages in the range and the
+        footer, and the counts of those pages and their revisions; the
+        output file must be there already, it is never made
+        """
+        output_path = os.path.join(BaseDumpsTestCase.TEMPDIR, "slice.xml")
+        count_path = os.path.join(BaseDumpsTestCase.TEMPDIR, "slice.counts")
+        with patch('sys.stderr', new=StringIO()):
+            self.assertEqual(slice_stub(self.stub_path, output_path, 2, 8, count_path), 1)
+        self.assertFalse(os.path.exists(output_path))
+        self.assertFalse(os.path.exists(count_path))
+
+        open(output_path, "wb").close()
+        for (start, end, page_ids, revisions) in [(2, 8, [2, 3, 7], 6), (8, None, [8, 9], 4),
+                                                  (4, 7, [], 0)]:
+            self.assertEqual(slice_stub(self.stub_path, output_path, start, end, count_path), 0)
+            with open(output_path, "rb") as infile:
+                self.assertEqual(infile.read(), HEADER + b''.join(
+                    self.pages[page_id] for page_id in page_ids) + b'</mediawiki>\n')
+            with open(count_path, "r") as infile:
+                self.assertEqual(infile.read(),
+                                 '{"pages": %d, "revisions": %d}' % (len(page_ids), revisions))
+
+    def test_stream_slice(self):
+        """
+        the page range should be streamed through the named pipe to the
+        reader after the slicer in the pipeline, and the counts should
+        show whether there were pages in it; if the reader goes away
+        without reading, the slicer should give up rather than hang
+        """
+        stubber = StubProvider(self.wiki, {}, False)
+        slicer = os.path.abspath("xmlslice.py")
+        for (first, last, page_ids) in [(1, 3, [1, 2, 3]), (4, 6, [])]:
+            range_dfname = DumpFilename(self.wiki)
+            range_dfname.new_from_filename(
+                'enwiki-{today}-stub-meta-history1.xml-p{first}p{last}.gz'.format(
+                    today=self.today, first=first, last=last))
+            command = stubber.get_stub_slice_cmd(self.stub_dfname, range_dfname,
+                                                 FakeRunner(self.en['dump_dir']), slicer)
+            stubber.make_stub_slice_fifo(range_dfname)
+            fifo_path = stubber.get_stub_slice_paths(range_dfname)[0]
+            slicer_proc = Popen(command, stdout=PIPE)
+            reader_proc = Popen(["cat", fifo_path], stdin=slicer_proc.stdout, stdout=PIPE)
+            slicer_proc.stdout.close()
+            self.assertEqual(reader_proc.communicate()[0], HEADER + b''.join(
+                self.pages[page_id] for page_id in page_ids) + b'</mediawiki>\n')
+            self.assertEqual(slicer_proc.wait(), 0)
+            self.assertEqual(stubber.stub_slice_has_no_pages(range_dfname), not page_ids)
+            stubber.cleanup_stub_slice(range_dfname)
+            self.assertFalse(os.path.exists(fifo_path))
+
+        command = stubber.get_stub_slice_cmd(self.stub_dfname, range_dfname,
+                                             FakeRunner(self.en['dump_dir']), slicer)
+        stubber.make_stub_slice_fifo(range_dfname)
+        slicer_proc = Popen(command, stdout=PIPE, stderr=PIPE)
+        reader_proc = Popen(["true"], stdin=slicer_proc.stdout)
+        slicer_proc.stdout.close()
+        reader_proc.wait()
+        slicer_proc.communicate(timeout=10)
+        self.assertEqual(slicer_proc.returncode, 1)
+        self.assertFalse(stubber.stub_slice_has_no_pages(range_dfname))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+"""
+test suite for xml dumps run in pieces
+"""
+import gzip
+import os
+import shutil
+import stat
+import unittest
+from test.basedumpstest import BaseDumpsTestCase
+import xmlstreams
+
+
+# stand-in for dumpBackup.php, writes one page per id in the
+# range to each output file, and fails for a start of 13
+FAKE_DUMPER = '''#!/usr/bin/python3
+import sys
+args = sys.argv[1:]
+outputs = [arg[len("--output=file:"):] for arg in args if arg.startswith("--output=file:")]
+start = int([arg for arg in args if arg.startswith("--start=")][0][len("--start="):])
+if "--end" in args:
+    end = int(args[args.index("--end") + 1])
+else:
+    end = int([arg for arg in args if arg.startswith("--end=")][0][len("--end="):])
+if start == 13:
+    sys.exit(1)
+for output in outputs:
+    with open(output, "w") as outfile:
+        if "--skip-header" not in args:
+            outfile.write("<mediawiki>\\n")
+        for pageid in range(start, end):
+            outfile.write("<page><id>%d</id></page>\\n" % pageid)
+        if "--skip-footer" not in args:
+            outfile.write("</mediawiki>\\n")
+'''
+
+
+class TestXmlStreams(BaseDumpsTestCase):
+    """
+    run a fake dumper in pieces, one at a time or several at once
+    """
+    def setUp(self):
+        super().setUp()
+        self.dumper = os.path.join(BaseDumpsTestCase.TEMPDIR, 'fakedumper')
+        with open(self.dumper, "w") as outfile:
+            outfile.write(FAKE_DUMPER)
+        os.chmod(self.dumper, stat.S_IRWXU)
+        self.config.gzip = shutil.which('gzip')
+        self.config.max_retries = 1
+
+    def run_pieces(self, workers, start, end):
+        """
+        dump pages start through end to two output files, return
+        the names of the output files
+        """
+        self.config.xmlstream_workers = workers
+        outfiles = {}
+        command = [self.dumper]
+        for filetype in ['history', 'current']:
+            name = os.path.join(BaseDumpsTestCase.TEMPDIR, '%s-%d.xml.gz' % (filetype, workers))
+            outfiles[filetype] = {'name': name, 'temp': name + "_tmp",
+                                  'compr': [xmlstreams.gzippit_append, name],
+                                  'piece_compr': [self.config.gzip]}
+            command.append("--output=file:%s" % outfiles[filetype]['temp'])
+        for args in [{'header': True}, {}, {'footer': True}]:
+            xmlstreams.do_xml_stream('enwiki', outfiles, command, self.config, start, end,
+                                     False, 'page_id', 'page', 3, 3, '</page>\n', **args)
+        return [outfiles[filetype]['name'] for filetype in outfiles]
+
+    def test_concurrent_pieces(self):
+        """
+        make sure output is the same for pieces run concurrently,
+        and that each piece is a separate gzip member
+        """
+        for serial, concurrent in zip(self.run_pieces(1, 1, 11), self.run_pieces(3, 1, 11)):
+            with gzip.open(serial, "rb") as infile:
+                expected = infile.read()
+            with gzip.open(concurrent, "rb") as infile:
+                self.assertEqual(infile.read(), expected)
+            self.assertTrue(expected.endswith(b"<page><id>11</id></page>\n</mediawiki>\n"))
+            with open(concurrent, "rb") as infile:
+                # header, one piece per page, footer
+                self.assertEqual(infile.read().count(b"\x1f\x8b\x08"), 13)
+        for path in os.listdir(BaseDumpsTestCase.TEMPDIR):
+            self.assertFalse(path.endswith("_tmp") or "_tmp." in path)
+
+        # the piece starting at 13 always fails
+        with self.assertRaises(SystemExit):
+            self.run_pieces(3, 1, 20)
+        self.assertFalse(os.path.exists(os.path.join(BaseDumpsTestCase.TEMPDIR,
+                                                     'history-3.xml.gz')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -34,6 +34,7 @@ def do_flowbackup(wikidb, outfile, history,
             outfiles[filetype]['compr'] = [None, outfiles[filetype]['name']]
         else:
             outfiles[filetype]['compr'] = [bzip2it_append, outfiles[filetype]['name']]
+            outfiles[filetype]['piece_compr'] = [wikiconf.bzip2]
 
     script_command = MultiVersion.mw_script_as_array(wikiconf,
                                                      "extensions/Flow/maintenance/dumpBackup.php")
@@ -33,6 +33,7 @@ def dologsbackup(wikidb, outfile,
             outfiles[filetype]['compr'] = [None, outfiles[filetype]['name']]
         else:
             outfiles[filetype]['compr'] = [gzippit_append, outfiles[filetype]['name']]
+            outfiles[filetype]['piece_compr'] = [wikiconf.gzip]
 
     script_command = MultiVersion.mw_script_as_array(wikiconf, "dumpBackup.php")
     command = [wikiconf.php] + script_command
@@ -0,0 +1,252 @@
+#!/usr/bin/python3
+'''
+read a stub xml file and write out the xml header, the pages in a
+page id range and the xml footer, as writeuptopageid would, but to
+one output file that may be a named pipe read by dumpTextPass.php,
+so that no temporary stub file need be written, read back and removed
+
+the number of pages and revisions written is saved in a small json
+file once the output is complete, so that the caller can tell if the
+page range had no pages in it
+
+the output depends only on the input file and the page range, so
+running this again for the same range produces the same output
+'''
+
+import bz2
+import errno
+import fcntl
+import getopt
+import gzip
+import json
+import os
+import re
+import select
+import stat
+import sys
+
+
+PAGE_START = b'<page>'
+PAGE_END = b'</page>'
+REVISION_START = b'<revision>'
+FOOTER = b'</mediawiki>\n'
+PAGE_ID = re.compile(rb'^\s*<id>(\d+)</id>')
+# how long to wait between checks that the reader of a named pipe
+# is still around, while waiting for it to open the pipe
+READER_WAIT = 100
+
+
+def open_input(path):
+    '''
+    open the stub file for reading, decompressing by file extension
+    '''
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+
+def reader_gone(timeout):
+    '''
+    the reader of the named pipe runs after us in the same pipeline,
+    so our stdout goes to its stdin; wait up to timeout milliseconds
+    and return True if it has been closed, meaning that the reader
+    has died and will never open the named pipe
+    '''
+    poller = select.poll()
+    # errors and hangups are always reported, we ask for nothing else
+    poller.register(sys.stdout.fileno(), 0)
+    return bool(poller.poll(timeout))
+
+
+def open_output(path):
+    '''
+    open the output file, which must exist, for writing; if it is a
+    named pipe, wait for the reader to open it, and return None if
+    the reader goes away first
+    '''
+    if not stat.S_ISFIFO(os.stat(path).st_mode):
+        return open(path, "wb")
+    while True:
+        try:
+            fdesc = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+            break
+        except OSError as ex:
+            # no reader yet
+            if ex.errno != errno.ENXIO:
+                raise
+        if reader_gone(READER_WAIT):
+            return None
+    # writes should block until the reader catches up
+    fcntl.fcntl(fdesc, fcntl.F_SETFL, fcntl.fcntl(fdesc, fcntl.F_GETFL) & ~os.O_NONBLOCK)
+    return os.fdopen(fdesc, "wb")
+
+
+def slice_pages(infile, outfile, start, end):
+    '''
+    read stub xml from the binary file object infile and write the header,
+    the pages with page id at least start and less than end (if end is not
+    None), and the footer to the binary file object outfile, stopping as
+    soon as a page with id at or past end is seen
+
+    returns a dict with the number of pages and revisions written
+    '''
+    counts = {'pages': 0, 'revisions': 0}
+    in_header = True
+    # lines of a page whose id we have not yet seen
+    page = None
+    # whether the lines of the current page are written out
+    wanted = False
+    for line in infile:
+        stripped = line.strip()
+        if page is not None:
+            page.append(line)
+            found = PAGE_ID.match(line)
+            if not found:
+                continue
+            page_id = int(found.group(1))
+            if end is not None and page_id >= end:
+                break
+            wanted = page_id >= start
+            if wanted:
+                counts['pages'] += 1
+                outfile.write(b''.join(page))
+            page = None
+        elif stripped == PAGE_START:
+            in_header = False
+            page = [line]
+        elif wanted:
+            outfile.write(line)
+            if stripped == REVISION_START:
+                counts['revisions'] += 1
+            elif stripped == PAGE_END:
+                wanted = False
+        elif in_header and stripped != FOOTER.strip():
+            outfile.write(line)
+    outfile.write(FOOTER)
+    return counts
+
+
+def write_counts(path, counts):
+    '''
+    write the counts as json to the file, atomically so that a reader
+    never sees a partial file
+    '''
+    with open(path + ".tmp", "w") as outfile:
+        json.dump(counts, outfile)
+    os.rename(path + ".tmp", path)
+
+
+def slice_stub(input_path, output_path, start, end, count_path=None):
+    '''
+    write the header, the pages from start up to but not including end
+    (None for no end) and the footer of the stub file to the output file,
+    and the counts of pages and revisions to the count file, if any
+
+    the output is opened first, so that a reader of a named pipe is not
+    left waiting forever if the input can't be read; it gets what was
+    written and the end of the file, and we fail
+
+    returns 0 on success, 1 if the output file is missing, or if the
+    reader of a named pipe went away before opening it
+    '''
+    if count_path is not None and os.path.exists(count_path):
+        # from an earlier attempt for this page range
+        os.unlink(count_path)
+    if not os.path.exists(output_path):
+        # the named pipe should have been made for us; if we made a
+        # regular file instead, the reader would be left waiting
+        sys.stderr.write("no output file %s\n" % output_path)
+        return 1
+    outfile = open_output(output_path)
+    if outfile is None:
+        sys.stderr.write("reader of %s went away\n" % output_path)
+        return 1
+    with outfile:
+        with open_input(input_path) as infile:
+            counts = slice_pages(infile, outfile, start, end)
+    if count_path is not None:
+        write_counts(count_path, counts)
+    return 0
+
+
+def usage(message=None):
+    """
+    display a helpful usage message with
+    an optional introductory message first
+    """
+    if message is not None:
+        sys.stderr.write(message)
+        sys.stderr.write("\n")
+    usage_message = """
+Usage: xmlslice.py --infile path --outfile path --start pageid
+           [--end pageid] [--countfile path]
+
+Reads a stub xml file and writes the xml header, the pages in the given
+page id range and the xml footer, uncompressed, to the output file.
+
+Options:
+
+  --infile    (-i):   full path to the stub file, gz, bz2 or uncompressed
+  --outfile   (-o):   full path to the output file, which must exist; if this
+                      is a named pipe, it must be opened by a reader that runs
+                      after this script in the same pipeline
+  --start     (-s):   first page id to write
+  --end       (-e):   page id to stop at, not written; default: end of file
+  --countfile (-c):   full path to a file to which the numbers of pages and
+                      revisions written are saved as json, once all output
+                      has been written
+"""
+    sys.stderr.write(usage_message)
+    sys.exit(1)
+
+
+def main():
+    'main entry point, does all the work'
+    input_file = None
+    output_file = None
+    count_file = None
+    start = None
+    end = None
+
+    try:
+        (options, remainder) = getopt.gnu_getopt(
+            sys.argv[1:], "i:o:s:e:c:h",
+            ["infile=", "outfile=", "start=", "end=", "countfile=", "help"])
+
+    except getopt.GetoptError as err:
+        usage("Unknown option specified: " + str(err))
+    for (opt, val) in options:
+        if opt in ["-i", "--infile"]:
+            input_file = val
+        elif opt in ["-o", "--outfile"]:
+            output_file = val
+        elif opt in ["-s", "--start"]:
+            start = val
+        elif opt in ["-e", "--end"]:
+            end = val
+        elif opt in ["-c", "--countfile"]:
+            count_file = val
+        elif opt in ["-h", "--help"]:
+            usage('Help for this script\n')
+        else:
+            usage("Unknown option specified: <%s>" % opt)
+
+    if remainder:
+        usage("Unknown option(s) specified: <%s>" % remainder[0])
+    if input_file is None:
+        usage("mandatory argument argument missing: --infile")
+    if output_file is None:
+        usage("mandatory argument argument missing: --outfile")
+    if start is None:
+        usage("mandatory argument argument missing: --start")
+    if not start.isdigit() or (end and not end.isdigit()):
+        usage("--start and --end must be page ids")
+
+    sys.exit(slice_stub(input_file, output_file, int(start),
+                        int(end) if end else None, count_file))
+
+
+if __name__ == '__main__':
+    main()
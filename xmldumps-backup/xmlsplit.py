@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+'''
+read an xml dump on stdin and write it out compressed, with the
+xml header, the body and the xml footer each compressed separately
+(separate bz2 streams or gzip members) and all concatenated together
+
+files written this way can be recombined by copying out the bytes
+of the body, without decompressing anything
+'''
+
+import sys
+import getopt
+from subprocess import Popen, PIPE
+
+
+READ_SIZE = 1048576
+HEADER_END = b'</siteinfo>\n'
+FOOTER_START = b'</mediawiki>'
+
+
+def compress_to(compressor, outfile, content):
+    '''
+    run the compressor on the content, writing to the open
+    output file; return the compressor's exit code
+    '''
+    process = Popen(compressor, stdin=PIPE, stdout=outfile)
+    process.stdin.write(content)
+    process.stdin.close()
+    return process.wait()
+
+
+def split_xml_streams(infile, output_path, compressor):
+    '''
+    read xml from the binary file object infile and write it to output_path
+    via the compressor command (a list), header, body and footer separately
+
+    if there is no header or no footer, whatever is there is written as
+    one compressed stream; there will be no body stream if the xml has no
+    content between header and footer
+
+    returns 0 on success, or the first nonzero exit code from a compressor
+    '''
+    with open(output_path, "wb") as outfile:
+        header = b''
+        while HEADER_END not in header:
+            data = infile.read(READ_SIZE)
+            if not data:
+                # no header, this is not a regular dump, just write it all
+                return compress_to(compressor, outfile, header)
+            header += data
+        end = header.index(HEADER_END) + len(HEADER_END)
+        leftover = header[end:]
+        errors = compress_to(compressor, outfile, header[:end])
+
+        # everything but the last bit goes straight to the body compressor;
+        # we hold back enough to find the start of the footer at eof
+        process = None
+        while True:
+            data = infile.read(READ_SIZE)
+            if not data:
+                break
+            leftover += data
+            if len(leftover) > READ_SIZE:
+                if process is None:
+                    outfile.flush()
+                    process = Popen(compressor, stdin=PIPE, stdout=outfile)
+                process.stdin.write(leftover[:-1 * READ_SIZE])
+                leftover = leftover[-1 * READ_SIZE:]
+
+        footer_start = leftover.rfind(FOOTER_START)
+        if footer_start < 0:
+            footer_start = len(leftover)
+        if footer_start:
+            if process is None:
+                outfile.flush()
+                process = Popen(compressor, stdin=PIPE, stdout=outfile)
+            process.stdin.write(leftover[:footer_start])
+        if process is not None:
+            process.stdin.close()
+            result = process.wait()
+            errors = errors or result
+        if footer_start < len(leftover):
+            result = compress_to(compressor, outfile, leftover[footer_start:])
+            errors = errors or result
+    return errors
+
+
+def usage(message=None):
+    """
+    display a helpful usage message with
+    an optional introductory message first
+    """
+    if message is not None:
+        sys.stderr.write(message)
+        sys.stderr.write("\n")
+    usage_message = """
+Usage: xmlsplit.py --compressor command --outfile path
+
+Reads an xml dump from stdin and writes it compressed to the output file,
+with the xml header, the pages and the xml footer compressed separately.
+
+Options:
+
+  --compressor (-c):   compression command that reads from stdin and writes
+                       to stdout, e.g. "/usr/bin/bzip2" or "/usr/bin/lbzip2 -n 2"
+  --outfile    (-o):   full path to the compressed output file
+"""
+    sys.stderr.write(usage_message)
+    sys.exit(1)
+
+
+def main():
+    'main entry point, does all the work'
+    compressor = None
+    output_file = None
+
+    try:
+        (options, remainder) = getopt.gnu_getopt(
+            sys.argv[1:], "c:o:h", ["compressor=", "outfile=", "help"])
+
+    except getopt.GetoptError as err:
+        usage("Unknown option specified: " + str(err))
+    for (opt, val) in options:
+        if opt in ["-c", "--compressor"]:
+            compressor = val.split()
+        elif opt in ["-o", "--outfile"]:
+            output_file = val
+        elif opt in ["-h", "--help"]:
+            usage('Help for this script\n')
+        else:
+            usage("Unknown option specified: <%s>" % opt)
+
+    if remainder:
+        usage("Unknown option(s) specified: <%s>" % remainder[0])
+    if compressor is None:
+        usage("mandatory argument argument missing: --compressor")
+    if output_file is None:
+        usage("mandatory argument argument missing: --outfile")
+
+    sys.exit(split_xml_streams(sys.stdin.buffer, output_file, compressor))
+
+
+if __name__ == '__main__':
+    main()
@@ -12,7 +12,10 @@ import os
 import sys
 import time
 import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from subprocess import Popen, PIPE
+from dumps.exceptions import BackupError
 from dumps.utils import DbServerInfo
 from dumps.wikidump import Wiki
 
@@ -30,6 +33,10 @@ def do_xml_stream(wikidb, outfiles, command, wikiconf,
     temporary files and shovelling those into gzip's stdin for the
     concatenated compressed output
 
+    if the config setting xmlstreamworkers is more than 1, and the
+    outfiles have a 'piece_compr' command, the pieces of the body
+    are instead run that many at a time, see do_xml_pieces_concurrently
+
     if header is True, write only the header
     if footer is True, write only the footer
     '''
@@ -83,29 +90,20 @@ def do_xml_stream(wikidb, outfiles, command, wikiconf,
                 outfiles[filetype]['process'].stdin.close()
             for filetype in outfiles:
                 outfiles[filetype]['process'].wait()
+    elif (not dryrun and wikiconf.xmlstream_workers > 1 and
+          all('piece_compr' in outfiles[filetype] for filetype in outfiles)):
+        piece_commands = get_piece_commands(command, wikidb, wikiconf, start, end,
+                                            interval_save, callback)
+        do_xml_pieces_concurrently(piece_commands, outfiles, wikiconf, ends_with,
+                                   wikiconf.xmlstream_workers, verbose=verbose)
     else:
         if not dryrun:
             for filetype in outfiles:
                 outfiles[filetype]['process'] = outfiles[filetype]['compr'][0](
                     outfiles[filetype]['compr'][1])
 
-        if callback is not None:
-            wiki = Wiki(wikiconf, wikidb)
-            db_info = DbServerInfo(wiki, wikidb)
-
-        upto = start
-        while upto <= end:
-            if callback is not None:
-                interval = callback(upto, interval_save, wiki, db_info)
-            piece_command = [field for field in command]
-            piece_command.append("--skip-header")
-            piece_command.extend(["--start=%s" % str(upto)])
-            piece_command.append("--skip-footer")
-            if upto + interval <= end:
-                piece_command.extend(["--end", str(upto + interval)])
-            else:
-                piece_command.extend(["--end", str(end + 1)])
-            upto = upto + interval
+        for piece_command in get_piece_commands(command, wikidb, wikiconf, start, end,
+                                                interval_save, callback):
             do_xml_piece(piece_command, outfiles, wikiconf, ends_with,
                          dryrun=dryrun, verbose=verbose)
 
@@ -119,10 +117,164 @@ def do_xml_stream(wikidb, outfiles, command, wikiconf,
         return
 
 
-def run_script(command, outfiles, shouldendwith=None):
+def get_piece_commands(command, wikidb, wikiconf, start, end, interval, callback=None):
     '''
-    given a command
-    returns True on success, None on failure
+    generate the commands for the pieces of the body of an xml dump
+    from start through end, interval ids at a time, or as many
+    as the callback says for each piece
+    '''
+    if callback is not None:
+        wiki = Wiki(wikiconf, wikidb)
+        db_info = DbServerInfo(wiki, wikidb)
+
+    interval_save = interval
+    upto = start
+    while upto <= end:
+        if callback is not None:
+            interval = callback(upto, interval_save, wiki, db_info)
+        piece_command = [field for field in command]
+        piece_command.append("--skip-header")
+        piece_command.extend(["--start=%s" % str(upto)])
+        piece_command.append("--skip-footer")
+        if upto + interval <= end:
+            piece_command.extend(["--end", str(upto + interval)])
+        else:
+            piece_command.extend(["--end", str(end + 1)])
+        upto = upto + interval
+        yield piece_command
+
+
+def do_xml_pieces_concurrently(piece_commands, outfiles, wikiconf, ends_with,
+                               workers, verbose=False):
+    '''
+    run the pieces of the body of an xml dump, several at a time, each
+    writing into its own uncompressed temporary files; each piece's
+    output is compressed on its own by the outfile's 'piece_compr'
+    command into a separate gzip member or bz2 stream, and appended
+    to the output file in order without going through any other process
+
+    at most 'workers' pieces are running or waiting to be appended
+
+    on failure, the output files are removed and we exit
+    '''
+    outputs = {}
+    try:
+        for filetype in outfiles:
+            outputs[filetype] = open(outfiles[filetype]['name'], "ab")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            try:
+                for piece_num, piece_command in enumerate(piece_commands):
+                    pending.append(executor.submit(
+                        do_xml_piece_compressed, piece_command, outfiles, piece_num,
+                        wikiconf, ends_with, verbose))
+                    if len(pending) >= workers:
+                        append_pieces(pending.popleft().result(), outputs)
+                while pending:
+                    append_pieces(pending.popleft().result(), outputs)
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+    except Exception:
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        sys.stderr.write(repr(traceback.format_exception(exc_type, exc_value, exc_traceback)))
+        sys.stderr.write("failed job after max retries\n")
+        for filetype in outputs:
+            outputs[filetype].close()
+        for filetype in outfiles:
+            try:
+                # don't bother to save partial files, cleanup everything
+                os.unlink(outfiles[filetype]['name'])
+            except Exception:
+                # files might not be there, we don't care
+                pass
+        sys.exit(1)
+    for filetype in outputs:
+        outputs[filetype].close()
+
+
+def append_pieces(compressed, outputs):
+    '''
+    append the compressed output of a piece for each filetype
+    to the open output file for that filetype
+    '''
+    for filetype in outputs:
+        outputs[filetype].write(compressed[filetype])
+
+
+def do_xml_piece_compressed(command, outfiles, piece_num, wikiconf, ends_with=None,
+                            verbose=False):
+    '''
+    do one piece of an xml dump, output going uncompressed to temporary
+    files of its own, then compress each of those with the outfile's
+    'piece_compr' command and return a dict of the compressed output
+    by filetype
+
+    retries are as for do_xml_piece; if they all fail, raise BackupError
+    '''
+    temps = {}
+    piece_command = [field for field in command]
+    for filetype in outfiles:
+        temps[filetype] = "%s.%d" % (outfiles[filetype]['temp'], piece_num)
+        output_arg = "--output=file:%s" % outfiles[filetype]['temp']
+        piece_command = [("--output=file:%s" % temps[filetype]) if field == output_arg
+                         else field for field in piece_command]
+
+    if verbose:
+        sys.stderr.write("running command: %s\n" % " ".join(piece_command))
+    try:
+        retries = 0
+        maxretries = wikiconf.max_retries
+        timeout = 60
+        while True:
+            try:
+                result = run_script(piece_command, temps, ends_with)
+            except Exception:
+                exc_type, exc_value, exc_traceback = sys.exc_info()
+                sys.stderr.write(repr(traceback.format_exception(
+                    exc_type, exc_value, exc_traceback)))
+                result = False
+            if result:
+                break
+            retries += 1
+            if retries >= maxretries:
+                raise BackupError("failed command after max retries: %s" %
+                                  " ".join(piece_command))
+            time.sleep(timeout)
+            timeout = timeout * 2
+
+        compressed = {}
+        for filetype in outfiles:
+            compressed[filetype] = compress_file(outfiles[filetype]['piece_compr'],
+                                                 temps[filetype])
+        return compressed
+    finally:
+        # get rid of all temp files, regardless
+        for filetype in temps:
+            if os.path.exists(temps[filetype]):
+                os.unlink(temps[filetype])
+
+
+def compress_file(compressor, inputfile):
+    '''
+    run the compressor command (a list) on the contents of the file
+    and return the compressed output
+    '''
+    with open(inputfile, "rb") as infile:
+        process = Popen(compressor, stdin=infile, stdout=PIPE)
+        output, _unused = process.communicate()
+    if process.returncode:
+        raise BackupError("nonzero return {retval} from command '{command}'".format(
+            retval=process.returncode, command=" ".join(compressor)))
+    return output
+
+
+def run_script(command, temps, shouldendwith=None):
+    '''
+    given a command and a dict of the temp files it writes
+    by filetype, run the command and check its output
+    returns True on success, False on failure
     '''
     failed = False
     process = Popen(command)
@@ -130,8 +282,8 @@ def run_script(command, outfiles, shouldendwith=None):
     process.wait()
     retval = process.returncode
     if not retval:
-        for filetype in outfiles:
-            outfile = outfiles[filetype]['temp']
+        for filetype in temps:
+            outfile = temps[filetype]
             if os.path.exists(outfile):
                 # file could be empty (all pages in the range deleted)
                 if os.path.getsize(outfile) > 0:
@@ -270,7 +422,8 @@ def do_xml_piece(command, outfiles, wikiconf, ends_with=None, dryrun=False, verb
     timeout = 60
     while retries < maxretries:
         try:
-            result = run_script(command, outfiles, ends_with)
+            result = run_script(command, {filetype: outfiles[filetype]['temp']
+                                          for filetype in outfiles}, ends_with)
         except Exception:
             exc_type, exc_value, exc_traceback = sys.exc_info()
             sys.stderr.write(repr(traceback.format_exception(exc_type, exc_value, exc_traceback)))
@@ -49,6 +49,7 @@ def get_revs_per_page_interval(page_id_start, interval, wiki, db_info):
         time.sleep(5)
         # maybe the server was depooled. if so we will get another one
         db_info = DbServerInfo(wiki, wiki.db_name)
+        db_info.get_db_server_and_prefix(use_cache=False)
         results = db_info.run_sql_and_get_output(query)
         if not results:
             continue
@@ -122,6 +123,7 @@ def dostubsbackup(wikidb, history_file, current_file, articles_file,
             outfiles[filetype]['compr'] = [None, outfiles[filetype]['name']]
         else:
             outfiles[filetype]['compr'] = [gzippit_append, outfiles[filetype]['name']]
+            outfiles[filetype]['piece_compr'] = [wikiconf.gzip]
 
     script_command = MultiVersion.mw_script_as_array(wikiconf, "dumpBackup.php")
     command = [wikiconf.php] + script_command